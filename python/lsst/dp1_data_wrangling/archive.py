@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import os
+import pathlib
+import shutil
+import struct
+
+import click
+import pydantic
+import pyarrow
+
+from .chunk_store import ChunkStoreExportPaths, is_chunk_store
+from .paths import DEFAULT_EXPORT_DIRECTORY, ExportPaths
+
+# Layout of an archive file:
+#   header: _MAGIC
+#   members: the raw bytes of each file in the export directory, each starting
+#     at an offset that is a multiple of the alignment.
+#   index: JSON-serialized ArchiveIndex.
+#   footer: index offset (uint64), index length (uint64), _MAGIC
+#
+# Members are stored uncompressed (parquet files are already compressed
+# internally), so a member can be memory-mapped or range-read in place without
+# extracting it.
+
+_MAGIC = b"DP1DUMP1"
+_FOOTER = struct.Struct("<QQ8s")
+DEFAULT_ALIGNMENT = 4096
+
+
+class ArchiveMember(pydantic.BaseModel):
+    offset: int
+    size: int
+
+
+class ArchiveIndex(pydantic.BaseModel):
+    alignment: int
+    members: dict[str, ArchiveMember]
+    """Mapping from path relative to the export directory to the location of
+    the file's contents in the archive.
+    """
+
+
+def write_archive(input_directory: str, output_file: str, alignment: int = DEFAULT_ALIGNMENT) -> None:
+    """Pack an export directory into a single archive file."""
+    root = pathlib.Path(input_directory)
+    members: dict[str, ArchiveMember] = {}
+    with open(output_file, "wb") as output:
+        output.write(_MAGIC)
+        for path in sorted(p for p in root.rglob("*") if p.is_file()):
+            padding = -output.tell() % alignment
+            output.write(b"\0" * padding)
+            offset = output.tell()
+            with open(path, "rb") as input:
+                shutil.copyfileobj(input, output)
+            size = output.tell() - offset
+            members[path.relative_to(root).as_posix()] = ArchiveMember(offset=offset, size=size)
+
+        index = ArchiveIndex(alignment=alignment, members=members).model_dump_json().encode()
+        index_offset = output.tell()
+        output.write(index)
+        output.write(_FOOTER.pack(index_offset, len(index), _MAGIC))
+
+
+class DumpArchive:
+    """Read-only access to the members of an archive written by
+    `write_archive`.
+
+    Members are returned as zero-copy views into a memory map of the archive
+    (or read with positional reads, if ``memory_map`` is `False`), so nothing
+    is extracted to disk.  Reads do not share a file position, so members can
+    be read from several threads at once.
+    """
+
+    def __init__(self, path: str, memory_map: bool = True) -> None:
+        self._file = pyarrow.memory_map(path) if memory_map else pyarrow.OSFile(path)
+        file_size = self._file.size()
+        if file_size < len(_MAGIC) + _FOOTER.size:
+            raise ValueError(f"{path} is too small to be a dump archive")
+        index_offset, index_length, magic = _FOOTER.unpack(
+            self._file.read_at(_FOOTER.size, file_size - _FOOTER.size).to_pybytes()
+        )
+        if magic != _MAGIC or self._file.read_at(len(_MAGIC), 0).to_pybytes() != _MAGIC:
+            raise ValueError(f"{path} is not a dump archive")
+        self.index = ArchiveIndex.model_validate_json(
+            self._file.read_at(index_length, index_offset).to_pybytes()
+        )
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.index.members
+
+    def member_size(self, name: str) -> int:
+        return self._get_member(name).size
+
+    def open_member(self, name: str) -> pyarrow.NativeFile:
+        member = self._get_member(name)
+        return pyarrow.BufferReader(self._file.read_at(member.size, member.offset))
+
+    def _get_member(self, name: str) -> ArchiveMember:
+        member = self.index.members.get(name)
+        if member is None:
+            raise FileNotFoundError(f"No member '{name}' in dump archive")
+        return member
+
+
+class ArchiveExportPaths(ExportPaths):
+    """`ExportPaths` that reads files from a `DumpArchive` instead of a
+    directory.  Paths returned by this class are the names of archive
+    members.
+    """
+
+    def __init__(self, archive: DumpArchive) -> None:
+        # Member names are paths relative to the root of the export.
+        super().__init__("")
+        self._archive = archive
+
+    def create_directories(self) -> None:
+        raise NotImplementedError("Dump archives are read-only")
+
+    def exists(self, path: str) -> bool:
+        return path in self._archive
+
+    def file_size(self, path: str) -> int:
+        return self._archive.member_size(path)
+
+    def open_input(self, path: str) -> pyarrow.NativeFile:
+        return self._archive.open_member(path)
+
+    def relative_path(self, path: str) -> str:
+        return path
+
+
+def open_export(input_path: str) -> ExportPaths:
+    """Return an `ExportPaths` for reading an export, which may be a
+    directory, an archive created by `write_archive`, a chunk store created
+    by `write_chunk_store`, or a URI accepted by `ExportPaths.from_uri`.
+    """
+    if "://" in input_path:
+        return ExportPaths.from_uri(input_path)
+    if os.path.isfile(input_path):
+        return ArchiveExportPaths(DumpArchive(input_path))
+    if is_chunk_store(input_path):
+        return ChunkStoreExportPaths(input_path)
+    return ExportPaths(input_path)
+
+
+@click.command("pack")
+@click.option("--input-dir", default=DEFAULT_EXPORT_DIRECTORY)
+@click.option("--output", default=DEFAULT_EXPORT_DIRECTORY + ".dp1a", help="Archive file to create")
+@click.option("--alignment", default=DEFAULT_ALIGNMENT, help="Byte alignment of each member")
+def main(input_dir: str, output: str, alignment: int) -> None:
+    """Pack an export directory into a single archive file that can be
+    imported without extracting it.
+    """
+    write_archive(input_dir, output, alignment)
@@ -0,0 +1,312 @@
+from __future__ import annotations
+
+import json
+import os
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+
+import click
+import pydantic
+from lsst.daf.butler import Butler, CollectionType, DatasetRef, DatasetType, Timespan
+from lsst.daf.butler.tests import addDataIdValue, addDatasetType, makeTestRepo
+
+from .export_dp1 import export
+from .generate_dp1_file_tree import generate_file_tree
+from .importer import Importer
+from .index import ExportIndex
+from .path_mapping import DatastoreMappingInput
+from .paths import ExportPaths
+from .utils import read_model_from_file
+
+BENCHMARK_FORMAT_VERSION = 1
+
+_INSTRUMENT = "DummyCam"
+_PHYSICAL_FILTER = "d-r"
+_ROOT_COLLECTION = "benchmark/all"
+
+
+class BenchmarkScale(pydantic.BaseModel):
+    """Size of the synthetic repository used for a benchmark run."""
+
+    visits: int = 20
+    detectors: int = 9
+    dataset_types: int = 3
+    """Number of per-visit, per-detector dataset types."""
+    runs: int = 2
+    """Number of RUN collections the per-visit datasets are spread over."""
+    calibration_collections: int = 1
+    """Number of CALIBRATION collections, each with one bias per detector."""
+    log_zip_files: int = 2
+    """Number of zip files the log datasets are packed into.  Zero to store
+    logs as individual files.
+    """
+
+
+class StageResult(pydantic.BaseModel):
+    seconds: float
+    rows: int
+    """Number of rows (or files, for the symlink stage) processed."""
+    rows_per_second: float
+    bytes: int
+    """Size of the export read or written by this stage."""
+    peak_rss_bytes: int
+    """Peak resident memory of the process running the stage."""
+
+
+class BenchmarkResult(pydantic.BaseModel):
+    format_version: int = BENCHMARK_FORMAT_VERSION
+    scale: BenchmarkScale
+    stages: dict[str, StageResult]
+
+
+def run_benchmark(scale: BenchmarkScale, work_directory: str) -> BenchmarkResult:
+    """Build a synthetic repository, then time the export, symlink and
+    import steps against it.
+    """
+    source_repo = os.path.join(work_directory, "source-repo")
+    dump_dir = os.path.join(work_directory, "dp1-dump")
+    symlink_dir = os.path.join(work_directory, "datastore_symlinks")
+    target_repo = os.path.join(work_directory, "target-repo")
+
+    dataset_types = create_synthetic_repo(source_repo, scale)
+    stages: dict[str, StageResult] = {}
+
+    def run_export() -> tuple[int, int]:
+        export(Butler(source_repo), _ROOT_COLLECTION, dataset_types, dump_dir)
+        return _get_export_size(dump_dir)
+
+    def run_symlinks() -> tuple[int, int]:
+        count = generate_file_tree(source_repo, symlink_dir, dump_dir)
+        return count, _get_export_size(dump_dir)[1]
+
+    def run_import() -> tuple[int, int]:
+        Butler.makeRepo(target_repo)
+        importer = Importer(dump_dir, Butler(target_repo, writeable=True), None)
+        importer.import_all(datastore_mapping=_identity_mapping)
+        return _get_export_size(dump_dir)
+
+    stages["export"] = _run_stage(run_export)
+    stages["symlinks"] = _run_stage(run_symlinks)
+    stages["import"] = _run_stage(run_import)
+    return BenchmarkResult(scale=scale, stages=stages)
+
+
+def create_synthetic_repo(root: str, scale: BenchmarkScale) -> list[str]:
+    """Create a local SQLite/POSIX repository filled with small datasets,
+    returning the names of the dataset types created.
+    """
+    makeTestRepo(root)
+    butler = Butler(root, writeable=True)
+    addDataIdValue(butler, "instrument", _INSTRUMENT)
+    addDataIdValue(butler, "physical_filter", _PHYSICAL_FILTER, band="r")
+    for detector in range(scale.detectors):
+        addDataIdValue(butler, "detector", detector)
+    for visit in range(scale.visits):
+        addDataIdValue(butler, "visit", visit, physical_filter=_PHYSICAL_FILTER)
+
+    runs = [f"benchmark/run{i}" for i in range(scale.runs)]
+    calibration_collections = [f"benchmark/calib{i}" for i in range(scale.calibration_collections)]
+    for run in runs:
+        butler.collections.register(run)
+    for collection in calibration_collections:
+        butler.collections.register(f"{collection}/run")
+        butler.collections.register(collection, CollectionType.CALIBRATION)
+    # Every child must be registered before the chain is defined.
+    butler.collections.register(_ROOT_COLLECTION, CollectionType.CHAINED)
+    butler.collections.redefine_chain(_ROOT_COLLECTION, [*runs, *calibration_collections])
+
+    dataset_types = []
+    per_visit_dimensions = {"instrument", "visit", "detector"}
+    for i in range(scale.dataset_types):
+        name = f"benchmark_{i}"
+        addDatasetType(butler, name, per_visit_dimensions, "StructuredDataDict")
+        dataset_types.append(name)
+        for visit in range(scale.visits):
+            run = runs[visit % len(runs)]
+            for detector in range(scale.detectors):
+                data_id = {"instrument": _INSTRUMENT, "visit": visit, "detector": detector}
+                butler.put({"visit": visit, "detector": detector}, name, data_id, run=run)
+
+    addDatasetType(butler, "benchmark_log", per_visit_dimensions, "StructuredDataDict")
+    dataset_types.append("benchmark_log")
+    log_refs = []
+    for visit in range(scale.visits):
+        for detector in range(scale.detectors):
+            data_id = {"instrument": _INSTRUMENT, "visit": visit, "detector": detector}
+            log_refs.append(butler.put({"log": []}, "benchmark_log", data_id, run=runs[0]))
+    if scale.log_zip_files > 0:
+        _zip_datasets(butler, log_refs, scale.log_zip_files, os.path.join(root, "zips"))
+
+    if calibration_collections:
+        butler.registry.registerDatasetType(
+            DatasetType(
+                "benchmark_bias",
+                butler.dimensions.conform(["instrument", "detector"]),
+                "StructuredDataDict",
+                isCalibration=True,
+            )
+        )
+        dataset_types.append("benchmark_bias")
+        for collection in calibration_collections:
+            calibration_run = f"{collection}/run"
+            refs = [
+                butler.put(
+                    {"detector": detector},
+                    "benchmark_bias",
+                    {"instrument": _INSTRUMENT, "detector": detector},
+                    run=calibration_run,
+                )
+                for detector in range(scale.detectors)
+            ]
+            butler.registry.certify(collection, refs, Timespan(None, None))
+
+    return dataset_types
+
+
+def _zip_datasets(butler: Butler, refs: list[DatasetRef], num_zip_files: int, zip_directory: str) -> None:
+    """Replace the files for the given datasets with zip files containing
+    several datasets each, the way logs are stored in production
+    repositories.
+    """
+    os.makedirs(zip_directory, exist_ok=True)
+    chunk_size = max(1, -(-len(refs) // num_zip_files))
+    for start in range(0, len(refs), chunk_size):
+        chunk = refs[start : start + chunk_size]
+        zip_path = butler.retrieve_artifacts_zip(chunk, zip_directory)
+        butler.pruneDatasets(chunk, purge=True, unstore=True, disassociate=True)
+        butler.ingest_zip(zip_path, transfer="move")
+
+
+def _identity_mapping(input: DatastoreMappingInput) -> DatastoreMappingInput:
+    return input
+
+
+def _get_export_size(dump_dir: str) -> tuple[int, int]:
+    paths = ExportPaths(dump_dir)
+    index = read_model_from_file(ExportIndex, paths.index_path())
+    rows = sum(f.num_rows for f in index.files.values())
+    size = sum(f.num_bytes for f in index.files.values())
+    return rows, size
+
+
+def _run_stage(stage: Callable[[], tuple[int, int]]) -> StageResult:
+    """Run a benchmark stage in a forked child process, so that its peak
+    memory use can be measured separately from the other stages.
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        exit_code = 0
+        try:
+            start = time.perf_counter()
+            rows, size = stage()
+            seconds = time.perf_counter() - start
+            output = json.dumps({"seconds": seconds, "rows": rows, "bytes": size})
+        except BaseException as e:
+            output = json.dumps({"error": repr(e)})
+            exit_code = 1
+        with os.fdopen(write_fd, "w") as pipe:
+            pipe.write(output)
+        os._exit(exit_code)
+
+    os.close(write_fd)
+    with os.fdopen(read_fd) as pipe:
+        output = pipe.read()
+    _, _, usage = os.wait4(pid, 0)
+    data = json.loads(output)
+    if "error" in data:
+        raise RuntimeError(f"Benchmark stage failed: {data['error']}")
+    seconds = data["seconds"]
+    return StageResult(
+        seconds=seconds,
+        rows=data["rows"],
+        rows_per_second=data["rows"] / seconds if seconds > 0 else 0.0,
+        bytes=data["bytes"],
+        peak_rss_bytes=_maxrss_to_bytes(usage.ru_maxrss),
+    )
+
+
+def _maxrss_to_bytes(maxrss: int) -> int:
+    # ru_maxrss is in kilobytes on Linux, but bytes on macOS.
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def compare_to_baseline(result: BenchmarkResult, baseline: BenchmarkResult, tolerance: float) -> list[str]:
+    """Return a description of each stage whose throughput dropped, or peak
+    memory grew, by more than ``tolerance`` (a fraction) relative to the
+    baseline.
+    """
+    if result.scale != baseline.scale:
+        return ["Benchmark scale does not match the baseline, so results are not comparable"]
+    regressions = []
+    for name, stage in result.stages.items():
+        base = baseline.stages.get(name)
+        if base is None:
+            continue
+        if stage.rows_per_second < base.rows_per_second * (1 - tolerance):
+            regressions.append(
+                f"{name}: {stage.rows_per_second:.0f} rows/s vs baseline {base.rows_per_second:.0f} rows/s"
+            )
+        if stage.peak_rss_bytes > base.peak_rss_bytes * (1 + tolerance):
+            regressions.append(
+                f"{name}: peak memory {stage.peak_rss_bytes} bytes vs baseline {base.peak_rss_bytes} bytes"
+            )
+    return regressions
+
+
+@click.command()
+@click.option("--visits", default=BenchmarkScale().visits)
+@click.option("--detectors", default=BenchmarkScale().detectors)
+@click.option("--dataset-types", default=BenchmarkScale().dataset_types)
+@click.option("--runs", default=BenchmarkScale().runs)
+@click.option("--calibration-collections", default=BenchmarkScale().calibration_collections)
+@click.option("--log-zip-files", default=BenchmarkScale().log_zip_files)
+@click.option("--output", help="File to write JSON results to.  Defaults to standard output")
+@click.option("--baseline", help="JSON results from a previous run to compare against")
+@click.option("--tolerance", default=0.1, help="Allowed fractional regression relative to the baseline")
+@click.option("--work-dir", help="Directory for the synthetic repositories.  Defaults to a temporary one")
+def main(
+    visits: int,
+    detectors: int,
+    dataset_types: int,
+    runs: int,
+    calibration_collections: int,
+    log_zip_files: int,
+    output: str | None,
+    baseline: str | None,
+    tolerance: float,
+    work_dir: str | None,
+) -> None:
+    """Measure the throughput of the export, symlink and import steps
+    against a synthetic repository.
+    """
+    scale = BenchmarkScale(
+        visits=visits,
+        detectors=detectors,
+        dataset_types=dataset_types,
+        runs=runs,
+        calibration_collections=calibration_collections,
+        log_zip_files=log_zip_files,
+    )
+    if work_dir is not None:
+        os.makedirs(work_dir)
+        result = run_benchmark(scale, work_dir)
+    else:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            result = run_benchmark(scale, tmpdir)
+
+    json_output = result.model_dump_json(indent=2)
+    if output is not None:
+        with open(output, "w") as file:
+            file.write(json_output)
+    else:
+        print(json_output)
+
+    if baseline is not None:
+        regressions = compare_to_baseline(result, read_model_from_file(BenchmarkResult, baseline), tolerance)
+        if regressions:
+            raise click.ClickException("Performance regressions found:\n" + "\n".join(regressions))
+
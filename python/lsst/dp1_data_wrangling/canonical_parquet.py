@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import pyarrow
+import pyarrow.compute
+import pyarrow.types
+from pyarrow.parquet import ParquetFile, write_table
+
+from .paths import ExportPaths
+
+CANONICAL_ROW_GROUP_SIZE = 50000
+"""Rows in each row group of a file rewritten by `write_canonical_parquet`.
+"""
+
+# Every option that affects the bytes written is given explicitly, so that
+# changes to pyarrow's defaults don't change the output.  The "created_by"
+# field still records the pyarrow version, so files are only reproducible
+# with the same version of pyarrow.
+_WRITE_OPTIONS = dict(
+    row_group_size=CANONICAL_ROW_GROUP_SIZE,
+    version="2.6",
+    data_page_version="1.0",
+    compression="snappy",
+    use_dictionary=True,
+    write_statistics=True,
+)
+
+
+def write_canonical_parquet(paths: ExportPaths, path: str, sort_columns: list[str]) -> None:
+    """Rewrite a parquet file so that its bytes depend only on the set of rows
+    it contains, not on the order they were written in.
+
+    Rows are sorted by ``sort_columns`` (the columns missing from the file
+    are skipped), which must identify each row uniquely.  Dictionaries are
+    sorted by value, schema metadata (e.g. the pandas version) is dropped and
+    the file is written with fixed row group sizes and writer options.
+
+    Parameters
+    ----------
+    paths
+        Export containing the file.
+    path
+        File to rewrite in place.
+    sort_columns
+        Columns to sort by, in order.  Dictionary-encoded columns sort by
+        value; struct and extension columns (e.g. timespans) sort by their
+        fields; list columns (e.g. ``healpix_pixels``) sort by their first
+        element.
+    """
+    reader = ParquetFile(paths.open_input(path))
+    try:
+        table = reader.read()
+    finally:
+        reader.close(force=True)
+    table = table.replace_schema_metadata(None)
+    table = pyarrow.table(
+        [_sort_dictionary(table.column(i)) for i in range(table.num_columns)], schema=table.schema
+    )
+
+    sort_keys = pyarrow.table(
+        {
+            f"{name}.{i}": array
+            for name in sort_columns
+            if name in table.column_names
+            for i, array in enumerate(_get_sort_arrays(table.column(name)))
+        }
+    )
+    if sort_keys.num_columns > 0:
+        indices = pyarrow.compute.sort_indices(
+            sort_keys,
+            sort_keys=[(name, "ascending") for name in sort_keys.column_names],
+            null_placement="at_end",
+        )
+        table = table.take(indices)
+
+    temporary_path = f"{path}.canonical"
+    write_table(table, temporary_path, filesystem=paths.filesystem, **_WRITE_OPTIONS)
+    paths.move(temporary_path, path)
+
+
+def _sort_dictionary(column: pyarrow.ChunkedArray) -> pyarrow.ChunkedArray:
+    """Re-encode a dictionary column with a single dictionary sorted by
+    value, instead of the order each value was first seen in.
+    """
+    if not pyarrow.types.is_dictionary(column.type):
+        return column
+    values = column.cast(column.type.value_type)
+    dictionary = pyarrow.compute.unique(values.combine_chunks().drop_null())
+    dictionary = dictionary.take(pyarrow.compute.sort_indices(dictionary))
+    indices = pyarrow.compute.index_in(values, value_set=dictionary).cast(column.type.index_type)
+    return pyarrow.chunked_array(
+        [pyarrow.DictionaryArray.from_arrays(chunk, dictionary) for chunk in indices.chunks], column.type
+    )
+
+
+def _get_sort_arrays(column: pyarrow.ChunkedArray) -> list[pyarrow.ChunkedArray]:
+    """Return arrays of plain values that sort the same way as ``column``."""
+    if isinstance(column.type, pyarrow.ExtensionType):
+        column = pyarrow.chunked_array([chunk.storage for chunk in column.chunks], column.type.storage_type)
+    if pyarrow.types.is_dictionary(column.type):
+        return [column.cast(column.type.value_type)]
+    if pyarrow.types.is_list(column.type):
+        return [pyarrow.compute.list_element(column, 0)]
+    if pyarrow.types.is_struct(column.type):
+        arrays = []
+        for i in range(column.type.num_fields):
+            arrays.extend(_get_sort_arrays(pyarrow.compute.struct_field(column, [i])))
+        return arrays
+    return [column]
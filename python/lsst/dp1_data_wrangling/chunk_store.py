@@ -0,0 +1,261 @@
+from __future__ import annotations
+
+import hashlib
+import io
+import os
+import pathlib
+from typing import Any, BinaryIO, NamedTuple
+
+import click
+import pydantic
+import pyarrow
+
+from .paths import DEFAULT_EXPORT_DIRECTORY, ExportPaths
+from .utils import read_model_from_file, write_model_to_file
+
+# Layout of a chunk store directory:
+#   manifest.json: JSON-serialized ChunkManifest.
+#   chunks/<first two hex digits>/<SHA-256 of the chunk>: the raw bytes of
+#     each chunk.
+#
+# Each file in the export is split into fixed-size chunks named by the hash
+# of their contents, so chunks shared by two exports (or two files) are
+# stored once.  Copying a store over an older copy of itself (e.g. with
+# rsync) only transfers the chunks that changed, as long as the export was
+# written with --deterministic so that unchanged files have the same bytes.
+
+MANIFEST_NAME = "manifest.json"
+DEFAULT_CHUNK_SIZE = 64 * 1024 * 1024
+_CHUNK_SUBDIRECTORY = "chunks"
+
+
+class ChunkedFile(pydantic.BaseModel):
+    size: int
+    chunks: list[str]
+    """SHA-256 hex digest of each chunk of the file, in order."""
+
+
+class ChunkManifest(pydantic.BaseModel):
+    chunk_size: int
+    files: dict[str, ChunkedFile]
+    """Mapping from path relative to the export directory to the chunks of
+    the file.
+    """
+
+
+class ChunkStoreReport(NamedTuple):
+    """Summary of an update to a chunk store."""
+
+    files: int
+    chunks: int
+    new_chunks: int
+    new_bytes: int
+    removed_chunks: int
+
+    def format(self) -> str:
+        return (
+            f"{self.files} files in {self.chunks} chunks; {self.new_chunks} new chunks "
+            f"({self.new_bytes} bytes) to transfer, {self.removed_chunks} unused chunks removed"
+        )
+
+
+def write_chunk_store(
+    input_directory: str, store_directory: str, chunk_size: int = DEFAULT_CHUNK_SIZE, prune: bool = True
+) -> ChunkStoreReport:
+    """Add the files in an export directory to a chunk store, replacing its
+    manifest.
+
+    Chunks already in the store are not rewritten.  The manifest is replaced
+    only after all of the new chunks have been written, so an interrupted
+    update leaves the store readable with its previous contents.  If
+    ``prune`` is `True`, chunks that the new manifest doesn't use are then
+    removed.
+    """
+    root = pathlib.Path(input_directory)
+    store = pathlib.Path(store_directory)
+    store.joinpath(_CHUNK_SUBDIRECTORY).mkdir(parents=True, exist_ok=True)
+    files: dict[str, ChunkedFile] = {}
+    used: set[str] = set()
+    new_chunks = 0
+    new_bytes = 0
+    for path in sorted(p for p in root.rglob("*") if p.is_file()):
+        digests = []
+        size = 0
+        with open(path, "rb") as input:
+            while chunk := input.read(chunk_size):
+                digest = hashlib.sha256(chunk).hexdigest()
+                digests.append(digest)
+                size += len(chunk)
+                if digest not in used and _write_chunk(store, digest, chunk):
+                    new_chunks += 1
+                    new_bytes += len(chunk)
+                used.add(digest)
+        files[path.relative_to(root).as_posix()] = ChunkedFile(size=size, chunks=digests)
+
+    manifest_path = store.joinpath(MANIFEST_NAME)
+    temporary_path = store.joinpath(f"{MANIFEST_NAME}.tmp")
+    write_model_to_file(ChunkManifest(chunk_size=chunk_size, files=files), str(temporary_path))
+    os.replace(temporary_path, manifest_path)
+
+    removed_chunks = 0
+    if prune:
+        for chunk_path in store.joinpath(_CHUNK_SUBDIRECTORY).glob("*/*"):
+            if chunk_path.name not in used:
+                chunk_path.unlink()
+                removed_chunks += 1
+    return ChunkStoreReport(
+        files=len(files),
+        chunks=len(used),
+        new_chunks=new_chunks,
+        new_bytes=new_bytes,
+        removed_chunks=removed_chunks,
+    )
+
+
+def _get_chunk_path(store: pathlib.Path, digest: str) -> pathlib.Path:
+    return store.joinpath(_CHUNK_SUBDIRECTORY, digest[:2], digest)
+
+
+def _write_chunk(store: pathlib.Path, digest: str, chunk: bytes) -> bool:
+    """Write a chunk to the store unless it is already there, returning
+    `True` if it was written.
+    """
+    chunk_path = _get_chunk_path(store, digest)
+    if chunk_path.exists() and chunk_path.stat().st_size == len(chunk):
+        return False
+    chunk_path.parent.mkdir(exist_ok=True)
+    # Write under a temporary name, so an interrupted write can't leave a
+    # truncated chunk under the name of its hash.
+    temporary_path = chunk_path.with_name(f"{digest}.tmp")
+    temporary_path.write_bytes(chunk)
+    os.replace(temporary_path, chunk_path)
+    return True
+
+
+def is_chunk_store(path: str) -> bool:
+    return os.path.isfile(os.path.join(path, MANIFEST_NAME))
+
+
+class ChunkStoreExportPaths(ExportPaths):
+    """`ExportPaths` that reads files from a chunk store written by
+    `write_chunk_store` instead of a directory.  Paths returned by this class
+    are paths relative to the export directory.
+    """
+
+    def __init__(self, store_directory: str) -> None:
+        super().__init__("")
+        self._store = pathlib.Path(store_directory)
+        self._manifest = read_model_from_file(ChunkManifest, str(self._store.joinpath(MANIFEST_NAME)))
+
+    def create_directories(self) -> None:
+        raise NotImplementedError("Chunk stores are read-only")
+
+    def exists(self, path: str) -> bool:
+        return path in self._manifest.files
+
+    def file_size(self, path: str) -> int:
+        return self._get_file(path).size
+
+    def open_input(self, path: str) -> pyarrow.NativeFile:
+        file = self._get_file(path)
+        if len(file.chunks) == 1:
+            return pyarrow.memory_map(str(_get_chunk_path(self._store, file.chunks[0])))
+        chunk_paths = [_get_chunk_path(self._store, digest) for digest in file.chunks]
+        return pyarrow.PythonFile(_ChunkedFileReader(chunk_paths, self._manifest.chunk_size, file.size), "r")
+
+    def relative_path(self, path: str) -> str:
+        return path
+
+    def _get_file(self, path: str) -> ChunkedFile:
+        file = self._manifest.files.get(path)
+        if file is None:
+            raise FileNotFoundError(f"No file '{path}' in chunk store")
+        return file
+
+
+class _ChunkedFileReader(io.RawIOBase):
+    """Seekable reader for a file stored as several chunks, which maps each
+    read onto the chunks it covers, so that only the bytes read are loaded.
+
+    Parameters
+    ----------
+    chunk_paths
+        Path of each chunk of the file, in order.
+    chunk_size
+        Size of every chunk but the last.
+    size
+        Size of the whole file.
+    """
+
+    def __init__(self, chunk_paths: list[pathlib.Path], chunk_size: int, size: int) -> None:
+        super().__init__()
+        self._chunk_paths = chunk_paths
+        self._chunk_size = chunk_size
+        self._size = size
+        self._position = 0
+        # Reads are mostly sequential, so the last chunk read is kept open.
+        self._chunk_index = -1
+        self._chunk: BinaryIO | None = None
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = self._size + offset
+        else:
+            raise ValueError(f"Invalid whence {whence}")
+        if position < 0:
+            raise ValueError(f"Negative seek position {position}")
+        self._position = position
+        return position
+
+    def readinto(self, buffer: Any) -> int:
+        view = memoryview(buffer).cast("B")
+        total = 0
+        while total < len(view) and self._position < self._size:
+            index, offset = divmod(self._position, self._chunk_size)
+            chunk = self._open_chunk(index)
+            chunk.seek(offset)
+            count = chunk.readinto(view[total : total + min(len(view) - total, self._chunk_size - offset)])
+            if not count:
+                raise OSError(f"Chunk {self._chunk_paths[index]} is shorter than expected")
+            total += count
+            self._position += count
+        return total
+
+    def close(self) -> None:
+        if self._chunk is not None:
+            self._chunk.close()
+            self._chunk = None
+        super().close()
+
+    def _open_chunk(self, index: int) -> BinaryIO:
+        if index != self._chunk_index or self._chunk is None:
+            if self._chunk is not None:
+                self._chunk.close()
+            self._chunk = open(self._chunk_paths[index], "rb")
+            self._chunk_index = index
+        return self._chunk
+
+
+@click.command("chunk")
+@click.option("--input-dir", default=DEFAULT_EXPORT_DIRECTORY)
+@click.option("--output", default=DEFAULT_EXPORT_DIRECTORY + "-chunks", help="Chunk store to update")
+@click.option("--chunk-size", default=DEFAULT_CHUNK_SIZE, help="Size in bytes of each chunk")
+@click.option("--prune/--no-prune", default=True, help="Remove chunks not used by the new export")
+def main(input_dir: str, output: str, chunk_size: int, prune: bool) -> None:
+    """Add an export directory to a content-addressed chunk store, so that
+    copying the store over an older copy only transfers changed chunks.
+    """
+    print(write_chunk_store(input_dir, output, chunk_size, prune).format())
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import graphlib
+from collections.abc import Iterable
+from typing import Any, NamedTuple
+
+import pyarrow
+import yaml
+from lsst.daf.butler import Butler, CollectionInfo, CollectionType
+from pyarrow.parquet import read_table, write_table
+
+COLLECTIONS_SCHEMA = pyarrow.schema(
+    [
+        pyarrow.field("name", pyarrow.string(), nullable=False),
+        pyarrow.field("type", pyarrow.string(), nullable=False),
+        pyarrow.field("doc", pyarrow.string()),
+        pyarrow.field("children", pyarrow.list_(pyarrow.string())),
+    ]
+)
+"""Schema of the collections file.  ``type`` is the name of the
+`CollectionType`.  ``children`` is the ordered list of children for
+CHAINED collections, and null for other collections.
+"""
+
+
+class ExportedCollection(NamedTuple):
+    """A collection as it is recorded in an export."""
+
+    name: str
+    type: CollectionType
+    doc: str | None
+    """Documentation for the collection, or `None` if it has none."""
+    children: list[str]
+    """Children of a CHAINED collection, in order.  Empty for other
+    collections.
+    """
+
+    @classmethod
+    def from_info(cls, info: CollectionInfo) -> ExportedCollection:
+        return cls(name=info.name, type=info.type, doc=info.doc or None, children=list(info.children))
+
+
+def write_collections_file(
+    output_file: str | pyarrow.NativeFile, collections: Iterable[ExportedCollection]
+) -> None:
+    """Write collections to a parquet file, sorted by name."""
+    rows = [
+        {
+            "name": c.name,
+            "type": c.type.name,
+            "doc": c.doc,
+            "children": c.children if c.type == CollectionType.CHAINED else None,
+        }
+        for c in sorted(collections, key=lambda c: c.name)
+    ]
+    write_table(pyarrow.Table.from_pylist(rows, schema=COLLECTIONS_SCHEMA), output_file)
+
+
+def read_collections_file(input_file: str | pyarrow.NativeFile) -> list[ExportedCollection]:
+    """Read collections written by `write_collections_file`."""
+    table = read_table(input_file, schema=COLLECTIONS_SCHEMA)
+    return [
+        ExportedCollection(
+            name=row["name"],
+            type=CollectionType.from_name(row["type"]),
+            doc=row["doc"],
+            children=row["children"] or [],
+        )
+        for row in table.to_pylist()
+    ]
+
+
+def read_collections_yaml(text: str) -> list[ExportedCollection]:
+    """Read the collections from a YAML file written by `Butler.export`, in
+    the order they appear in the file.
+    """
+    collections = []
+    for data in yaml.load(text, Loader=_ExportLoader)["data"]:
+        if data["type"] != "collection":
+            continue
+        collections.append(
+            ExportedCollection(
+                name=data["name"],
+                type=CollectionType.from_name(data["collection_type"]),
+                doc=data.get("doc") or None,
+                children=list(data.get("children", [])),
+            )
+        )
+    return collections
+
+
+def read_yaml_universe(text: str) -> tuple[str, int] | None:
+    """Return the namespace and version of the dimension universe recorded
+    in the header of a YAML file written by `Butler.export`, or `None` if
+    the header does not have them.
+    """
+    header = yaml.load(text, Loader=_ExportLoader)
+    if "universe_version" not in header:
+        return None
+    return header.get("universe_namespace", "daf_butler"), header["universe_version"]
+
+
+def sort_collections(collections: list[ExportedCollection]) -> list[ExportedCollection]:
+    """Return the collections sorted so that each collection comes after all
+    of its children.
+    """
+    by_name = {c.name: c for c in collections}
+    graph = {c.name: [child for child in c.children if child in by_name] for c in collections}
+    # Raises graphlib.CycleError for a chain that contains itself.
+    return [by_name[name] for name in graphlib.TopologicalSorter(graph).static_order()]
+
+
+def register_collections(butler: Butler, collections: list[ExportedCollection]) -> None:
+    """Register the given collections and define their chains, making the
+    same changes as importing them from YAML with `Butler.import_`.
+
+    Collections are registered children-first, then every chain is
+    defined in the same order, so a chain is never defined before a chain
+    it contains.  Existing collections are left in place, and existing
+    chains are redefined.
+    """
+    collections = sort_collections(collections)
+    for collection in collections:
+        butler.collections.register(collection.name, collection.type, doc=collection.doc)
+    for collection in collections:
+        if collection.type == CollectionType.CHAINED:
+            butler.collections.redefine_chain(collection.name, collection.children)
+
+
+class _ExportLoader(yaml.SafeLoader):
+    """YAML loader for `Butler.export` files that ignores values with custom
+    tags (e.g. the times in run timespans), which aren't needed to read the
+    collections.
+    """
+
+
+def _ignore_tagged_value(loader: yaml.Loader, suffix: str, node: yaml.Node) -> Any:
+    return None
+
+
+_ExportLoader.add_multi_constructor("!", _ignore_tagged_value)
@@ -0,0 +1,344 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import tempfile
+import uuid
+from collections.abc import Iterator
+from typing import Any, NamedTuple
+
+import click
+import numpy
+from pyarrow.parquet import ParquetFile
+
+from .archive import open_export
+from .dataset_ids import DATASET_ID_DTYPE, dataset_ids_to_numpy
+from .datastore_paths import join_path_columns
+from .index import ExportIndex, IndexFileInfo
+from .paths import DEFAULT_EXPORT_DIRECTORY, ExportPaths
+from .utils import read_model_from_file
+
+# The dataset ID index is a flat array of fixed-width records, sorted by
+# dataset ID.  Each record gives the location of one row containing that
+# dataset ID: the position of the file in ExportIndex.dataset_id_index_files,
+# and the row number within that file.  A dataset ID may have several
+# records, e.g. one for its datasets file and one or more for the datastore
+# file.  Records with the same dataset ID are ordered by file number, and
+# datasets files are numbered before the datastore file.
+INDEX_RECORD_DTYPE = numpy.dtype([("id", DATASET_ID_DTYPE), ("file", "<u4"), ("row", "<u8")])
+
+_BATCH_SIZE = 100000
+
+# Records are spilled to one temporary file per value of the first byte of
+# the dataset ID while the index is built, so only one bucket (about 1/256
+# of the index) is sorted in memory at a time.
+_NUM_BUCKETS = 256
+
+_HASH_BLOCK_SIZE = 16 * 1024 * 1024
+
+
+def build_dataset_id_index(paths: ExportPaths, files: list[str], output_path: str) -> IndexFileInfo:
+    """Write a dataset ID index covering the given parquet files, returning
+    the size and hash of the index file.
+
+    Parameters
+    ----------
+    paths
+        Export containing the files.
+    files
+        Paths of the files to index.  The index refers to files by their
+        position in this list, which must also be recorded in
+        `ExportIndex.dataset_id_index_files`.
+    output_path
+        Path to write the index to.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        bucket_paths = [os.path.join(directory, f"{i:02x}") for i in range(_NUM_BUCKETS)]
+        buckets = [open(path, "wb") for path in bucket_paths]
+        try:
+            for file_number, path in enumerate(files):
+                for chunk in _iter_index_records(paths, path, file_number):
+                    # The ID is the first field of each record.
+                    first_bytes = chunk.view(numpy.uint8).reshape(len(chunk), -1)[:, 0]
+                    # Records are appended to each bucket in file and row
+                    # order.
+                    order = numpy.argsort(first_bytes, kind="stable")
+                    bounds = numpy.searchsorted(first_bytes[order], numpy.arange(_NUM_BUCKETS + 1))
+                    for i in numpy.flatnonzero(bounds[1:] > bounds[:-1]):
+                        buckets[i].write(chunk[order[bounds[i] : bounds[i + 1]]].tobytes())
+        finally:
+            for bucket in buckets:
+                bucket.close()
+
+        checksum = hashlib.sha256()
+        num_bytes = 0
+        with paths.open_output(output_path) as output:
+            for bucket_path in bucket_paths:
+                records = numpy.fromfile(bucket_path, dtype=INDEX_RECORD_DTYPE)
+                # A stable sort keeps records for the same ID in file order.
+                data = records[numpy.argsort(records["id"], kind="stable")].tobytes()
+                output.write(data)
+                checksum.update(data)
+                num_bytes += len(data)
+                os.remove(bucket_path)
+    return IndexFileInfo(num_bytes=num_bytes, sha256=checksum.hexdigest())
+
+
+def _iter_index_records(paths: ExportPaths, path: str, file_number: int) -> Iterator[numpy.ndarray]:
+    row = 0
+    reader = ParquetFile(paths.open_input(path))
+    try:
+        for batch in reader.iter_batches(batch_size=_BATCH_SIZE, columns=["dataset_id"]):
+            chunk = numpy.empty(batch.num_rows, dtype=INDEX_RECORD_DTYPE)
+            chunk["id"] = dataset_ids_to_numpy(batch.column(0))
+            chunk["file"] = file_number
+            chunk["row"] = numpy.arange(row, row + batch.num_rows)
+            row += batch.num_rows
+            yield chunk
+    finally:
+        reader.close(force=True)
+
+
+def check_dataset_id_index(paths: ExportPaths, expected: IndexFileInfo) -> list[str]:
+    """Compare the dataset ID index file against the size and hash recorded
+    for it at export time, returning a description of each difference
+    found.
+    """
+    path = paths.dataset_id_index_path()
+    if not paths.exists(path):
+        return [f"{path}: file is missing"]
+    num_bytes = paths.file_size(path)
+    if num_bytes != expected.num_bytes:
+        return [f"{path}: expected {expected.num_bytes} bytes, found {num_bytes}"]
+    checksum = hashlib.sha256()
+    with paths.open_input(path) as input:
+        while block := input.read(_HASH_BLOCK_SIZE):
+            checksum.update(block)
+    if checksum.hexdigest() != expected.sha256:
+        return [f"{path}: contents do not match the hash recorded at export time"]
+    return []
+
+
+class DatasetLocation(NamedTuple):
+    file: str
+    """Path of the parquet file containing the row, relative to the root of
+    the export.
+    """
+    row: int
+    """Row number within the file."""
+
+
+class DatasetIdIndex:
+    """Point lookups of dataset IDs in an export, using the index written by
+    `build_dataset_id_index`.
+
+    The index is memory-mapped when the export is a local directory, and
+    lookups are binary searches, so only a few pages of the index are
+    touched for each lookup.  Call `close` (or use the index as a context
+    manager) to release the file.
+    """
+
+    def __init__(self, paths: ExportPaths, index: ExportIndex) -> None:
+        if not index.dataset_id_index_files:
+            raise ValueError("This export does not include a dataset ID index")
+        self._paths = paths
+        self._files = index.dataset_id_index_files
+        self._file_numbers = {name: i for i, name in enumerate(self._files)}
+        self._input = paths.open_input(paths.dataset_id_index_path())
+        self._records = numpy.frombuffer(self._input.read_buffer(), dtype=INDEX_RECORD_DTYPE)
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __enter__(self) -> DatasetIdIndex:
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        # Drop the array first, since it refers to the mapped memory.
+        self._records = numpy.empty(0, dtype=INDEX_RECORD_DTYPE)
+        self._input.close()
+
+    def find(self, dataset_id: uuid.UUID) -> list[DatasetLocation]:
+        """Return the location of every row containing the given dataset
+        ID.
+        """
+        query = numpy.array([dataset_id.bytes], dtype=DATASET_ID_DTYPE)
+        start = _lower_bound(self._records["id"], query)[0]
+        locations = []
+        for record in self._records[start:]:
+            if record["id"] != query[0]:
+                break
+            locations.append(DatasetLocation(file=self._files[record["file"]], row=int(record["row"])))
+        return locations
+
+    def contains(self, ids: numpy.ndarray, files: list[str]) -> numpy.ndarray:
+        """Return a boolean mask indicating which of ``ids`` are present in
+        any of the given datasets files.
+
+        Parameters
+        ----------
+        ids
+            Dataset IDs to look up, as returned by `dataset_ids_to_numpy`.
+        files
+            Datasets files to search, as paths relative to the export root.
+        """
+        file_numbers = numpy.array([self._file_numbers[f] for f in files], dtype="<u4")
+        if len(self._records) == 0:
+            return numpy.zeros(len(ids), dtype=bool)
+        positions = _lower_bound(self._records["id"], ids)
+        positions[positions == len(self._records)] = 0
+        # Because records for the same ID are sorted by file number and
+        # datasets files come first, the first record for an ID is its
+        # datasets file record.
+        first = self._records[positions]
+        return (first["id"] == ids) & numpy.isin(first["file"], file_numbers)
+
+    def find_row_groups(self, file: str, dataset_files: list[str]) -> list[int]:
+        """Return the row groups of ``file`` that have rows for any of the
+        datasets in the given datasets files.
+
+        The dataset IDs of the datasets files are read in batches, and each
+        batch is looked up with binary searches, so only the parts of the
+        index for those datasets are touched.
+
+        Parameters
+        ----------
+        file
+            File to find row groups in (e.g. the datastore file), as a path
+            relative to the export root.
+        dataset_files
+            Datasets files to search, as paths relative to the export root.
+        """
+        file_number = self._file_numbers[file]
+        reader = ParquetFile(self._paths.open_input(self._paths.path_from_relative(file)))
+        try:
+            metadata = reader.metadata
+            counts = numpy.array([metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)])
+        finally:
+            reader.close(force=True)
+        ends = numpy.cumsum(counts)
+
+        row_groups: set[int] = set()
+        for dataset_file in dataset_files:
+            for chunk in _iter_index_records(
+                self._paths, self._paths.path_from_relative(dataset_file), self._file_numbers[dataset_file]
+            ):
+                rows = self._find_rows(chunk["id"], file_number)
+                row_groups.update(numpy.searchsorted(ends, rows.astype(numpy.int64), side="right").tolist())
+        return sorted(row_groups)
+
+    def _find_rows(self, ids: numpy.ndarray, file_number: int) -> numpy.ndarray:
+        """Return the row numbers in the given file of every record for the
+        given dataset IDs.
+        """
+        rows = []
+        positions = _lower_bound(self._records["id"], ids)
+        # The records for an ID are contiguous, so step through them for all
+        # of the IDs at once until every ID has run out of records.
+        while len(ids) > 0:
+            in_range = positions < len(self._records)
+            ids, positions = ids[in_range], positions[in_range]
+            records = self._records[positions]
+            same_id = records["id"] == ids
+            ids, positions, records = ids[same_id], positions[same_id], records[same_id]
+            rows.append(records["row"][records["file"] == file_number])
+            positions = positions + 1
+        return numpy.concatenate(rows) if rows else numpy.empty(0, dtype="<u8")
+
+
+def _lower_bound(sorted_values: numpy.ndarray, queries: numpy.ndarray) -> numpy.ndarray:
+    """Vectorized equivalent of ``numpy.searchsorted(side="left")``.
+
+    ``numpy.searchsorted`` makes a contiguous copy of a strided input, which
+    would mean copying the whole index on every call.
+    """
+    lo = numpy.zeros(len(queries), dtype=numpy.int64)
+    hi = numpy.full(len(queries), len(sorted_values), dtype=numpy.int64)
+    while True:
+        active = numpy.flatnonzero(lo < hi)
+        if len(active) == 0:
+            return lo
+        mid = (lo[active] + hi[active]) // 2
+        less = sorted_values[mid] < queries[active]
+        lo[active[less]] = mid[less] + 1
+        hi[active[~less]] = mid[~less]
+
+
+class DatasetRecord(NamedTuple):
+    dataset_type: str
+    """Name of the dataset type."""
+    dataset: dict[str, object]
+    """Row from the datasets file: the dataset ID, run and data ID values."""
+    datastore: list[dict[str, object]]
+    """Rows from the datastore file for this dataset."""
+
+
+def lookup_dataset(input_path: str, dataset_id: uuid.UUID) -> DatasetRecord | None:
+    """Find everything the export contains about a single dataset, or return
+    `None` if the dataset is not in the export.
+    """
+    paths = open_export(input_path)
+    index = read_model_from_file(ExportIndex, paths.open_input(paths.index_path()))
+    with DatasetIdIndex(paths, index) as id_index:
+        locations = id_index.find(dataset_id)
+    if not locations:
+        return None
+
+    datastore_file = paths.relative_path(paths.datastore_parquet_path())
+    dataset_type = None
+    dataset: dict[str, object] = {}
+    datastore = []
+    for location in locations:
+        row = _read_row(paths, location)
+        if location.file == datastore_file:
+            datastore.append(row)
+        else:
+            dataset_type = location.file.rsplit("/", 1)[-1]
+            dataset = row
+    assert dataset_type is not None, "Datastore row found for a dataset without a datasets file entry"
+    return DatasetRecord(dataset_type=dataset_type, dataset=dataset, datastore=datastore)
+
+
+def _read_row(paths: ExportPaths, location: DatasetLocation) -> dict[str, object]:
+    reader = ParquetFile(paths.open_input(paths.path_from_relative(location.file)))
+    try:
+        metadata = reader.metadata
+        start = 0
+        for row_group in range(metadata.num_row_groups):
+            num_rows = metadata.row_group(row_group).num_rows
+            if location.row < start + num_rows:
+                table = reader.read_row_group(row_group)
+                return join_path_columns(table.slice(location.row - start, 1)).to_pylist()[0]
+            start += num_rows
+        raise IndexError(f"Row {location.row} is past the end of {location.file}")
+    finally:
+        reader.close(force=True)
+
+
+def _format_value(value: object) -> str:
+    if isinstance(value, bytes) and len(value) == 16:
+        return str(uuid.UUID(bytes=value))
+    return str(value)
+
+
+@click.command("lookup")
+@click.argument("dataset_id")
+@click.option("--input-dir", default=DEFAULT_EXPORT_DIRECTORY)
+def main(dataset_id: str, input_dir: str) -> None:
+    """Show the dataset type, run, data ID and datastore records for a
+    dataset ID.
+    """
+    result = lookup_dataset(input_dir, uuid.UUID(dataset_id))
+    if result is None:
+        raise click.ClickException(f"Dataset {dataset_id} is not in the export")
+    print(f"dataset_type: {result.dataset_type}")
+    for key, value in result.dataset.items():
+        print(f"{key}: {_format_value(value)}")
+    for row in result.datastore:
+        print("datastore:")
+        for key, value in row.items():
+            print(f"    {key}: {_format_value(value)}")
+
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import uuid
+
+import numpy
+import pyarrow
+import pyarrow.types
+
+DATASET_ID_DTYPE = numpy.dtype("S16")
+"""numpy representation of a dataset ID: a fixed-width 16 byte string, which
+can be sorted and searched without creating a Python object for each ID.
+"""
+
+
+def dataset_ids_to_numpy(column: pyarrow.Array) -> numpy.ndarray:
+    """Convert a parquet column of 16-byte dataset IDs to a numpy array."""
+    if pyarrow.types.is_fixed_size_binary(column.type):
+        values = numpy.frombuffer(column.buffers()[1], dtype=DATASET_ID_DTYPE)
+        return values[column.offset : column.offset + len(column)].copy()
+
+    # The datastore file has its schema inferred by pyarrow, so dataset IDs
+    # there are variable-width binary.  Every value is 16 bytes long, so the
+    # data buffer can be reinterpreted directly.
+    offset_type = numpy.int64 if pyarrow.types.is_large_binary(column.type) else numpy.int32
+    offsets = numpy.frombuffer(column.buffers()[1], dtype=offset_type)
+    offsets = offsets[column.offset : column.offset + len(column) + 1]
+    if not numpy.all(numpy.diff(offsets) == 16):
+        raise ValueError("Dataset IDs are expected to be 16 bytes long")
+    data = numpy.frombuffer(column.buffers()[2], dtype=numpy.uint8)[offsets[0] : offsets[-1]]
+    return data.view(DATASET_ID_DTYPE).copy()
+
+
+def contains_dataset_ids(sorted_ids: numpy.ndarray, ids: numpy.ndarray) -> numpy.ndarray:
+    """Return a boolean mask indicating which of ``ids`` are present in the
+    sorted array ``sorted_ids``.
+    """
+    if len(sorted_ids) == 0:
+        return numpy.zeros(len(ids), dtype=bool)
+    positions = numpy.searchsorted(sorted_ids, ids)
+    positions[positions == len(sorted_ids)] = 0
+    return sorted_ids[positions] == ids
+
+
+def get_dataset_id_bytes(value: object) -> bytes:
+    """Convert a dataset ID returned by a database query to 16 bytes.
+    Depending on the database, IDs come back as UUID objects or as hex
+    strings.
+    """
+    if isinstance(value, uuid.UUID):
+        return value.bytes
+    if isinstance(value, str):
+        return uuid.UUID(value).bytes
+    assert isinstance(value, bytes), f"Unexpected dataset ID value: {value!r}"
+    return value
+
+
+def format_dataset_id(value: bytes) -> str:
+    # numpy strips trailing null bytes when converting fixed-width byte
+    # strings back to Python.
+    return value.ljust(16, b"\0").hex()
+
+
+class DatasetIdSet:
+    """Set of dataset IDs stored as a sorted numpy array.
+
+    IDs are appended into a buffer that can be pre-sized when the number of
+    IDs is known in advance, then sorted once by `freeze` before membership
+    checks.
+
+    Parameters
+    ----------
+    capacity
+        Expected number of IDs.  The buffer grows if more are added.
+    """
+
+    def __init__(self, capacity: int = 0) -> None:
+        self._ids = numpy.empty(max(capacity, 1024), dtype=DATASET_ID_DTYPE)
+        self._size = 0
+        self._frozen = False
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, ids: numpy.ndarray) -> None:
+        assert not self._frozen, "Can't add IDs after freeze()"
+        end = self._size + len(ids)
+        if end > len(self._ids):
+            new_ids = numpy.empty(max(end, 2 * len(self._ids)), dtype=DATASET_ID_DTYPE)
+            new_ids[: self._size] = self._ids[: self._size]
+            self._ids = new_ids
+        self._ids[self._size : end] = ids
+        self._size = end
+
+    def freeze(self) -> None:
+        self._ids = numpy.sort(self._ids[: self._size])
+        self._frozen = True
+
+    def contains(self, ids: numpy.ndarray) -> numpy.ndarray:
+        assert self._frozen, "Must call freeze() before checking membership"
+        return contains_dataset_ids(self._ids, ids)
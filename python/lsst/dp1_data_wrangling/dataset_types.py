@@ -1,19 +1,48 @@
+import pyarrow
 import pydantic
-from lsst.daf.butler import DatasetType, DimensionUniverse, SerializedDatasetType
+from lsst.daf.butler import DatasetType, DimensionConfig, DimensionUniverse, SerializedDatasetType
 
+from .collections_parquet import read_yaml_universe
+from .index import ExportIndex
+from .paths import ExportPaths
 from .utils import read_model_from_file, write_model_to_file
 
 
-def export_dataset_types(output_file: str, dataset_types: list[DatasetType]) -> None:
+def export_dataset_types(output_file: str | pyarrow.NativeFile, dataset_types: list[DatasetType]) -> None:
     serialized = [dt.to_simple() for dt in dataset_types]
     model = DatasetTypeExport(dataset_types=serialized)
     write_model_to_file(model, output_file)
 
 
-def import_dataset_types(input_file: str, universe: DimensionUniverse) -> list[DatasetType]:
+def import_dataset_types(
+    input_file: str | pyarrow.NativeFile, universe: DimensionUniverse
+) -> list[DatasetType]:
     model = read_model_from_file(DatasetTypeExport, input_file)
     return [DatasetType.from_simple(dt, universe=universe) for dt in model.dataset_types]
 
 
 class DatasetTypeExport(pydantic.BaseModel):
     dataset_types: list[SerializedDatasetType]
+
+
+def load_export_universe(paths: ExportPaths, index: ExportIndex) -> DimensionUniverse:
+    """Return the dimension universe of the repository an export was written
+    from.
+
+    The universe is recorded in the export index.  For older exports, it is
+    read from the header of the YAML collections file, and the current
+    default universe is used if neither has it.
+    """
+    universe: tuple[str, int] | None = None
+    if index.universe_namespace is not None and index.universe_version is not None:
+        universe = (index.universe_namespace, index.universe_version)
+    elif paths.exists(paths.collections_path()):
+        universe = read_yaml_universe(paths.read_text(paths.collections_path()))
+    default = DimensionUniverse()
+    if universe is None or universe == (default.namespace, default.version):
+        return default
+    namespace, version = universe
+    # daf_butler ships the configurations of older universe versions, for
+    # reading old repositories and exports.
+    config_uri = f"resource://lsst.daf.butler/configs/old_dimensions/{namespace}_universe{version}.yaml"
+    return DimensionUniverse(DimensionConfig(config_uri))
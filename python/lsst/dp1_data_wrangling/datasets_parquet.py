@@ -3,6 +3,7 @@ from __future__ import annotations
 from collections.abc import Iterable, Iterator
 
 import pyarrow
+import pyarrow.fs
 import pyarrow.types
 from lsst.daf.butler import (
     DatasetAssociation,
@@ -14,30 +15,42 @@ from lsst.daf.butler import (
 from lsst.daf.butler.arrow_utils import TimespanArrowType
 from pyarrow.parquet import ParquetFile, ParquetWriter
 
-from .utils import convert_parquet_uuid_to_dataset_id
+from .memory_budget import BatchSizer, MemoryBudget, iter_parquet_batches
+from .utils import DEFAULT_BATCH_SIZE, convert_parquet_uuid_to_dataset_id
 
 
 class DatasetsParquetWriter:
-    def __init__(self, dataset_type: DatasetType, output_file: str) -> None:
+    def __init__(
+        self, dataset_type: DatasetType, output_file: str, filesystem: pyarrow.fs.FileSystem | None = None
+    ) -> None:
         self._schema = _create_dataset_arrow_schema(dataset_type, [])
-        self._writer = ParquetWriter(output_file, self._schema)
+        self._writer = ParquetWriter(output_file, self._schema, filesystem=filesystem)
 
-    def add_refs(self, refs: Iterable[DatasetRef]) -> None:
+    def add_refs(self, refs: Iterable[DatasetRef]) -> int:
+        """Write rows for the given refs, returning their size in bytes."""
         rows = [_convert_ref_to_row(ref) for ref in refs]
         batch = pyarrow.RecordBatch.from_pylist(rows, schema=self._schema)
         self._writer.write(batch)
+        return batch.nbytes
 
     def finish(self) -> None:
         self._writer.close()
 
 
-def read_dataset_refs_from_file(dataset_type: DatasetType, input_file: str) -> Iterator[list[DatasetRef]]:
-    for batch in _read_rows_from_parquet(input_file):
+def read_dataset_refs_from_file(
+    dataset_type: DatasetType,
+    input_file: str | pyarrow.NativeFile,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    sizer: BatchSizer | None = None,
+) -> Iterator[list[DatasetRef]]:
+    for batch in _read_rows_from_parquet(input_file, batch_size, sizer):
         yield [_convert_row_to_ref(dataset_type, row) for row in batch]
 
 
 class DatasetAssociationParquetWriter:
-    def __init__(self, dataset_type: DatasetType, output_file: str) -> None:
+    def __init__(
+        self, dataset_type: DatasetType, output_file: str, filesystem: pyarrow.fs.FileSystem | None = None
+    ) -> None:
         self._schema = _create_dataset_arrow_schema(
             dataset_type,
             [
@@ -47,21 +60,28 @@ class DatasetAssociationParquetWriter:
                 pyarrow.field("timespan", TimespanArrowType(), nullable=True),
             ],
         )
-        self._writer = ParquetWriter(output_file, self._schema)
+        self._writer = ParquetWriter(output_file, self._schema, filesystem=filesystem)
 
-    def add_associations(self, associations: Iterable[DatasetAssociation]) -> None:
+    def add_associations(self, associations: Iterable[DatasetAssociation]) -> int:
+        """Write rows for the given associations, returning their size in
+        bytes.
+        """
         rows = [_convert_association_to_row(association) for association in associations]
         batch = pyarrow.RecordBatch.from_pylist(rows, schema=self._schema)
         self._writer.write(batch)
+        return batch.nbytes
 
     def finish(self) -> None:
         self._writer.close()
 
 
 def read_dataset_associations_from_file(
-    dataset_type: DatasetType, input_file: str
+    dataset_type: DatasetType,
+    input_file: str | pyarrow.NativeFile,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    sizer: BatchSizer | None = None,
 ) -> Iterator[list[DatasetAssociation]]:
-    for batch in _read_rows_from_parquet(input_file):
+    for batch in _read_rows_from_parquet(input_file, batch_size, sizer):
         yield [_convert_row_to_association(dataset_type, row) for row in batch]
 
 
@@ -121,11 +141,17 @@ def _convert_timespan_to_dict(value: Timespan | None) -> dict[str, int] | None:
     return {"begin_nsec": value.nsec[0], "end_nsec": value.nsec[1]} if value is not None else None
 
 
-def _read_rows_from_parquet(input_file: str) -> Iterator[list[dict[str, object]]]:
-    batch_size = 10000
+def _read_rows_from_parquet(
+    input_file: str | pyarrow.NativeFile, batch_size: int, sizer: BatchSizer | None
+) -> Iterator[list[dict[str, object]]]:
+    """Read rows in batches of ``batch_size`` rows, or of the size chosen by
+    ``sizer`` if it is given.
+    """
     reader = ParquetFile(input_file)
+    sizer = sizer if sizer is not None else MemoryBudget().open("datasets", batch_size)
     try:
-        for batch in reader.iter_batches(batch_size=batch_size):
+        for batch in iter_parquet_batches(reader, sizer):
             yield batch.to_pylist()
     finally:
-        reader.close()
+        # Also closes input_file, if it was passed in as an open file.
+        reader.close(force=True)
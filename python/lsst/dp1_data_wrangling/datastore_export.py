@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import numpy
+import pyarrow
+import sqlalchemy
+from lsst.daf.butler import Butler
+
+from .dataset_ids import (
+    DATASET_ID_DTYPE,
+    DatasetIdSet,
+    contains_dataset_ids,
+    dataset_ids_to_numpy,
+    get_dataset_id_bytes,
+)
+from .datastore_mapping import find_file_datastore
+from .datastore_parquet import DatastoreParquetWriter
+from .memory_budget import MemoryBudget
+
+MAX_ROWS_PER_SCAN_BATCH = 500000
+"""Largest number of rows fetched from a datastore records table at once.
+"""
+
+# Types in the export of the Python types of the records table's columns.
+_COLUMN_TYPES = {str: pyarrow.string(), int: pyarrow.int64()}
+
+
+class BulkDatastoreExporter:
+    """Write the datastore records for a set of datasets by scanning the
+    records table of each FileDatastore once, instead of calling
+    `Datastore.export_records` for each batch of refs.
+
+    Rows are streamed from the database in batches sized to fit in the
+    memory budget, filtered against the exported dataset IDs with numpy, and
+    written as Arrow columns without creating `StoredFileInfo` objects.
+
+    Only SQL registries and FileDatastores (possibly inside a
+    ChainedDatastore) are supported.
+
+    Parameters
+    ----------
+    butler
+        Butler for the source repository.
+    writer
+        Writer for the export's datastore records file.
+    memory_budget
+        Budget used to size the batches of rows fetched.
+    """
+
+    def __init__(
+        self, butler: Butler, writer: DatastoreParquetWriter, memory_budget: MemoryBudget | None = None
+    ) -> None:
+        self._butler = butler
+        self._engine: sqlalchemy.engine.Engine = butler._registry._db._engine
+        self._writer = writer
+        self._budget = memory_budget if memory_budget is not None else MemoryBudget()
+
+    def export(self, dataset_ids: DatasetIdSet) -> int:
+        """Write the records of the given (frozen) set of datasets, returning
+        the number of rows written.
+
+        Datastores are scanned in the priority order of
+        ``Datastore.names``.  As in `DatastoreParquetWriter.write_records`,
+        a dataset with records in more than one datastore only gets the
+        records from the first of them.
+        """
+        claimed = numpy.empty(0, dtype=DATASET_ID_DTYPE)
+        rows = 0
+        for datastore_name in self._butler._datastore.names:
+            found = self._export_datastore(datastore_name, dataset_ids, claimed)
+            rows += len(found)
+            claimed = numpy.union1d(claimed, found)
+        return rows
+
+    def _export_datastore(
+        self, datastore_name: str, dataset_ids: DatasetIdSet, claimed: numpy.ndarray
+    ) -> numpy.ndarray:
+        """Write the records in one datastore for datasets in ``dataset_ids``
+        and not in the sorted array ``claimed``, returning the dataset ID of
+        each row written.
+        """
+        table = find_file_datastore(self._butler._datastore, datastore_name)._table._table
+        columns = _get_record_columns(table)
+        query = sqlalchemy.select(table.c.dataset_id, *(table.c[name] for name in columns))
+        sizer = self._budget.open(f"datastore records/{datastore_name}", MAX_ROWS_PER_SCAN_BATCH)
+        found = [numpy.empty(0, dtype=DATASET_ID_DTYPE)]
+        with self._engine.connect() as connection:
+            result = connection.execution_options(stream_results=True).execute(query)
+            while rows := result.fetchmany(sizer.next_batch_size()):
+                batch = _make_batch(datastore_name, columns, rows)
+                ids = dataset_ids_to_numpy(batch.column("dataset_id"))
+                mask = dataset_ids.contains(ids) & ~contains_dataset_ids(claimed, ids)
+                found.append(ids[mask])
+                selected = batch.filter(pyarrow.array(mask))
+                if selected.num_rows > 0:
+                    self._writer.write_table(pyarrow.Table.from_batches([selected]))
+                # Every row fetched is held in memory, not just the ones kept.
+                sizer.record(len(rows), batch.nbytes)
+        sizer.close()
+        return numpy.concatenate(found)
+
+
+def _get_record_columns(table: sqlalchemy.Table) -> dict[str, pyarrow.DataType]:
+    """Return the columns of a FileDatastore records table other than
+    ``dataset_id``, with their types in the export.
+    """
+    columns = {}
+    for column in table.c:
+        if column.name == "dataset_id":
+            continue
+        value_type = _COLUMN_TYPES.get(column.type.python_type)
+        if value_type is None:
+            raise NotImplementedError(
+                f"Unsupported type {column.type} for column {column.name} of {table.name}."
+            )
+        columns[column.name] = value_type
+    return columns
+
+
+def _make_batch(
+    datastore_name: str, columns: dict[str, pyarrow.DataType], rows: list[sqlalchemy.Row]
+) -> pyarrow.RecordBatch:
+    values = list(zip(*rows))
+    arrays = {
+        "datastore_name": pyarrow.array([datastore_name] * len(rows), pyarrow.string()),
+        "dataset_id": pyarrow.array([get_dataset_id_bytes(v) for v in values[0]], pyarrow.binary()),
+    }
+    for (name, value_type), column_values in zip(columns.items(), values[1:]):
+        arrays[name] = pyarrow.array(column_values, value_type)
+    return pyarrow.RecordBatch.from_pydict(arrays)
@@ -1,24 +1,12 @@
 from __future__ import annotations
 
-from typing import Callable, NamedTuple, TypeAlias
-
 from lsst.daf.butler import DatasetId, Datastore
 from lsst.daf.butler.datastore.record_data import DatastoreRecordData
 from lsst.daf.butler.datastores.chainedDatastore import ChainedDatastore
 from lsst.daf.butler.datastores.fileDatastore import FileDatastore, StoredFileInfo
 
 from .datastore_parquet import DatastoreRow
-
-
-class DatastoreMappingInput(NamedTuple):
-    datastore_name: str
-    path: str
-
-
-DatastoreMappingFunction: TypeAlias = Callable[[DatastoreMappingInput], DatastoreMappingInput]
-"""Input is datastore record information from the source repository.  Output is
-that information mapped to the target repository.
-"""
+from .path_mapping import DatastoreMappingFunction, DatastoreMappingInput
 
 
 class DatastoreMapper:
@@ -40,17 +28,20 @@ class DatastoreMapper:
         """Given a flat list of records, generate the nested structure
         expected by ``Datastore.import_records()``.
         """
+        return self.group_for_target(map_datastore_rows(records, self._mapping))
+
+    def group_for_target(self, records: list[DatastoreRow]) -> dict[str, DatastoreRecordData]:
+        """Generate the nested structure expected by
+        ``Datastore.import_records()`` from records that have already been
+        mapped by `map_datastore_rows`.
+        """
         # Group rows by datastore and dataset ID.
         # Datastore name -> (dataset UUID -> list of file info objects)
         values: dict[str, dict[DatasetId, list[StoredFileInfo]]] = {}
         for r in records:
-            output_destination = self._mapping(
-                DatastoreMappingInput(datastore_name=r.datastore_name, path=r.file_info.path)
-            )
-            file_info = r.file_info.update(path=output_destination.path)
-            datasets = values.setdefault(output_destination.datastore_name, {})
+            datasets = values.setdefault(r.datastore_name, {})
             item_infos = datasets.setdefault(r.dataset_id, [])
-            item_infos.append(file_info)
+            item_infos.append(r.file_info)
 
         # Add extra intermediate data structures to match format expected by
         # Datastore.import_records.
@@ -71,10 +62,37 @@ class DatastoreMapper:
         return table_name
 
 
-def _find_table_name(datastore: Datastore, datastore_name: str) -> str:
+def map_datastore_rows(records: list[DatastoreRow], mapping: DatastoreMappingFunction) -> list[DatastoreRow]:
+    """Apply a mapping function to the datastore name and path of each
+    record.
+    """
+    mapped = []
+    for r in records:
+        output_destination = mapping(
+            DatastoreMappingInput(datastore_name=r.datastore_name, path=r.file_info.path)
+        )
+        mapped.append(
+            DatastoreRow(
+                datastore_name=output_destination.datastore_name,
+                dataset_id=r.dataset_id,
+                file_info=r.file_info.update(path=output_destination.path),
+            )
+        )
+    return mapped
+
+
+def find_file_datastore(datastore: Datastore, datastore_name: str) -> FileDatastore:
+    """Return the `FileDatastore` with the given name, which may be
+    ``datastore`` itself or one of its children.
+    """
     file_datastore = _get_child_datastore(datastore, datastore_name)
     if file_datastore is None:
         raise ValueError(f"Target datastore not found: {datastore_name}")
+    return file_datastore
+
+
+def _find_table_name(datastore: Datastore, datastore_name: str) -> str:
+    file_datastore = find_file_datastore(datastore, datastore_name)
     tables = file_datastore.get_opaque_table_definitions()
     table_names = list(tables.keys())
     if len(table_names) > 1:
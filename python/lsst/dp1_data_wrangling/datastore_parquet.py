@@ -1,10 +1,13 @@
 from __future__ import annotations
 
 import uuid
-from collections.abc import Iterator, Mapping
+from collections.abc import Callable, Iterator, Mapping
 from typing import Any, NamedTuple
 
+import numpy
 import pyarrow
+import pyarrow.fs
+import pyarrow.types
 from lsst.daf.butler import DatasetId
 from lsst.daf.butler.datastore.record_data import (
     DatastoreRecordData,
@@ -13,7 +16,10 @@ from lsst.daf.butler.datastore.record_data import (
 from lsst.daf.butler.datastores.fileDatastore import StoredFileInfo
 from pyarrow.parquet import ParquetFile, ParquetWriter
 
-from .utils import convert_parquet_uuid_to_dataset_id
+from .dataset_ids import dataset_ids_to_numpy
+from .datastore_paths import factorize_path_column, join_path_columns
+from .memory_budget import BatchSizer, MemoryBudget, iter_parquet_batches
+from .utils import DEFAULT_BATCH_SIZE, convert_parquet_uuid_to_dataset_id
 
 # The full structure of the export structure used by
 # Datastore.export_records/Datastore.import_records is:
@@ -25,14 +31,17 @@ from .utils import convert_parquet_uuid_to_dataset_id
 
 
 class DatastoreParquetWriter:
-    def __init__(self, output_file: str) -> None:
+    def __init__(self, output_file: str, filesystem: pyarrow.fs.FileSystem | None = None) -> None:
         self._writer: ParquetWriter | None = None
+        self._schema: pyarrow.Schema | None = None
         self._output_file = output_file
+        self._filesystem = filesystem
 
     def write_records(
         self, records: Mapping[str, DatastoreRecordData], datastore_priority: list[str]
-    ) -> None:
-        """Write exported records from Butler Datastore.
+    ) -> int:
+        """Write exported records from Butler Datastore, returning the size
+        of the rows written in bytes.
 
         records
             Mapping from Datastore name to the records for that Datastore (as
@@ -49,20 +58,44 @@ class DatastoreParquetWriter:
 
         rows = list(_convert_records_from_rows(records, datastore_priority))
         if len(rows) == 0:
-            return
-
-        table = pyarrow.Table.from_pylist(rows)
+            return 0
+        return self.write_table(pyarrow.Table.from_pylist(rows))
+
+    def write_table(self, table: pyarrow.Table) -> int:
+        """Write rows that are already in Arrow form, with a ``path`` column
+        and the other columns of `StoredFileInfo.to_record` after
+        ``datastore_name`` and ``dataset_id``.  Returns the size of the rows
+        in bytes.
+        """
+        table = factorize_path_column(table)
 
         if self._writer is None:
-            self._writer = ParquetWriter(self._output_file, table.schema)
+            # The schema is inferred from the first batch, which may have no
+            # values at all in nullable columns.
+            self._schema = _fill_null_types(table.schema)
+            self._writer = ParquetWriter(self._output_file, self._schema, filesystem=self._filesystem)
 
+        table = table.cast(self._schema)
         self._writer.write(table)
+        return table.nbytes
 
     def finish(self) -> None:
         if self._writer is not None:
             self._writer.close()
 
 
+def _fill_null_types(schema: pyarrow.Schema) -> pyarrow.Schema:
+    """Replace the type of columns with only null values (which is inferred
+    as the null type) with string, the type of every nullable column in the
+    FileDatastore records table other than ``file_size``.
+    """
+    for i, field in enumerate(schema):
+        if pyarrow.types.is_null(field.type):
+            value_type = pyarrow.int64() if field.name == "file_size" else pyarrow.string()
+            schema = schema.set(i, field.with_type(value_type))
+    return schema
+
+
 def _convert_records_from_rows(
     records: Mapping[str, DatastoreRecordData], datastore_priority: list[str]
 ) -> Iterator[dict[str, object]]:
@@ -98,12 +131,44 @@ class DatastoreRow(NamedTuple):
     file_info: StoredFileInfo
 
 
-def read_datastore_records_from_file(input_file: str) -> Iterator[list[DatastoreRow]]:
-    batch_size = 10000
+def read_datastore_records_from_file(
+    input_file: str | pyarrow.NativeFile,
+    dataset_id_filter: Callable[[numpy.ndarray], numpy.ndarray] | None = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    sizer: BatchSizer | None = None,
+    row_groups: list[int] | None = None,
+) -> Iterator[list[DatastoreRow]]:
+    """Read datastore records from the given file.
+
+    Parameters
+    ----------
+    input_file
+        Path to, or open handle for, the datastore parquet file.  An open
+        handle is closed when iteration finishes.
+    dataset_id_filter
+        Optional function taking an array of dataset IDs (as returned by
+        `dataset_ids_to_numpy`) and returning a boolean mask of the rows to
+        keep.  Rows are filtered before being converted to Python objects.
+    batch_size
+        Number of rows to read at a time.
+    sizer
+        If given, chooses the number of rows to read at a time from a memory
+        budget instead of using ``batch_size``.
+    row_groups
+        If given, only these row groups are read.
+    """
     reader = ParquetFile(input_file)
-    for batch in reader.iter_batches(batch_size=batch_size):
-        rows = batch.to_pylist()
-        yield [_to_datastore_row_tuple(row) for row in rows]
+    sizer = sizer if sizer is not None else MemoryBudget().open("datastore", batch_size)
+    try:
+        for batch in iter_parquet_batches(reader, sizer, row_groups=row_groups):
+            if dataset_id_filter is not None:
+                mask = dataset_id_filter(dataset_ids_to_numpy(batch.column("dataset_id")))
+                batch = batch.filter(pyarrow.array(mask))
+            rows = join_path_columns(batch).to_pylist()
+            yield [_to_datastore_row_tuple(row) for row in rows]
+    finally:
+        # Also closes input_file, if it was passed in as an open file.
+        reader.close(force=True)
 
 
 def _to_datastore_row_tuple(row: dict[str, Any]) -> DatastoreRow:
@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+from collections.abc import Iterator
+from typing import NamedTuple, TypeVar
+
+import pyarrow
+import pyarrow.compute
+import pyarrow.types
+from pyarrow.parquet import ParquetFile
+
+from .utils import DEFAULT_BATCH_SIZE
+
+# This module must not import lsst.daf.butler, so that tools that only need
+# the file paths from an export (e.g. generate_dp1_file_tree) start quickly.
+
+PATH_COLUMNS = ["path_directory", "path_basename", "path_fragment"]
+"""Columns storing datastore paths in the datastore parquet file.
+
+Each path is split into a dictionary-encoded directory (including the
+trailing ``/``, or empty), a file name, and a URI fragment without the
+``#`` (null if there is none).  Paths for datasets from the same run and
+dataset type share a directory, and files containing several datasets
+(e.g. zip files) differ only in their fragment, so this is much smaller than
+storing the full paths.  Exports written before this was introduced have a
+single ``path`` column instead.
+"""
+
+# Directories can't contain '#', which starts the fragment.  (?s) lets the
+# fragment contain any character.
+_PATH_PATTERN = r"(?s)^(?P<directory>(?:[^#]*/)?)(?P<basename>[^/#]*)(?:#(?P<fragment>.*))?$"
+
+_T = TypeVar("_T", pyarrow.Table, pyarrow.RecordBatch)
+
+
+class DatastorePathParts(NamedTuple):
+    """Datastore paths for a batch of rows, split into their parts."""
+
+    directories: list[str]
+    """Distinct directories in the batch."""
+    directory_indices: list[int]
+    """Index into ``directories`` for each row."""
+    basenames: list[str]
+    """File name for each row."""
+    fragments: list[str | None]
+    """URI fragment for each row, or `None`."""
+
+
+def factorize_path_column(table: _T) -> _T:
+    """Replace the ``path`` column with the `PATH_COLUMNS`."""
+    names = table.schema.names
+    if "path" not in names:
+        return table
+    paths = table.column("path")
+    parts = pyarrow.compute.extract_regex(paths, _PATH_PATTERN)
+    directory = pyarrow.compute.struct_field(parts, [0])
+    basename = pyarrow.compute.struct_field(parts, [1])
+    # An unmatched optional group comes back as an empty string, so find
+    # the paths that really have a fragment separately.
+    fragment = pyarrow.compute.if_else(
+        pyarrow.compute.match_substring(paths, "#"),
+        pyarrow.compute.struct_field(parts, [2]),
+        pyarrow.scalar(None, pyarrow.string()),
+    )
+    new_columns = [pyarrow.compute.dictionary_encode(directory), basename, fragment]
+    return _replace_columns(table, ["path"], PATH_COLUMNS, new_columns)
+
+
+def join_path_columns(table: _T) -> _T:
+    """Replace the `PATH_COLUMNS` with a ``path`` column holding the full
+    paths.  Tables that already have a ``path`` column are returned as-is.
+    """
+    names = table.schema.names
+    if PATH_COLUMNS[0] not in names:
+        return table
+    directory = table.column(PATH_COLUMNS[0])
+    if pyarrow.types.is_dictionary(directory.type):
+        directory = directory.cast(pyarrow.string())
+    without_fragment = pyarrow.compute.binary_join_element_wise(directory, table.column(PATH_COLUMNS[1]), "")
+    # Null when there is no fragment.
+    with_fragment = pyarrow.compute.binary_join_element_wise(
+        without_fragment, table.column(PATH_COLUMNS[2]), "#"
+    )
+    path = pyarrow.compute.coalesce(with_fragment, without_fragment)
+    return _replace_columns(table, PATH_COLUMNS, ["path"], [path])
+
+
+def get_path_read_columns(schema: pyarrow.Schema, columns: list[str]) -> list[str]:
+    """Return the columns to read from a datastore file with the given
+    schema, so that `join_path_columns` can provide the requested
+    ``columns`` (which may include ``path``).
+    """
+    if "path" not in columns or "path" in schema.names:
+        return columns
+    read_columns = []
+    for column in columns:
+        read_columns.extend(PATH_COLUMNS if column == "path" else [column])
+    return read_columns
+
+
+def read_datastore_path_parts_from_file(
+    input_file: str | pyarrow.NativeFile, batch_size: int = DEFAULT_BATCH_SIZE
+) -> Iterator[DatastorePathParts]:
+    """Read the path of each record in the datastore parquet file, without
+    converting the records to Butler objects.
+
+    Paths are returned split into parts, so that work that only depends on
+    the directory (e.g. mapping paths to a different layout) can be done
+    once per distinct directory instead of once per row.
+
+    Parameters
+    ----------
+    input_file
+        Path to, or open handle for, the datastore parquet file.  An open
+        handle is closed when iteration finishes.
+    batch_size
+        Number of rows to read at a time.
+    """
+    reader = ParquetFile(input_file)
+    try:
+        columns = get_path_read_columns(reader.schema_arrow, ["path"])
+        for batch in reader.iter_batches(batch_size=batch_size, columns=columns):
+            batch = factorize_path_column(batch)
+            directory = batch.column(PATH_COLUMNS[0])
+            yield DatastorePathParts(
+                directories=directory.dictionary.to_pylist(),
+                directory_indices=directory.indices.to_pylist(),
+                basenames=batch.column(PATH_COLUMNS[1]).to_pylist(),
+                fragments=batch.column(PATH_COLUMNS[2]).to_pylist(),
+            )
+    finally:
+        reader.close(force=True)
+
+
+def _replace_columns(
+    table: _T,
+    old_names: list[str],
+    new_names: list[str],
+    new_columns: list[pyarrow.Array | pyarrow.ChunkedArray],
+) -> _T:
+    """Replace the ``old_names`` columns with new columns, at the position
+    of the first of the old columns.
+    """
+    names = table.schema.names
+    position = names.index(old_names[0])
+    columns = [table.column(name) for name in names if name not in old_names]
+    kept_names = [name for name in names if name not in old_names]
+    columns[position:position] = new_columns
+    kept_names[position:position] = new_names
+    return type(table).from_arrays(columns, names=kept_names)
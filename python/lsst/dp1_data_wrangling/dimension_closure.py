@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+from collections import defaultdict
+
+import numpy
+import pyarrow
+import pyarrow.types
+from lsst.daf.butler import DatasetType, DimensionElement, DimensionUniverse
+from pyarrow.parquet import ParquetFile
+
+from .paths import ExportPaths
+
+
+class DimensionClosure:
+    """The dimension records needed to import a subset of the dataset types
+    in an export.
+
+    The closure contains every element in the data IDs of the dataset types
+    (including implied dimensions and join elements such as
+    ``visit_detector_region``), the elements populated by those dimensions
+    (e.g. ``visit_definition``), and everything the records of those
+    elements refer to.
+
+    Records of an element are selected by the values of its required
+    dimensions that appear in the datasets files.  Only the dimensions that
+    have a column in a datasets file can be used, so the selection may
+    include some unneeded records (e.g. every ``physical_filter`` of the
+    instrument), but never leaves out a needed one.  Elements that are only
+    needed because other records refer to them are imported in full.
+
+    Parameters
+    ----------
+    paths
+        Export being imported.
+    universe
+        Dimension universe of the export.
+    dataset_types
+        Dataset types being imported.
+    exported_dimensions
+        Elements with records in the export, from `ExportIndex.dimensions`.
+    """
+
+    def __init__(
+        self,
+        paths: ExportPaths,
+        universe: DimensionUniverse,
+        dataset_types: list[DatasetType],
+        exported_dimensions: list[str],
+    ) -> None:
+        self._paths = paths
+        # Dataset types whose data IDs refer directly to each element.
+        self._referencing: dict[str, list[DatasetType]] = defaultdict(list)
+        for dataset_type in dataset_types:
+            group = dataset_type.dimensions
+            names = set(group.elements)
+            for dimension in group.names:
+                names.update(e.name for e in universe.get_elements_populated_by(universe[dimension]))
+            for name in names:
+                self._referencing[name].append(dataset_type)
+
+        needed = set(self._referencing)
+        pending = list(needed)
+        while pending:
+            for name in universe[pending.pop()].minimal_group.elements:
+                if name not in needed:
+                    needed.add(name)
+                    pending.append(name)
+        self.elements = [name for name in exported_dimensions if name in needed]
+        """Elements whose records need to be imported, in the order they were
+        given in ``exported_dimensions``.
+        """
+        self._keys: dict[tuple[str, tuple[str, ...]], pyarrow.Table] = {}
+
+    def make_filter(self, element: DimensionElement) -> _RecordFilter | None:
+        """Return a function selecting the records of ``element`` that are
+        needed, or `None` if all of them are.
+        """
+        referencing = self._referencing.get(element.name)
+        if not referencing:
+            return None
+        # Record files name the element's own key column after its primary
+        # key field (e.g. "id") rather than the dimension.
+        columns = dict(zip(element.required.names, element.schema.required.names))
+        key_tables = []
+        for dataset_type in referencing:
+            keys = tuple(d for d in element.required.names if d in dataset_type.dimensions.required)
+            if not keys:
+                return None
+            key_tables.append((tuple(columns[k] for k in keys), self._get_keys(dataset_type, keys)))
+        return _RecordFilter(key_tables)
+
+    def _get_keys(self, dataset_type: DatasetType, keys: tuple[str, ...]) -> pyarrow.Table:
+        """Return the distinct values of the given data ID columns in the
+        datasets file for ``dataset_type``.
+        """
+        cache_key = (dataset_type.name, keys)
+        table = self._keys.get(cache_key)
+        if table is None:
+            path = self._paths.dataset_parquet_path(dataset_type.name)
+            reader = ParquetFile(self._paths.open_input(path))
+            try:
+                table = _decode_dictionaries(reader.read(columns=list(keys)))
+            finally:
+                reader.close(force=True)
+            table = table.group_by(list(keys)).aggregate([])
+            self._keys[cache_key] = table
+        return table
+
+
+class _RecordFilter:
+    """Selects the records whose key columns match a row of any of the given
+    key tables.
+    """
+
+    def __init__(self, key_tables: list[tuple[tuple[str, ...], pyarrow.Table]]) -> None:
+        self._key_tables = key_tables
+
+    def __call__(self, batch: pyarrow.RecordBatch | pyarrow.Table) -> numpy.ndarray:
+        table = batch if isinstance(batch, pyarrow.Table) else pyarrow.Table.from_batches([batch])
+        mask = numpy.zeros(table.num_rows, dtype=bool)
+        for columns, keys in self._key_tables:
+            records = _decode_dictionaries(table.select(list(columns)))
+            # Join key types must match exactly.
+            keys = pyarrow.table(
+                [keys.column(i).cast(records.schema.field(i).type) for i in range(len(columns))],
+                names=list(columns),
+            )
+            # Joins don't preserve order, so match up rows by position.
+            records = records.append_column("__position", pyarrow.array(numpy.arange(table.num_rows)))
+            matched = records.join(keys, keys=list(columns), join_type="left semi")
+            mask[matched.column("__position").to_numpy()] = True
+        return mask
+
+
+def _decode_dictionaries(table: pyarrow.Table) -> pyarrow.Table:
+    for i, field in enumerate(table.schema):
+        if pyarrow.types.is_dictionary(field.type):
+            table = table.set_column(i, field.name, table.column(i).cast(field.type.value_type))
+    return table
@@ -1,9 +1,15 @@
 from __future__ import annotations
 
-from collections.abc import Iterator
+import heapq
+import operator
+import os
+from collections.abc import Callable, Iterator
+from typing import Any
 
-import pandas
+import numpy
 import pyarrow
+import pyarrow.compute
+import pyarrow.fs
 from lsst.daf.butler import (
     DimensionElement,
     DimensionRecord,
@@ -12,31 +18,90 @@ from lsst.daf.butler import (
 )
 from pyarrow.parquet import ParquetFile, ParquetWriter
 
+from .memory_budget import BatchSizer, MemoryBudget, iter_parquet_batches
+from .spatial_index import SPATIAL_SORT_COLUMNS, add_spatial_index_columns, get_spatial_sort_keys
+from .utils import DEFAULT_BATCH_SIZE
+
 _MAX_ROWS_PER_WRITE = 50000
 
 
 class DimensionRecordParquetWriter:
-    def __init__(self, dimension: DimensionElement, output_file: str) -> None:
+    """Write dimension records to a parquet file, de-duplicating and sorting
+    them when finished.
+
+    Records are buffered and written in batches sized by ``sizer``, if
+    given, or of up to 50000 rows otherwise.  Each batch is sorted and
+    written to a temporary file as a row group of its own, and `finish`
+    merges those sorted runs into the output file a batch at a time, so
+    memory use stays within the budget however many records there are.
+
+    Records are sorted by data ID.  If ``spatial_index_order`` is given and
+    the element has regions, the `SPATIAL_INDEX_COLUMNS` are added, with
+    HEALPix pixels at that order, and records are sorted by the
+    `SPATIAL_SORT_COLUMNS` before their data IDs, so that the row group
+    statistics of the bounding box columns are narrow enough to skip row
+    groups in spatial queries.
+
+    ``output_file`` is a path in ``filesystem``, or a local path if it is
+    `None`.
+    """
+
+    def __init__(
+        self,
+        dimension: DimensionElement,
+        output_file: str,
+        sizer: BatchSizer | None = None,
+        spatial_index_order: int | None = None,
+        filesystem: pyarrow.fs.FileSystem | None = None,
+    ) -> None:
         self._dimension = dimension
+        self._spatial_index_order = spatial_index_order if dimension.spatial is not None else None
         self._output_file = output_file
+        self._runs_file = output_file + ".runs"
+        self._filesystem = filesystem
         self._records: DimensionRecordSet = DimensionRecordSet(dimension)
         self._schema = DimensionRecordTable.make_arrow_schema(dimension)
-        self._writer = ParquetWriter(output_file, self._schema)
+        if self._spatial_index_order is not None:
+            empty = self._schema.empty_table()
+            self._schema = add_spatial_index_columns(empty, self._spatial_index_order).schema
+        # The data ID columns are used in indexes and are typically ordered
+        # from low to high cardinality, so sorting on them should give better
+        # compression and insert performance.
+        self._data_id_columns = list(dimension.schema.required.names)
+        self._writer = ParquetWriter(self._runs_file, self._schema, filesystem=filesystem)
+        self._sizer = sizer if sizer is not None else MemoryBudget().open(output_file, _MAX_ROWS_PER_WRITE)
+        self._rows_per_write = self._sizer.next_batch_size()
         self._finished = False
 
+    @property
+    def sort_columns(self) -> list[str]:
+        """Columns the finished file is sorted by, in order."""
+        if self._spatial_index_order is not None:
+            return [*SPATIAL_SORT_COLUMNS, *self._data_id_columns]
+        return self._data_id_columns
+
     def add_record(self, record: DimensionRecord) -> None:
         if self._finished:
             raise RuntimeError(
                 f"Can't write rows to already-closed parquet file for dimension {self._dimension.name}"
             )
         self._records.add(record)
-        if len(self._records) >= _MAX_ROWS_PER_WRITE:
+        if len(self._records) >= self._rows_per_write:
             self._flush_records()
 
     def _flush_records(self) -> None:
-        table = DimensionRecordTable(self._dimension, self._records)
-        self._writer.write(table.to_arrow())
+        table = DimensionRecordTable(self._dimension, self._records).to_arrow()
+        if table.num_rows > 0:
+            if self._spatial_index_order is not None:
+                table = add_spatial_index_columns(table, self._spatial_index_order)
+            keys = pyarrow.table({str(i): array for i, array in enumerate(self._get_sort_keys(table))})
+            table = table.take(
+                pyarrow.compute.sort_indices(keys, [(name, "ascending") for name in keys.column_names])
+            )
+            self._writer.write(table, row_group_size=table.num_rows)
         self._records = DimensionRecordSet(self._dimension)
+        self._sizer.record(table.num_rows, table.nbytes)
+        self._rows_per_write = self._sizer.next_batch_size()
 
     def finish(self) -> None:
         if self._finished:
@@ -44,28 +109,133 @@ class DimensionRecordParquetWriter:
 
         self._flush_records()
         self._writer.close()
+        self._merge_runs()
+        if self._filesystem is None:
+            os.remove(self._runs_file)
+        else:
+            self._filesystem.delete_file(self._runs_file)
 
-        df = pandas.read_parquet(self._output_file)
-        data_id_columns = list(self._dimension.schema.required.names)
-        # De-duplicate the dimension records.  Because the records were
-        # inserted from DatasetRefs of multiple dataset types, there is likely
-        # to be significant duplication.
-        df.drop_duplicates(subset=data_id_columns, inplace=True)
-        # The data ID columns are used in indexes and are typically ordered
-        # from low to high cardinality, so sorting here should give better
-        # compression and insert performance.
-        df.sort_values(by=data_id_columns, inplace=True)
-        df.to_parquet(self._output_file, schema=self._schema, index=False)
-
+        self._sizer.close()
         self._finished = True
 
+    def _merge_runs(self) -> None:
+        """Merge the sorted runs in the temporary file into the output file,
+        keeping the first of any records with the same data ID.  Because the
+        records were inserted from DatasetRefs of multiple dataset types,
+        there is likely to be significant duplication.
+        """
+        if self._filesystem is None:
+            reader = ParquetFile(self._runs_file)
+        else:
+            reader = ParquetFile(self._filesystem.open_input_file(self._runs_file))
+        writer = ParquetWriter(self._output_file, self._schema, filesystem=self._filesystem)
+        try:
+            num_runs = reader.metadata.num_row_groups
+            rows_per_write = self._sizer.next_batch_size()
+            # Each run holds one batch in memory at a time.
+            rows_per_run = max(1, rows_per_write // max(num_runs, 1))
+            runs = [
+                _iter_sorted_rows(reader, run, rows_per_run, self._get_sort_keys) for run in range(num_runs)
+            ]
+            output = _SliceBuffer()
+            previous_key = None
+            for key, batch, row in heapq.merge(*runs, key=operator.itemgetter(0)):
+                if key == previous_key:
+                    continue
+                previous_key = key
+                output.add(batch, row)
+                if output.num_rows >= rows_per_write:
+                    self._write_merged(writer, output.take())
+            if output.num_rows > 0:
+                self._write_merged(writer, output.take())
+        finally:
+            writer.close()
+            reader.close(force=True)
+
+    def _get_sort_keys(self, batch: pyarrow.RecordBatch | pyarrow.Table) -> list[pyarrow.Array]:
+        keys = [batch.column(name) for name in self._data_id_columns]
+        if self._spatial_index_order is not None:
+            keys = get_spatial_sort_keys(batch) + keys
+        return keys
+
+    def _write_merged(self, writer: ParquetWriter, table: pyarrow.Table) -> None:
+        table = table.cast(self._schema)
+        writer.write_table(table)
+        self._sizer.record(table.num_rows, table.nbytes)
+
+
+def _iter_sorted_rows(
+    reader: ParquetFile,
+    row_group: int,
+    batch_size: int,
+    get_sort_keys: Callable[[pyarrow.RecordBatch], list[pyarrow.Array]],
+) -> Iterator[tuple[tuple[Any, ...], pyarrow.RecordBatch, int]]:
+    """Iterate over the rows of one sorted run, as tuples of the sort key,
+    the batch holding the row, and the row's position in the batch.
+    """
+    for batch in reader.iter_batches(batch_size=batch_size, row_groups=[row_group]):
+        keys = zip(*(array.to_pylist() for array in get_sort_keys(batch)))
+        for row, key in enumerate(keys):
+            yield key, batch, row
+
+
+class _SliceBuffer:
+    """Collects rows from record batches, as slices of consecutive rows,
+    until they are taken as a table.
+    """
+
+    def __init__(self) -> None:
+        self.num_rows = 0
+        self._slices: list[pyarrow.RecordBatch] = []
+        self._batch: pyarrow.RecordBatch | None = None
+        self._start = 0
+        self._end = 0
+
+    def add(self, batch: pyarrow.RecordBatch, row: int) -> None:
+        if batch is not self._batch or row != self._end:
+            self._end_slice()
+            self._batch, self._start = batch, row
+        self._end = row + 1
+        self.num_rows += 1
+
+    def take(self) -> pyarrow.Table:
+        self._end_slice()
+        table = pyarrow.Table.from_batches(self._slices)
+        self._slices = []
+        self.num_rows = 0
+        return table
+
+    def _end_slice(self) -> None:
+        if self._batch is not None:
+            self._slices.append(self._batch.slice(self._start, self._end - self._start))
+        self._batch = None
+
 
 def read_dimension_records_from_file(
-    dimension: DimensionElement, input_file: str
+    dimension: DimensionElement,
+    input_file: str | pyarrow.NativeFile,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    sizer: BatchSizer | None = None,
+    row_filter: Callable[[pyarrow.RecordBatch], numpy.ndarray] | None = None,
 ) -> Iterator[DimensionRecordTable]:
-    batch_size = 10000
+    """Read dimension records from the given file.
+
+    If ``row_filter`` is given, it is called with each batch read and
+    returns a boolean mask of the rows to keep.  Rows are filtered before
+    being converted to records.  Columns that are not part of the record
+    schema (e.g. the `SPATIAL_INDEX_COLUMNS`) are not read.
+    """
     reader = ParquetFile(input_file)
     schema = DimensionRecordTable.make_arrow_schema(dimension)
-    for batch in reader.iter_batches(batch_size=batch_size):
-        table = pyarrow.Table.from_batches([batch], schema=schema)
-        yield DimensionRecordTable(dimension, table=table)
+    sizer = sizer if sizer is not None else MemoryBudget().open(dimension.name, batch_size)
+    try:
+        for batch in iter_parquet_batches(reader, sizer, columns=schema.names):
+            if row_filter is not None:
+                batch = batch.filter(pyarrow.array(row_filter(batch)))
+                if batch.num_rows == 0:
+                    continue
+            table = pyarrow.Table.from_batches([batch], schema=schema)
+            yield DimensionRecordTable(dimension, table=table)
+    finally:
+        # Also closes input_file, if it was passed in as an open file.
+        reader.close(force=True)
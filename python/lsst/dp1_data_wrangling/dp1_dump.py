@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import importlib
+
+import click
+
+
+class _LazyGroup(click.Group):
+    """Command group that imports the module defining a subcommand only when
+    that subcommand is run.
+
+    Some subcommands need lsst.daf.butler, which is slow to import, so
+    loading every subcommand up front would make ``--help`` and the
+    pyarrow-only subcommands wait for it.
+    """
+
+    def __init__(self, *args: object, lazy_commands: dict[str, tuple[str, str]], **kwargs: object) -> None:
+        super().__init__(*args, **kwargs)  # type: ignore[arg-type]
+        self._lazy_commands = lazy_commands
+
+    def list_commands(self, ctx: click.Context) -> list[str]:
+        return sorted(self._lazy_commands)
+
+    def get_command(self, ctx: click.Context, cmd_name: str) -> click.Command | None:
+        if cmd_name not in self._lazy_commands:
+            return None
+        module_name, _ = self._lazy_commands[cmd_name]
+        module = importlib.import_module(f".{module_name}", __package__)
+        return module.main
+
+    def format_commands(self, ctx: click.Context, formatter: click.HelpFormatter) -> None:
+        # Uses the help text registered with each command, rather than
+        # importing every subcommand to read its docstring.
+        rows = [(name, self._lazy_commands[name][1]) for name in self.list_commands(ctx)]
+        if rows:
+            with formatter.section("Commands"):
+                formatter.write_dl(rows)
+
+
+@click.group(
+    cls=_LazyGroup,
+    lazy_commands={
+        "chunk": ("chunk_store", "Add an export directory to a content-addressed chunk store."),
+        "hips": ("hips_coverage", "Update HiPS properties files with the sky coverage of the export."),
+        "inspect": ("inspect_dump", "Answer questions about the contents of an export directory."),
+        "lookup": ("dataset_id_index", "Show everything the export contains about one dataset ID."),
+        "obscore": ("obscore_dump", "Write the ObsCore table for an export."),
+        "pack": ("archive", "Pack an export directory into a single archive file."),
+        "validate": ("validate_dump", "Check an export directory for dangling references between files."),
+    },
+)
+def main() -> None:
+    """Tools for working with a DP1 export directory without a Butler."""
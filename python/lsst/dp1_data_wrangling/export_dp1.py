@@ -1,13 +1,25 @@
 from __future__ import annotations
 
 import fnmatch
-from collections.abc import Iterator
+from collections.abc import Iterable, Iterator
+from typing import TYPE_CHECKING
 
 import click
-from lsst.daf.butler import Butler, DataCoordinate
+import pyarrow
 from pyarrow.parquet import ParquetFile
 
-from .exporter import MAX_ROWS_PER_WRITE, Exporter
+from .index import ExportSubset
+from .memory_budget import MemoryBudget, memory_budget_option
+from .paths import DEFAULT_EXPORT_DIRECTORY
+from .profiling import StageProfiler, make_profiler, profiling_options
+
+if TYPE_CHECKING:
+    from lsst.daf.butler import Butler
+
+    from .exporter import Exporter
+
+# Modules that import lsst.daf.butler are imported inside the functions that
+# use them, so that --help doesn't wait for the Butler stack to load.
 
 # Based on a preliminary list provided by Jim Bosch at
 # https://rubinobs.atlassian.net/wiki/spaces/~jbosch/pages/423559233/DP1+Dataset+Retention+Removal+Planning
@@ -54,28 +66,161 @@ DATASET_TYPES = [
     "illuminationCorrection",
 ]
 
-DEFAULT_EXPORT_DIRECTORY = "dp1-dump"
-
 
 @click.command
 @click.option("--dataset-type", "-t", multiple=True, help="Override default dataset types to export")
 @click.option("--repo", default="/repo/dp1")
 @click.option("--collection", default="LSSTComCam/DP1")
-@click.option("--output-directory", default=DEFAULT_EXPORT_DIRECTORY)
-def main(dataset_type: list[str], repo: str, collection: str, output_directory: str) -> None:
+@click.option(
+    "--output-directory",
+    default=DEFAULT_EXPORT_DIRECTORY,
+    help="Local directory or URI to write the export to, e.g. s3://bucket/dp1-dump",
+)
+@click.option("--tract", multiple=True, type=int, help="Only export datasets overlapping these tracts")
+@click.option("--patch", multiple=True, type=int, help="Only export datasets overlapping these patches")
+@click.option("--skymap", default="lsst_cells_v1", help="Sky map for --tract and --patch")
+@click.option(
+    "--region",
+    type=(float, float, float),
+    help="Only export datasets overlapping a circle given as RA, Dec and radius in degrees",
+)
+@click.option("--day-obs-min", type=int, help="Only export datasets observed on or after this day_obs")
+@click.option("--day-obs-max", type=int, help="Only export datasets observed on or before this day_obs")
+@click.option(
+    "--visit-fraction", type=click.FloatRange(0, 1), help="Only export datasets for this fraction of visits"
+)
+@click.option(
+    "--partitions",
+    default=1,
+    type=click.IntRange(min=1),
+    help="Split each dataset type into up to this many data ID ranges, exported in parallel",
+)
+@click.option(
+    "--spatial-index/--no-spatial-index",
+    default=False,
+    help="Add bounding box and HEALPix pixel columns to dimension records with regions",
+)
+@click.option(
+    "--upload-threads",
+    type=click.IntRange(min=1),
+    help="Number of threads pyarrow uses to upload parts of files when writing to object storage",
+)
+@click.option(
+    "--deterministic",
+    is_flag=True,
+    help="Rewrite the files so that re-exporting the same datasets gives identical bytes",
+)
+@click.option(
+    "--bulk-datastore-export",
+    is_flag=True,
+    help="Export datastore records by scanning each datastore's records table once at the end",
+)
+@memory_budget_option
+@profiling_options
+def main(
+    dataset_type: list[str],
+    repo: str,
+    collection: str,
+    output_directory: str,
+    tract: list[int],
+    patch: list[int],
+    skymap: str,
+    region: tuple[float, float, float] | None,
+    day_obs_min: int | None,
+    day_obs_max: int | None,
+    visit_fraction: float | None,
+    partitions: int,
+    spatial_index: bool,
+    upload_threads: int | None,
+    deterministic: bool,
+    bulk_datastore_export: bool,
+    memory_budget: MemoryBudget,
+    profile: bool,
+    trace_memory: bool,
+    profile_dir: str,
+) -> None:
+    from lsst.daf.butler import Butler
+
+    from .spatial_index import DEFAULT_SPATIAL_INDEX_ORDER
+
+    if upload_threads is not None:
+        # Multipart uploads are done on pyarrow's I/O thread pool.
+        pyarrow.set_io_thread_count(upload_threads)
+    profiler = make_profiler(profile, trace_memory, profile_dir)
     butler = Butler(repo)
+    if dataset_type:
+        exported_types = set(dataset_type)
+    else:
+        exported_types = set(DATASET_TYPES).union(_find_extra_dataset_types(butler, collection))
+    subset = None
+    if tract or patch or any(v is not None for v in [region, day_obs_min, day_obs_max, visit_fraction]):
+        subset = ExportSubset(
+            skymap=skymap,
+            tracts=list(tract),
+            patches=list(patch),
+            region=region,
+            day_obs_min=day_obs_min,
+            day_obs_max=day_obs_max,
+            visit_fraction=visit_fraction,
+        )
+    export(
+        butler,
+        collection,
+        exported_types,
+        output_directory,
+        profiler,
+        subset,
+        partitions,
+        memory_budget,
+        spatial_index_order=DEFAULT_SPATIAL_INDEX_ORDER if spatial_index else None,
+        deterministic=deterministic,
+        bulk_datastore_export=bulk_datastore_export,
+    )
+    profiler.finish()
 
-    with butler.registry.caching_context():
-        dumper = Exporter(output_directory, butler, root_collection=collection)
 
-        if dataset_type:
-            exported_types = set(dataset_type)
-        else:
-            exported_types = set(DATASET_TYPES).union(_find_extra_dataset_types(butler, collection))
-        for dt in exported_types:
+def export(
+    butler: Butler,
+    collection: str,
+    dataset_types: Iterable[str],
+    output_directory: str,
+    profiler: StageProfiler | None = None,
+    subset: ExportSubset | None = None,
+    partitions: int = 1,
+    memory_budget: MemoryBudget | None = None,
+    spatial_index_order: int | None = None,
+    deterministic: bool = False,
+    bulk_datastore_export: bool = False,
+) -> None:
+    """Export the given dataset types from ``collection``, along with the
+    dimension records, datastore records and collections they need.  If
+    ``subset`` is given, only the datasets matching it are exported.  See
+    `Exporter` for ``partitions``, ``memory_budget``,
+    ``spatial_index_order``, ``deterministic`` and ``bulk_datastore_export``.
+    """
+    from .exporter import Exporter
+
+    profiler = profiler if profiler is not None else StageProfiler()
+    with butler.registry.caching_context():
+        dumper = Exporter(
+            output_directory,
+            butler,
+            root_collection=collection,
+            profiler=profiler,
+            subset=subset,
+            partitions=partitions,
+            memory_budget=memory_budget,
+            spatial_index_order=spatial_index_order,
+            deterministic=deterministic,
+            bulk_datastore_export=bulk_datastore_export,
+        )
+        for dt in dataset_types:
             dumper.dump_refs(dt, [collection])
-        _dump_extra_visit_dimensions(butler, dumper)
+        with profiler.stage("dimensions/extra_visit_dimensions"):
+            _dump_extra_visit_dimensions(butler, dumper)
         dumper.finish()
+    if memory_budget is not None and memory_budget.limit is not None:
+        print(memory_budget.format_report())
 
 
 def _find_extra_dataset_types(butler: Butler, collection: str) -> set[str]:
@@ -102,6 +247,8 @@ def _dump_extra_visit_dimensions(butler: Butler, dumper: Exporter) -> None:
     # referenced directly by dataset data IDs, and need to be handled
     # specially.  These are the dimensions listed as "populated_by: visit" in
     # the dimension universe YAML.
+    from lsst.daf.butler import DataCoordinate
+
     with butler.query() as query:
         dumper.dump_dimension_records(
             query.dimension_records("visit_system").where("instrument='LSSTComCam'")
@@ -116,10 +263,11 @@ def _dump_extra_visit_dimensions(butler: Butler, dumper: Exporter) -> None:
 
 
 def _read_referenced_visits(dumper: Exporter) -> Iterator[list[dict[str, object]]]:
+    from .exporter import MAX_ROWS_PER_WRITE
+
     if not dumper.did_export_dimension_records("visit"):
         return
-    parquet_path = dumper.close_and_get_dimension_record_output_file("visit")
-    file = ParquetFile(parquet_path)
+    file = ParquetFile(dumper.close_and_open_dimension_record_output_file("visit"))
     for batch in file.iter_batches(batch_size=MAX_ROWS_PER_WRITE, columns=["instrument", "id"]):
         yield [{"instrument": v["instrument"], "visit": v["id"]} for v in batch.to_pylist()]
     file.close()
@@ -1,42 +1,131 @@
 from __future__ import annotations
 
+import concurrent.futures
 import itertools
-from collections.abc import Iterable, Iterator
-from typing import TypeVar
+import os
+import tempfile
+import threading
+from collections.abc import Callable, Iterable, Iterator
+from typing import Any, NamedTuple, TypeVar
 
+import numpy
+import pyarrow
 from lsst.daf.butler import (
     Butler,
     CollectionType,
     DatasetAssociation,
     DatasetId,
     DatasetType,
+    DimensionGroup,
     DimensionRecord,
 )
+from pyarrow.parquet import ParquetFile, ParquetWriter
 
+from .canonical_parquet import write_canonical_parquet
+from .collections_parquet import ExportedCollection, write_collections_file
+from .dataset_id_index import build_dataset_id_index
+from .dataset_ids import DATASET_ID_DTYPE, DatasetIdSet
 from .dataset_types import export_dataset_types
 from .datasets_parquet import DatasetAssociationParquetWriter, DatasetsParquetWriter
+from .datastore_export import BulkDatastoreExporter
 from .datastore_parquet import DatastoreParquetWriter
 from .dimension_record_parquet import DimensionRecordParquetWriter
-from .index import ExportIndex
+from .index import ExportIndex, ExportSubset, IndexFileInfo, ParquetFileInfo, describe_parquet_file
+from .memory_budget import MemoryBudget
 from .paths import ExportPaths
+from .profiling import StageProfiler
+from .subset import Queryable, SubsetFilter
 from .utils import write_model_to_file
 
 MAX_ROWS_PER_WRITE = 50000
 
+PARTITION_DIMENSIONS = ["visit", "exposure", "tract", "day_obs", "detector"]
+"""Dimensions that dataset types may be partitioned on, in order of
+preference.  A dataset type is partitioned on the first of these in its
+required dimensions.
+"""
+
 
 class Exporter:
-    """Export DatasetRefs with associated dimension records to parquet files"""
+    """Export DatasetRefs with associated dimension records to parquet files.
+
+    If ``subset`` is given, only the matching datasets are exported, along
+    with the dimension records, datastore records and associations for
+    them.
+
+    If ``partitions`` is greater than one, the datasets of each dataset type
+    are split into up to that many ranges of values of one of its
+    `PARTITION_DIMENSIONS`.  The ranges are queried concurrently, each with
+    its own Butler connection, and written to separate files that are then
+    concatenated in order.  Each data ID falls in exactly one range, so
+    find-first searches give the same results as a single query.
+
+    Batches of datasets and dimension records are sized to fit in
+    ``memory_budget``, if given, with at most `MAX_ROWS_PER_WRITE` rows each.
+
+    If ``spatial_index_order`` is given, dimension records with regions get
+    bounding box and HEALPix pixel columns at that order; see
+    `DimensionRecordParquetWriter`.
 
-    def __init__(self, output_path: str, butler: Butler, root_collection: str) -> None:
+    If ``deterministic`` is `True`, every parquet file is rewritten by
+    `write_canonical_parquet` when the export is finished, so exporting the
+    same datasets again with the same software versions gives byte-for-byte
+    identical files, whatever order the queries returned rows in.
+
+    If ``bulk_datastore_export`` is `True`, datastore records are not looked
+    up for each batch of datasets.  Instead the exported dataset IDs are
+    collected, and `BulkDatastoreExporter` scans each datastore's records
+    table once when the export is finished.
+    """
+
+    def __init__(
+        self,
+        output_path: str,
+        butler: Butler,
+        root_collection: str,
+        profiler: StageProfiler | None = None,
+        subset: ExportSubset | None = None,
+        partitions: int = 1,
+        memory_budget: MemoryBudget | None = None,
+        spatial_index_order: int | None = None,
+        deterministic: bool = False,
+        bulk_datastore_export: bool = False,
+    ) -> None:
         self._dimensions: dict[str, DimensionRecordParquetWriter] = {}
         self._butler = butler
-        self._paths = ExportPaths(output_path)
+        self._paths = ExportPaths.from_uri(output_path)
         self._paths.create_directories()
         self._root_collection = root_collection
+        self._profiler = profiler if profiler is not None else StageProfiler()
+        self._subset = SubsetFilter(butler, subset) if subset is not None else None
+        self._partitions = partitions
+        self._budget = memory_budget if memory_budget is not None else MemoryBudget()
+        self._spatial_index_order = spatial_index_order
+        self._deterministic = deterministic
+        # IDs of the exported datasets, if their datastore records are
+        # exported in bulk by finish().
+        self._exported_ids = DatasetIdSet() if bulk_datastore_export else None
+        # Serializes access to the shared writers when partitions are
+        # exported concurrently.
+        self._lock = threading.Lock()
 
         self._dataset_types_written: set[str] = set()
         self._collections_seen: set[str] = set()
-        self._datastore_writer = DatastoreParquetWriter(self._paths.datastore_parquet_path())
+        self._datastore_writer = DatastoreParquetWriter(
+            self._paths.datastore_parquet_path(), self._paths.filesystem
+        )
+        # Mapping from path of each parquet file written to the columns whose
+        # value ranges will be recorded in the index.
+        self._key_columns: dict[str, list[str]] = {
+            self._paths.datastore_parquet_path(): ["dataset_id"],
+            self._paths.collections_parquet_path(): ["name"],
+        }
+        # Mapping from path of each parquet file written to the columns that
+        # identify its rows, used to sort it in deterministic mode.
+        self._sort_columns: dict[str, list[str]] = {
+            self._paths.datastore_parquet_path(): ["dataset_id", "component", "datastore_name"],
+            self._paths.collections_parquet_path(): ["name"],
+        }
 
     def dump_refs(self, dataset_type_name: str, collections: list[str]) -> None:
         assert (
@@ -47,8 +136,12 @@ class Exporter:
         self._collections_seen.update(collections)
 
         dataset_type = self._butler.get_dataset_type(dataset_type_name)
-        datasets = self._generate_dataset_output(dataset_type, collections)
-        self._generate_association_output(dataset_type, collections, datasets)
+        # The datasets stage also covers the dimension and datastore records
+        # for the datasets, which are written as the datasets are found.
+        with self._profiler.stage(f"datasets/{dataset_type_name}"):
+            datasets = self._generate_dataset_output(dataset_type, collections)
+        with self._profiler.stage(f"associations/{dataset_type_name}"):
+            self._generate_association_output(dataset_type, collections, datasets)
 
     def dump_dimension_records(self, records: Iterable[DimensionRecord]) -> None:
         for record in records:
@@ -57,22 +150,67 @@ class Exporter:
     def did_export_dimension_records(self, dimension: str) -> bool:
         return dimension in self._dimensions
 
-    def close_and_get_dimension_record_output_file(self, dimension: str) -> str:
-        """Return the path where the parquet file for a given dimension can be
-        found.  No more records may be written for the given dimension after
-        this function is called.
+    def close_and_open_dimension_record_output_file(self, dimension: str) -> pyarrow.NativeFile:
+        """Open the parquet file for a given dimension for reading.  No more
+        records may be written for the given dimension after this function is
+        called.
         """
         self._dimensions[dimension].finish()
-        return self._paths.dimension_parquet_path(dimension)
+        return self._paths.open_input(self._paths.dimension_parquet_path(dimension))
 
     def _generate_dataset_output(self, dataset_type: DatasetType, collections: list[str]) -> set[DatasetId]:
         """Dump full list of datasets included in the given collections for the
         given dataset type
         """
-        writer = DatasetsParquetWriter(dataset_type, self._paths.dataset_parquet_path(dataset_type.name))
+        output_path = self._paths.dataset_parquet_path(dataset_type.name)
+        self._key_columns[output_path] = ["dataset_id", *dataset_type.dimensions.required]
+        self._sort_columns[output_path] = [*dataset_type.dimensions.required, "dataset_id"]
+        partitions = self._find_partitions(dataset_type, collections) if self._partitions > 1 else []
+        if len(partitions) <= 1:
+            return self._export_partition(self._butler, dataset_type, collections, None, output_path)
+
+        print(f"Exporting {dataset_type.name} in {len(partitions)} partitions by {partitions[0].dimension}")
+        part_files = [f"{output_path}.part{i}" for i in range(len(partitions))]
+        datasets_found: set[DatasetId] = set()
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=len(partitions)) as executor:
+                futures = [
+                    executor.submit(
+                        self._export_partition,
+                        self._butler.clone(),
+                        dataset_type,
+                        collections,
+                        partition,
+                        part_file,
+                    )
+                    for partition, part_file in zip(partitions, part_files)
+                ]
+                for future in futures:
+                    datasets_found.update(future.result())
+            _concatenate_parquet_files(self._paths, part_files, output_path)
+        finally:
+            for part_file in part_files:
+                if self._paths.exists(part_file):
+                    self._paths.remove(part_file)
+        return datasets_found
+
+    def _export_partition(
+        self,
+        butler: Butler,
+        dataset_type: DatasetType,
+        collections: list[str],
+        partition: _Partition | None,
+        output_path: str,
+    ) -> set[DatasetId]:
+        """Write the datasets of the given type in one partition (or all of
+        them, if ``partition`` is `None`) to ``output_path``, returning their
+        IDs.
+        """
+        writer = DatasetsParquetWriter(dataset_type, output_path, self._paths.filesystem)
+        sizer = self._budget.open(self._paths.relative_path(output_path), MAX_ROWS_PER_WRITE)
         datasets_found: set[DatasetId] = set()
 
-        with self._butler.query() as query:
+        with butler.query() as query:
             # There are some datasets in DP1 that were revised, with the
             # updated version replacing an incorrect version.  We don't
             # want to ship the broken versions, so we use find_first to pull
@@ -82,29 +220,61 @@ class Exporter:
             # with the same data ID may be associated with different validity
             # time ranges.
             find_first = not dataset_type.isCalibration()
-            results = query.datasets(
-                dataset_type, collections, find_first=find_first
-            ).with_dimension_records()
-            for refs in _batched(results, MAX_ROWS_PER_WRITE):
+            results = query.datasets(dataset_type, collections, find_first=find_first)
+            if self._subset is not None:
+                results = self._subset.apply(results, dataset_type.dimensions)
+            if partition is not None:
+                results = partition.apply(results)
+            for refs in _batched(results.with_dimension_records(), sizer.next_batch_size):
                 datasets_found.update([r.id for r in refs])
                 # Sort by data ID to improve compressibility.
                 refs.sort(key=lambda ref: ref.dataId)
-                writer.add_refs(refs)
-                for ref in refs:
-                    self._collections_seen.add(ref.run)
-                    # Write dimension records from these refs to separate
-                    # dimension record files.
-                    for record in ref.dataId.records.values():
-                        if record is not None:
-                            self._add_dimension_record(record)
-                # Export datastore records (file paths etc) associated with
-                # these refs to a separate file.
-                datastore_records = self._butler._datastore.export_records(refs)
-                self._datastore_writer.write_records(datastore_records, self._butler._datastore.names)
+                nbytes = writer.add_refs(refs)
+                if self._exported_ids is not None:
+                    ids = numpy.array([ref.id.bytes for ref in refs], dtype=DATASET_ID_DTYPE)
+                else:
+                    # Export datastore records (file paths etc) associated
+                    # with these refs to a separate file.
+                    datastore_records = butler._datastore.export_records(refs)
+                with self._lock:
+                    for ref in refs:
+                        self._collections_seen.add(ref.run)
+                        # Write dimension records from these refs to separate
+                        # dimension record files.
+                        for record in ref.dataId.records.values():
+                            if record is not None:
+                                self._add_dimension_record(record)
+                    if self._exported_ids is not None:
+                        self._exported_ids.add(ids)
+                    else:
+                        nbytes += self._datastore_writer.write_records(
+                            datastore_records, butler._datastore.names
+                        )
+                sizer.record(len(refs), nbytes)
 
         writer.finish()
+        sizer.close()
         return datasets_found
 
+    def _find_partitions(self, dataset_type: DatasetType, collections: list[str]) -> list[_Partition]:
+        """Split the values of the partitioning dimension for the given
+        dataset type into ranges with roughly equal numbers of values.
+        """
+        dimension = _choose_partition_dimension(dataset_type.dimensions)
+        if dimension is None:
+            return []
+        with self._butler.query() as query:
+            query = query.join_dataset_search(dataset_type, collections)
+            if self._subset is not None:
+                query = self._subset.apply(query, dataset_type.dimensions)
+            values = sorted({data_id[dimension] for data_id in query.data_ids([dimension])})
+        count = min(self._partitions, len(values))
+        starts = [len(values) * i // count for i in range(count + 1)]
+        return [
+            _Partition(dimension, values[start], values[end - 1])
+            for start, end in zip(starts[:-1], starts[1:])
+        ]
+
     def _generate_association_output(
         self, dataset_type: DatasetType, collections: list[str], datasets_to_include: set[DatasetId]
     ) -> None:
@@ -118,71 +288,194 @@ class Exporter:
                 flatten_chains=True,
             )
         )
-        writer = DatasetAssociationParquetWriter(
-            dataset_type, self._paths.dataset_association_parquet_path(dataset_type.name)
-        )
+        output_path = self._paths.dataset_association_parquet_path(dataset_type.name)
+        writer = DatasetAssociationParquetWriter(dataset_type, output_path, self._paths.filesystem)
+        sizer = self._budget.open(self._paths.relative_path(output_path), MAX_ROWS_PER_WRITE)
+        self._key_columns[output_path] = ["dataset_id", *dataset_type.dimensions.required]
+        self._sort_columns[output_path] = [
+            "collection",
+            *dataset_type.dimensions.required,
+            "dataset_id",
+            "timespan",
+        ]
         if len(tag_and_calib_collections) > 0:
             with self._butler.query() as query:
                 query = query.join_dataset_search(dataset_type, tag_and_calib_collections)
+                if self._subset is not None:
+                    query = self._subset.apply(query, dataset_type.dimensions)
                 result = query.general(
                     dataset_type.dimensions,
                     dataset_fields={dataset_type.name: {"dataset_id", "run", "collection", "timespan"}},
                     find_first=False,
                 )
                 associations = DatasetAssociation.from_query_result(result, dataset_type)
-                for batch in _batched(associations, MAX_ROWS_PER_WRITE):
+                for batch in _batched(associations, sizer.next_batch_size):
                     # Only export the associations in tagged collections if the
                     # datasets are included in the release.
                     batch = [assoc for assoc in batch if assoc.ref.id in datasets_to_include]
                     # Sort to group datasets from the same collection together,
                     # then by data ID to improve compressibility.
                     batch.sort(key=lambda association: (association.collection, association.ref.dataId))
-                    writer.add_associations(batch)
+                    sizer.record(len(batch), writer.add_associations(batch))
         writer.finish()
+        sizer.close()
 
     def finish(self) -> None:
-        for writer in self._dimensions.values():
-            writer.finish()
-        self._datastore_writer.finish()
+        if self._exported_ids is not None:
+            with self._profiler.stage("datastore"):
+                self._exported_ids.freeze()
+                BulkDatastoreExporter(self._butler, self._datastore_writer, self._budget).export(
+                    self._exported_ids
+                )
 
-        self._export_collections()
+        with self._profiler.stage("finish_writers"):
+            for writer in self._dimensions.values():
+                writer.finish()
+            self._datastore_writer.finish()
 
-        dataset_types = self._butler.registry.queryDatasetTypes(self._dataset_types_written)
-        export_dataset_types(self._paths.dataset_type_path(), dataset_types)
+        with self._profiler.stage("collections"):
+            self._export_collections()
 
+            dataset_types = sorted(
+                self._butler.registry.queryDatasetTypes(self._dataset_types_written), key=lambda dt: dt.name
+            )
+            export_dataset_types(self._paths.open_output(self._paths.dataset_type_path()), dataset_types)
+
+        if self._deterministic:
+            with self._profiler.stage("canonical"):
+                for path, sort_columns in sorted(self._sort_columns.items()):
+                    # The datastore file is not created if no datastore
+                    # records were found.
+                    if self._paths.exists(path):
+                        write_canonical_parquet(self._paths, path, sort_columns)
+
+        with self._profiler.stage("index"):
+            dataset_id_index_files, dataset_id_index = self._build_dataset_id_index()
+            files = self._describe_files()
+
+        # Lists are sorted so that the index doesn't depend on the order
+        # dataset types were exported or records were found in.
         index = ExportIndex(
-            dimensions=list(self._dimensions.keys()),
-            dataset_types=list(self._dataset_types_written),
+            dimensions=sorted(self._dimensions.keys()),
+            dataset_types=sorted(self._dataset_types_written),
             root_collection=self._root_collection,
+            files=files,
+            dataset_id_index_files=dataset_id_index_files,
+            dataset_id_index=dataset_id_index,
+            subset=self._subset.subset if self._subset is not None else None,
+            universe_namespace=self._butler.dimensions.namespace,
+            universe_version=self._butler.dimensions.version,
         )
-        write_model_to_file(index, self._paths.index_path())
+        write_model_to_file(index, self._paths.open_output(self._paths.index_path()))
+
+    def _build_dataset_id_index(self) -> tuple[list[str], IndexFileInfo]:
+        """Write an index for looking up rows by dataset ID, returning the
+        list of files it covers and the size and hash of the index.
+        """
+        # Datasets files must come before the datastore file, see
+        # DatasetIdIndex.contains.
+        files = [self._paths.dataset_parquet_path(dt) for dt in sorted(self._dataset_types_written)]
+        if self._paths.exists(self._paths.datastore_parquet_path()):
+            files.append(self._paths.datastore_parquet_path())
+        info = build_dataset_id_index(self._paths, files, self._paths.dataset_id_index_path())
+        return [self._paths.relative_path(f) for f in files], info
+
+    def _describe_files(self) -> dict[str, ParquetFileInfo]:
+        files = {}
+        for path, key_columns in sorted(self._key_columns.items()):
+            # The datastore file is not created if no datastore records were
+            # found.
+            if self._paths.exists(path):
+                files[self._paths.relative_path(path)] = describe_parquet_file(self._paths, path, key_columns)
+        return files
 
     def _export_collections(self) -> None:
-        with self._butler.export(filename=self._paths.collections_path()) as exporter:
-            # Export collection structure
-            collections = self._butler.collections.query(
-                self._collections_seen, flatten_chains=True, include_chains=True
-            )
-            for collection in collections:
-                exporter.saveCollection(collection)
+        # Collections are written both as a parquet file, which the importer
+        # reads, and in the YAML format of Butler.export, which the
+        # validator checks the parquet file against.
+        collections = self._butler.collections.query_info(
+            self._collections_seen, flatten_chains=True, include_chains=True, include_doc=True
+        )
+        with self._paths.open_output(self._paths.collections_parquet_path()) as output:
+            write_collections_file(output, [ExportedCollection.from_info(info) for info in collections])
+
+        # Butler.export can only write local files, so write to a temporary
+        # file and copy it into the export.
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "collections.yaml")
+            with self._butler.export(filename=filename) as exporter:
+                # Export collection structure
+                for collection in sorted(info.name for info in collections):
+                    exporter.saveCollection(collection)
+            with open(filename, "rb") as input:
+                with self._paths.open_output(self._paths.collections_path()) as output:
+                    output.write(input.read())
 
     def _add_dimension_record(self, record: DimensionRecord) -> None:
         dimension = record.definition.name
         writer = self._dimensions.get(dimension)
         if writer is None:
+            output_path = self._paths.dimension_parquet_path(dimension)
+            sizer = self._budget.open(self._paths.relative_path(output_path), MAX_ROWS_PER_WRITE)
             writer = DimensionRecordParquetWriter(
-                record.definition, self._paths.dimension_parquet_path(dimension)
+                record.definition, output_path, sizer, self._spatial_index_order, self._paths.filesystem
             )
             self._dimensions[dimension] = writer
+            self._key_columns[output_path] = list(record.definition.schema.required.names)
+            self._sort_columns[output_path] = writer.sort_columns
 
         writer.add_record(record)
 
 
 _T = TypeVar("_T")
+_Q = TypeVar("_Q", bound=Queryable)
+
+
+class _Partition(NamedTuple):
+    """Range of values of one dimension, inclusive at both ends."""
+
+    dimension: str
+    first: Any
+    last: Any
+
+    def apply(self, query: _Q) -> _Q:
+        return query.where(
+            f"{self.dimension} >= partition_first AND {self.dimension} <= partition_last",
+            bind={"partition_first": self.first, "partition_last": self.last},
+        )
+
+
+def _choose_partition_dimension(dimensions: DimensionGroup) -> str | None:
+    for dimension in PARTITION_DIMENSIONS:
+        if dimension in dimensions.required:
+            return dimension
+    return None
+
+
+def _concatenate_parquet_files(paths: ExportPaths, input_files: list[str], output_file: str) -> None:
+    """Concatenate parquet files in an export with the same schema, in
+    order.
+    """
+    writer: ParquetWriter | None = None
+    try:
+        for input_file in input_files:
+            reader = ParquetFile(paths.open_input(input_file))
+            try:
+                if writer is None:
+                    writer = ParquetWriter(output_file, reader.schema_arrow, filesystem=paths.filesystem)
+                for row_group in range(reader.num_row_groups):
+                    writer.write_table(reader.read_row_group(row_group))
+            finally:
+                reader.close(force=True)
+    finally:
+        if writer is not None:
+            writer.close()
 
 
-def _batched(refs: Iterable[_T], batch_size: int) -> Iterator[list[_T]]:
-    """Roughly equivalent to Python 3.12's itertools.batched."""
+def _batched(refs: Iterable[_T], batch_size: Callable[[], int]) -> Iterator[list[_T]]:
+    """Roughly equivalent to Python 3.12's itertools.batched, but calling
+    ``batch_size`` before each batch to get its size.
+    """
     iterator = iter(refs)
-    while batch := list(itertools.islice(iterator, batch_size)):
+    while batch := list(itertools.islice(iterator, batch_size())):
         yield batch
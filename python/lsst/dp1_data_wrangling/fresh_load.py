@@ -0,0 +1,296 @@
+from __future__ import annotations
+
+import concurrent.futures
+import tempfile
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import Any, NamedTuple
+
+import sqlalchemy
+from lsst.daf.butler import Butler, Config
+
+DEFAULT_INDEX_BUILD_JOBS = 4
+"""Number of indexes built at once on backends that support it."""
+
+SUPPORTED_DIALECTS = ("postgresql", "sqlite")
+"""Registry database dialects whose secondary indexes `FreshLoad` can
+find.
+"""
+
+PENDING_INDEXES_TABLE = "dp1_fresh_load_indexes"
+"""Table recording the indexes dropped by `FreshLoad.drop_indexes` that have
+not been rebuilt yet.  It only exists while a fresh load is in progress, or
+after one was interrupted.
+"""
+
+
+class IndexDefinition(NamedTuple):
+    table: str
+    name: str
+    ddl: str
+    """SQL statement that re-creates the index, as reported by the
+    database.
+    """
+
+
+class FreshLoad:
+    """Speeds up bulk loading into a newly created repository by dropping the
+    registry's non-unique secondary indexes before the load and rebuilding
+    them afterward, so that rows inserted during the load do not pay
+    index-maintenance costs.
+
+    Unique indexes, primary keys and indexes backing constraints are left in
+    place, because the import relies on them to detect conflicts.
+
+    The definitions of the dropped indexes are saved in the
+    `PENDING_INDEXES_TABLE` table, in the same transaction that drops them,
+    and removed once they have been rebuilt.  If the load is interrupted
+    before then, `restore` on a new instance for the same database (e.g.
+    from ``restore_dp1_indexes.py``) rebuilds them.
+
+    Parameters
+    ----------
+    engine
+        Engine for the registry database of the repository being loaded.
+    namespace
+        Schema of the registry tables, or `None` for the default schema.
+    jobs
+        Number of indexes to build at once on PostgreSQL.  SQLite builds them
+        one at a time.
+    """
+
+    def __init__(
+        self, engine: sqlalchemy.engine.Engine, namespace: str | None, jobs: int = DEFAULT_INDEX_BUILD_JOBS
+    ) -> None:
+        self._engine = engine
+        self._namespace = namespace
+        self._jobs = jobs if self._engine.dialect.name == "postgresql" else 1
+        self._pending_table = sqlalchemy.Table(
+            PENDING_INDEXES_TABLE,
+            sqlalchemy.MetaData(schema=namespace),
+            sqlalchemy.Column("index_name", sqlalchemy.String(256), primary_key=True),
+            sqlalchemy.Column("table_name", sqlalchemy.String(256), nullable=False),
+            sqlalchemy.Column("ddl", sqlalchemy.Text, nullable=False),
+        )
+
+    @classmethod
+    def from_butler(cls, butler: Butler, jobs: int = DEFAULT_INDEX_BUILD_JOBS) -> FreshLoad:
+        """Return a `FreshLoad` for the registry database of a repository
+        created by `Butler.makeRepo` (i.e. with a SQL registry).
+        """
+        db = butler._registry._db
+        return cls(db._engine, db.namespace, jobs)
+
+    def drop_indexes(self) -> None:
+        """Save the secondary index definitions, then drop the secondary
+        indexes.
+        """
+        if self.get_pending_indexes():
+            raise RuntimeError(
+                "Indexes dropped by an earlier fresh load have not been rebuilt; run restore_dp1_indexes.py"
+            )
+        indexes = _get_secondary_indexes(self._engine, self._namespace)
+        print(f"Dropping {len(indexes)} secondary indexes for the bulk load...")
+        with self._engine.begin() as connection:
+            self._pending_table.create(connection)
+            if indexes:
+                connection.execute(
+                    self._pending_table.insert(),
+                    [{"index_name": i.name, "table_name": i.table, "ddl": i.ddl} for i in indexes],
+                )
+            for index in indexes:
+                connection.execute(sqlalchemy.text(f"DROP INDEX {self._qualify(index.name)}"))
+
+    def get_pending_indexes(self) -> list[IndexDefinition]:
+        """Return the indexes that were dropped and have not been rebuilt
+        yet.
+        """
+        if not sqlalchemy.inspect(self._engine).has_table(PENDING_INDEXES_TABLE, schema=self._namespace):
+            return []
+        table = self._pending_table
+        query = sqlalchemy.select(table.c.table_name, table.c.index_name, table.c.ddl).order_by(
+            table.c.table_name, table.c.index_name
+        )
+        with self._engine.connect() as connection:
+            rows = connection.execute(query).all()
+        return [IndexDefinition(table=row[0], name=row[1], ddl=row[2]) for row in rows]
+
+    def restore(self, expected_schema: dict[str, Any] | None = None) -> None:
+        """Rebuild the dropped indexes, update table statistics, and check
+        that the schema matches ``expected_schema`` (as returned by
+        `describe_schema`), if given.
+
+        The expected schema should come from an empty repository created
+        the same way (see `make_reference_repo`), so that an index that was
+        never dropped or never rebuilt is caught too.
+        """
+        pending = self.get_pending_indexes()
+        # Indexes rebuilt by an earlier, interrupted call are skipped.
+        existing = {index.name for index in _get_secondary_indexes(self._engine, self._namespace)}
+        indexes = [index for index in pending if index.name not in existing]
+        print(f"Rebuilding {len(indexes)} secondary indexes...")
+        self._run_in_parallel([index.ddl for index in indexes])
+        with self._engine.begin() as connection:
+            self._pending_table.drop(connection, checkfirst=True)
+
+        print("Updating table statistics...")
+        if self._engine.dialect.name == "postgresql":
+            tables = sqlalchemy.inspect(self._engine).get_table_names(schema=self._namespace)
+            self._run_in_parallel([f"ANALYZE {self._qualify(table)}" for table in tables])
+        else:
+            self._run_in_parallel(["ANALYZE"])
+
+        if expected_schema is not None:
+            problems = compare_schemas(expected_schema, describe_schema(self._engine, self._namespace))
+            if problems:
+                raise RuntimeError(
+                    "Schema after rebuilding indexes does not match a newly created repository:\n"
+                    + "\n".join(problems)
+                )
+
+    def _run_in_parallel(self, statements: list[str]) -> None:
+        def execute(statement: str) -> None:
+            # Each statement gets its own connection, so that they can run
+            # concurrently in the database.
+            with self._engine.begin() as connection:
+                connection.execute(sqlalchemy.text(statement))
+
+        if self._jobs == 1:
+            for statement in statements:
+                execute(statement)
+            return
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self._jobs) as executor:
+            for future in concurrent.futures.as_completed([executor.submit(execute, s) for s in statements]):
+                future.result()
+
+    def _qualify(self, name: str) -> str:
+        quote = self._engine.dialect.identifier_preparer.quote
+        if self._namespace is None:
+            return quote(name)
+        return f"{quote(self._namespace)}.{quote(name)}"
+
+
+def get_registry_dialect(config: Config) -> str:
+    """Return the SQLAlchemy dialect name of the registry database that
+    `Butler.makeRepo` would create from ``config``.
+    """
+    db = config.get(("registry", "db"))
+    if db is None:
+        # The default configuration uses SQLite in the repository root.
+        return "sqlite"
+    return sqlalchemy.engine.make_url(db).get_backend_name()
+
+
+@contextmanager
+def make_reference_repo(config: Config) -> Iterator[Butler]:
+    """Create an empty repository from the same configuration as a
+    repository being loaded with `FreshLoad`, as a reference for its schema.
+
+    With SQLite the reference registry is a temporary file; otherwise it is
+    a new schema next to the target's in the same database, which is
+    dropped when the context exits.
+    """
+    config = Config(config)
+    namespace: str | None = None
+    with tempfile.TemporaryDirectory() as root:
+        if get_registry_dialect(config) == "sqlite":
+            config["registry", "db"] = f"sqlite:///{root}/gen3.sqlite3"
+        else:
+            namespace = f"{config.get(('registry', 'namespace')) or 'public'}_fresh_load_reference"
+            config["registry", "namespace"] = namespace
+        Butler.makeRepo(root, config=config)
+        butler = Butler(root, writeable=True)
+        try:
+            yield butler
+        finally:
+            if namespace is not None:
+                engine = butler._registry._db._engine
+                quote = engine.dialect.identifier_preparer.quote
+                with engine.begin() as connection:
+                    connection.execute(sqlalchemy.text(f"DROP SCHEMA {quote(namespace)} CASCADE"))
+
+
+def describe_repo_schema(butler: Butler) -> dict[str, Any]:
+    """Return `describe_schema` for the registry database of a repository
+    created by `Butler.makeRepo`.
+    """
+    db = butler._registry._db
+    return describe_schema(db._engine, db.namespace)
+
+
+def _get_secondary_indexes(engine: sqlalchemy.engine.Engine, namespace: str | None) -> list[IndexDefinition]:
+    if engine.dialect.name == "postgresql":
+        query = sqlalchemy.text(
+            "SELECT i.tablename, i.indexname, i.indexdef FROM pg_indexes i"
+            " JOIN pg_namespace n ON n.nspname = i.schemaname"
+            " JOIN pg_class c ON c.relname = i.indexname AND c.relnamespace = n.oid"
+            " JOIN pg_index x ON x.indexrelid = c.oid"
+            " WHERE i.schemaname = :schema AND NOT x.indisunique AND NOT x.indisprimary"
+            " AND NOT EXISTS (SELECT 1 FROM pg_constraint k WHERE k.conindid = c.oid)"
+            " ORDER BY i.tablename, i.indexname"
+        )
+        with engine.connect() as connection:
+            rows = connection.execute(query, {"schema": namespace or "public"}).all()
+        return [IndexDefinition(table=row[0], name=row[1], ddl=row[2]) for row in rows]
+    elif engine.dialect.name == "sqlite":
+        # Indexes created implicitly for UNIQUE and PRIMARY KEY constraints
+        # have no SQL.
+        query = sqlalchemy.text(
+            "SELECT tbl_name, name, sql FROM sqlite_master"
+            " WHERE type = 'index' AND sql IS NOT NULL ORDER BY tbl_name, name"
+        )
+        with engine.connect() as connection:
+            rows = connection.execute(query).all()
+        return [
+            IndexDefinition(table=row[0], name=row[1], ddl=row[2])
+            for row in rows
+            if not row[2].upper().startswith("CREATE UNIQUE")
+        ]
+    else:
+        raise NotImplementedError(f"Fresh load mode is not supported for database '{engine.dialect.name}'")
+
+
+def describe_schema(engine: sqlalchemy.engine.Engine, namespace: str | None) -> dict[str, Any]:
+    """Return a comparable description of the tables, columns, keys and
+    indexes in a database schema.
+    """
+    inspector = sqlalchemy.inspect(engine)
+    schema: dict[str, Any] = {}
+    for table in sorted(inspector.get_table_names(schema=namespace)):
+        schema[table] = {
+            "columns": [
+                (c["name"], str(c["type"]), c["nullable"])
+                for c in inspector.get_columns(table, schema=namespace)
+            ],
+            "primary_key": inspector.get_pk_constraint(table, schema=namespace)["constrained_columns"],
+            "unique": sorted(
+                tuple(u["column_names"]) for u in inspector.get_unique_constraints(table, schema=namespace)
+            ),
+            "foreign_keys": sorted(
+                (tuple(f["constrained_columns"]), f["referred_table"], tuple(f["referred_columns"]))
+                for f in inspector.get_foreign_keys(table, schema=namespace)
+            ),
+            "indexes": sorted(
+                (i["name"], tuple(i["column_names"]), bool(i["unique"]))
+                for i in inspector.get_indexes(table, schema=namespace)
+            ),
+        }
+    return schema
+
+
+def compare_schemas(expected: dict[str, Any], actual: dict[str, Any]) -> list[str]:
+    """Compare two schemas returned by `describe_schema`, returning a
+    description of each difference.
+    """
+    problems = []
+    for table in sorted(expected.keys() | actual.keys()):
+        if table not in actual:
+            problems.append(f"{table}: table is missing")
+        elif table not in expected:
+            problems.append(f"{table}: unexpected table")
+        else:
+            for key, value in expected[table].items():
+                if actual[table][key] != value:
+                    problems.append(f"{table}: {key} differ: expected {value}, found {actual[table][key]}")
+    return problems
@@ -1,29 +1,48 @@
 from __future__ import annotations
 
 import concurrent.futures
+import os
 from collections.abc import Iterator
 from pathlib import Path
 from typing import NamedTuple
 
 import click
 
-from .datastore_parquet import read_datastore_records_from_file
-from .export_dp1 import DEFAULT_EXPORT_DIRECTORY
-from .import_dp1 import map_datastore_path_for_rsp
-from .paths import ExportPaths
+from .datastore_paths import read_datastore_path_parts_from_file
+from .path_mapping import map_datastore_path_for_rsp
+from .paths import DEFAULT_EXPORT_DIRECTORY, ExportPaths
+from .profiling import StageProfiler, make_profiler, profiling_options
 
 
 @click.command
 @click.option("--input-root", default="/sdf/group/rubin/repo/dp1/")
 @click.option("--output-root", default="datastore_symlinks")
 @click.option("--export-dir", default=DEFAULT_EXPORT_DIRECTORY)
-def main(input_root: str, output_root: str, export_dir: str) -> None:
+@profiling_options
+def main(
+    input_root: str, output_root: str, export_dir: str, profile: bool, trace_memory: bool, profile_dir: str
+) -> None:
+    profiler = make_profiler(profile, trace_memory, profile_dir)
+    generate_file_tree(input_root, output_root, export_dir, profiler)
+    profiler.finish()
+
+
+def generate_file_tree(
+    input_root: str, output_root: str, export_dir: str, profiler: StageProfiler | None = None
+) -> int:
+    """Create a tree of symlinks in ``output_root`` pointing to each file
+    referenced by the export, returning the number of files processed.
+
+    Only the thread reading the datastore records is profiled, not the
+    worker threads creating the symlinks.
+    """
+    profiler = profiler if profiler is not None else StageProfiler()
     output_dir = Path(output_root)
     output_dir.mkdir()
 
     count = 0
     datastore_records_file = ExportPaths(export_dir).datastore_parquet_path()
-    with concurrent.futures.ThreadPoolExecutor(max_workers=16) as executor:
+    with profiler.stage("datastore"), concurrent.futures.ThreadPoolExecutor(max_workers=16) as executor:
         futures = []
         for path in _generate_file_list(input_root, datastore_records_file):
             futures.append(executor.submit(_create_symlink, output_dir, path))
@@ -32,6 +51,7 @@ def main(input_root: str, output_root: str, export_dir: str) -> None:
             count += 1
             if (count % 10000) == 0:
                 print(count)
+    return count
 
 
 def _create_symlink(output_dir: Path, path: MappedPath) -> None:
@@ -47,29 +67,34 @@ def _create_symlink(output_dir: Path, path: MappedPath) -> None:
 
 
 def _generate_file_list(datastore_root_path: str, datastore_records_file_path: str) -> Iterator[MappedPath]:
-    for batch in read_datastore_records_from_file(datastore_records_file_path):
-        for row in batch:
-            original_path = row.file_info.path
-            absolute_path = _make_path_absolute(datastore_root_path, original_path)
-            target_path = _strip_fragment(map_datastore_path_for_rsp(original_path))
-            yield MappedPath(absolute_source=absolute_path, relative_target=target_path)
-
-
-def _make_path_absolute(datastore_root_path: str, file_path: str) -> str:
-    file_path = _strip_fragment(file_path)
-
-    if file_path.startswith("file://"):
-        return file_path.removeprefix("file://")
-
-    return str(Path(datastore_root_path).joinpath(file_path))
-
-
-def _strip_fragment(file_path: str) -> str:
-    """Strip a trailing URI fragment like '#unzip=...'.  These are used to
-    indicate special loading behaviors for a file, but are not part of the
-    actual path.
-    """
-    return file_path.split("#")[0]
+    # Source and target directories are computed once per distinct directory.
+    # URI fragments like '#unzip=...' indicate special loading behaviors for
+    # a file, but are not part of the actual path, so they are ignored.
+    mapped_directories: dict[str, MappedPath] = {}
+    for batch in read_datastore_path_parts_from_file(datastore_records_file_path):
+        directories = []
+        for directory in batch.directories:
+            mapped = mapped_directories.get(directory)
+            if mapped is None:
+                mapped = MappedPath(
+                    absolute_source=_make_directory_absolute(datastore_root_path, directory),
+                    relative_target=map_datastore_path_for_rsp(directory),
+                )
+                mapped_directories[directory] = mapped
+            directories.append(mapped)
+        for directory_index, basename in zip(batch.directory_indices, batch.basenames):
+            mapped = directories[directory_index]
+            yield MappedPath(
+                absolute_source=mapped.absolute_source + basename,
+                relative_target=mapped.relative_target + basename,
+            )
+
+
+def _make_directory_absolute(datastore_root_path: str, directory: str) -> str:
+    if directory.startswith("file://"):
+        return directory.removeprefix("file://")
+
+    return os.path.join(datastore_root_path, directory)
 
 
 class MappedPath(NamedTuple):
@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import concurrent.futures
+import json
+import os
+from typing import NamedTuple
+
+import click
+import numpy
+import pyarrow
+import pyarrow.types
+from lsst.sphgeom import HealpixPixelization, Region
+from pyarrow.parquet import ParquetFile
+
+from .archive import open_export
+from .paths import DEFAULT_EXPORT_DIRECTORY, ExportPaths
+
+DEFAULT_HIPS_ORDER = 11
+"""HEALPix order of the DP1 HiPS tiles, from ``hips_order`` in their
+properties files.
+"""
+
+DEFAULT_PROPERTIES_DIRECTORY = "manual-hips-edits/DM-51494/deep_coadd"
+
+
+class Coverage(NamedTuple):
+    """HEALPix cells covered by a set of patches."""
+
+    order: int
+    ranges: numpy.ndarray
+    """Sorted, non-overlapping half-open ranges of nested cell indices, with
+    shape ``(n, 2)``.
+    """
+
+    @property
+    def sky_fraction(self) -> float:
+        cells = int(numpy.sum(self.ranges[:, 1] - self.ranges[:, 0]))
+        return cells / (12 * 4**self.order)
+
+    def union(self, other: Coverage) -> Coverage:
+        assert self.order == other.order, "Coverages must be at the same order"
+        return Coverage(self.order, _union_ranges(numpy.concatenate([self.ranges, other.ranges])))
+
+    def to_moc_json(self) -> str:
+        """Serialize as a MOC in the IVOA MOC 2.0 JSON format, with every
+        cell at ``order``.
+        """
+        cells = numpy.concatenate(
+            [numpy.empty(0, dtype=numpy.uint64)]
+            + [numpy.arange(begin, end, dtype=numpy.uint64) for begin, end in self.ranges]
+        )
+        return json.dumps({str(self.order): cells.tolist()})
+
+
+def read_patch_regions(paths: ExportPaths, dataset_type: str) -> dict[str, list[bytes]]:
+    """Return the encoded regions of the patches that have datasets of the
+    given type, for each band.
+    """
+    reader = ParquetFile(paths.open_input(paths.dataset_parquet_path(dataset_type)))
+    try:
+        datasets = _decode_dictionaries(reader.read(columns=["band", "skymap", "tract", "patch"]))
+    finally:
+        reader.close(force=True)
+    datasets = datasets.group_by(["band", "skymap", "tract", "patch"]).aggregate([])
+
+    reader = ParquetFile(paths.open_input(paths.dimension_parquet_path("patch")))
+    try:
+        patches = _decode_dictionaries(reader.read(columns=["skymap", "tract", "id", "region"]))
+    finally:
+        reader.close(force=True)
+    region = patches.column("region")
+    if isinstance(region.type, pyarrow.ExtensionType):
+        # Regions are stored as sphgeom's encoded bytes.
+        region = pyarrow.chunked_array([chunk.storage for chunk in region.chunks], region.type.storage_type)
+    patches = pyarrow.table(
+        {
+            "skymap": patches.column("skymap"),
+            "tract": patches.column("tract").cast(datasets.schema.field("tract").type),
+            "patch": patches.column("id").cast(datasets.schema.field("patch").type),
+            "region": region,
+        }
+    )
+
+    joined = datasets.join(patches, ["skymap", "tract", "patch"], join_type="inner")
+    regions: dict[str, list[bytes]] = {}
+    for band, encoded in zip(joined.column("band").to_pylist(), joined.column("region").to_pylist()):
+        regions.setdefault(band, []).append(encoded)
+    return regions
+
+
+def compute_coverage(encoded_regions: list[bytes], order: int) -> Coverage:
+    """Return the HEALPix cells at ``order`` overlapping any of the given
+    regions.
+    """
+    pixelization = HealpixPixelization(order)
+    ranges = [numpy.empty((0, 2), dtype=numpy.uint64)]
+    for encoded in encoded_regions:
+        envelope = pixelization.envelope(Region.decode(encoded))
+        ranges.append(numpy.array(envelope.ranges(), dtype=numpy.uint64).reshape(-1, 2))
+    return Coverage(order, _union_ranges(numpy.concatenate(ranges)))
+
+
+def compute_band_coverage(
+    paths: ExportPaths, dataset_type: str, order: int, jobs: int = 1
+) -> dict[str, Coverage]:
+    """Compute the coverage of the patches with datasets of the given type
+    for each band, processing bands in parallel.
+    """
+    regions = read_patch_regions(paths, dataset_type)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {band: executor.submit(compute_coverage, r, order) for band, r in regions.items()}
+        return {band: future.result() for band, future in futures.items()}
+
+
+def get_hips_bands(name: str) -> list[str] | None:
+    """Return the bands combined in the HiPS with the given directory name
+    (e.g. ``band_g`` or ``color_gri``), or `None` if the name is not
+    recognized.
+    """
+    kind, _, bands = name.partition("_")
+    if kind == "band" and bands:
+        return [bands]
+    if kind == "color" and bands:
+        # DP1 band names are single letters.
+        return list(bands)
+    return None
+
+
+def update_properties_file(path: str, values: dict[str, str]) -> bool:
+    """Replace the values of existing keys in a HiPS properties file,
+    keeping its layout.  Returns `True` if the file was changed.
+    """
+    with open(path) as file:
+        lines = file.read().splitlines(keepends=True)
+    changed = False
+    for i, line in enumerate(lines):
+        key, sep, old_value = line.partition("=")
+        value = values.get(key.strip())
+        if sep and value is not None and old_value.strip() != value:
+            lines[i] = f"{key}{sep} {value}\n"
+            changed = True
+    if changed:
+        with open(path, "w") as file:
+            file.writelines(lines)
+    return changed
+
+
+def _union_ranges(ranges: numpy.ndarray) -> numpy.ndarray:
+    """Merge overlapping or adjacent half-open ranges."""
+    if len(ranges) == 0:
+        return ranges
+    ranges = ranges[numpy.argsort(ranges[:, 0], kind="stable")]
+    ends = numpy.maximum.accumulate(ranges[:, 1])
+    # A merged range starts wherever a range begins after every earlier
+    # range has ended.
+    starts = numpy.flatnonzero(numpy.concatenate([[True], ranges[1:, 0] > ends[:-1]]))
+    last = numpy.concatenate([starts[1:] - 1, [len(ranges) - 1]])
+    return numpy.stack([ranges[starts, 0], ends[last]], axis=1)
+
+
+def _decode_dictionaries(table: pyarrow.Table) -> pyarrow.Table:
+    for i, field in enumerate(table.schema):
+        if pyarrow.types.is_dictionary(field.type):
+            table = table.set_column(i, field.name, table.column(i).cast(field.type.value_type))
+    return table
+
+
+@click.command("hips")
+@click.option("--input-dir", default=DEFAULT_EXPORT_DIRECTORY)
+@click.option("--properties-dir", default=DEFAULT_PROPERTIES_DIRECTORY, help="Directory of HiPS directories")
+@click.option("--dataset-type", default="deep_coadd", help="Dataset type the HiPS were generated from")
+@click.option("--order", default=DEFAULT_HIPS_ORDER, help="HEALPix order of the HiPS tiles")
+@click.option("--moc-dir", help="Also write a MOC JSON file for each HiPS to this directory")
+@click.option("--jobs", "-j", default=os.cpu_count(), help="Number of bands to process at once")
+def main(
+    input_dir: str, properties_dir: str, dataset_type: str, order: int, moc_dir: str | None, jobs: int
+) -> None:
+    """Compute the sky coverage of each band's HiPS from the patches in the
+    export, and update moc_sky_fraction in the HiPS properties files.
+    """
+    coverage = compute_band_coverage(open_export(input_dir), dataset_type, order, jobs)
+    if moc_dir is not None:
+        os.makedirs(moc_dir, exist_ok=True)
+    for name in sorted(os.listdir(properties_dir)):
+        path = os.path.join(properties_dir, name, "properties")
+        bands = get_hips_bands(name)
+        if bands is None or not os.path.exists(path):
+            continue
+        missing = [band for band in bands if band not in coverage]
+        if missing:
+            print(f"{name}: skipped, no {dataset_type} datasets for {', '.join(missing)}")
+            continue
+        hips_coverage = coverage[bands[0]]
+        for band in bands[1:]:
+            hips_coverage = hips_coverage.union(coverage[band])
+        changed = update_properties_file(path, {"moc_sky_fraction": str(hips_coverage.sky_fraction)})
+        print(f"{name}: moc_sky_fraction = {hips_coverage.sky_fraction}{'' if changed else ' (unchanged)'}")
+        if moc_dir is not None:
+            with open(os.path.join(moc_dir, f"{name}.json"), "w") as file:
+                file.write(hips_coverage.to_moc_json())
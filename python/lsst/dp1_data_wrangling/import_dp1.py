@@ -1,122 +1,279 @@
 from __future__ import annotations
 
-import re
+import os
 import tempfile
 from contextlib import ExitStack
+from typing import TYPE_CHECKING
 
 import click
-from lsst.daf.butler import Butler, Config
 
-from .datastore_mapping import DatastoreMappingInput
-from .export_dp1 import DEFAULT_EXPORT_DIRECTORY
-from .importer import Importer
+from .memory_budget import MemoryBudget, memory_budget_option
+from .path_mapping import get_datastore_mapping
+from .paths import DEFAULT_EXPORT_DIRECTORY
+from .profiling import make_profiler, profiling_options
+from .utils import DEFAULT_BATCH_SIZE
+
+if TYPE_CHECKING:
+    from lsst.daf.butler import Config
+
+    from .verify_import import Mismatch
+
+# Modules that import lsst.daf.butler are imported inside the commands, so
+# that --help and option errors don't wait for the Butler stack to load.
 
 
 @click.command()
-@click.option("--seed", help="Butler seed configuration file to use when creating repository")
+@click.option(
+    "--seed",
+    multiple=True,
+    help="Butler seed configuration file to use when creating repository.  Give --seed,"
+    " --db-connection-string and --db-schema once per repository to import into several repositories from"
+    " one read of the export; an option given only once applies to every repository",
+)
 @click.option(
     "--use-existing-repo", is_flag=True, help="Use existing Butler repository instead of creating a new one"
 )
-@click.option("--db-schema", help="Schema name to use when creating the registry database")
-@click.option("--db-connection-string", help="Schema name to use when creating the registry database")
+@click.option("--db-schema", multiple=True, help="Schema name to use when creating the registry database")
+@click.option("--db-connection-string", multiple=True, help="Connection string for the registry database")
 @click.option("--no-datastore-remap", is_flag=True, help="Disable remapping of paths inside the datastore")
 @click.option(
     "--file-paths",
     help="Selects the directory layout to use for the imported files.  Options are 'rsp' or 'rucio'",
     default="rsp",
 )
-@click.option("--input-dir", default=DEFAULT_EXPORT_DIRECTORY)
+@click.option(
+    "--input-dir",
+    default=DEFAULT_EXPORT_DIRECTORY,
+    help="Export directory or URI (e.g. s3://bucket/dp1-dump), or archive file created by 'dp1_dump.py pack'",
+)
 @click.option(
     "--dataset-type", "-t", multiple=True, help="Subset the imported data to only the given dataset type"
 )
+@click.option(
+    "--batch-size",
+    default=DEFAULT_BATCH_SIZE,
+    help="Number of rows to read at a time, or the largest batch to use with --memory-budget",
+)
+@click.option(
+    "--pipeline-depth",
+    default=0,
+    help="Decode batches in a background thread while the database writes the previous ones, keeping up"
+    " to this many decoded batches queued.  0 disables pipelining",
+)
+@click.option(
+    "--fresh-load",
+    is_flag=True,
+    help="Drop secondary indexes in the newly created repository during the load, then rebuild them and"
+    " run ANALYZE",
+)
+@click.option(
+    "--verify",
+    is_flag=True,
+    help="After the import, check that every target repository contains everything from the export",
+)
+@memory_budget_option
+@profiling_options
 def main(
-    seed: str | None,
+    seed: list[str],
     use_existing_repo: bool,
     no_datastore_remap: bool,
-    db_schema: str | None,
-    db_connection_string: str | None,
+    db_schema: list[str],
+    db_connection_string: list[str],
     input_dir: str,
     file_paths: str,
     dataset_type: list[str] | None,
+    batch_size: int,
+    pipeline_depth: int,
+    fresh_load: bool,
+    verify: bool,
+    memory_budget: MemoryBudget,
+    profile: bool,
+    trace_memory: bool,
+    profile_dir: str,
 ) -> None:
+    target_options = _get_target_options(seed, db_connection_string, db_schema)
+    if use_existing_repo and len(target_options) > 1:
+        raise click.UsageError("--use-existing-repo can only be used with a single target repository")
+    if use_existing_repo and fresh_load:
+        raise click.UsageError("--fresh-load can only be used when creating a new repository")
+
+    from lsst.daf.butler import Butler
+
+    from .fresh_load import SUPPORTED_DIALECTS, get_registry_dialect, make_reference_repo
+    from .import_targets import ImportTarget
+    from .importer import Importer
+    from .verify_import import ImportVerifier
+
+    configs = [None if use_existing_repo else _make_config(*options) for options in target_options]
+    if fresh_load:
+        # Check before any repository is created, rather than failing when
+        # the indexes are about to be dropped.
+        for config in configs:
+            assert config is not None
+            dialect = get_registry_dialect(config)
+            if dialect not in SUPPORTED_DIALECTS:
+                raise click.UsageError(
+                    f"--fresh-load is not supported for '{dialect}' registry databases; it requires one of"
+                    f" {', '.join(SUPPORTED_DIALECTS)}"
+                )
+
+    profiler = make_profiler(profile, trace_memory, profile_dir)
     exit_stack = ExitStack()
     with exit_stack:
-        output_repo = "import-test-repo"
-        if not use_existing_repo:
-            if seed:
-                config = Config(seed)
-            else:
-                config = Config()
-            if db_connection_string is not None:
-                assert db_schema is not None, "--db-schema is required with --db-connection-string"
-                config["registry", "db"] = db_connection_string
-            if db_schema is not None:
-                assert db_connection_string is not None, "--db-connection-string is required with --db-schema"
-                config["registry", "namespace"] = db_schema
-            if seed or db_connection_string:
-                # User manually specified a target database; use a tempdir
-                # for the repository directory so this script can be run
-                # more than once.
-                output_repo = exit_stack.enter_context(tempfile.TemporaryDirectory())
-            print("Initializing repository...")
-            Butler.makeRepo(output_repo, config=config)
-
-        print("Connecting to database...")
-        butler = Butler(output_repo, writeable=True)
+        targets: list[ImportTarget] = []
+        for config, (target_seed, target_db_connection_string, target_db_schema) in zip(
+            configs, target_options
+        ):
+            output_repo = "import-test-repo"
+            reference = None
+            if config is not None:
+                if target_seed or target_db_connection_string:
+                    # User manually specified a target database; use a tempdir
+                    # for the repository directory so this script can be run
+                    # more than once.
+                    output_repo = exit_stack.enter_context(tempfile.TemporaryDirectory())
+                print("Initializing repository...")
+                Butler.makeRepo(output_repo, config=config)
+                if fresh_load:
+                    reference = exit_stack.enter_context(make_reference_repo(config))
+
+            print("Connecting to database...")
+            name = _get_target_name(target_seed, target_db_schema, [t.name for t in targets])
+            targets.append(
+                ImportTarget(name=name, butler=Butler(output_repo, writeable=True), reference=reference)
+            )
+
         print("Importing DP1 registry...")
         if not dataset_type:
             dataset_type = None
-        importer = Importer(input_dir, butler, dataset_type)
-        if no_datastore_remap:
-            datastore_mapping = _null_datastore_mapping_function
-        elif file_paths == "rsp":
-            datastore_mapping = _rsp_datastore_mapping_function
-        elif file_paths == "rucio":
-            datastore_mapping = _rucio_datastore_mapping_function
-        else:
-            raise ValueError(f"Unknown value for --file-paths: {file_paths}")
-
+        importer = Importer(
+            input_dir,
+            targets,
+            dataset_type,
+            profiler,
+            batch_size=batch_size,
+            queue_depth=pipeline_depth,
+            fresh_load=fresh_load,
+            memory_budget=memory_budget,
+        )
+        datastore_mapping = get_datastore_mapping(no_datastore_remap, file_paths)
         importer.import_all(datastore_mapping=datastore_mapping)
+        profiler.finish()
+        if memory_budget.limit is not None:
+            print(memory_budget.format_report())
         print("Import complete")
 
+        if verify:
+            for target in targets:
+                print(f"Verifying {target.name}...")
+                verifier = ImportVerifier(input_dir, target.butler, dataset_type, datastore_mapping)
+                _report_mismatches(verifier.verify())
+
+
+@click.command()
+@click.argument("repo")
+@click.option("--input-dir", default=DEFAULT_EXPORT_DIRECTORY)
+@click.option("--dataset-type", "-t", multiple=True, help="Only verify the given dataset types")
+@click.option("--no-datastore-remap", is_flag=True, help="The import did not remap datastore paths")
+@click.option(
+    "--file-paths",
+    help="Directory layout used for the imported files.  Options are 'rsp' or 'rucio'",
+    default="rsp",
+)
+def verify_main(
+    repo: str, input_dir: str, dataset_type: list[str], no_datastore_remap: bool, file_paths: str
+) -> None:
+    """Check that the repository REPO contains everything from an export."""
+    from lsst.daf.butler import Butler
+
+    from .verify_import import ImportVerifier
 
-_EXTERNAL_FILES_PREFIX = "file:///sdf/data/rubin/"
+    verifier = ImportVerifier(
+        input_dir, Butler(repo), list(dataset_type), get_datastore_mapping(no_datastore_remap, file_paths)
+    )
+    _report_mismatches(verifier.verify())
 
 
-def map_datastore_path_for_rsp(path: str) -> str:
-    """Remap a path to match the directory layout in the Google RSP deployment
-    of DP1.
+@click.command()
+@click.option(
+    "--db-connection-string",
+    required=True,
+    help="Connection string for the registry database, e.g. sqlite:///import-test-repo/gen3.sqlite3",
+)
+@click.option("--db-schema", help="Schema name of the registry tables")
+def restore_indexes_main(db_connection_string: str, db_schema: str | None) -> None:
+    """Rebuild the secondary indexes dropped by an import with --fresh-load
+    that was interrupted before it could rebuild them.
     """
-    path = path.replace(_EXTERNAL_FILES_PREFIX, "external/rubin/")
+    import sqlalchemy
+
+    from .fresh_load import FreshLoad
+
+    fresh_load = FreshLoad(sqlalchemy.create_engine(db_connection_string), db_schema)
+    if not fresh_load.get_pending_indexes():
+        print("No dropped indexes are waiting to be rebuilt")
+        return
+    fresh_load.restore()
+    print("Indexes restored")
 
-    if re.match(r"^[\w+]+://", path):
-        raise ValueError(f"Unhandled absolute path to datastore file: {path}")
 
-    return path
+def _report_mismatches(problems: list[Mismatch]) -> None:
+    for problem in problems:
+        print(f"{problem.table}: {problem.count} {problem.category} rows")
+        for sample in problem.samples:
+            print(f"    {sample}")
+    if problems:
+        raise click.ClickException(f"Found {len(problems)} sets of mismatched rows")
+    print("Target repository matches the export")
 
 
-def _rsp_datastore_mapping_function(input: DatastoreMappingInput) -> DatastoreMappingInput:
-    path = map_datastore_path_for_rsp(input.path)
-    # /repo/main and target repo both use the default
-    # "FileDatastore@<butlerRoot>" datastore name, so we don't need to remap
-    # the datastore name.
-    return input._replace(path=path)
+def _get_target_options(
+    seeds: list[str], db_connection_strings: list[str], db_schemas: list[str]
+) -> list[tuple[str | None, str | None, str | None]]:
+    """Return the seed, connection string and schema for each target
+    repository.
+    """
+    num_targets = max(len(seeds), len(db_connection_strings), len(db_schemas), 1)
+
+    def expand(option: str, values: list[str]) -> list[str | None]:
+        if not values:
+            return [None] * num_targets
+        if len(values) == 1:
+            return [values[0]] * num_targets
+        if len(values) != num_targets:
+            raise click.UsageError(f"{option} must be given once, or once for each target repository")
+        return list(values)
 
+    return list(
+        zip(
+            expand("--seed", seeds),
+            expand("--db-connection-string", db_connection_strings),
+            expand("--db-schema", db_schemas),
+        )
+    )
 
-def _rucio_datastore_mapping_function(input: DatastoreMappingInput) -> DatastoreMappingInput:
-    path = input.path
 
-    raw_prefix = _EXTERNAL_FILES_PREFIX + "lsstdata/offline/instrument/"
-    refcat_prefix = _EXTERNAL_FILES_PREFIX + "shared/"
-    if path.startswith(raw_prefix):
-        path = path.replace(raw_prefix, "raw/")
-    elif path.startswith(refcat_prefix):
-        path = path.replace(refcat_prefix, "raw/")
-    else:
-        path = "dp1/" + path
+def _make_config(seed: str | None, db_connection_string: str | None, db_schema: str | None) -> Config:
+    """Return the configuration for a new target repository."""
+    from lsst.daf.butler import Config
 
-    return input._replace(path=path)
+    config = Config(seed) if seed else Config()
+    if db_connection_string is not None:
+        assert db_schema is not None, "--db-schema is required with --db-connection-string"
+        config["registry", "db"] = db_connection_string
+    if db_schema is not None:
+        assert db_connection_string is not None, "--db-connection-string is required with --db-schema"
+        config["registry", "namespace"] = db_schema
+    return config
 
 
-def _null_datastore_mapping_function(input: DatastoreMappingInput) -> DatastoreMappingInput:
-    return input
+def _get_target_name(seed: str | None, db_schema: str | None, existing_names: list[str]) -> str:
+    parts = []
+    if seed:
+        parts.append(os.path.splitext(os.path.basename(seed))[0])
+    if db_schema:
+        parts.append(db_schema)
+    name = "/".join(parts) or "import-test-repo"
+    if name in existing_names:
+        name = f"{name}#{len(existing_names)}"
+    return name
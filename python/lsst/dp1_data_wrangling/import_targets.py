@@ -0,0 +1,301 @@
+from __future__ import annotations
+
+import io
+import queue
+import threading
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from itertools import groupby
+from typing import Any, NamedTuple, TypeAlias
+
+from lsst.daf.butler import (
+    Butler,
+    CollectionType,
+    DatasetAssociation,
+    DatasetRef,
+    DatasetType,
+    DimensionElement,
+    DimensionRecord,
+)
+
+from .collections_parquet import ExportedCollection, register_collections
+from .datastore_mapping import DatastoreMapper
+from .datastore_parquet import DatastoreRow
+from .fresh_load import FreshLoad, describe_repo_schema
+from .path_mapping import DatastoreMappingFunction
+from .progress import ProgressReporter
+
+# How often the thread distributing batches checks whether a writer thread
+# with a full queue has failed.
+_POLL_INTERVAL = 0.1
+
+
+class ImportTarget(NamedTuple):
+    """A repository to import into."""
+
+    name: str
+    """Name used to identify the repository in progress messages."""
+    butler: Butler
+    """Writeable Butler for the repository."""
+    reference: Butler | None = None
+    """Empty repository created from the same configuration, whose schema
+    the target's is checked against after a fresh load (see
+    `make_reference_repo`).
+    """
+
+
+class DatastoreBatch(NamedTuple):
+    rows: list[DatastoreRow]
+    """Datastore records for imported datasets, with paths already mapped to
+    the target repository.
+    """
+    rows_read: int
+    """Number of rows read from the export to produce ``rows``, including
+    rows for datasets that are not being imported.
+    """
+
+
+class TargetImporter:
+    """Writes decoded batches of rows from an export into one target
+    repository.
+
+    Parameters
+    ----------
+    target
+        Repository to write to.
+    datastore_mapping
+        Function used to map datastore records to the target.
+    progress
+        Progress reporter for rows written to this target.
+    fresh_load
+        If `True`, the target is a newly created repository, and its
+        secondary indexes are dropped for the duration of the load (see
+        `FreshLoad`).  If the target has a reference repository, the
+        schema is checked against it afterward.
+    """
+
+    def __init__(
+        self,
+        target: ImportTarget,
+        datastore_mapping: DatastoreMappingFunction,
+        progress: ProgressReporter,
+        fresh_load: bool = False,
+    ) -> None:
+        self.target = target
+        self.progress = progress
+        self._butler = target.butler
+        self._datastore_mapper = DatastoreMapper(datastore_mapping, self._butler._datastore)
+        self._collection_types: dict[str, CollectionType] = {}
+        self._fresh_load = FreshLoad.from_butler(self._butler) if fresh_load else None
+
+    @contextmanager
+    def load(self, dataset_types: list[DatasetType]) -> Iterator[None]:
+        """Prepare the target for writing batches, then open the transaction
+        they are written in.
+        """
+        # Dataset types have to be registered outside the transaction,
+        # because registering them creates tables.  They are registered
+        # before dropping indexes so that the indexes on their tables are
+        # deferred too.
+        for dt in dataset_types:
+            self._butler.registry.registerDatasetType(dt)
+            if self.target.reference is not None:
+                self.target.reference.registry.registerDatasetType(dt)
+        if self._fresh_load is not None:
+            self._fresh_load.drop_indexes()
+        try:
+            with self._butler.transaction():
+                yield
+        finally:
+            if self._fresh_load is not None:
+                reference = self.target.reference
+                self._fresh_load.restore(describe_repo_schema(reference) if reference is not None else None)
+        self.progress.finish()
+
+    def import_collections(self, collections_yaml: str) -> None:
+        self._butler.import_(filename=io.StringIO(collections_yaml), format="yaml")
+
+    def register_collections(self, collections: list[ExportedCollection]) -> None:
+        register_collections(self._butler, collections)
+
+    def insert_dimension_records(self, element: DimensionElement, records: list[DimensionRecord]) -> None:
+        self._butler.registry.insertDimensionData(element, *records, skip_existing=True)
+        self.progress.update(len(records))
+
+    def import_refs(self, refs: list[DatasetRef]) -> None:
+        # _importDatasets can only import refs from one run at a time,
+        # so chunk by run.
+        for run, run_refs in groupby(sorted(refs, key=_get_run), _get_run):
+            self._butler.registry._importDatasets(
+                list(run_refs),
+                # Setting expand=False will break things if "live
+                # ObsCore" is enabled, but expand=True is unacceptably
+                # slow because it generates a query for every single
+                # ref we are inserting.  We currently do not plan to
+                # use live ObsCore for data releases.
+                #
+                # TODO: The export data contains the dimension records
+                # necessary to expand the data IDs ourselves, so
+                # writing the logic to plumb that in would allow Live
+                # ObsCore to work without the queries.
+                expand=False,
+            )
+        self.progress.update(len(refs))
+
+    def import_associations(self, associations: list[DatasetAssociation]) -> None:
+        self.progress.update(len(associations))
+        associations = sorted(associations, key=_get_collection)
+        for collection, rows in groupby(associations, _get_collection):
+            collection_type = self._get_collection_type(collection)
+            if collection_type == CollectionType.TAGGED:
+                self._butler.registry.associate(collection, [r.ref for r in rows])
+            elif collection_type == CollectionType.CALIBRATION:
+                for row in rows:
+                    self._butler.registry.certify(collection, [row.ref], row.timespan)
+            else:
+                raise ValueError(
+                    f"Unexpected collection type '{collection_type}'"
+                    f" when importing associations into collection '{collection}'"
+                )
+
+    def import_datastore_records(self, batch: DatastoreBatch) -> None:
+        records = self._datastore_mapper.group_for_target(batch.rows)
+        self._butler._datastore.import_records(records)
+        self.progress.update(batch.rows_read)
+
+    def _get_collection_type(self, collection: str) -> CollectionType:
+        collection_type = self._collection_types.get(collection)
+        if collection_type is None:
+            collection_type = self._butler.collections.get_info(collection).type
+            self._collection_types[collection] = collection_type
+        return collection_type
+
+
+ApplyFunction: TypeAlias = Callable[[TargetImporter, Any], None]
+"""Function writing one decoded batch to a target."""
+
+
+class SerialWriter:
+    """Writes batches to a single target, in the calling thread."""
+
+    def __init__(self, target: TargetImporter) -> None:
+        self._target = target
+
+    @contextmanager
+    def session(self, dataset_types: list[DatasetType]) -> Iterator[None]:
+        with self._target.load(dataset_types):
+            yield
+
+    def write(self, apply: ApplyFunction, batch: object) -> None:
+        apply(self._target, batch)
+
+
+class FanOutWriter:
+    """Writes each batch to several targets concurrently.
+
+    Each target has its own writer thread, queue and transaction, so a
+    failure in one target rolls back only that target's transaction; the
+    others continue.  Each batch is decoded once and shared between the
+    targets, so apply functions must not modify it.
+
+    Parameters
+    ----------
+    targets
+        Targets to write to.
+    queue_depth
+        Maximum number of batches waiting to be written to each target.
+    """
+
+    def __init__(self, targets: list[TargetImporter], queue_depth: int) -> None:
+        self._writers = [_WriterThread(t, queue_depth) for t in targets]
+
+    @contextmanager
+    def session(self, dataset_types: list[DatasetType]) -> Iterator[None]:
+        """Start the writer threads, which prepare their targets and open a
+        transaction.  When the session ends, wait for the
+        writers to finish and commit, and raise if any target failed.
+        """
+        for writer in self._writers:
+            writer.start(dataset_types)
+        try:
+            yield
+        except BaseException:
+            # Reading the export failed, so roll back every target.
+            for writer in self._writers:
+                writer.finish(commit=False)
+            raise
+        for writer in self._writers:
+            writer.finish(commit=True)
+
+        failures = [w for w in self._writers if w.failure is not None]
+        for writer in self._writers:
+            status = f"FAILED: {writer.failure!r}" if writer.failure is not None else "complete"
+            print(f"Import into {writer.target.target.name}: {status}")
+        if failures:
+            raise RuntimeError(
+                f"Import failed for {len(failures)} of {len(self._writers)} targets: "
+                + ", ".join(w.target.target.name for w in failures)
+            ) from failures[0].failure
+
+    def write(self, apply: ApplyFunction, batch: object) -> None:
+        for writer in self._writers:
+            writer.put((apply, batch))
+        if all(w.failure is not None for w in self._writers):
+            raise RuntimeError("Import failed for all targets") from self._writers[0].failure
+
+
+class _Finish(NamedTuple):
+    commit: bool
+
+
+class _WriterThread:
+    def __init__(self, target: TargetImporter, queue_depth: int) -> None:
+        self.target = target
+        self.failure: BaseException | None = None
+        self._queue: queue.Queue[tuple[ApplyFunction, object] | _Finish] = queue.Queue(
+            maxsize=max(1, queue_depth)
+        )
+        self._thread: threading.Thread | None = None
+
+    def start(self, dataset_types: list[DatasetType]) -> None:
+        self._thread = threading.Thread(
+            target=self._run, args=(dataset_types,), name=f"ImportWriter-{self.target.target.name}"
+        )
+        self._thread.start()
+
+    def put(self, item: tuple[ApplyFunction, object] | _Finish) -> None:
+        # Batches for a failed target are dropped, and the distributing
+        # thread must not block forever on its full queue.
+        while self.failure is None:
+            try:
+                self._queue.put(item, timeout=_POLL_INTERVAL)
+                return
+            except queue.Full:
+                pass
+
+    def finish(self, commit: bool) -> None:
+        assert self._thread is not None
+        self.put(_Finish(commit))
+        self._thread.join()
+
+    def _run(self, dataset_types: list[DatasetType]) -> None:
+        try:
+            with self.target.load(dataset_types):
+                while True:
+                    item = self._queue.get()
+                    if isinstance(item, _Finish):
+                        if not item.commit:
+                            raise RuntimeError("Import aborted")
+                        break
+                    apply, batch = item
+                    apply(self.target, batch)
+        except BaseException as e:
+            self.failure = e
+
+
+def _get_run(ref: DatasetRef) -> str:
+    return ref.run
+
+
+def _get_collection(association: DatasetAssociation) -> str:
+    return association.collection
@@ -1,37 +1,106 @@
 from __future__ import annotations
 
-from itertools import groupby
-
-from lsst.daf.butler import (
-    Butler,
-    CollectionType,
-    DatasetAssociation,
-    DatasetId,
-    DatasetRef,
-    DatasetType,
-)
+import functools
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from typing import TypeAlias, TypeVar
+
+import numpy
+from lsst.daf.butler import Butler, DatasetRef, DatasetType, DimensionElement, DimensionRecord
 
+from .archive import open_export
+from .collections_parquet import read_collections_file
+from .dataset_id_index import DatasetIdIndex, check_dataset_id_index
+from .dataset_ids import DATASET_ID_DTYPE, DatasetIdSet
 from .dataset_types import import_dataset_types
 from .datasets_parquet import (
     read_dataset_associations_from_file,
     read_dataset_refs_from_file,
 )
-from .datastore_mapping import DatastoreMapper, DatastoreMappingFunction
+from .datastore_mapping import map_datastore_rows
 from .datastore_parquet import read_datastore_records_from_file
+from .dimension_closure import DimensionClosure
 from .dimension_record_parquet import read_dimension_records_from_file
-from .index import ExportIndex
-from .paths import ExportPaths
-from .utils import read_model_from_file
+from .import_targets import (
+    DatastoreBatch,
+    FanOutWriter,
+    ImportTarget,
+    SerialWriter,
+    TargetImporter,
+)
+from .index import ExportIndex, check_parquet_file
+from .memory_budget import BatchSizer, MemoryBudget
+from .path_mapping import CachedDatastoreMapping, DatastoreMappingFunction
+from .pipeline import PipelineStats, prefetch
+from .profiling import StageProfiler
+from .progress import ProgressReporter
+from .utils import DEFAULT_BATCH_SIZE, read_model_from_file
 
 
 class Importer:
-    def __init__(self, input_path: str, butler: Butler, dataset_types: list[str] | None) -> None:
-        self._paths = ExportPaths(input_path)
-        self._butler = butler
+    """Import an export created by `Exporter` into one or more Butler
+    repositories.
+
+    Parameters
+    ----------
+    input_path
+        Export directory or archive.
+    targets
+        Writeable Butler for the target repository, or several target
+        repositories.  With several targets, each batch is read and decoded
+        once, then written to every target concurrently, each in its own
+        thread and transaction.  A failure in one target does not stop the
+        import into the others.
+    dataset_types
+        Dataset types to import, or `None` to import all of them.
+    profiler
+        Profiler for the stages of the import.
+    batch_size
+        Number of rows read from the export at a time, or the largest batch
+        read when ``memory_budget`` is given.
+    queue_depth
+        If greater than zero, read and decode batches in a background thread
+        while the database writes happen in the calling thread, keeping up
+        to this many decoded batches waiting to be written.  If zero, each
+        batch is read, decoded and written in turn.  With several targets,
+        this is also the number of batches queued for each target's writer.
+    fresh_load
+        If `True`, the targets are newly created repositories, and their
+        secondary indexes are dropped during the load and rebuilt afterward
+        (see `FreshLoad`).
+    memory_budget
+        If given, batches are sized so that the batches read, queued and
+        being written fit in this budget.
+    """
+
+    def __init__(
+        self,
+        input_path: str,
+        targets: Butler | Sequence[ImportTarget],
+        dataset_types: list[str] | None,
+        profiler: StageProfiler | None = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        queue_depth: int = 0,
+        fresh_load: bool = False,
+        memory_budget: MemoryBudget | None = None,
+    ) -> None:
+        self._paths = open_export(input_path)
+        if isinstance(targets, Butler):
+            targets = [ImportTarget(name="target", butler=targets)]
+        assert len(targets) > 0, "At least one target repository is required"
+        self._targets = list(targets)
+        # All targets are expected to use the same dimension universe, so
+        # batches can be decoded once for all of them.
+        self._universe = self._targets[0].butler.dimensions
         self._dataset_types = dataset_types
+        self._profiler = profiler if profiler is not None else StageProfiler()
+        self._batch_size = batch_size
+        self._queue_depth = queue_depth
+        self._fresh_load = fresh_load
+        self._budget = memory_budget if memory_budget is not None else MemoryBudget()
+        self.pipeline_stats = PipelineStats()
 
     def import_all(self, datastore_mapping: DatastoreMappingFunction) -> ExportIndex:
-        index = read_model_from_file(ExportIndex, self._paths.index_path())
+        index = read_model_from_file(ExportIndex, self._paths.open_input(self._paths.index_path()))
 
         if self._dataset_types:
             unknown_dataset_types = set(self._dataset_types) - set(index.dataset_types)
@@ -40,95 +109,273 @@ class Importer:
         else:
             self._dataset_types = index.dataset_types
 
-        # Dataset types have to be registered outside the transaction,
-        # because registering them creates tables.
-        dataset_types = import_dataset_types(self._paths.dataset_type_path(), self._butler.dimensions)
+        # Make sure the files we are about to read are the ones that were
+        # written by the exporter, before making any changes to the target
+        # repository.
+        self._check_files(index)
+
+        id_index = DatasetIdIndex(self._paths, index) if index.dataset_id_index_files else None
+        try:
+            self._load(index, id_index, datastore_mapping)
+        finally:
+            if id_index is not None:
+                id_index.close()
+        return index
+
+    def _load(
+        self,
+        index: ExportIndex,
+        id_index: DatasetIdIndex | None,
+        datastore_mapping: DatastoreMappingFunction,
+    ) -> None:
+        assert self._dataset_types is not None
+        dataset_types = import_dataset_types(
+            self._paths.open_input(self._paths.dataset_type_path()), self._universe
+        )
         dataset_types = [dt for dt in dataset_types if dt.name in self._dataset_types]
-        for dt in dataset_types:
-            self._butler.registry.registerDatasetType(dt)
 
-        with self._butler.transaction():
-            self._butler.import_(filename=self._paths.collections_path())
-            self._import_dimension_records(index.dimensions)
-            imported_datasets = self._import_datasets(dataset_types)
-            self._import_associations(dataset_types)
-            self._import_datastore(datastore_mapping, imported_datasets)
+        closure: DimensionClosure | None = None
+        datastore_row_groups: list[int] | None = None
+        if set(self._dataset_types) != set(index.dataset_types):
+            # Only part of the export is being imported, so only read the
+            # dimension records and datastore rows it needs.
+            with self._profiler.stage("subset"):
+                closure = DimensionClosure(self._paths, self._universe, dataset_types, index.dimensions)
+                if id_index is not None:
+                    datastore_row_groups = self._find_datastore_row_groups(index, id_index, dataset_types)
+        dimensions = closure.elements if closure is not None else index.dimensions
+        total_rows = self._count_rows(index, dimensions)
 
-        return index
+        writer = self._make_writer(datastore_mapping, total_rows)
+        with writer.session(dataset_types):
+            with self._profiler.stage("collections"):
+                self._import_collections(writer)
+            self._import_dimension_records(writer, dimensions, closure)
+            imported_datasets = self._import_datasets(writer, index, id_index, dataset_types)
+            self._import_associations(writer, dataset_types)
+            with self._profiler.stage("datastore"):
+                self._import_datastore(writer, datastore_mapping, imported_datasets, datastore_row_groups)
+        if self._queue_depth > 0:
+            print(f"Import pipeline: {self.pipeline_stats.format()}")
+
+    def _make_writer(
+        self, datastore_mapping: DatastoreMappingFunction, total_rows: int | None
+    ) -> SerialWriter | FanOutWriter:
+        if len(self._targets) == 1:
+            progress = ProgressReporter("Importing rows", total_rows)
+            return SerialWriter(
+                TargetImporter(self._targets[0], datastore_mapping, progress, self._fresh_load)
+            )
+
+        target_importers = []
+        for target in self._targets:
+            progress = ProgressReporter(f"Importing rows into {target.name}", total_rows)
+            target_importers.append(TargetImporter(target, datastore_mapping, progress, self._fresh_load))
+        return FanOutWriter(target_importers, self._queue_depth)
+
+    def _get_input_files(self, index: ExportIndex, dimensions: list[str]) -> list[str]:
+        assert self._dataset_types is not None
+        paths = [self._paths.dimension_parquet_path(d) for d in dimensions if self._universe[d].has_own_table]
+        for dt in self._dataset_types:
+            paths.append(self._paths.dataset_parquet_path(dt))
+            paths.append(self._paths.dataset_association_parquet_path(dt))
+        if self._paths.relative_path(self._paths.datastore_parquet_path()) in index.files:
+            paths.append(self._paths.datastore_parquet_path())
+        return paths
+
+    def _check_files(self, index: ExportIndex) -> None:
+        problems = []
+        for path in [*self._get_input_files(index, index.dimensions), self._paths.collections_parquet_path()]:
+            expected = index.files.get(self._paths.relative_path(path))
+            if expected is not None:
+                problems.extend(check_parquet_file(self._paths, path, expected))
+        if index.dataset_id_index is not None:
+            # Datastore rows are selected using the dataset ID index, so a
+            # stale index would silently drop rows.
+            problems.extend(check_dataset_id_index(self._paths, index.dataset_id_index))
+        if problems:
+            raise RuntimeError("Export files do not match the export index:\n" + "\n".join(problems))
 
-    def _import_dimension_records(self, dimensions: list[str]) -> None:
-        universe = self._butler.dimensions
-        dimensions = universe.sorted(dimensions)
-        for dimension_name in dimensions:
-            element = universe[dimension_name]
+    def _count_rows(self, index: ExportIndex, dimensions: list[str]) -> int | None:
+        """Return the total number of rows in the files that will be read
+        during the import, or `None` if the index does not include row counts.
+        """
+        if not index.files:
+            return None
+        return sum(self._get_row_count(index, path) for path in self._get_input_files(index, dimensions))
+
+    def _get_row_count(self, index: ExportIndex, path: str) -> int:
+        info = index.files.get(self._paths.relative_path(path))
+        return info.num_rows if info is not None else 0
+
+    def _import_collections(self, writer: _Writer) -> None:
+        if self._paths.exists(self._paths.collections_parquet_path()):
+            with self._paths.open_input(self._paths.collections_parquet_path()) as input:
+                collections = read_collections_file(input)
+            writer.write(TargetImporter.register_collections, collections)
+        else:
+            # Exports written before the collections parquet file was added
+            # only have the YAML file.
+            collections_yaml = self._paths.read_text(self._paths.collections_path())
+            writer.write(TargetImporter.import_collections, collections_yaml)
+
+    def _import_dimension_records(
+        self, writer: _Writer, dimensions: list[str], closure: DimensionClosure | None
+    ) -> None:
+        for dimension_name in self._universe.sorted(dimensions):
+            element = self._universe[dimension_name]
             # If a dimension doesn't "have its own table", then it's a virtual
             # dimension defined by another dimension, and we can't insert rows
             # for it.  In the default LSST universe, "band" doesn't have its
             # own table because it is derived from "physical_filter".
             if element.has_own_table:
                 path = self._paths.dimension_parquet_path(element.name)
-                for table in read_dimension_records_from_file(element, path):
-                    self._butler.registry.insertDimensionData(element, *list(table), skip_existing=True)
+                tables = read_dimension_records_from_file(
+                    element,
+                    self._paths.open_input(path),
+                    sizer=self._open_sizer(path),
+                    row_filter=closure.make_filter(element) if closure is not None else None,
+                )
+                apply = functools.partial(_insert_dimension_records, element=element)
+                with self._profiler.stage(f"dimensions/{element.name}"):
+                    for records in self._read(list(table) for table in tables):
+                        writer.write(apply, records)
 
-    def _import_datasets(self, dataset_types: list[DatasetType]) -> set[DatasetId]:
-        imported_datasets: set[DatasetId] = set()
+    def _import_datasets(
+        self,
+        writer: _Writer,
+        index: ExportIndex,
+        id_index: DatasetIdIndex | None,
+        dataset_types: list[DatasetType],
+    ) -> _DatasetIdFilter:
+        """Import datasets, returning a function that checks whether dataset
+        IDs are among the ones that were imported.
+        """
+        dataset_files = [self._paths.dataset_parquet_path(dt.name) for dt in dataset_types]
+        imported_datasets: DatasetIdSet | None = None
+        if id_index is not None:
+            # The export's dataset ID index already knows which file each
+            # dataset came from, so there is no need to track the IDs.
+            id_filter = functools.partial(
+                id_index.contains, files=[self._paths.relative_path(f) for f in dataset_files]
+            )
+        else:
+            # Size the ID buffer up front from the row counts in the index, so
+            # it doesn't have to be repeatedly re-allocated as it grows.
+            imported_datasets = DatasetIdSet(sum(self._get_row_count(index, f) for f in dataset_files))
+            id_filter = imported_datasets.contains
 
         for dt in dataset_types:
-            path = self._paths.dataset_parquet_path(dt.name)
-            for batch in read_dataset_refs_from_file(dt, path):
-                # _importDatasets can only import refs from one run at a time,
-                # so chunk by run.
-                for run, refs in groupby(sorted(batch, key=_get_run), _get_run):
-                    ref_list = list(refs)
-                    imported_datasets.update(ref.id for ref in ref_list)
-                    self._butler.registry._importDatasets(
-                        ref_list,
-                        # Setting expand=False will break things if "live
-                        # ObsCore" is enabled, but expand=True is unacceptably
-                        # slow because it generates a query for every single
-                        # ref we are inserting.  We currently do not plan to
-                        # use live ObsCore for data releases.
-                        #
-                        # TODO: The export data contains the dimension records
-                        # necessary to expand the data IDs ourselves, so
-                        # writing the logic to plumb that in would allow Live
-                        # ObsCore to work without the queries.
-                        expand=False,
-                    )
-
-        return imported_datasets
-
-    def _import_associations(self, dataset_types: list[DatasetType]) -> None:
+            with self._profiler.stage(f"datasets/{dt.name}"):
+                for refs in self._read(self._decode_refs(dt, imported_datasets)):
+                    writer.write(TargetImporter.import_refs, refs)
+
+        if imported_datasets is not None:
+            imported_datasets.freeze()
+        return id_filter
+
+    def _decode_refs(
+        self, dt: DatasetType, imported_datasets: DatasetIdSet | None
+    ) -> Iterator[list[DatasetRef]]:
+        path = self._paths.dataset_parquet_path(dt.name)
+        input_file = self._paths.open_input(path)
+        for refs in read_dataset_refs_from_file(dt, input_file, sizer=self._open_sizer(path)):
+            if imported_datasets is not None:
+                imported_datasets.add(numpy.array([ref.id.bytes for ref in refs], dtype=DATASET_ID_DTYPE))
+            yield refs
+
+    def _import_associations(self, writer: _Writer, dataset_types: list[DatasetType]) -> None:
         for dt in dataset_types:
             path = self._paths.dataset_association_parquet_path(dt.name)
-            for batch in read_dataset_associations_from_file(dt, path):
-                batch.sort(key=_get_collection)
-                for collection, rows in groupby(batch, _get_collection):
-                    collection_type = self._butler.collections.get_info(collection).type
-                    if collection_type == CollectionType.TAGGED:
-                        self._butler.registry.associate(collection, [r.ref for r in rows])
-                    elif collection_type == CollectionType.CALIBRATION:
-                        for row in rows:
-                            self._butler.registry.certify(collection, [row.ref], row.timespan)
-                    else:
-                        raise ValueError(
-                            f"Unexpected collection type '{collection_type}'"
-                            f" when importing associations for dataset type '{dt.name}'"
-                        )
+            batches = read_dataset_associations_from_file(
+                dt, self._paths.open_input(path), sizer=self._open_sizer(path)
+            )
+            with self._profiler.stage(f"associations/{dt.name}"):
+                for associations in self._read(batches):
+                    writer.write(TargetImporter.import_associations, associations)
 
     def _import_datastore(
-        self, datastore_mapping: DatastoreMappingFunction, imported_datasets: set[DatasetId]
+        self,
+        writer: _Writer,
+        datastore_mapping: DatastoreMappingFunction,
+        imported_datasets: _DatasetIdFilter,
+        row_groups: list[int] | None,
     ) -> None:
-        mapper = DatastoreMapper(datastore_mapping, self._butler._datastore)
-        for batch in read_datastore_records_from_file(self._paths.datastore_parquet_path()):
-            batch = [row for row in batch if row.dataset_id in imported_datasets]
-            records = mapper.map_to_target(batch)
-            self._butler._datastore.import_records(records)
+        batches = self._decode_datastore_records(datastore_mapping, imported_datasets, row_groups)
+        for batch in self._read(batches):
+            writer.write(TargetImporter.import_datastore_records, batch)
+
+    def _decode_datastore_records(
+        self,
+        datastore_mapping: DatastoreMappingFunction,
+        imported_datasets: _DatasetIdFilter,
+        row_groups: list[int] | None,
+    ) -> Iterator[DatastoreBatch]:
+        rows_read = 0
+
+        def dataset_id_filter(ids: numpy.ndarray) -> numpy.ndarray:
+            nonlocal rows_read
+            rows_read += len(ids)
+            return imported_datasets(ids)
+
+        path = self._paths.datastore_parquet_path()
+        input_file = self._paths.open_input(path)
+        # Path mapping is done along with decoding, so it is done only once
+        # for all targets, and in the background thread when pipelining is
+        # enabled.
+        datastore_mapping = CachedDatastoreMapping(datastore_mapping)
+        sizer = self._open_sizer(path)
+        records = read_datastore_records_from_file(
+            input_file, dataset_id_filter, sizer=sizer, row_groups=row_groups
+        )
+        for rows in records:
+            yield DatastoreBatch(rows=map_datastore_rows(rows, datastore_mapping), rows_read=rows_read)
+            rows_read = 0
+
+    def _find_datastore_row_groups(
+        self, index: ExportIndex, id_index: DatasetIdIndex, dataset_types: list[DatasetType]
+    ) -> list[int] | None:
+        """Return the row groups of the datastore file that have records for
+        the given dataset types, or `None` if the whole file must be read.
+        """
+        datastore_file = self._paths.relative_path(self._paths.datastore_parquet_path())
+        if datastore_file not in index.dataset_id_index_files:
+            return None
+        dataset_files = [
+            self._paths.relative_path(self._paths.dataset_parquet_path(dt.name)) for dt in dataset_types
+        ]
+        row_groups = id_index.find_row_groups(datastore_file, dataset_files)
+        info = index.files.get(datastore_file)
+        total = f" of {info.num_row_groups}" if info is not None else ""
+        print(f"Reading {len(row_groups)}{total} datastore row groups")
+        return row_groups
+
+    def _open_sizer(self, path: str) -> BatchSizer:
+        """Return the sizer for the batches read from one file."""
+        # Batches may be queued for the background decoding thread and for
+        # each target's writer thread, besides the one being written.
+        copies = 1
+        if self._queue_depth > 0:
+            copies += self._queue_depth + 1
+        if len(self._targets) > 1:
+            copies += max(1, self._queue_depth)
+        return self._budget.open(self._paths.relative_path(path), self._batch_size, copies)
+
+    def _read(self, batches: Iterable[_T]) -> Iterable[_T]:
+        """Return ``batches``, read and decoded in a background thread if
+        pipelining is enabled.
+        """
+        if self._queue_depth > 0:
+            return prefetch(batches, self._queue_depth, self.pipeline_stats)
+        return batches
 
 
-def _get_run(ref: DatasetRef) -> str:
-    return ref.run
+def _insert_dimension_records(
+    target: TargetImporter, records: list[DimensionRecord], *, element: DimensionElement
+) -> None:
+    target.insert_dimension_records(element, records)
 
 
-def _get_collection(association: DatasetAssociation) -> str:
-    return association.collection
+_DatasetIdFilter: TypeAlias = Callable[[numpy.ndarray], numpy.ndarray]
+_Writer: TypeAlias = SerialWriter | FanOutWriter
+_T = TypeVar("_T")
@@ -1,9 +1,176 @@
 from __future__ import annotations
 
+import hashlib
+
 import pydantic
+import pyarrow
+from pyarrow.parquet import ParquetFile
+
+from .paths import ExportPaths
+
+
+class KeyRange(pydantic.BaseModel):
+    """Minimum and maximum value of a column.  Binary values are stored as
+    hex strings.
+    """
+
+    min: int | str
+    max: int | str
+
+
+class ParquetFileInfo(pydantic.BaseModel):
+    """Summary of a parquet file, used to plan an import and detect files
+    that were truncated or replaced after the export was written.
+    """
+
+    num_rows: int
+    num_bytes: int
+    num_row_groups: int
+    schema_hash: str
+    key_ranges: dict[str, KeyRange] = pydantic.Field(default_factory=dict)
+
+
+class IndexFileInfo(pydantic.BaseModel):
+    """Size and hash of a file that isn't in parquet format, used to detect
+    files that were truncated or replaced after the export was written.
+    """
+
+    num_bytes: int
+    sha256: str
+
+
+class ExportSubset(pydantic.BaseModel):
+    """Restrictions on which datasets are exported, for small development
+    exports.  All given restrictions apply together.
+    """
+
+    skymap: str | None = None
+    """Sky map that ``tracts`` and ``patches`` belong to."""
+    tracts: list[int] = pydantic.Field(default_factory=list)
+    """Only export datasets overlapping these tracts."""
+    patches: list[int] = pydantic.Field(default_factory=list)
+    """Only export datasets overlapping these patches."""
+    region: tuple[float, float, float] | None = None
+    """Only export datasets overlapping a circle, given as RA, Dec and
+    radius in degrees.
+    """
+    day_obs_min: int | None = None
+    """Only export datasets observed on or after this day_obs."""
+    day_obs_max: int | None = None
+    """Only export datasets observed on or before this day_obs."""
+    visit_fraction: float | None = None
+    """Only export datasets for this fraction of the visits, chosen evenly
+    from the visits sorted by ID.
+    """
 
 
 class ExportIndex(pydantic.BaseModel):
     dimensions: list[str]
     dataset_types: list[str]
     root_collection: str
+    files: dict[str, ParquetFileInfo] = pydantic.Field(default_factory=dict)
+    """Information about each parquet file in the export, keyed by path
+    relative to the export directory.  Empty for exports written before this
+    information was recorded.
+    """
+    dataset_id_index_files: list[str] = pydantic.Field(default_factory=list)
+    """Files covered by the dataset ID index, as paths relative to the export
+    directory, in the order used for file numbers in the index.  Empty if the
+    export does not have a dataset ID index.
+    """
+    dataset_id_index: IndexFileInfo | None = None
+    """Size and hash of the dataset ID index file, or `None` if the export
+    does not have a dataset ID index or was written before this was
+    recorded.
+    """
+    subset: ExportSubset | None = None
+    """Restrictions applied when the export was written, or `None` if the
+    export contains everything in the root collection.
+    """
+    universe_namespace: str | None = None
+    """Namespace of the dimension universe of the source repository, or
+    `None` for exports written before the universe was recorded.
+    """
+    universe_version: int | None = None
+    """Version of the dimension universe of the source repository, or `None`
+    for exports written before the universe was recorded.
+    """
+
+
+def describe_parquet_file(paths: ExportPaths, path: str, key_columns: list[str]) -> ParquetFileInfo:
+    """Summarize a parquet file using only its footer metadata."""
+    with paths.open_input(path) as input:
+        return _describe_parquet_file(input, paths.file_size(path), key_columns)
+
+
+def _describe_parquet_file(
+    input: pyarrow.NativeFile, num_bytes: int, key_columns: list[str]
+) -> ParquetFileInfo:
+    file = ParquetFile(input)
+    metadata = file.metadata
+    return ParquetFileInfo(
+        num_rows=metadata.num_rows,
+        num_bytes=num_bytes,
+        num_row_groups=metadata.num_row_groups,
+        schema_hash=compute_schema_hash(file.schema_arrow),
+        key_ranges=_get_key_ranges(file, key_columns),
+    )
+
+
+def compute_schema_hash(schema: pyarrow.Schema) -> str:
+    # Metadata is excluded because pandas stores its version number there.
+    return hashlib.sha256(str(schema.remove_metadata()).encode()).hexdigest()
+
+
+def _get_key_ranges(file: ParquetFile, key_columns: list[str]) -> dict[str, KeyRange]:
+    metadata = file.metadata
+    column_indexes = {metadata.schema.column(i).path: i for i in range(metadata.num_columns)}
+    ranges: dict[str, KeyRange] = {}
+    for name in key_columns:
+        index = column_indexes.get(name)
+        if index is None:
+            continue
+        values = []
+        for row_group in range(metadata.num_row_groups):
+            statistics = metadata.row_group(row_group).column(index).statistics
+            if statistics is None or not statistics.has_min_max:
+                break
+            values.extend([statistics.min, statistics.max])
+        else:
+            if values:
+                ranges[name] = KeyRange(min=_to_json_value(min(values)), max=_to_json_value(max(values)))
+    return ranges
+
+
+def _to_json_value(value: object) -> int | str:
+    if isinstance(value, bytes):
+        return value.hex()
+    if isinstance(value, int):
+        return value
+    return str(value)
+
+
+def check_parquet_file(paths: ExportPaths, path: str, expected: ParquetFileInfo) -> list[str]:
+    """Compare a parquet file against the information recorded for it at
+    export time, returning a description of each difference found.
+    """
+    if not paths.exists(path):
+        return [f"{path}: file is missing"]
+    num_bytes = paths.file_size(path)
+    if num_bytes != expected.num_bytes:
+        # A truncated file won't have a readable footer, so don't try to open
+        # it.
+        return [f"{path}: expected {expected.num_bytes} bytes, found {num_bytes}"]
+
+    with paths.open_input(path) as input:
+        actual = _describe_parquet_file(input, num_bytes, [])
+    problems = []
+    if actual.num_rows != expected.num_rows:
+        problems.append(f"{path}: expected {expected.num_rows} rows, found {actual.num_rows}")
+    if actual.num_row_groups != expected.num_row_groups:
+        problems.append(
+            f"{path}: expected {expected.num_row_groups} row groups, found {actual.num_row_groups}"
+        )
+    if actual.schema_hash != expected.schema_hash:
+        problems.append(f"{path}: schema does not match the schema recorded at export time")
+    return problems
@@ -0,0 +1,444 @@
+from __future__ import annotations
+
+from collections.abc import Iterable, Iterator
+from typing import TYPE_CHECKING
+
+import click
+import pyarrow
+import pyarrow.compute
+import pyarrow.dataset
+import pyarrow.types
+
+from .archive import open_export
+from .datastore_paths import PATH_COLUMNS, get_path_read_columns, join_path_columns
+from .index import ExportIndex
+from .paths import DEFAULT_EXPORT_DIRECTORY
+from .utils import read_model_from_file
+
+if TYPE_CHECKING:
+    from lsst.sphgeom import Region
+
+
+class DumpInspector:
+    """Read-only access to the parquet files in an export, without needing a
+    Butler.  The export may be a directory, an archive, a chunk store or a
+    URI (see `open_export`).
+
+    Tables are named the same way as the files in the export directory:
+    ``datasets/<dataset type>``, ``associations/<dataset type>``,
+    ``dimensions/<element>`` and ``datastore``.  They are opened lazily as
+    `pyarrow.dataset.Dataset` objects, so filters and column selections are
+    pushed down to the parquet reader and only the row groups and columns
+    needed to answer a query are read.
+    """
+
+    def __init__(self, input_path: str) -> None:
+        self._paths = open_export(input_path)
+        self.index = read_model_from_file(ExportIndex, self._paths.open_input(self._paths.index_path()))
+        self._datasets: dict[str, pyarrow.dataset.Dataset] = {}
+
+    def table_names(self) -> list[str]:
+        names = ["datastore"]
+        names.extend(f"datasets/{dt}" for dt in sorted(self.index.dataset_types))
+        names.extend(f"associations/{dt}" for dt in sorted(self.index.dataset_types))
+        names.extend(f"dimensions/{d}" for d in sorted(self.index.dimensions))
+        return names
+
+    def open(self, table_name: str) -> pyarrow.dataset.Dataset:
+        dataset = self._datasets.get(table_name)
+        if dataset is None:
+            # The file is opened through the export's paths, so that
+            # members of archives and chunk stores can be read in place.
+            format = pyarrow.dataset.ParquetFileFormat()
+            fragment = format.make_fragment(self._paths.open_input(self._get_path(table_name)))
+            dataset = pyarrow.dataset.FileSystemDataset([fragment], fragment.physical_schema, format)
+            self._datasets[table_name] = dataset
+        return dataset
+
+    def scan(
+        self,
+        table_name: str,
+        columns: list[str] | None = None,
+        filter: pyarrow.compute.Expression | None = None,
+        region: Region | None = None,
+    ) -> Iterator[pyarrow.RecordBatch]:
+        """Iterate over record batches from the given table, reading only the
+        given columns and skipping row groups whose statistics show they
+        cannot match ``filter``.
+
+        If ``region`` is given, only dimension records whose regions overlap
+        it are returned.
+
+        Datastore paths are returned as a single ``path`` column, even though
+        they are stored split into parts.
+        """
+        dataset = self.open(table_name)
+        if region is not None:
+            yield from self._scan_overlapping(table_name, dataset, columns, filter, region)
+            return
+        if columns is not None:
+            columns = get_path_read_columns(dataset.schema, columns)
+        for batch in dataset.to_batches(columns=columns, filter=filter):
+            if batch.num_rows > 0:
+                yield join_path_columns(batch)
+
+    def count(
+        self,
+        table_name: str,
+        filter: pyarrow.compute.Expression | None = None,
+        region: Region | None = None,
+    ) -> int:
+        if region is not None:
+            return sum(batch.num_rows for batch in self.scan(table_name, ["region"], filter, region))
+        return self.open(table_name).count_rows(filter=filter)
+
+    def group_count(
+        self,
+        table_name: str,
+        group_by: list[str],
+        filter: pyarrow.compute.Expression | None = None,
+        region: Region | None = None,
+    ) -> pyarrow.Table:
+        """Count rows for each distinct combination of values in the
+        ``group_by`` columns.
+
+        Counts are computed one batch at a time and then combined, so memory
+        use is proportional to the number of groups rather than the number of
+        rows.
+        """
+        counts = _combine_group_counts(
+            [
+                _count_groups(pyarrow.Table.from_batches([_decode_dictionaries(batch)]), group_by)
+                for batch in self.scan(table_name, columns=group_by, filter=filter, region=region)
+            ],
+            group_by,
+        )
+        if counts is None:
+            schema = self.open(table_name).schema
+            fields = [_decode_dictionary_field(schema.field(c)) for c in group_by]
+            return pyarrow.schema([*fields, pyarrow.field("count", pyarrow.int64())]).empty_table()
+        return counts
+
+    def join(
+        self,
+        left_table: str,
+        right_table: str,
+        keys: list[tuple[str, str]],
+        columns: list[str],
+        filter: pyarrow.compute.Expression | None = None,
+        region: Region | None = None,
+    ) -> Iterator[pyarrow.Table]:
+        """Generate the rows from ``right_table`` that match the rows of
+        ``left_table`` selected by ``filter`` and ``region``.
+
+        The selected left rows are read into memory, and the right table is
+        read one batch at a time, with each batch joined against them, so
+        memory use does not grow with the size of the right table.
+
+        Parameters
+        ----------
+        left_table
+            Table that ``filter`` applies to.
+        right_table
+            Table being joined to ``left_table``.
+        keys
+            Pairs of (left column, right column) that must be equal.
+        columns
+            Columns to include in the output.  Columns are looked up in the
+            right table first, then the left table.
+        filter
+            Filter applied to the left table before joining.
+        region
+            If given, only left rows whose regions overlap it are joined.
+        """
+        left_keys = [k[0] for k in keys]
+        right_keys = [k[1] for k in keys]
+        right_schema = self.open(right_table).schema
+        right_names = _column_names(right_schema)
+        right_columns = _unique([*right_keys, *(c for c in columns if c in right_names)])
+        left_columns = _unique([*left_keys, *(c for c in columns if c not in right_columns)])
+
+        left = _read_decoded(self.scan(left_table, columns=left_columns, filter=filter, region=region))
+        if left is None:
+            return
+        for left_key, right_key in keys:
+            # Dataset IDs are fixed-width binary in the datasets files, but
+            # variable-width binary in the datastore file.
+            right_type = _decode_dictionary_field(right_schema.field(right_key)).type
+            index = left.schema.get_field_index(left_key)
+            if left.schema.field(index).type != right_type:
+                left = left.set_column(index, left_key, left.column(index).cast(right_type))
+
+        right_filter = None
+        if len(keys) == 1:
+            # Push the key values down into the scan of the right table, so
+            # row groups that can't contain any of them are skipped.
+            values = pyarrow.compute.unique(left.column(left_keys[0]))
+            right_filter = pyarrow.compute.field(right_keys[0]).isin(values)
+        for batch in self.scan(right_table, columns=right_columns, filter=right_filter):
+            right = pyarrow.Table.from_batches([_decode_dictionaries(batch)])
+            joined = left.join(right, left_keys, right_keys=right_keys, join_type="inner")
+            if joined.num_rows > 0:
+                yield joined.select([c if c in joined.column_names else _renamed(c, keys) for c in columns])
+
+    def _scan_overlapping(
+        self,
+        table_name: str,
+        dataset: pyarrow.dataset.Dataset,
+        columns: list[str] | None,
+        filter: pyarrow.compute.Expression | None,
+        region: Region,
+    ) -> Iterator[pyarrow.RecordBatch]:
+        # Imported here so that commands that don't need it start quickly.
+        from .spatial_index import (
+            SPATIAL_INDEX_COLUMNS,
+            find_overlapping_rows,
+            has_spatial_index,
+            make_bounding_box_filter,
+        )
+
+        if "region" not in dataset.schema.names:
+            raise ValueError(f"Table '{table_name}' has no regions")
+        read_columns = None
+        if has_spatial_index(dataset.schema):
+            # Skip row groups and rows whose bounding boxes can't overlap,
+            # before checking the pixels and then the regions themselves.
+            box_filter = make_bounding_box_filter(region.getBoundingBox())
+            filter = box_filter if filter is None else filter & box_filter
+            if columns is not None:
+                read_columns = _unique([*columns, "region", SPATIAL_INDEX_COLUMNS[4]])
+        elif columns is not None:
+            read_columns = _unique([*columns, "region"])
+        for batch in dataset.to_batches(columns=read_columns, filter=filter):
+            batch = batch.filter(pyarrow.array(find_overlapping_rows(batch, region)))
+            if batch.num_rows > 0:
+                yield batch.select(columns) if columns is not None else batch
+
+    def parse_filter(self, table_name: str, conditions: list[str]) -> pyarrow.compute.Expression | None:
+        """Convert a list of ``column=value`` strings into a filter expression
+        that is true when all of the conditions match.  Multiple values can
+        be given for the same column separated by commas, e.g.
+        ``band=g,r``.
+        """
+        schema = self.open(table_name).schema
+        expression = None
+        for condition in conditions:
+            column, sep, value_string = condition.partition("=")
+            if not sep or column not in schema.names:
+                raise ValueError(f"Invalid condition '{condition}' for table '{table_name}'")
+            values = [_convert_value(schema.field(column).type, v) for v in value_string.split(",")]
+            term = pyarrow.compute.field(column).isin(values)
+            expression = term if expression is None else expression & term
+        return expression
+
+    def _get_path(self, table_name: str) -> str:
+        category, _, name = table_name.partition("/")
+        if category == "datastore" and not name:
+            return self._paths.datastore_parquet_path()
+        elif category == "datasets" and name in self.index.dataset_types:
+            return self._paths.dataset_parquet_path(name)
+        elif category == "associations" and name in self.index.dataset_types:
+            return self._paths.dataset_association_parquet_path(name)
+        elif category == "dimensions" and name in self.index.dimensions:
+            return self._paths.dimension_parquet_path(name)
+        raise ValueError(f"Unknown table '{table_name}'.  Known tables are: {self.table_names()}")
+
+
+def _count_groups(table: pyarrow.Table, group_by: list[str]) -> pyarrow.Table:
+    counts = table.group_by(group_by).aggregate([(group_by[0], "count")])
+    return _rename_column(counts, f"{group_by[0]}_count", "count").select([*group_by, "count"])
+
+
+def _combine_group_counts(partial_counts: list[pyarrow.Table], group_by: list[str]) -> pyarrow.Table | None:
+    """Add up counts from `_count_groups` for several tables, or return
+    `None` if there are none.
+    """
+    if not partial_counts:
+        return None
+    combined = pyarrow.concat_tables(partial_counts)
+    counts = combined.group_by(group_by).aggregate([("count", "sum")])
+    counts = _rename_column(counts, "count_sum", "count")
+    return counts.select([*group_by, "count"]).sort_by([(c, "ascending") for c in group_by])
+
+
+def _rename_column(table: pyarrow.Table, old_name: str, new_name: str) -> pyarrow.Table:
+    return table.rename_columns([new_name if c == old_name else c for c in table.column_names])
+
+
+def _read_decoded(batches: Iterator[pyarrow.RecordBatch]) -> pyarrow.Table | None:
+    decoded = [_decode_dictionaries(batch) for batch in batches]
+    if not decoded:
+        return None
+    return pyarrow.Table.from_batches(decoded)
+
+
+def _decode_dictionaries(batch: pyarrow.RecordBatch) -> pyarrow.RecordBatch:
+    # Grouping and joining on dictionary-encoded columns is not supported for
+    # all key types, so convert them back to plain values.
+    arrays = [
+        column.dictionary_decode() if pyarrow.types.is_dictionary(column.type) else column
+        for column in batch.columns
+    ]
+    return pyarrow.RecordBatch.from_arrays(arrays, names=batch.schema.names)
+
+
+def _decode_dictionary_field(field: pyarrow.Field) -> pyarrow.Field:
+    if pyarrow.types.is_dictionary(field.type):
+        return field.with_type(field.type.value_type)
+    return field
+
+
+def _convert_value(data_type: pyarrow.DataType, value: str) -> object:
+    if pyarrow.types.is_dictionary(data_type):
+        data_type = data_type.value_type
+    if pyarrow.types.is_integer(data_type):
+        return int(value)
+    if pyarrow.types.is_floating(data_type):
+        return float(value)
+    if pyarrow.types.is_boolean(data_type):
+        return value.lower() in ("1", "true", "yes")
+    if pyarrow.types.is_binary(data_type) or pyarrow.types.is_fixed_size_binary(data_type):
+        return bytes.fromhex(value.replace("-", ""))
+    return value
+
+
+def _renamed(column: str, keys: list[tuple[str, str]]) -> str:
+    # Table.join drops the right-hand key columns, keeping the left-hand ones.
+    for left, right in keys:
+        if column == right:
+            return left
+    return column
+
+
+def _unique(values: Iterator[str] | list[str]) -> list[str]:
+    return list(dict.fromkeys(values))
+
+
+def _parse_join_keys(
+    on: tuple[str, ...], left_schema: pyarrow.Schema, right_schema: pyarrow.Schema
+) -> list[tuple[str, str]]:
+    if on:
+        keys = []
+        for pair in on:
+            left, sep, right = pair.partition("=")
+            keys.append((left, right if sep else left))
+        return keys
+    common = [name for name in left_schema.names if name in right_schema.names]
+    if not common:
+        raise click.UsageError("Tables have no columns in common; use --on to specify join keys")
+    return [(name, name) for name in common]
+
+
+def _format_value(value: object) -> str:
+    if isinstance(value, bytes):
+        return value.hex()
+    return str(value)
+
+
+def _print_table(table: pyarrow.Table, limit: int | None) -> None:
+    _print_tables(table.column_names, [table], limit)
+
+
+def _print_tables(column_names: list[str], tables: Iterable[pyarrow.Table], limit: int | None) -> None:
+    """Print the rows of a sequence of tables, stopping after ``limit`` rows
+    and counting the rest without keeping them.
+    """
+    print("\t".join(column_names))
+    printed = 0
+    remaining = 0
+    for table in tables:
+        if limit is not None and printed >= limit:
+            remaining += table.num_rows
+            continue
+        for row in table.to_pylist():
+            if limit is not None and printed >= limit:
+                remaining += 1
+                continue
+            print("\t".join(_format_value(v) for v in row.values()))
+            printed += 1
+    if remaining:
+        print(f"... ({remaining} more rows)")
+
+
+@click.command("inspect")
+@click.argument("table", required=False)
+@click.option("--input-dir", default=DEFAULT_EXPORT_DIRECTORY)
+@click.option("--where", "-w", multiple=True, help="Filter rows with a condition like 'tract=5063'")
+@click.option(
+    "--overlaps",
+    type=(float, float, float),
+    help="Only include dimension records overlapping a circle given as RA, Dec and radius in degrees",
+)
+@click.option("--group-by", "-g", multiple=True, help="Count rows for each distinct value of a column")
+@click.option("--join", "-j", "join_table", help="Show rows from another table matching the filtered rows")
+@click.option(
+    "--on", multiple=True, help="Join keys as 'left_column=right_column'.  Defaults to common columns"
+)
+@click.option("--column", "-c", multiple=True, help="Columns to display")
+@click.option("--limit", default=100, help="Maximum number of rows to display")
+def main(
+    table: str | None,
+    input_dir: str,
+    where: tuple[str, ...],
+    overlaps: tuple[float, float, float] | None,
+    group_by: tuple[str, ...],
+    join_table: str | None,
+    on: tuple[str, ...],
+    column: tuple[str, ...],
+    limit: int,
+) -> None:
+    """Answer questions about the contents of an export directory without
+    importing it into a Butler.
+
+    With no TABLE, lists the tables in the export.  Otherwise prints the
+    number of rows in TABLE matching the --where conditions, broken down by
+    the --group-by columns if given.  With --join, prints the rows of the
+    joined table that match.  --overlaps is faster for exports written with
+    --spatial-index.
+    """
+    inspector = DumpInspector(input_dir)
+    if table is None:
+        for name in inspector.table_names():
+            print(name)
+        return
+
+    filter = inspector.parse_filter(table, list(where))
+    region = None
+    if overlaps is not None:
+        from lsst.sphgeom import Angle, Circle, LonLat, UnitVector3d
+
+        ra, dec, radius = overlaps
+        region = Circle(UnitVector3d(LonLat.fromDegrees(ra, dec)), Angle.fromDegrees(radius))
+    if join_table is not None:
+        keys = _parse_join_keys(on, inspector.open(table).schema, inspector.open(join_table).schema)
+        if column:
+            columns = list(column)
+        elif group_by:
+            # Only the columns being grouped on are needed, not e.g. the
+            # region and timespan columns of the joined table.
+            columns = _unique([*group_by, *(right_key for _, right_key in keys)])
+        else:
+            columns = _column_names(inspector.open(join_table).schema)
+        joined = inspector.join(table, join_table, keys, columns, filter=filter, region=region)
+        if group_by:
+            counts = _combine_group_counts([_count_groups(t, list(group_by)) for t in joined], list(group_by))
+            _print_tables([*group_by, "count"], [counts] if counts is not None else [], limit)
+        else:
+            _print_tables(columns, joined, limit)
+    elif group_by:
+        _print_table(inspector.group_count(table, list(group_by), filter=filter, region=region), limit)
+    elif column:
+        rows = _read_decoded(inspector.scan(table, columns=list(column), filter=filter, region=region))
+        _print_table(rows if rows is not None else pyarrow.table({c: [] for c in column}), limit)
+    else:
+        print(inspector.count(table, filter=filter, region=region))
+
+
+def _column_names(schema: pyarrow.Schema) -> list[str]:
+    """Return the columns `DumpInspector.scan` can return for a table with
+    the given schema.
+    """
+    names = [name for name in schema.names if name not in PATH_COLUMNS]
+    if PATH_COLUMNS[0] in schema.names:
+        names.append("path")
+    return names
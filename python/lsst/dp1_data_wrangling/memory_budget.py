@@ -0,0 +1,251 @@
+from __future__ import annotations
+
+import re
+import threading
+from collections.abc import Callable, Iterator
+from typing import Any, NamedTuple, TypeVar
+
+import click
+import pyarrow
+from pyarrow.parquet import FileMetaData, ParquetFile
+
+_INITIAL_ROWS = 1000
+"""Rows in the first batch written by a writer that hasn't measured the size
+of its rows yet.
+"""
+
+_SIZE_PATTERN = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([kmgt]?)(i?b?)\s*$", re.IGNORECASE)
+
+
+class BatchReport(NamedTuple):
+    """Batch sizes chosen for one file, and the memory its batches used."""
+
+    name: str
+    batches: int
+    rows: int
+    min_batch_rows: int
+    max_batch_rows: int
+    peak_bytes: int
+
+    def format(self) -> str:
+        return (
+            f"{self.name}: {self.rows} rows in {self.batches} batches of {self.min_batch_rows}-"
+            f"{self.max_batch_rows} rows, peak {format_size(self.peak_bytes)}"
+        )
+
+
+class MemoryBudget:
+    """Limit on the memory used by the batches of rows being read or written
+    at one time, shared by all of the readers and writers in an export or
+    import.
+
+    Each reader or writer gets a `BatchSizer` from `open`, which chooses its
+    batch sizes from the measured size of its rows and the part of the
+    budget not held by other open readers and writers.  Sizes are measured
+    in Arrow bytes; the Python objects created from a batch are roughly
+    proportional to that, so the budget should be set well below the memory
+    available to the process.
+
+    Parameters
+    ----------
+    limit
+        Budget in bytes, or `None` to always use the maximum batch size given
+        to `open`.
+    """
+
+    def __init__(self, limit: int | None = None) -> None:
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._held: dict[int, int] = {}
+        self._next_id = 0
+        self.peak_bytes = 0
+        self.reports: list[BatchReport] = []
+
+    def open(self, name: str, max_rows: int, copies: int = 1) -> BatchSizer:
+        """Return a sizer for the batches of one file.
+
+        Parameters
+        ----------
+        name
+            Name used to report the batch sizes.
+        max_rows
+            Largest batch to use, however much budget is available.
+        copies
+            Number of batches that may be held at once, e.g. when batches are
+            queued between a reader thread and a writer thread.
+        """
+        with self._lock:
+            self._next_id += 1
+            return BatchSizer(self, self._next_id, name, max_rows, copies)
+
+    def format_report(self) -> str:
+        lines = [report.format() for report in self.reports]
+        lines.append(f"Peak memory held by batches: {format_size(self.peak_bytes)}")
+        return "\n".join(lines)
+
+    def _available(self, sizer_id: int) -> int | None:
+        if self.limit is None:
+            return None
+        with self._lock:
+            others = sum(held for i, held in self._held.items() if i != sizer_id)
+        return max(self.limit - others, 0)
+
+    def _hold(self, sizer_id: int, nbytes: int) -> None:
+        with self._lock:
+            self._held[sizer_id] = nbytes
+            self.peak_bytes = max(self.peak_bytes, sum(self._held.values()))
+
+    def _release(self, sizer_id: int, report: BatchReport | None) -> None:
+        with self._lock:
+            self._held.pop(sizer_id, None)
+            if report is not None:
+                self.reports.append(report)
+
+
+class BatchSizer:
+    """Chooses the batch sizes for one file.  Created by
+    `MemoryBudget.open`.
+    """
+
+    def __init__(self, budget: MemoryBudget, sizer_id: int, name: str, max_rows: int, copies: int) -> None:
+        self._budget = budget
+        self._id = sizer_id
+        self._name = name
+        self._max_rows = max_rows
+        self._copies = copies
+        self._bytes_per_row: float | None = None
+        self._batches = 0
+        self._rows = 0
+        self._min_batch_rows: int | None = None
+        self._max_batch_rows = 0
+        self._peak_bytes = 0
+
+    @property
+    def max_rows(self) -> int:
+        return self._max_rows
+
+    def next_batch_size(self) -> int:
+        """Return the number of rows to put in the next batch."""
+        available = self._budget._available(self._id)
+        if available is None:
+            return self._max_rows
+        if self._bytes_per_row is None:
+            return min(self._max_rows, _INITIAL_ROWS)
+        rows = int(available / (self._bytes_per_row * self._copies))
+        return max(1, min(self._max_rows, rows))
+
+    def batch_size_for_parquet(self, metadata: FileMetaData, columns: list[str] | None = None) -> int:
+        """Return the number of rows to read at a time from a parquet file,
+        estimating the size of its rows from the uncompressed size of the
+        largest row group.
+        """
+        for row_group in range(metadata.num_row_groups):
+            group = metadata.row_group(row_group)
+            if group.num_rows == 0:
+                continue
+            nbytes = 0
+            for column in range(group.num_columns):
+                chunk = group.column(column)
+                if columns is None or chunk.path_in_schema.split(".")[0] in columns:
+                    nbytes += chunk.total_uncompressed_size
+            self._observe_bytes_per_row(nbytes / group.num_rows)
+        return self.next_batch_size()
+
+    def record(self, rows: int, nbytes: int) -> None:
+        """Record a batch that was read or written, updating the estimated
+        size of each row.
+        """
+        if rows > 0:
+            self._observe_bytes_per_row(nbytes / rows)
+        self._batches += 1
+        self._rows += rows
+        self._min_batch_rows = rows if self._min_batch_rows is None else min(self._min_batch_rows, rows)
+        self._max_batch_rows = max(self._max_batch_rows, rows)
+        self._peak_bytes = max(self._peak_bytes, nbytes * self._copies)
+        self._budget._hold(self._id, nbytes * self._copies)
+
+    def close(self) -> None:
+        """Release this file's share of the budget, and add its batch sizes
+        to the report.
+        """
+        report = None
+        if self._batches > 0:
+            report = BatchReport(
+                name=self._name,
+                batches=self._batches,
+                rows=self._rows,
+                min_batch_rows=self._min_batch_rows or 0,
+                max_batch_rows=self._max_batch_rows,
+                peak_bytes=self._peak_bytes,
+            )
+            self._batches = 0
+        self._budget._release(self._id, report)
+
+    def _observe_bytes_per_row(self, bytes_per_row: float) -> None:
+        # Rows vary in size (e.g. regions with different numbers of
+        # vertices), so keep the largest size seen.
+        if self._bytes_per_row is None or bytes_per_row > self._bytes_per_row:
+            self._bytes_per_row = bytes_per_row
+
+
+def iter_parquet_batches(
+    reader: ParquetFile,
+    sizer: BatchSizer,
+    columns: list[str] | None = None,
+    row_groups: list[int] | None = None,
+) -> Iterator[pyarrow.RecordBatch]:
+    """Iterate over the record batches of a parquet file (or only the given
+    row groups), in batches sized by ``sizer``.  The sizer is closed when
+    iteration finishes.
+    """
+    try:
+        batch_size = sizer.batch_size_for_parquet(reader.metadata, columns)
+        for batch in reader.iter_batches(batch_size=batch_size, columns=columns, row_groups=row_groups):
+            sizer.record(batch.num_rows, batch.nbytes)
+            yield batch
+    finally:
+        sizer.close()
+
+
+def parse_size(value: str) -> int:
+    """Convert a size like ``512MB``, ``2GiB`` or ``1000000`` to bytes.
+    Both decimal and binary suffixes are treated as powers of 1024.
+    """
+    match = _SIZE_PATTERN.match(value)
+    if match is None:
+        raise ValueError(f"Invalid size '{value}'")
+    number, prefix, _ = match.groups()
+    return int(float(number) * 1024 ** " kmgt".index(prefix.lower() or " "))
+
+
+def format_size(nbytes: int) -> str:
+    size = float(nbytes)
+    for unit in ["B", "KiB", "MiB", "GiB"]:
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TiB"
+
+
+_F = TypeVar("_F", bound=Callable[..., Any])
+
+
+def memory_budget_option(function: _F) -> _F:
+    """Add the ``--memory-budget`` option to a click command.  The value is
+    passed to the command as a `MemoryBudget`.
+    """
+
+    def convert(ctx: click.Context, param: click.Parameter, value: str | None) -> MemoryBudget:
+        if value is None:
+            return MemoryBudget()
+        try:
+            return MemoryBudget(parse_size(value))
+        except ValueError as e:
+            raise click.BadParameter(str(e)) from None
+
+    return click.option(
+        "--memory-budget",
+        callback=convert,
+        help="Size batches so the rows held in memory at once fit in this many bytes, e.g. 2GB."
+        "  Batch sizes and peak usage are reported for each file",
+    )(function)
@@ -0,0 +1,572 @@
+from __future__ import annotations
+
+import concurrent.futures
+import os
+import shutil
+from collections.abc import Iterator
+from typing import Any
+
+import click
+import numpy
+import pyarrow
+import pyarrow.compute
+import pyarrow.csv
+import pyarrow.dataset
+import sqlalchemy
+from lsst.daf.butler import (
+    Config,
+    DataCoordinate,
+    DatasetRef,
+    DatasetType,
+    DimensionElement,
+    DimensionGroup,
+    DimensionRecord,
+    DimensionRecordTable,
+    DimensionUniverse,
+    SkyPixDimension,
+    ddl,
+)
+from lsst.daf.butler.registry.obscore import (
+    ExposureRegionFactory,
+    ObsCoreSchema,
+    RecordFactory,
+    SpatialObsCorePlugin,
+)
+from lsst.dax.obscore import ExporterConfig
+from lsst.sphgeom import Region
+from pyarrow.parquet import ParquetFile, ParquetWriter, read_table
+
+from .archive import open_export
+from .dataset_types import import_dataset_types, load_export_universe
+from .datastore_paths import get_path_read_columns, join_path_columns
+from .index import ExportIndex
+from .path_mapping import map_datastore_path_for_rsp
+from .paths import DEFAULT_EXPORT_DIRECTORY, ExportPaths
+from .utils import DEFAULT_BATCH_SIZE, convert_parquet_uuid_to_dataset_id, read_model_from_file
+
+DEFAULT_JOBS = min(os.cpu_count() or 1, 4)
+"""Default number of dataset types processed at once.  Each worker process
+only holds the dimension records for the batch it is processing.
+"""
+
+ACCESS_URL_SCHEMA = pyarrow.schema(
+    [pyarrow.field("dataset_id", pyarrow.binary()), pyarrow.field("access_url", pyarrow.string())]
+)
+"""Schema of the files written by `DumpObsCoreExporter.write_access_urls`."""
+
+_ARROW_TYPES: dict[type, pyarrow.DataType] = {
+    sqlalchemy.SmallInteger: pyarrow.int16(),
+    sqlalchemy.Integer: pyarrow.int32(),
+    sqlalchemy.BigInteger: pyarrow.int64(),
+    sqlalchemy.Float: pyarrow.float64(),
+    sqlalchemy.Boolean: pyarrow.bool_(),
+    sqlalchemy.String: pyarrow.string(),
+    sqlalchemy.Text: pyarrow.string(),
+}
+
+
+class DumpObsCoreExporter:
+    """Generate ObsCore rows from an export, without a Butler registry.
+
+    The rows are produced by the same `RecordFactory` used by ``butler
+    obscore export``, from `DatasetRef` objects whose data IDs are expanded
+    with dimension records joined from the export's ``dimensions/`` files.
+    Collection filtering in the configuration is not applied, because the
+    export already contains only the datasets found in its root collection.
+
+    Parameters
+    ----------
+    input_path
+        Export directory or archive.
+    config
+        dax_obscore exporter configuration.
+    universe
+        Dimension universe used to read the export.  Defaults to the universe
+        the export was written with.
+    datastore_root
+        URI prefix for datastore paths in the target environment.  Used to
+        fill ``access_url`` when the configuration sets ``use_butler_uri``.
+        Paths are mapped to the RSP directory layout before the prefix is
+        added.
+    batch_size
+        Number of datasets processed at a time.
+    """
+
+    def __init__(
+        self,
+        input_path: str,
+        config: ExporterConfig,
+        universe: DimensionUniverse | None = None,
+        datastore_root: str | None = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ) -> None:
+        self._paths = open_export(input_path)
+        self._index = read_model_from_file(ExportIndex, self._paths.open_input(self._paths.index_path()))
+        self._config = config
+        if universe is None:
+            universe = load_export_universe(self._paths, self._index)
+        self._universe = universe
+        self._datastore_root = datastore_root
+        self._batch_size = batch_size
+        self._dimensions = _DimensionRecordReader(self._paths, self._index, universe)
+        self._exposure_regions = _DumpExposureRegionFactory(self._dimensions)
+
+        spatial_plugins = SpatialObsCorePlugin.load_plugins(config.spatial_plugins, None)
+        self.schema = ObsCoreSchema(config=config, spatial_plugins=spatial_plugins)
+        self.arrow_schema = make_arrow_schema(self.schema.table_spec)
+        self._record_factory = RecordFactory.get_record_factory(
+            config,
+            self.schema,
+            universe,
+            spatial_plugins,
+            self._exposure_regions,
+        )
+
+    @property
+    def uses_butler_uri(self) -> bool:
+        """Whether ``access_url`` is filled from the datastore records."""
+        return self._config.use_butler_uri
+
+    def get_dataset_types(self) -> list[str]:
+        """Return the dataset types that are both configured and present in
+        the export.
+        """
+        return [dt for dt in self._index.dataset_types if dt in self._config.dataset_types]
+
+    def iter_batches(
+        self, dataset_type_name: str, access_urls: pyarrow.Table | None = None
+    ) -> Iterator[pyarrow.Table]:
+        """Generate ObsCore rows for one dataset type.
+
+        Parameters
+        ----------
+        dataset_type_name
+            Name of the dataset type.
+        access_urls
+            ``access_url`` of each dataset, as written by
+            `write_access_urls`.  If `None`, ``access_url`` is left as
+            produced by the record factory.
+        """
+        (dataset_type,) = [
+            dt
+            for dt in import_dataset_types(
+                self._paths.open_input(self._paths.dataset_type_path()), self._universe
+            )
+            if dt.name == dataset_type_name
+        ]
+        reader = ParquetFile(self._paths.open_input(self._paths.dataset_parquet_path(dataset_type_name)))
+        try:
+            for batch in reader.iter_batches(batch_size=self._batch_size):
+                table = pyarrow.Table.from_batches([batch])
+                records = self._make_records(dataset_type, table, access_urls)
+                yield pyarrow.Table.from_pylist(records, schema=self.arrow_schema)
+        finally:
+            reader.close(force=True)
+
+    def _make_records(
+        self, dataset_type: DatasetType, table: pyarrow.Table, paths: pyarrow.Table | None
+    ) -> list[dict[str, Any]]:
+        dimensions = dataset_type.dimensions
+        required = list(dimensions.required)
+        keys, element_records = self._lookup_element_records(dimensions, table.select(required))
+        if "exposure" in dimensions.names:
+            self._exposure_regions.read_batch(keys)
+        access_urls = _lookup_paths(table, paths) if paths is not None else None
+
+        output = []
+        datasets = table.select(["dataset_id", "run"]).to_pylist()
+        for i, (dataset, row) in enumerate(zip(datasets, keys.to_pylist())):
+            records: dict[str, DimensionRecord | None] = {
+                name: element_rows[i] for name, element_rows in element_records.items()
+            }
+            for name in dimensions.elements:
+                if name not in records and not self._universe[name].has_own_table:
+                    records[name] = _make_virtual_record(self._universe[name], row, records)
+                records.setdefault(name, None)
+            data_id = DataCoordinate.standardize(
+                {name: row[name] for name in required}, dimensions=dimensions
+            ).expanded(records)
+            dataset_id = convert_parquet_uuid_to_dataset_id(dataset["dataset_id"])
+            ref = DatasetRef(dataset_type, data_id, run=dataset["run"], id=dataset_id)
+            record = self._record_factory(ref)
+            if record is None:
+                continue
+            if access_urls is not None and access_urls[i] is not None:
+                record["access_url"] = access_urls[i]
+            output.append(record)
+        return output
+
+    def _lookup_element_records(
+        self, dimensions: DimensionGroup, keys: pyarrow.Table
+    ) -> tuple[pyarrow.Table, dict[str, list[DimensionRecord | None]]]:
+        """Look up the record of each element with its own table for each
+        row of ``keys``, the required dimension columns of a datasets file.
+
+        Datasets files have no columns for implied dimensions, so their
+        values (e.g. ``physical_filter`` and ``day_obs`` for a visit) are
+        taken from the records of the elements that imply them, before the
+        records of the implied elements are looked up.  Returns ``keys``
+        with the implied dimension columns added, and the records of each
+        element.  Elements whose required dimensions can't be found have no
+        entry.
+        """
+        element_records: dict[str, list[DimensionRecord | None]] = {}
+        pending = [name for name in dimensions.elements if self._universe[name].has_own_table]
+        while True:
+            ready = [
+                name
+                for name in pending
+                if set(self._universe[name].required.names).issubset(keys.column_names)
+            ]
+            if not ready:
+                return keys, element_records
+            for name in ready:
+                element = self._universe[name]
+                records = self._dimensions.lookup(element, keys)
+                element_records[name] = records
+                for implied in element.implied.names:
+                    if implied in dimensions.names and implied not in keys.column_names:
+                        values = [getattr(r, implied) if r is not None else None for r in records]
+                        keys = keys.append_column(implied, pyarrow.array(values))
+            pending = [name for name in pending if name not in element_records]
+
+    def write_access_urls(self, output_files: dict[str, str]) -> None:
+        """Write the ``access_url`` of each dataset of the given dataset
+        types to a parquet file per dataset type, with the schema
+        `ACCESS_URL_SCHEMA`.
+
+        The datastore records file is read once for all of the dataset
+        types.
+
+        Parameters
+        ----------
+        output_files
+            Output file for each dataset type.
+        """
+        dataset_ids = {
+            dt: _read_column(self._paths, self._paths.dataset_parquet_path(dt), "dataset_id").cast(
+                pyarrow.binary()
+            )
+            for dt in output_files
+        }
+        writers = {dt: ParquetWriter(path, ACCESS_URL_SCHEMA) for dt, path in output_files.items()}
+        reader = ParquetFile(self._paths.open_input(self._paths.datastore_parquet_path()))
+        try:
+            columns = get_path_read_columns(reader.schema_arrow, ["dataset_id", "path", "component"])
+            for batch in reader.iter_batches(columns=columns):
+                # Datasets stored as several component files (disassembled
+                # composites) don't have a single URI.
+                batch = batch.filter(pyarrow.compute.is_null(batch.column("component")))
+                ids = batch.column("dataset_id").cast(pyarrow.binary())
+                paths = join_path_columns(batch).column("path")
+                for dt, writer in writers.items():
+                    mask = pyarrow.compute.is_in(ids, value_set=dataset_ids[dt])
+                    selected = paths.filter(mask).to_pylist()
+                    if not selected:
+                        continue
+                    urls = pyarrow.array([self._make_access_url(path) for path in selected], pyarrow.string())
+                    table = pyarrow.table({"dataset_id": ids.filter(mask), "access_url": urls})
+                    writer.write_table(table.cast(ACCESS_URL_SCHEMA))
+        finally:
+            reader.close(force=True)
+            for writer in writers.values():
+                writer.close()
+
+    def _make_access_url(self, path: str) -> str:
+        path = map_datastore_path_for_rsp(path).split("#")[0]
+        if self._datastore_root is None:
+            return path
+        return self._datastore_root.rstrip("/") + "/" + path
+
+
+class _DimensionRecordReader:
+    """Reads the dimension records matching the data IDs in a batch of
+    datasets, so that memory use is bounded by the batch rather than by the
+    size of the dimension record files.
+    """
+
+    def __init__(self, paths: ExportPaths, index: ExportIndex, universe: DimensionUniverse) -> None:
+        self.universe = universe
+        self._paths = paths
+        self._index = index
+        self._fragments: dict[str, pyarrow.dataset.ParquetFileFragment] = {}
+
+    def read(
+        self, element: DimensionElement, values: dict[str, pyarrow.Array | pyarrow.ChunkedArray]
+    ) -> tuple[DimensionRecordTable, pyarrow.Table] | None:
+        """Return the records for an element whose data ID values appear in
+        ``values``, and a table mapping data ID key columns (named as in a
+        datasets file) to the row number of each record.
+
+        ``values`` maps required dimensions of the element to the values to
+        select.  Each dimension is matched separately, so some of the
+        records returned may not match any single data ID.  Returns `None`
+        if the export has no records for the element.
+        """
+        if element.name not in self._index.dimensions:
+            return None
+        fragment = self._get_fragment(element)
+        # Dimension record files name the primary key column after the
+        # record field (e.g. 'id' for visit), not after the dimension.
+        fields = dict(zip(element.required.names, element.schema.required.names))
+        filter = None
+        for name, column in values.items():
+            field_type = fragment.physical_schema.field(fields[name]).type
+            value_set = pyarrow.compute.unique(column.drop_null()).cast(field_type)
+            condition = pyarrow.compute.field(fields[name]).isin(value_set)
+            filter = condition if filter is None else filter & condition
+        schema = DimensionRecordTable.make_arrow_schema(element)
+        # Row groups whose statistics exclude the batch's values are skipped,
+        # and any spatial index columns are not read.
+        arrow_table = fragment.to_table(columns=schema.names, filter=filter)
+        records = DimensionRecordTable(element, table=arrow_table.cast(schema))
+        record_keys = arrow_table.select(list(fields.values())).rename_columns(list(fields))
+        record_keys = record_keys.append_column("__row", pyarrow.array(numpy.arange(record_keys.num_rows)))
+        return records, record_keys
+
+    def lookup(self, element: DimensionElement, datasets: pyarrow.Table) -> list[DimensionRecord | None]:
+        """Return the record for each row in ``datasets``, or `None` where
+        there is no matching record.
+        """
+        key_columns = list(element.required.names)
+        result = self.read(element, {name: datasets.column(name) for name in key_columns})
+        if result is None:
+            return [None] * datasets.num_rows
+        records, keys = result
+        left = datasets.select(key_columns).cast(keys.select(key_columns).schema)
+        rows = _join_row_numbers(left, keys, key_columns, "__row")
+        return [records[row] if row is not None else None for row in rows.to_pylist()]
+
+    def _get_fragment(self, element: DimensionElement) -> pyarrow.dataset.ParquetFileFragment:
+        fragment = self._fragments.get(element.name)
+        if fragment is None:
+            # Only the file's metadata is read here; rows are read by each
+            # call to `read`.
+            path = self._paths.dimension_parquet_path(element.name)
+            fragment = pyarrow.dataset.ParquetFileFormat().make_fragment(self._paths.open_input(path))
+            self._fragments[element.name] = fragment
+        return fragment
+
+
+def _join_row_numbers(
+    left: pyarrow.Table, right: pyarrow.Table, keys: list[str], column: str
+) -> pyarrow.Array:
+    """Return ``right[column]`` for the row of ``right`` matching each row of
+    ``left`` on ``keys``, in the order of ``left``.
+    """
+    left = left.append_column("__position", pyarrow.array(numpy.arange(left.num_rows)))
+    # Arrow joins do not preserve row order.
+    joined = left.join(right, keys, join_type="left outer").sort_by("__position")
+    return joined.column(column).combine_chunks()
+
+
+def _lookup_paths(datasets: pyarrow.Table, paths: pyarrow.Table) -> list[str | None]:
+    left = pyarrow.table({"dataset_id": datasets.column("dataset_id").cast(pyarrow.binary())})
+    return _join_row_numbers(left, paths, ["dataset_id"], "access_url").to_pylist()
+
+
+def _make_virtual_record(
+    element: DimensionElement, row: dict[str, Any], records: dict[str, DimensionRecord | None]
+) -> DimensionRecord | None:
+    """Make a record for a dimension that doesn't have its own table (e.g.
+    ``band``, or a skypix dimension).
+    """
+    value = row.get(element.name)
+    if value is None:
+        # The value is implied by another dimension, e.g. band by
+        # physical_filter.
+        for record in records.values():
+            if record is not None and element.name in record.definition.implied.names:
+                value = getattr(record, element.name)
+                break
+    if value is None:
+        return None
+    if isinstance(element, SkyPixDimension):
+        return element.RecordClass(id=value, region=element.pixelization.pixel(value))
+    return element.RecordClass(**{element.primary_key.name: value})
+
+
+class _DumpExposureRegionFactory(ExposureRegionFactory):
+    """Finds regions for exposure-based datasets (e.g. raws) from the
+    visit_detector_region records of the visits they belong to.
+
+    `read_batch` must be called with the data IDs of each batch of datasets
+    before regions are requested for them.
+    """
+
+    def __init__(self, dimensions: _DimensionRecordReader) -> None:
+        self._dimensions = dimensions
+        self._visits: dict[tuple[str, int], list[int]] = {}
+        self._regions: dict[tuple[str, int, int], Region] = {}
+
+    def read_batch(self, keys: pyarrow.Table) -> None:
+        """Read the visit definitions and regions for the exposures and
+        detectors in a batch of datasets, replacing those of the previous
+        batch.
+        """
+        self._visits = {}
+        self._regions = {}
+        universe = self._dimensions.universe
+        values = {name: keys.column(name) for name in ["instrument", "exposure"]}
+        definitions = self._dimensions.read(universe["visit_definition"], values)
+        if definitions is None or len(definitions[0]) == 0:
+            return
+        for record in definitions[0]:
+            self._visits.setdefault((record.instrument, record.exposure), []).append(record.visit)
+        values = {
+            "instrument": keys.column("instrument"),
+            "visit": pyarrow.array([visit for visits in self._visits.values() for visit in visits]),
+        }
+        if "detector" in keys.column_names:
+            values["detector"] = keys.column("detector")
+        regions = self._dimensions.read(universe["visit_detector_region"], values)
+        if regions is not None:
+            for record in regions[0]:
+                self._regions[(record.instrument, record.visit, record.detector)] = record.region
+
+    def exposure_region(self, dataId: DataCoordinate, *args: Any) -> Region | None:
+        instrument = dataId["instrument"]
+        for visit in self._visits.get((instrument, dataId["exposure"]), []):
+            region = self._regions.get((instrument, visit, dataId["detector"]))
+            if region is not None:
+                return region
+        return None
+
+
+def make_arrow_schema(table_spec: ddl.TableSpec) -> pyarrow.Schema:
+    """Convert the ObsCore table specification to an Arrow schema."""
+    fields = []
+    for field_spec in table_spec.fields:
+        arrow_type = pyarrow.string()
+        for sql_type, candidate in _ARROW_TYPES.items():
+            if issubclass(field_spec.dtype, sql_type):
+                arrow_type = candidate
+                break
+        fields.append(pyarrow.field(field_spec.name, arrow_type, nullable=field_spec.nullable))
+    return pyarrow.schema(fields)
+
+
+def _read_column(paths: ExportPaths, path: str, column: str) -> pyarrow.Array:
+    reader = ParquetFile(paths.open_input(path))
+    try:
+        return reader.read(columns=[column]).column(0).combine_chunks()
+    finally:
+        reader.close(force=True)
+
+
+def load_exporter_config(config_file: str) -> ExporterConfig:
+    return ExporterConfig.model_validate(Config(config_file).toDict())
+
+
+def export_obscore(
+    input_path: str,
+    config_file: str,
+    output_file: str,
+    format: str,
+    datastore_root: str | None = None,
+    jobs: int = 1,
+) -> int:
+    """Write the ObsCore table for an export to a CSV or parquet file,
+    processing dataset types in parallel.  Returns the number of rows
+    written.
+
+    If the configuration uses Butler URIs, the datastore records are read
+    once, before the dataset types are processed, and each worker is given
+    the URIs for its dataset type.
+    """
+    exporter = DumpObsCoreExporter(input_path, load_exporter_config(config_file), None, datastore_root)
+    dataset_types = exporter.get_dataset_types()
+    parts_directory = output_file + ".parts"
+    os.makedirs(parts_directory, exist_ok=True)
+    part_files = [os.path.join(parts_directory, f"{dt}.{format}") for dt in dataset_types]
+    url_files: list[str | None] = [None] * len(dataset_types)
+    try:
+        if exporter.uses_butler_uri:
+            url_files = [os.path.join(parts_directory, f"{dt}.access_url.parquet") for dt in dataset_types]
+            exporter.write_access_urls(dict(zip(dataset_types, url_files)))
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {
+                executor.submit(
+                    _write_dataset_type, input_path, config_file, dt, part_file, format, url_file
+                ): dt
+                for dt, part_file, url_file in zip(dataset_types, part_files, url_files)
+            }
+            total = 0
+            for future in concurrent.futures.as_completed(futures):
+                rows = future.result()
+                print(f"{futures[future]}: {rows} rows")
+                total += rows
+        _merge_parts(part_files, output_file, format, exporter.arrow_schema)
+    finally:
+        shutil.rmtree(parts_directory, ignore_errors=True)
+    return total
+
+
+def _write_dataset_type(
+    input_path: str,
+    config_file: str,
+    dataset_type: str,
+    output_file: str,
+    format: str,
+    access_url_file: str | None,
+) -> int:
+    exporter = DumpObsCoreExporter(input_path, load_exporter_config(config_file))
+    access_urls = read_table(access_url_file) if access_url_file is not None else None
+    rows = 0
+    if format == "csv":
+        # Parts are concatenated, so the header is written once for the
+        # merged file instead.
+        options = pyarrow.csv.WriteOptions(include_header=False)
+        with pyarrow.csv.CSVWriter(output_file, exporter.arrow_schema, write_options=options) as csv_writer:
+            for table in exporter.iter_batches(dataset_type, access_urls):
+                csv_writer.write_table(table)
+                rows += table.num_rows
+    else:
+        with ParquetWriter(output_file, exporter.arrow_schema) as parquet_writer:
+            for table in exporter.iter_batches(dataset_type, access_urls):
+                parquet_writer.write_table(table)
+                rows += table.num_rows
+    return rows
+
+
+def _merge_parts(part_files: list[str], output_file: str, format: str, schema: pyarrow.Schema) -> None:
+    if format == "csv":
+        with open(output_file, "wb") as output:
+            header = pyarrow.BufferOutputStream()
+            pyarrow.csv.write_csv(schema.empty_table(), header)
+            output.write(header.getvalue().to_pybytes())
+            for part in part_files:
+                with open(part, "rb") as input:
+                    shutil.copyfileobj(input, output)
+    else:
+        with ParquetWriter(output_file, schema) as writer:
+            for part in part_files:
+                reader = ParquetFile(part)
+                try:
+                    for batch in reader.iter_batches():
+                        writer.write_batch(batch)
+                finally:
+                    reader.close()
+
+
+@click.command("obscore")
+@click.argument("config")
+@click.argument("output")
+@click.option("--input-dir", default=DEFAULT_EXPORT_DIRECTORY)
+@click.option(
+    "--format",
+    type=click.Choice(["csv", "parquet"]),
+    help="Output format.  Defaults to the extension of OUTPUT",
+)
+@click.option("--datastore-root", help="URI prefix for access_url, when the configuration uses Butler URIs")
+@click.option("--jobs", "-j", default=DEFAULT_JOBS, help="Number of dataset types to process at once")
+def main(
+    config: str, output: str, input_dir: str, format: str | None, datastore_root: str | None, jobs: int
+) -> None:
+    """Write the ObsCore table for an export, using a dax_obscore
+    configuration file, without importing the export first.
+    """
+    if format is None:
+        format = "parquet" if output.endswith(".parquet") else "csv"
+    total = export_obscore(input_dir, config, output, format, datastore_root, jobs)
+    print(f"Wrote {total} rows to {output}")
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import re
+from typing import Callable, NamedTuple, TypeAlias
+
+# This module must not import lsst.daf.butler, so that the tools that only
+# need to map paths (e.g. generate_dp1_file_tree) start quickly.
+
+
+class DatastoreMappingInput(NamedTuple):
+    datastore_name: str
+    path: str
+
+
+DatastoreMappingFunction: TypeAlias = Callable[[DatastoreMappingInput], DatastoreMappingInput]
+"""Input is datastore record information from the source repository.  Output is
+that information mapped to the target repository.
+
+Mapping functions must map the directory part of a path independently of the
+file name, so that they can be applied once per directory by
+`CachedDatastoreMapping`.
+"""
+
+
+_EXTERNAL_FILES_PREFIX = "file:///sdf/data/rubin/"
+
+
+def map_datastore_path_for_rsp(path: str) -> str:
+    """Remap a path to match the directory layout in the Google RSP deployment
+    of DP1.
+    """
+    path = path.replace(_EXTERNAL_FILES_PREFIX, "external/rubin/")
+
+    if re.match(r"^[\w+]+://", path):
+        raise ValueError(f"Unhandled absolute path to datastore file: {path}")
+
+    return path
+
+
+def _rsp_datastore_mapping_function(input: DatastoreMappingInput) -> DatastoreMappingInput:
+    path = map_datastore_path_for_rsp(input.path)
+    # /repo/main and target repo both use the default
+    # "FileDatastore@<butlerRoot>" datastore name, so we don't need to remap
+    # the datastore name.
+    return input._replace(path=path)
+
+
+def _rucio_datastore_mapping_function(input: DatastoreMappingInput) -> DatastoreMappingInput:
+    path = input.path
+
+    raw_prefix = _EXTERNAL_FILES_PREFIX + "lsstdata/offline/instrument/"
+    refcat_prefix = _EXTERNAL_FILES_PREFIX + "shared/"
+    if path.startswith(raw_prefix):
+        path = path.replace(raw_prefix, "raw/")
+    elif path.startswith(refcat_prefix):
+        path = path.replace(refcat_prefix, "raw/")
+    else:
+        path = "dp1/" + path
+
+    return input._replace(path=path)
+
+
+def _null_datastore_mapping_function(input: DatastoreMappingInput) -> DatastoreMappingInput:
+    return input
+
+
+class CachedDatastoreMapping:
+    """Wraps a `DatastoreMappingFunction` so that it is only called once
+    for each distinct datastore name and directory.
+
+    Exported datastore records share a small number of directories (one per
+    run and dataset type, roughly), so this avoids re-running the string
+    manipulation for every row.  The file name and URI fragment are appended
+    to the mapped directory unchanged.
+    """
+
+    def __init__(self, mapping: DatastoreMappingFunction) -> None:
+        self._mapping = mapping
+        self._cache: dict[tuple[str, str], tuple[str, str]] = {}
+
+    def __call__(self, input: DatastoreMappingInput) -> DatastoreMappingInput:
+        location, separator, fragment = input.path.partition("#")
+        directory, slash, basename = location.rpartition("/")
+        key = (input.datastore_name, directory + slash)
+        mapped = self._cache.get(key)
+        if mapped is None:
+            result = self._mapping(DatastoreMappingInput(datastore_name=key[0], path=key[1]))
+            mapped = (result.datastore_name, result.path)
+            self._cache[key] = mapped
+        datastore_name, mapped_directory = mapped
+        return DatastoreMappingInput(
+            datastore_name=datastore_name, path=mapped_directory + basename + separator + fragment
+        )
+
+
+def get_datastore_mapping(no_datastore_remap: bool, file_paths: str) -> DatastoreMappingFunction:
+    """Return the mapping function selected by the import script's
+    ``--no-datastore-remap`` and ``--file-paths`` options.
+    """
+    if no_datastore_remap:
+        return _null_datastore_mapping_function
+    elif file_paths == "rsp":
+        return _rsp_datastore_mapping_function
+    elif file_paths == "rucio":
+        return _rucio_datastore_mapping_function
+    else:
+        raise ValueError(f"Unknown value for --file-paths: {file_paths}")
@@ -1,19 +1,65 @@
+from __future__ import annotations
+
+import os
 import pathlib
 import re
+import urllib.parse
+
+import pyarrow
+import pyarrow.fs
 
 _DIMENSION_SUBDIRECTORY = "dimensions"
 _DATASETS_SUBDIRECTORY = "datasets"
 _ASSOCIATION_SUBDIRECTORY = "associations"
 
+DEFAULT_EXPORT_DIRECTORY = "dp1-dump"
+
 
 class ExportPaths:
-    def __init__(self, output_directory: str) -> None:
-        self._dir = pathlib.Path(output_directory)
+    """Locations of the files in an export.
+
+    Parameters
+    ----------
+    output_directory
+        Root of the export: a local directory, or a path within
+        ``filesystem``.
+    filesystem
+        Filesystem containing the export, or `None` for the local
+        filesystem.  See `from_uri`.
+    """
+
+    def __init__(self, output_directory: str, filesystem: pyarrow.fs.FileSystem | None = None) -> None:
+        self._dir = pathlib.PurePosixPath(output_directory)
+        self.filesystem = filesystem
+        """Filesystem to pass to pyarrow when writing files in the export,
+        or `None` if they are local.
+        """
+
+    @classmethod
+    def from_uri(cls, uri: str) -> ExportPaths:
+        """Return the paths for an export at a local path or a URI, e.g.
+        ``s3://bucket/dp1-dump`` or ``gs://bucket/dp1-dump``.
+
+        S3 URIs may set pyarrow's S3 options as query parameters, e.g.
+        ``?endpoint_override=localhost:9000&scheme=http`` for a local
+        S3-compatible server.  If they don't set an endpoint, the
+        ``S3_ENDPOINT_URL`` environment variable is used, as it is by
+        `lsst.resources`.
+        """
+        if "://" not in uri:
+            return cls(uri)
+        filesystem, path = pyarrow.fs.FileSystem.from_uri(_add_s3_endpoint(uri))
+        if isinstance(filesystem, pyarrow.fs.LocalFileSystem):
+            return cls(path)
+        return cls(path, filesystem)
 
     def create_directories(self) -> None:
-        self._dir.mkdir(parents=True, exist_ok=True)
+        if self.filesystem is not None:
+            # Object stores don't have directories.
+            return
+        pathlib.Path(self._dir).mkdir(parents=True, exist_ok=True)
         for dir in [_DIMENSION_SUBDIRECTORY, _DATASETS_SUBDIRECTORY, _ASSOCIATION_SUBDIRECTORY]:
-            self._dir.joinpath(dir).mkdir(exist_ok=True)
+            pathlib.Path(self._dir, dir).mkdir(exist_ok=True)
 
     def _join(self, *path_fragments: str) -> str:
         # Make sure a poisoned filename can't escape the export directory.
@@ -24,6 +70,60 @@ class ExportPaths:
 
         return str(self._dir.joinpath(*path_fragments))
 
+    def exists(self, path: str) -> bool:
+        if self.filesystem is not None:
+            return self.filesystem.get_file_info(path).type != pyarrow.fs.FileType.NotFound
+        return os.path.exists(path)
+
+    def file_size(self, path: str) -> int:
+        if self.filesystem is not None:
+            return self.filesystem.get_file_info(path).size
+        return os.path.getsize(path)
+
+    def open_input(self, path: str) -> pyarrow.NativeFile:
+        """Open one of the files in the export for reading.  Files in object
+        stores are read with ranged requests, so reading a few columns or row
+        groups of a parquet file only downloads those parts.
+        """
+        if self.filesystem is not None:
+            return self.filesystem.open_input_file(path)
+        return pyarrow.memory_map(path)
+
+    def open_output(self, path: str) -> pyarrow.NativeFile:
+        """Open one of the files in the export for writing.  Files in object
+        stores are streamed to a multipart upload as they are written.
+        """
+        if self.filesystem is not None:
+            return self.filesystem.open_output_stream(path)
+        return pyarrow.OSFile(path, "wb")
+
+    def remove(self, path: str) -> None:
+        if self.filesystem is not None:
+            self.filesystem.delete_file(path)
+        else:
+            os.remove(path)
+
+    def move(self, source: str, destination: str) -> None:
+        """Replace ``destination`` with ``source``."""
+        if self.filesystem is not None:
+            self.filesystem.move(source, destination)
+        else:
+            os.replace(source, destination)
+
+    def read_text(self, path: str) -> str:
+        with self.open_input(path) as file:
+            return file.read().decode()
+
+    def relative_path(self, path: str) -> str:
+        """Return the given path relative to the export directory, for use
+        as a key in `ExportIndex`.
+        """
+        return pathlib.PurePosixPath(path).relative_to(self._dir).as_posix()
+
+    def path_from_relative(self, relative_path: str) -> str:
+        """Inverse of `relative_path`."""
+        return self._join(*relative_path.split("/"))
+
     def dimension_parquet_path(self, dimension_name: str) -> str:
         return self._join(_DIMENSION_SUBDIRECTORY, dimension_name)
 
@@ -39,8 +139,25 @@ class ExportPaths:
     def collections_path(self) -> str:
         return self._join("collections.yaml")
 
+    def collections_parquet_path(self) -> str:
+        return self._join("collections")
+
     def dataset_type_path(self) -> str:
         return self._join("dataset_types.json")
 
     def index_path(self) -> str:
         return self._join("index.json")
+
+    def dataset_id_index_path(self) -> str:
+        return self._join("dataset_id_index.bin")
+
+
+def _add_s3_endpoint(uri: str) -> str:
+    parsed = urllib.parse.urlsplit(uri)
+    endpoint = os.environ.get("S3_ENDPOINT_URL")
+    if parsed.scheme != "s3" or not endpoint or "endpoint_override" in urllib.parse.parse_qs(parsed.query):
+        return uri
+    parsed_endpoint = urllib.parse.urlsplit(endpoint)
+    query = urllib.parse.parse_qsl(parsed.query)
+    query.extend([("endpoint_override", parsed_endpoint.netloc), ("scheme", parsed_endpoint.scheme)])
+    return urllib.parse.urlunsplit(parsed._replace(query=urllib.parse.urlencode(query)))
@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from typing import Generic, TypeVar
+
+_T = TypeVar("_T")
+
+# How often a thread blocked on the queue checks whether the other side has
+# given up.
+_POLL_INTERVAL = 0.1
+
+
+class PipelineStats:
+    """Time spent blocked on each side of the queues created by
+    `prefetch`, accumulated over every queue that shares this object.
+    """
+
+    def __init__(self) -> None:
+        self.batches = 0
+        self.producer_blocked = 0.0
+        """Seconds the reader/decoder thread spent waiting for space in the
+        queue, i.e. waiting on the database writer.
+        """
+        self.consumer_blocked = 0.0
+        """Seconds the database writer spent waiting for a decoded batch."""
+        self._lock = threading.Lock()
+
+    def add(self, batches: int, producer_blocked: float, consumer_blocked: float) -> None:
+        with self._lock:
+            self.batches += batches
+            self.producer_blocked += producer_blocked
+            self.consumer_blocked += consumer_blocked
+
+    def format(self) -> str:
+        return (
+            f"{self.batches} batches; decoder blocked {self.producer_blocked:.1f} s waiting for writer,"
+            f" writer blocked {self.consumer_blocked:.1f} s waiting for decoder"
+        )
+
+
+def prefetch(items: Iterable[_T], queue_depth: int, stats: PipelineStats) -> Iterator[_T]:
+    """Iterate over ``items`` in a background thread, so that producing the
+    next item overlaps with the caller's processing of the current one.
+
+    Parameters
+    ----------
+    items
+        Items to iterate over.  All of the work done to produce each item
+        (e.g. reading and decoding a parquet batch) happens in the background
+        thread.
+    queue_depth
+        Maximum number of produced items waiting to be consumed.
+    stats
+        Updated with the time each side spent blocked when iteration ends.
+
+    Notes
+    -----
+    Exceptions raised while producing items are re-raised in the consuming
+    thread.  If the consumer stops early, the background thread stops
+    producing items and ``items`` is closed.
+    """
+    producer = _Producer(items, queue_depth)
+    producer.start()
+    consumer_blocked = 0.0
+    batches = 0
+    try:
+        while True:
+            start = time.perf_counter()
+            item = producer.queue.get()
+            consumer_blocked += time.perf_counter() - start
+            if isinstance(item, _End):
+                return
+            if isinstance(item, _Error):
+                raise item.exception
+            batches += 1
+            yield item
+    finally:
+        producer.stop()
+        stats.add(batches, producer.blocked, consumer_blocked)
+
+
+class _End:
+    pass
+
+
+class _Error:
+    def __init__(self, exception: BaseException) -> None:
+        self.exception = exception
+
+
+class _Producer(Generic[_T]):
+    def __init__(self, items: Iterable[_T], queue_depth: int) -> None:
+        self.queue: queue.Queue[_T | _End | _Error] = queue.Queue(maxsize=max(1, queue_depth))
+        self.blocked = 0.0
+        self._items = items
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="ImportDecoder", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        iterator = iter(self._items)
+        try:
+            for item in iterator:
+                if not self._put(item):
+                    return
+            self._put(_End())
+        except BaseException as e:
+            self._put(_Error(e))
+        finally:
+            # Release any resources (e.g. open parquet files) held by a
+            # generator that was not run to completion.
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    def _put(self, item: _T | _End | _Error) -> bool:
+        """Add an item to the queue, returning `False` if the consumer
+        stopped before there was space for it.
+        """
+        start = time.perf_counter()
+        try:
+            while not self._stopping.is_set():
+                try:
+                    self.queue.put(item, timeout=_POLL_INTERVAL)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+        finally:
+            self.blocked += time.perf_counter() - start
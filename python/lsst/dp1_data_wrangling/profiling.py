@@ -0,0 +1,247 @@
+from __future__ import annotations
+
+import cProfile
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from types import FrameType
+from typing import Any, TypeVar
+
+import click
+
+DEFAULT_PROFILE_DIRECTORY = "dp1-profile"
+DEFAULT_SAMPLE_INTERVAL = 0.005
+"""Seconds between stack samples when profiling."""
+
+_MEMORY_TOP_LINES = 50
+_TRACEMALLOC_FRAMES = 25
+
+
+class StageProfiler:
+    """Profile the major stages of an export, symlink or import run
+    separately, so hot spots in each stage are visible from a single run.
+
+    For each stage name, the following files are written to the output
+    directory:
+
+    - ``<stage>.pstats``: deterministic profile from `cProfile`, for use with
+      `pstats` or snakeviz.
+    - ``<stage>.collapsed``: stacks sampled every ``sample_interval``
+      seconds, in the "collapsed" format read by flamegraph.pl and
+      speedscope.
+    - ``<stage>.memory.txt``: the lines that allocated the most memory during
+      the stage, according to `tracemalloc`.
+
+    A ``summary.txt`` file lists the wall time and peak traced memory of each
+    stage.  Entering a stage with the same name more than once accumulates
+    into the same files.
+
+    Only the thread that enters a stage is profiled.  Stages may not be
+    nested.
+
+    Parameters
+    ----------
+    output_directory
+        Directory to write results to.  If `None`, profiling is disabled and
+        `stage` does nothing.
+    profile
+        If `True`, run `cProfile` and the stack sampler during each stage.
+    trace_memory
+        If `True`, trace memory allocations during each stage.
+    sample_interval
+        Seconds between stack samples.
+    """
+
+    def __init__(
+        self,
+        output_directory: str | None = None,
+        profile: bool = False,
+        trace_memory: bool = False,
+        sample_interval: float = DEFAULT_SAMPLE_INTERVAL,
+    ) -> None:
+        self._output_directory = output_directory
+        self._profile = profile and output_directory is not None
+        self._trace_memory = trace_memory and output_directory is not None
+        self._sample_interval = sample_interval
+        self._profiles: dict[str, cProfile.Profile] = {}
+        self._stacks: dict[str, Counter[str]] = {}
+        self._summaries: dict[str, _StageSummary] = {}
+        self._active_stage: str | None = None
+        if output_directory is not None:
+            os.makedirs(output_directory, exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return self._profile or self._trace_memory
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Profile the code run inside this context as part of the stage
+        with the given name.
+        """
+        if not self.enabled:
+            yield
+            return
+
+        assert self._active_stage is None, f"Stage '{name}' started inside stage '{self._active_stage}'"
+        self._active_stage = name
+        summary = self._summaries.setdefault(name, _StageSummary())
+
+        start_snapshot = None
+        if self._trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(_TRACEMALLOC_FRAMES)
+            tracemalloc.reset_peak()
+            start_snapshot = tracemalloc.take_snapshot()
+
+        sampler = None
+        profile = None
+        if self._profile:
+            sampler = _StackSampler(
+                threading.get_ident(), self._sample_interval, self._stacks.setdefault(name, Counter())
+            )
+            sampler.start()
+            profile = self._profiles.setdefault(name, cProfile.Profile())
+            profile.enable()
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            summary.seconds += time.perf_counter() - start
+            summary.calls += 1
+            if profile is not None and sampler is not None:
+                profile.disable()
+                sampler.stop()
+                self._write_profile(name)
+            if start_snapshot is not None:
+                _, peak = tracemalloc.get_traced_memory()
+                summary.peak_memory = max(summary.peak_memory, peak)
+                self._write_memory(name, start_snapshot, tracemalloc.take_snapshot())
+            self._active_stage = None
+            self._write_summary()
+
+    def finish(self) -> None:
+        """Stop memory tracing, if it was started by this profiler."""
+        if self._trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def _get_output_path(self, name: str, suffix: str) -> str:
+        assert self._output_directory is not None
+        filename = re.sub(r"[^\w.-]", "_", name.replace("/", ".")) + suffix
+        return os.path.join(self._output_directory, filename)
+
+    def _write_profile(self, name: str) -> None:
+        self._profiles[name].dump_stats(self._get_output_path(name, ".pstats"))
+        with open(self._get_output_path(name, ".collapsed"), "w") as output:
+            for stack, count in self._stacks[name].items():
+                output.write(f"{stack} {count}\n")
+
+    def _write_memory(
+        self, name: str, start_snapshot: tracemalloc.Snapshot, end_snapshot: tracemalloc.Snapshot
+    ) -> None:
+        # Allocations made by the profiler itself would otherwise show up at
+        # the top of the list.
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+        differences = end_snapshot.filter_traces(filters).compare_to(
+            start_snapshot.filter_traces(filters), "lineno"
+        )
+        # Each entry of the same stage is appended, since the snapshots only
+        # cover a single entry.
+        with open(self._get_output_path(name, ".memory.txt"), "a") as output:
+            summary = self._summaries[name]
+            output.write(f"# Entry {summary.calls} of stage '{name}'\n")
+            for difference in differences[:_MEMORY_TOP_LINES]:
+                output.write(f"{difference}\n")
+
+    def _write_summary(self) -> None:
+        with open(self._get_output_path("summary", ".txt"), "w") as output:
+            for name, summary in self._summaries.items():
+                line = f"{name}: {summary.seconds:.3f} s in {summary.calls} calls"
+                if self._trace_memory:
+                    line += f", peak traced memory {summary.peak_memory} bytes"
+                output.write(line + "\n")
+
+
+class _StageSummary:
+    def __init__(self) -> None:
+        self.seconds = 0.0
+        self.calls = 0
+        self.peak_memory = 0
+
+
+class _StackSampler:
+    """Periodically record the call stack of one thread into ``stacks``,
+    keyed by the stack in collapsed format (outermost frame first, frames
+    separated by semicolons).
+    """
+
+    def __init__(self, thread_id: int, interval: float, stacks: Counter[str]) -> None:
+        self._thread_id = thread_id
+        self._interval = interval
+        self._stacks = stacks
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="StackSampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self._interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is not None:
+                self._stacks[_collapse_stack(frame)] += 1
+
+
+def _collapse_stack(frame: FrameType | None) -> str:
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(frames))
+
+
+_F = TypeVar("_F", bound=Callable[..., Any])
+
+
+def profiling_options(function: _F) -> _F:
+    """Add the ``--profile``, ``--trace-memory`` and ``--profile-dir``
+    options to a click command.  Use `make_profiler` to create the
+    `StageProfiler` from the option values.
+    """
+    function = click.option(
+        "--profile-dir",
+        default=DEFAULT_PROFILE_DIRECTORY,
+        help="Directory to write profiling results to",
+    )(function)
+    function = click.option(
+        "--trace-memory",
+        is_flag=True,
+        help="Record the lines allocating the most memory in each stage, using tracemalloc",
+    )(function)
+    function = click.option(
+        "--profile",
+        is_flag=True,
+        help="Write a cProfile .pstats file and sampled flamegraph stacks for each stage",
+    )(function)
+    return function
+
+
+def make_profiler(profile: bool, trace_memory: bool, profile_dir: str) -> StageProfiler:
+    """Create a `StageProfiler` from the options added by
+    `profiling_options`.
+    """
+    if not (profile or trace_memory):
+        return StageProfiler()
+    return StageProfiler(profile_dir, profile=profile, trace_memory=trace_memory)
@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import time
+
+
+class ProgressReporter:
+    """Print periodic progress messages for a long-running operation.
+
+    Parameters
+    ----------
+    label
+        Name of the operation, included in each message.
+    total
+        Total number of rows expected, or `None` if not known in advance.
+        When known, messages include the percentage complete and an estimate
+        of the time remaining.
+    interval
+        Minimum number of seconds between messages.
+    """
+
+    def __init__(self, label: str, total: int | None, interval: float = 30.0) -> None:
+        self._label = label
+        self._total = total
+        self._interval = interval
+        self._done = 0
+        self._start = time.monotonic()
+        self._last_report = self._start
+
+    def update(self, rows: int) -> None:
+        self._done += rows
+        now = time.monotonic()
+        if now - self._last_report >= self._interval:
+            self._last_report = now
+            print(self._format_message(now))
+
+    def finish(self) -> None:
+        print(self._format_message(time.monotonic()))
+
+    def _format_message(self, now: float) -> str:
+        elapsed = now - self._start
+        rate = self._done / elapsed if elapsed > 0 else 0.0
+        message = f"{self._label}: {self._done}"
+        if self._total is not None:
+            message += f"/{self._total} rows"
+            if self._total > 0:
+                message += f" ({100 * self._done / self._total:.1f}%)"
+        else:
+            message += " rows"
+        message += f", {rate:.0f} rows/s, {_format_duration(elapsed)} elapsed"
+        if self._total is not None and rate > 0 and self._done < self._total:
+            message += f", ~{_format_duration((self._total - self._done) / rate)} remaining"
+        return message
+
+
+def _format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import numpy
+import pyarrow
+import pyarrow.compute
+from lsst.sphgeom import DISJOINT, Box, HealpixPixelization, Region
+
+DEFAULT_SPATIAL_INDEX_ORDER = 7
+"""HEALPix order of the pixels in the spatial index columns.  Order 7 pixels
+are about 0.46 degrees across, between the size of a detector and of a
+patch.
+"""
+
+SPATIAL_INDEX_COLUMNS = ["ra_min", "ra_max", "dec_min", "dec_max", "healpix_pixels"]
+"""Columns added to dimension record files with regions by
+`add_spatial_index_columns`.
+
+``ra_min``, ``ra_max``, ``dec_min`` and ``dec_max`` are the bounding box of
+the region in degrees.  A box that crosses RA 0 has ``ra_min > ra_max``.
+``healpix_pixels`` is the sorted list of nested HEALPix pixels overlapping
+the region, at the order given by the ``healpix_order`` metadata of its
+field.  All of the columns are null for records without a region.
+"""
+
+SPATIAL_SORT_COLUMNS = ["healpix_pixels", "dec_min"]
+"""Columns that dimension records with the `SPATIAL_INDEX_COLUMNS` are sorted
+by, before their data ID columns, so that each row group covers a compact
+area and its statistics for the bounding box columns can rule it out.
+``healpix_pixels`` sorts by its first pixel; nested pixel numbers keep
+neighbouring pixels close together.
+"""
+
+_ORDER_METADATA_KEY = b"healpix_order"
+
+
+def add_spatial_index_columns(
+    table: pyarrow.Table, order: int = DEFAULT_SPATIAL_INDEX_ORDER
+) -> pyarrow.Table:
+    """Append the `SPATIAL_INDEX_COLUMNS` computed from the ``region`` column
+    of a dimension record table.
+    """
+    pixelization = HealpixPixelization(order)
+    bounds: list[list[float | None]] = [[], [], [], []]
+    pixels: list[list[int] | None] = []
+    for encoded in _get_encoded_regions(table):
+        if encoded is None:
+            for values in bounds:
+                values.append(None)
+            pixels.append(None)
+            continue
+        region = Region.decode(encoded)
+        box = region.getBoundingBox()
+        lon, lat = box.getLon(), box.getLat()
+        for values, angle in zip(bounds, [lon.getA(), lon.getB(), lat.getA(), lat.getB()]):
+            values.append(angle.asDegrees())
+        pixels.append(_get_pixels(pixelization, region))
+    for name, values in zip(SPATIAL_INDEX_COLUMNS, bounds):
+        table = table.append_column(name, pyarrow.array(values, pyarrow.float64()))
+    field = pyarrow.field(
+        SPATIAL_INDEX_COLUMNS[4],
+        pyarrow.list_(pyarrow.uint64()),
+        metadata={_ORDER_METADATA_KEY: str(order).encode()},
+    )
+    return table.append_column(field, pyarrow.array(pixels, field.type))
+
+
+def get_spatial_sort_keys(batch: pyarrow.RecordBatch | pyarrow.Table) -> list[pyarrow.Array]:
+    """Return arrays that sort the rows of a batch with the
+    `SPATIAL_INDEX_COLUMNS` in the order of `SPATIAL_SORT_COLUMNS`.  Records
+    without a region sort last.
+    """
+    first_pixels = pyarrow.compute.list_element(batch.column(SPATIAL_SORT_COLUMNS[0]), 0)
+    return [
+        first_pixels.fill_null(pyarrow.scalar(numpy.iinfo(numpy.uint64).max, pyarrow.uint64())),
+        batch.column(SPATIAL_SORT_COLUMNS[1]).fill_null(numpy.inf),
+    ]
+
+
+def has_spatial_index(schema: pyarrow.Schema) -> bool:
+    return all(name in schema.names for name in SPATIAL_INDEX_COLUMNS)
+
+
+def make_bounding_box_filter(box: Box) -> pyarrow.compute.Expression:
+    """Return a filter selecting the records whose bounding boxes overlap
+    ``box``.
+
+    Only simple comparisons of the bounding box columns against constants
+    are used where possible, so scans can skip row groups using their
+    statistics.
+    """
+    field = pyarrow.compute.field
+    lon, lat = box.getLon(), box.getLat()
+    ra_min, ra_max = lon.getA().asDegrees(), lon.getB().asDegrees()
+    expression = (field("dec_max") >= lat.getA().asDegrees()) & (field("dec_min") <= lat.getB().asDegrees())
+    record_wraps = field("ra_min") > field("ra_max")
+    if ra_min <= ra_max:
+        ra_overlaps = (field("ra_max") >= ra_min) & (field("ra_min") <= ra_max)
+    else:
+        # The box crosses RA 0, so it overlaps anything touching either
+        # side.
+        ra_overlaps = (field("ra_max") >= ra_min) | (field("ra_min") <= ra_max)
+    # Records crossing RA 0 always overlap a box that crosses it too, and
+    # are rare enough to leave to the exact checks otherwise.
+    return expression & (ra_overlaps | record_wraps)
+
+
+def find_overlapping_rows(batch: pyarrow.RecordBatch | pyarrow.Table, region: Region) -> numpy.ndarray:
+    """Return a boolean mask of the rows of a dimension record batch whose
+    regions overlap ``region``.
+
+    The ``healpix_pixels`` column, if present, is used to rule out rows with
+    a vectorized test before the remaining regions are decoded and compared
+    exactly.
+    """
+    candidates = numpy.ones(batch.num_rows, dtype=bool)
+    if SPATIAL_INDEX_COLUMNS[4] in batch.schema.names:
+        order = int(batch.schema.field(SPATIAL_INDEX_COLUMNS[4]).metadata[_ORDER_METADATA_KEY])
+        wanted = pyarrow.array(_get_pixels(HealpixPixelization(order), region), pyarrow.uint64())
+        pixels = batch.column(SPATIAL_INDEX_COLUMNS[4])
+        if isinstance(pixels, pyarrow.ChunkedArray):
+            pixels = pixels.combine_chunks()
+        matched = pyarrow.compute.is_in(pyarrow.compute.list_flatten(pixels), wanted)
+        parents = pyarrow.compute.list_parent_indices(pixels).to_numpy()
+        candidates = numpy.zeros(batch.num_rows, dtype=bool)
+        candidates[parents[matched.to_numpy(zero_copy_only=False)]] = True
+
+    mask = numpy.zeros(batch.num_rows, dtype=bool)
+    encoded_regions = _get_encoded_regions(batch)
+    for i in numpy.flatnonzero(candidates):
+        encoded = encoded_regions[i]
+        if encoded is not None and not (Region.decode(encoded).relate(region) & DISJOINT):
+            mask[i] = True
+    return mask
+
+
+def _get_pixels(pixelization: HealpixPixelization, region: Region) -> list[int]:
+    return [p for begin, end in pixelization.envelope(region).ranges() for p in range(begin, end)]
+
+
+def _get_encoded_regions(batch: pyarrow.RecordBatch | pyarrow.Table) -> list[bytes | None]:
+    region = batch.column("region")
+    if isinstance(region, pyarrow.ChunkedArray):
+        chunks = region.chunks
+    else:
+        chunks = [region]
+    encoded: list[bytes | None] = []
+    for chunk in chunks:
+        # Regions are stored as sphgeom's encoded bytes, in an extension type
+        # when lsst.daf.butler has registered it.
+        if isinstance(chunk, pyarrow.ExtensionArray):
+            chunk = chunk.storage
+        encoded.extend(chunk.to_pylist())
+    return encoded
@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import click
+import pydantic
+
+from .utils import read_model_from_file
+
+STARTUP_BENCHMARK_FORMAT_VERSION = 1
+
+# The scripts are in the directory above python/lsst/dp1_data_wrangling.
+_SCRIPT_DIRECTORY = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+
+ENTRY_POINTS: dict[str, list[str]] = {
+    "export --help": ["export_preliminary_dp1.py", "--help"],
+    "symlinks --help": ["generate_dp1_datastore_symlinks.py", "--help"],
+    "import --help": ["import_preliminary_dp1.py", "--help"],
+    "verify --help": ["verify_dp1_import.py", "--help"],
+    "restore indexes --help": ["restore_dp1_indexes.py", "--help"],
+    "dp1_dump --help": ["dp1_dump.py", "--help"],
+    "dp1_dump chunk --help": ["dp1_dump.py", "chunk", "--help"],
+    "dp1_dump hips --help": ["dp1_dump.py", "hips", "--help"],
+    "dp1_dump inspect --help": ["dp1_dump.py", "inspect", "--help"],
+    "dp1_dump lookup --help": ["dp1_dump.py", "lookup", "--help"],
+    "dp1_dump pack --help": ["dp1_dump.py", "pack", "--help"],
+    "dp1_dump validate --help": ["dp1_dump.py", "validate", "--help"],
+    "dp1_dump obscore --help": ["dp1_dump.py", "obscore", "--help"],
+    "benchmark --help": ["benchmark_round_trip.py", "--help"],
+}
+"""Command lines measured by the benchmark, relative to the directory
+containing the scripts.
+"""
+
+# Runs a script the way the interpreter would, then reports which modules
+# were loaded.  --help exits through SystemExit, which is expected.
+_PROBE = """
+import json, runpy, sys
+sys.argv = sys.argv[1:]
+try:
+    runpy.run_path(sys.argv[0], run_name="__main__")
+except SystemExit:
+    pass
+modules = sorted(sys.modules)
+sys.stderr.write("\\n" + json.dumps(modules) + "\\n")
+"""
+
+_HEAVY_MODULES = ["lsst.daf.butler", "pandas", "sqlalchemy"]
+
+
+class EntryPointResult(pydantic.BaseModel):
+    seconds: float
+    """Median wall-clock time to run the command, including interpreter
+    startup.
+    """
+    modules: int
+    """Number of modules loaded by the command."""
+    heavy_modules: list[str]
+    """Slow-to-import packages loaded by the command."""
+
+
+class StartupBenchmarkResult(pydantic.BaseModel):
+    format_version: int = STARTUP_BENCHMARK_FORMAT_VERSION
+    entry_points: dict[str, EntryPointResult]
+
+
+def run_startup_benchmark(repeat: int) -> StartupBenchmarkResult:
+    """Time each entry point in `ENTRY_POINTS` ``repeat`` times in a fresh
+    interpreter, and count the modules it loads.
+    """
+    results = {}
+    for name, command in ENTRY_POINTS.items():
+        times = []
+        modules: list[str] = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            process = subprocess.run(
+                [sys.executable, "-c", _PROBE, os.path.join(_SCRIPT_DIRECTORY, command[0]), *command[1:]],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+                text=True,
+            )
+            times.append(time.perf_counter() - start)
+            if process.returncode != 0:
+                raise RuntimeError(f"'{name}' failed:\n{process.stderr}")
+            modules = json.loads(process.stderr.strip().splitlines()[-1])
+        results[name] = EntryPointResult(
+            seconds=statistics.median(times),
+            modules=len(modules),
+            heavy_modules=[m for m in _HEAVY_MODULES if m in modules],
+        )
+    return StartupBenchmarkResult(entry_points=results)
+
+
+def compare_to_baseline(
+    result: StartupBenchmarkResult, baseline: StartupBenchmarkResult, tolerance: float
+) -> list[str]:
+    """Return a description of each entry point that became slower, or
+    loads more modules, by more than ``tolerance`` (a fraction) relative to
+    the baseline, or that started loading a slow package.
+    """
+    regressions = []
+    for name, entry_point in result.entry_points.items():
+        base = baseline.entry_points.get(name)
+        if base is None:
+            continue
+        if entry_point.seconds > base.seconds * (1 + tolerance):
+            regressions.append(f"{name}: {entry_point.seconds:.2f} s vs baseline {base.seconds:.2f} s")
+        if entry_point.modules > base.modules * (1 + tolerance):
+            regressions.append(f"{name}: {entry_point.modules} modules vs baseline {base.modules} modules")
+        added = sorted(set(entry_point.heavy_modules) - set(base.heavy_modules))
+        if added:
+            regressions.append(f"{name}: now imports {', '.join(added)}")
+    return regressions
+
+
+@click.command()
+@click.option("--repeat", default=5, help="Number of times to run each command")
+@click.option("--output", help="File to write JSON results to.  Defaults to standard output")
+@click.option("--baseline", help="JSON results from a previous run to compare against")
+@click.option("--tolerance", default=0.2, help="Allowed fractional regression relative to the baseline")
+def main(repeat: int, output: str | None, baseline: str | None, tolerance: float) -> None:
+    """Measure the startup time and number of imported modules of each
+    command-line entry point.
+    """
+    result = run_startup_benchmark(repeat)
+    for name, entry_point in result.entry_points.items():
+        heavy = f" (imports {', '.join(entry_point.heavy_modules)})" if entry_point.heavy_modules else ""
+        print(f"{name}: {entry_point.seconds:.2f} s, {entry_point.modules} modules{heavy}", file=sys.stderr)
+
+    json_output = result.model_dump_json(indent=2)
+    if output is not None:
+        with open(output, "w") as file:
+            file.write(json_output)
+    else:
+        print(json_output)
+
+    if baseline is not None:
+        regressions = compare_to_baseline(
+            result, read_model_from_file(StartupBenchmarkResult, baseline), tolerance
+        )
+        if regressions:
+            raise click.ClickException("Startup regressions found:\n" + "\n".join(regressions))
@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+from typing import Any, Protocol, TypeVar
+
+from lsst.daf.butler import Butler, DimensionGroup
+from lsst.sphgeom import Angle, Circle, LonLat, UnitVector3d
+
+from .index import ExportSubset
+
+
+class Queryable(Protocol):
+    """A query or query result that can be restricted with a where
+    clause.
+    """
+
+    def where(self: _Q, *args: Any, bind: dict[str, Any] | None = None) -> _Q: ...
+
+
+_Q = TypeVar("_Q", bound=Queryable)
+
+
+class SubsetFilter:
+    """Restricts the dataset queries made by `Exporter` to an
+    `ExportSubset`.
+
+    Each restriction only applies to dataset types that have the dimensions
+    it constrains: spatial restrictions to dataset types with spatial
+    dimensions, ``day_obs`` ranges to dataset types with ``day_obs``, and the
+    visit sample to dataset types with ``visit`` or ``exposure``.  Other
+    dataset types (e.g. calibrations) are exported in full.
+
+    A dataset type may have dimensions in more than one spatial family, e.g.
+    a warp has both a visit (observation regions) and a patch (sky map
+    regions).  Its footprint is the intersection of those regions, so the
+    spatial region restriction requires the most precise element of every
+    family to overlap the region, rather than picking one family.
+
+    Parameters
+    ----------
+    butler
+        Butler being exported from.
+    subset
+        Restrictions to apply.
+    """
+
+    def __init__(self, butler: Butler, subset: ExportSubset) -> None:
+        self.subset = subset
+        self._region = None
+        if subset.region is not None:
+            ra, dec, radius = subset.region
+            self._region = Circle(UnitVector3d(LonLat.fromDegrees(ra, dec)), Angle.fromDegrees(radius))
+        self._visits: list[int] | None = None
+        if subset.visit_fraction is not None:
+            self._visits = self._sample_visits(butler, subset.visit_fraction)
+            print(f"Exporting datasets for {len(self._visits)} sampled visits")
+
+    def apply(self, query: _Q, dimensions: DimensionGroup) -> _Q:
+        """Add the restrictions that apply to datasets with the given
+        dimensions to a query or query result.
+        """
+        clauses, bind = self._get_constraints(dimensions)
+        if not clauses:
+            return query
+        return query.where(" AND ".join(clauses), bind=bind)
+
+    def _get_constraints(self, dimensions: DimensionGroup) -> tuple[list[str], dict[str, Any]]:
+        clauses = []
+        bind: dict[str, Any] = {}
+        subset = self.subset
+        if dimensions.spatial:
+            if subset.tracts or subset.patches:
+                clauses.append("skymap = subset_skymap")
+                bind["subset_skymap"] = subset.skymap
+            if subset.tracts:
+                clauses.append("tract IN (subset_tracts)")
+                bind["subset_tracts"] = subset.tracts
+            if subset.patches:
+                clauses.append("patch IN (subset_patches)")
+                bind["subset_patches"] = subset.patches
+            if self._region is not None:
+                # Compare against the most precise region of each family,
+                # e.g. visit_detector_region rather than visit.
+                for family in sorted(dimensions.spatial, key=str):
+                    element = family.choose(dimensions)
+                    clauses.append(f"{element.name}.region OVERLAPS subset_region")
+                bind["subset_region"] = self._region
+        if "day_obs" in dimensions.names:
+            if subset.day_obs_min is not None:
+                clauses.append("day_obs >= subset_day_obs_min")
+                bind["subset_day_obs_min"] = subset.day_obs_min
+            if subset.day_obs_max is not None:
+                clauses.append("day_obs <= subset_day_obs_max")
+                bind["subset_day_obs_max"] = subset.day_obs_max
+        if self._visits is not None:
+            if "visit" in dimensions.names:
+                clauses.append("visit IN (subset_visits)")
+                bind["subset_visits"] = self._visits
+            elif "exposure" in dimensions.names:
+                # Each DP1 visit has a single snap, whose exposure ID is the
+                # same as the visit ID.
+                clauses.append("exposure IN (subset_visits)")
+                bind["subset_visits"] = self._visits
+        return clauses, bind
+
+    def _sample_visits(self, butler: Butler, fraction: float) -> list[int]:
+        """Choose ``fraction`` of the visits in the repository, spread evenly
+        over the visits sorted by ID (and so by observation time).
+        """
+        with butler.query() as query:
+            query = self.apply(query, butler.dimensions.conform(["visit"]))
+            visits = sorted({data_id["visit"] for data_id in query.data_ids(["visit"])})
+        # Keep a visit each time the running total of the fraction passes a
+        # whole number.
+        return [v for i, v in enumerate(visits) if int((i + 1) * fraction) > int(i * fraction)]
@@ -1,13 +1,26 @@
 from __future__ import annotations
 
-from typing import TypeVar
+import uuid
+from typing import TYPE_CHECKING, TypeVar
 
+import pyarrow
 import pydantic
-from lsst.daf.butler import DatasetId
 
+if TYPE_CHECKING:
+    from lsst.daf.butler import DatasetId
 
-def write_model_to_file(model: pydantic.BaseModel, output_file: str) -> None:
+DEFAULT_BATCH_SIZE = 10000
+"""Default number of rows read from a parquet file at a time during
+import.
+"""
+
+
+def write_model_to_file(model: pydantic.BaseModel, output_file: str | pyarrow.NativeFile) -> None:
     json = model.model_dump_json(indent=2)
+    if isinstance(output_file, pyarrow.NativeFile):
+        with output_file:
+            output_file.write(json.encode())
+        return
     with open(output_file, "w") as output:
         output.write(json)
 
@@ -15,7 +28,10 @@ def write_model_to_file(model: pydantic.BaseModel, output_file: str) -> None:
 _T = TypeVar("_T", bound=pydantic.BaseModel)
 
 
-def read_model_from_file(model_class: type[_T], input_file: str) -> _T:
+def read_model_from_file(model_class: type[_T], input_file: str | pyarrow.NativeFile) -> _T:
+    if isinstance(input_file, pyarrow.NativeFile):
+        with input_file:
+            return model_class.model_validate_json(input_file.read())
     with open(input_file, "r") as file:
         data = file.read()
         return model_class.model_validate_json(data)
@@ -23,4 +39,6 @@ def read_model_from_file(model_class: type[_T], input_file: str) -> _T:
 
 def convert_parquet_uuid_to_dataset_id(dataset_id_binary: object) -> DatasetId:
     assert isinstance(dataset_id_binary, bytes), "Dataset ID expected to be serialized as binary bytes."
-    return DatasetId(bytes=dataset_id_binary)
+    # DatasetId is an alias for uuid.UUID.  It is constructed directly so
+    # that this module can be imported without lsst.daf.butler.
+    return uuid.UUID(bytes=dataset_id_binary)
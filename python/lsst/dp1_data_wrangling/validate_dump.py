@@ -0,0 +1,329 @@
+from __future__ import annotations
+
+from collections.abc import Iterator
+from typing import NamedTuple
+
+import click
+import numpy
+import pyarrow
+import pyarrow.types
+from lsst.daf.butler import DimensionElement, DimensionUniverse
+from pyarrow.parquet import ParquetFile
+
+from .archive import open_export
+from .collections_parquet import read_collections_file, read_collections_yaml
+from .dataset_ids import DATASET_ID_DTYPE, contains_dataset_ids, dataset_ids_to_numpy, format_dataset_id
+from .dataset_types import import_dataset_types, load_export_universe
+from .index import ExportIndex
+from .paths import DEFAULT_EXPORT_DIRECTORY, ExportPaths
+from .utils import read_model_from_file
+
+_BATCH_SIZE = 100000
+_MAX_SAMPLES = 5
+
+
+class DanglingReference(NamedTuple):
+    """A set of references from one file to keys that do not exist in the
+    file they refer to.
+    """
+
+    source: str
+    """Name of the file containing the references."""
+    target: str
+    """Name of the file that should contain the referenced keys."""
+    columns: list[str]
+    """Columns in ``source`` holding the reference."""
+    count: int
+    """Number of distinct dangling keys."""
+    samples: list[str]
+    """A few of the dangling keys, formatted for display."""
+
+
+class DumpValidator:
+    """Check an export for references that can't be satisfied by the other
+    files in the export, before handing it over to `Importer`.
+
+    Checks performed:
+
+    - Every dataset ID in the datastore file is present in a datasets file.
+    - Every dataset ID in an associations file is present in the datasets
+      file for the same dataset type.
+    - Every data ID value in a datasets file has a matching dimension
+      record.
+    - Every dimension referenced by a dimension record has a matching
+      dimension record.
+
+    `compare_collections` separately checks that the collections parquet
+    file matches the YAML collections file.
+
+    Parameters
+    ----------
+    input_path
+        Export to validate: a directory, archive, chunk store or URI (see
+        `open_export`).
+    universe
+        Dimension universe used to interpret the dimension record files.
+        Defaults to the universe the export was written with.
+    partitions
+        Number of passes to split the dataset ID checks into.  Each pass only
+        holds the dataset IDs whose first byte falls in that partition, so
+        increasing this bounds memory use at the cost of re-reading the
+        dataset ID columns.
+    """
+
+    def __init__(
+        self, input_path: str, universe: DimensionUniverse | None = None, partitions: int = 1
+    ) -> None:
+        self._paths = open_export(input_path)
+        self._index = read_model_from_file(ExportIndex, self._paths.open_input(self._paths.index_path()))
+        self._universe = universe if universe is not None else load_export_universe(self._paths, self._index)
+        self._partitions = partitions
+
+    def validate(self) -> list[DanglingReference]:
+        problems = []
+        problems.extend(self._check_dataset_ids())
+        problems.extend(self._check_dataset_data_ids())
+        problems.extend(self._check_dimension_records())
+        return problems
+
+    def compare_collections(self) -> list[str]:
+        """Return a description of each collection whose type, doc or
+        children differ between the collections parquet file and the YAML
+        file, or that is only in one of them.
+        """
+        parquet_path = self._paths.collections_parquet_path()
+        if not self._paths.exists(parquet_path):
+            # Exports written before the parquet file was added.
+            return []
+        from_parquet = {c.name: c for c in read_collections_file(self._paths.open_input(parquet_path))}
+        from_yaml = {
+            c.name: c for c in read_collections_yaml(self._paths.read_text(self._paths.collections_path()))
+        }
+        problems = []
+        for name in sorted(from_parquet.keys() | from_yaml.keys()):
+            parquet_collection = from_parquet.get(name)
+            yaml_collection = from_yaml.get(name)
+            if parquet_collection is None:
+                problems.append(f"{name}: only in the YAML file")
+            elif yaml_collection is None:
+                problems.append(f"{name}: only in the parquet file")
+            elif parquet_collection != yaml_collection:
+                problems.append(f"{name}: parquet has {parquet_collection}, YAML has {yaml_collection}")
+        return problems
+
+    def _check_dataset_ids(self) -> Iterator[DanglingReference]:
+        datastore_path = self._paths.datastore_parquet_path()
+        missing: dict[tuple[str, str], _MissingIds] = {}
+        for partition in range(self._partitions):
+            all_ids: list[numpy.ndarray] = []
+            for dt in self._index.dataset_types:
+                ids = _read_dataset_ids(
+                    self._paths, self._paths.dataset_parquet_path(dt), partition, self._partitions
+                )
+                ids.sort()
+                all_ids.append(ids)
+                missing.setdefault((f"associations/{dt}", f"datasets/{dt}"), _MissingIds()).update(
+                    self._paths,
+                    self._paths.dataset_association_parquet_path(dt),
+                    ids,
+                    partition,
+                    self._partitions,
+                )
+
+            if self._paths.exists(datastore_path):
+                known_ids = numpy.sort(numpy.concatenate([numpy.empty(0, DATASET_ID_DTYPE), *all_ids]))
+                missing.setdefault(("datastore", "datasets/*"), _MissingIds()).update(
+                    self._paths, datastore_path, known_ids, partition, self._partitions
+                )
+
+        for (source, target), result in missing.items():
+            if result.count > 0:
+                yield DanglingReference(
+                    source=source,
+                    target=target,
+                    columns=["dataset_id"],
+                    count=result.count,
+                    samples=result.samples,
+                )
+
+    def _check_dataset_data_ids(self) -> Iterator[DanglingReference]:
+        dataset_types = import_dataset_types(
+            self._paths.open_input(self._paths.dataset_type_path()), self._universe
+        )
+        for dt in dataset_types:
+            if dt.name not in self._index.dataset_types:
+                continue
+            for dimension_name in dt.dimensions.required:
+                yield from self._check_dimension_reference(
+                    self._paths.dataset_parquet_path(dt.name), f"datasets/{dt.name}", dimension_name
+                )
+
+    def _check_dimension_records(self) -> Iterator[DanglingReference]:
+        for element_name in self._index.dimensions:
+            element = self._universe[element_name]
+            if not element.has_own_table:
+                continue
+            for dimension in [*element.required, *element.implied]:
+                if dimension.name == element.name:
+                    continue
+                yield from self._check_dimension_reference(
+                    self._paths.dimension_parquet_path(element_name),
+                    f"dimensions/{element_name}",
+                    dimension.name,
+                )
+
+    def _check_dimension_reference(
+        self, source_path: str, source_name: str, dimension_name: str
+    ) -> Iterator[DanglingReference]:
+        dimension = self._universe.dimensions[dimension_name]
+        if not dimension.has_own_table:
+            return
+        source_columns = list(dimension.required.names)
+        target_name = f"dimensions/{dimension_name}"
+        referenced = read_distinct_keys(self._paths.open_input(source_path), source_columns)
+        if referenced.num_rows == 0:
+            return
+
+        if dimension_name in self._index.dimensions:
+            known = read_distinct_keys(
+                self._paths.open_input(self._paths.dimension_parquet_path(dimension_name)),
+                _get_record_key_columns(dimension),
+                rename=source_columns,
+            )
+            # The key columns in the two files aren't guaranteed to have the
+            # same integer widths, so match types before the anti-join.
+            referenced = referenced.cast(known.schema)
+            missing = referenced.join(known, source_columns, join_type="left anti")
+        else:
+            missing = referenced
+
+        if missing.num_rows > 0:
+            yield DanglingReference(
+                source=source_name,
+                target=target_name,
+                columns=source_columns,
+                count=missing.num_rows,
+                samples=[_format_key(row) for row in missing.slice(0, _MAX_SAMPLES).to_pylist()],
+            )
+
+
+def _get_record_key_columns(dimension: DimensionElement) -> list[str]:
+    # Dimension record files name the primary key column after the record
+    # field (e.g. 'id' for visit), not after the dimension.
+    return list(dimension.schema.required.names)
+
+
+def read_distinct_keys(
+    input_file: str | pyarrow.NativeFile, columns: list[str], rename: list[str] | None = None
+) -> pyarrow.Table:
+    """Read the distinct values of the given key columns from a parquet file,
+    dropping rows where any key is null.  Only one batch of rows plus the
+    distinct keys seen so far are held in memory at once.  An open handle is
+    closed when reading finishes.
+    """
+    partials = []
+    reader = ParquetFile(input_file)
+    try:
+        for batch in reader.iter_batches(batch_size=_BATCH_SIZE, columns=columns):
+            table = _decode_dictionaries(pyarrow.Table.from_batches([batch])).drop_null()
+            if rename is not None:
+                table = table.rename_columns(rename)
+            partials.append(table.group_by(table.column_names).aggregate([]))
+    finally:
+        reader.close(force=True)
+
+    if not partials:
+        return pyarrow.table({c: [] for c in (rename or columns)})
+    combined = pyarrow.concat_tables(partials)
+    return combined.group_by(combined.column_names).aggregate([])
+
+
+def _decode_dictionaries(table: pyarrow.Table) -> pyarrow.Table:
+    for i, field in enumerate(table.schema):
+        if pyarrow.types.is_dictionary(field.type):
+            table = table.set_column(i, field.name, table.column(i).dictionary_decode())
+    return table
+
+
+def _read_dataset_ids(paths: ExportPaths, input_file: str, partition: int, partitions: int) -> numpy.ndarray:
+    chunks = [ids for ids in _iter_dataset_ids(paths, input_file, partition, partitions)]
+    if not chunks:
+        return numpy.empty(0, dtype=DATASET_ID_DTYPE)
+    return numpy.concatenate(chunks)
+
+
+def _iter_dataset_ids(
+    paths: ExportPaths, input_file: str, partition: int, partitions: int
+) -> Iterator[numpy.ndarray]:
+    if not paths.exists(input_file):
+        return
+    reader = ParquetFile(paths.open_input(input_file))
+    try:
+        for batch in reader.iter_batches(batch_size=_BATCH_SIZE, columns=["dataset_id"]):
+            ids = dataset_ids_to_numpy(batch.column(0))
+            if partitions > 1:
+                ids = ids[ids.view(numpy.uint8)[::16] % partitions == partition]
+            yield ids
+    finally:
+        reader.close(force=True)
+
+
+class _MissingIds:
+    """Accumulates dataset IDs that were referenced but not found."""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.samples: list[str] = []
+
+    def update(
+        self, paths: ExportPaths, input_file: str, known_ids: numpy.ndarray, partition: int, partitions: int
+    ) -> None:
+        """Look for IDs in ``input_file`` that are not present in the sorted
+        array ``known_ids``.
+        """
+        missing_seen: set[bytes] = set()
+        for ids in _iter_dataset_ids(paths, input_file, partition, partitions):
+            for value in numpy.unique(ids[~contains_dataset_ids(known_ids, ids)]):
+                # The same dataset may appear more than once in the datastore
+                # file (e.g. a disassembled composite), so count distinct IDs.
+                if value not in missing_seen:
+                    missing_seen.add(value)
+                    self.count += 1
+                    if len(self.samples) < _MAX_SAMPLES:
+                        self.samples.append(format_dataset_id(value))
+
+
+def _format_key(row: dict[str, object]) -> str:
+    return ", ".join(f"{k}={v}" for k, v in row.items())
+
+
+@click.command("validate")
+@click.option("--input-dir", default=DEFAULT_EXPORT_DIRECTORY)
+@click.option(
+    "--partitions",
+    default=1,
+    help="Split dataset ID checks into this many passes to reduce peak memory use",
+)
+def main(input_dir: str, partitions: int) -> None:
+    """Check an export for dangling references between files, and that its
+    two collections files match.
+    """
+    validator = DumpValidator(input_dir, partitions=partitions)
+    collection_problems = validator.compare_collections()
+    for collection_problem in collection_problems:
+        print(f"collections: {collection_problem}")
+    problems = validator.validate()
+    for problem in problems:
+        print(
+            f"{problem.source} -> {problem.target} ({', '.join(problem.columns)}):"
+            f" {problem.count} missing keys"
+        )
+        for sample in problem.samples:
+            print(f"    {sample}")
+    if collection_problems:
+        raise click.ClickException(
+            f"Found {len(collection_problems)} collections that differ between the collections files"
+        )
+    if problems:
+        raise click.ClickException(f"Found {len(problems)} sets of dangling references")
+    print("No dangling references found")
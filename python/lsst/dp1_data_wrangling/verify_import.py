@@ -0,0 +1,427 @@
+from __future__ import annotations
+
+from collections.abc import Iterator
+from typing import Any, NamedTuple
+
+import numpy
+import pyarrow
+import pyarrow.compute
+import pyarrow.types
+import sqlalchemy
+from lsst.daf.butler import Butler, CollectionType
+from pyarrow.parquet import ParquetFile
+
+from .archive import open_export
+from .dataset_id_index import DatasetIdIndex
+from .dataset_ids import (
+    DATASET_ID_DTYPE,
+    contains_dataset_ids,
+    dataset_ids_to_numpy,
+    format_dataset_id,
+    get_dataset_id_bytes,
+)
+from .dataset_types import import_dataset_types
+from .datastore_mapping import find_file_datastore
+from .datastore_paths import get_path_read_columns, join_path_columns
+from .dimension_closure import DimensionClosure
+from .index import ExportIndex
+from .path_mapping import CachedDatastoreMapping, DatastoreMappingFunction, DatastoreMappingInput
+from .utils import read_model_from_file
+from .validate_dump import read_distinct_keys
+
+_BATCH_SIZE = 100000
+_KEY_BATCH_SIZE = 1000
+"""Number of dimension records whose keys are looked up with each query."""
+_MAX_SAMPLES = 5
+
+
+class Mismatch(NamedTuple):
+    """A set of rows that differ between the export and the target
+    repository.
+    """
+
+    table: str
+    """Name of the export file the rows belong to, e.g.
+    ``datasets/visit_image``.
+    """
+    category: str
+    """Kind of difference: ``missing`` (in the export but not the target),
+    ``unexpected`` (in the target but not the export), or ``wrong run``.
+    """
+    count: int
+    """Number of distinct rows that differ."""
+    samples: list[str]
+    """A few of the rows that differ, formatted for display."""
+
+
+class ImportVerifier:
+    """Check that a repository contains everything from an export, after an
+    import by `Importer`.
+
+    Rows are pulled from the target registry with a few bulk SQL queries per
+    dataset type, instead of one query per dataset, and compared with the
+    export's parquet columns using Arrow joins.  Only the rows for one
+    dataset type are held at a time.
+
+    Checks performed, for each imported dataset type:
+
+    - The target has exactly the exported dataset IDs for the dataset type,
+      each in the same run.
+    - The target has exactly the exported tagged and calibration collection
+      memberships for the dataset type (validity ranges are not compared).
+    - The target datastore has exactly the exported file records for the
+      datasets, with paths mapped as they were during the import.
+
+    And for each exported dimension element, every exported record exists
+    in the target.  Extra records are not reported, because records can be
+    shared with other imports into the same repository.  When only some
+    dataset types were imported, only the records the importer selected for
+    them (see `DimensionClosure`) are expected.
+
+    Parameters
+    ----------
+    input_path
+        Export directory or archive that was imported.
+    butler
+        Butler for the target repository.  Only SQL registries using
+        integer collection keys (the default) are supported.
+    dataset_types
+        Dataset types that were imported, or `None` if all of them were.
+    datastore_mapping
+        Function that was used to map datastore records during the import.
+    """
+
+    def __init__(
+        self,
+        input_path: str,
+        butler: Butler,
+        dataset_types: list[str] | None,
+        datastore_mapping: DatastoreMappingFunction,
+    ) -> None:
+        self._paths = open_export(input_path)
+        self._index = read_model_from_file(ExportIndex, self._paths.open_input(self._paths.index_path()))
+        self._butler = butler
+        self._dataset_types = dataset_types if dataset_types else self._index.dataset_types
+        self._datastore_mapping = CachedDatastoreMapping(datastore_mapping)
+        self._closure: DimensionClosure | None = None
+        if set(self._dataset_types) != set(self._index.dataset_types):
+            imported_types = [
+                dt
+                for dt in import_dataset_types(
+                    self._paths.open_input(self._paths.dataset_type_path()), butler.dimensions
+                )
+                if dt.name in self._dataset_types
+            ]
+            self._closure = DimensionClosure(
+                self._paths, butler.dimensions, imported_types, self._index.dimensions
+            )
+        db = butler._registry._db
+        self._engine: sqlalchemy.engine.Engine = db._engine
+        self._namespace: str | None = db.namespace
+
+    def verify(self) -> list[Mismatch]:
+        problems: list[Mismatch] = []
+        has_datastore = self._paths.relative_path(self._paths.datastore_parquet_path()) in self._index.files
+        id_index = (
+            DatasetIdIndex(self._paths, self._index)
+            if has_datastore and self._index.dataset_id_index_files
+            else None
+        )
+        try:
+            for dt in self._dataset_types:
+                print(f"Verifying {dt}...")
+                exported = self._read_exported_datasets(dt)
+                target = self._query_datasets(dt)
+                problems.extend(_compare(f"datasets/{dt}", exported, target, ["dataset_id"]))
+                problems.extend(_compare_runs(f"datasets/{dt}", exported, target))
+                problems.extend(self._verify_associations(dt))
+                if has_datastore:
+                    exported_ids = _sorted_ids([exported.column("dataset_id")])
+                    problems.extend(self._verify_datastore(dt, exported_ids, id_index))
+        finally:
+            if id_index is not None:
+                id_index.close()
+
+        print("Verifying dimension records...")
+        elements = self._closure.elements if self._closure is not None else self._index.dimensions
+        for element_name in elements:
+            problems.extend(self._verify_dimension_records(element_name))
+        return problems
+
+    def _read_exported_datasets(self, dataset_type: str) -> pyarrow.Table:
+        path = self._paths.dataset_parquet_path(dataset_type)
+        return _read_columns(self._paths.open_input(path), ["dataset_id", "run"])
+
+    def _query_datasets(self, dataset_type: str) -> pyarrow.Table:
+        query = sqlalchemy.text(
+            f"SELECT d.id, c.name FROM {self._qualify('dataset')} d"
+            f" JOIN {self._qualify('dataset_type')} t ON d.dataset_type_id = t.id"
+            f" JOIN {self._qualify('collection')} c ON d.run_id = c.collection_id"
+            " WHERE t.name = :name"
+        )
+        return self._query_table(query, {"name": dataset_type}, ["dataset_id", "run"])
+
+    def _verify_associations(self, dataset_type: str) -> Iterator[Mismatch]:
+        path = self._paths.dataset_association_parquet_path(dataset_type)
+        columns = ["collection", "dataset_id"]
+        exported = read_distinct_keys(self._paths.open_input(path), columns)
+        queries = []
+        for column, collection_type in [
+            ("tag_association_table", CollectionType.TAGGED),
+            ("calibration_association_table", CollectionType.CALIBRATION),
+        ]:
+            table = self._get_association_table(dataset_type, column)
+            if table is not None:
+                queries.append(
+                    f"SELECT DISTINCT c.name, a.dataset_id FROM {self._qualify(table)} a"
+                    f" JOIN {self._qualify('dataset_type')} t ON a.dataset_type_id = t.id"
+                    f" JOIN {self._qualify('collection')} c ON a.collection_id = c.collection_id"
+                    f" WHERE t.name = :name AND c.type = {collection_type.value}"
+                )
+        if queries:
+            query = sqlalchemy.text(" UNION ".join(queries))
+            target = self._query_table(query, {"name": dataset_type}, columns)
+        else:
+            target = _empty_table(columns)
+        yield from _compare(f"associations/{dataset_type}", exported, target, columns)
+
+    def _get_association_table(self, dataset_type: str, column: str) -> str | None:
+        query = sqlalchemy.text(f"SELECT {column} FROM {self._qualify('dataset_type')} WHERE name = :name")
+        with self._engine.connect() as connection:
+            return connection.execute(query, {"name": dataset_type}).scalar()
+
+    def _verify_datastore(
+        self, dataset_type: str, exported_ids: numpy.ndarray, id_index: DatasetIdIndex | None
+    ) -> Iterator[Mismatch]:
+        """Compare the datastore records for one dataset type, given its
+        sorted exported dataset IDs.
+        """
+        row_groups = None
+        datastore_file = self._paths.relative_path(self._paths.datastore_parquet_path())
+        if id_index is not None and datastore_file in self._index.dataset_id_index_files:
+            dataset_file = self._paths.relative_path(self._paths.dataset_parquet_path(dataset_type))
+            row_groups = id_index.find_row_groups(datastore_file, [dataset_file])
+        exported = self._read_exported_datastore_records(exported_ids, row_groups)
+        columns = ["dataset_id", "path", "component"]
+        datastore_names = pyarrow.compute.unique(exported.column("datastore_name")).to_pylist()
+        target = pyarrow.concat_tables(
+            [self._query_datastore_records(name, dataset_type) for name in datastore_names]
+            or [_empty_table(columns)]
+        )
+        yield from _compare("datastore", exported, target, columns)
+
+    def _read_exported_datastore_records(
+        self, dataset_ids: numpy.ndarray, row_groups: list[int] | None
+    ) -> pyarrow.Table:
+        """Read the exported datastore records for the given datasets, with
+        paths and datastore names mapped to the target.  If ``row_groups`` is
+        given, only those row groups of the datastore file are read.
+        """
+        columns = ["datastore_name", "dataset_id", "path", "component"]
+        chunks = [_empty_table(columns)]
+        if row_groups == []:
+            return chunks[0]
+        reader = ParquetFile(self._paths.open_input(self._paths.datastore_parquet_path()))
+        try:
+            read_columns = get_path_read_columns(reader.schema_arrow, columns)
+            batches = reader.iter_batches(batch_size=_BATCH_SIZE, row_groups=row_groups, columns=read_columns)
+            for batch in batches:
+                mask = contains_dataset_ids(dataset_ids, dataset_ids_to_numpy(batch.column("dataset_id")))
+                batch = join_path_columns(batch.filter(pyarrow.array(mask)))
+                mapped = [
+                    self._datastore_mapping(DatastoreMappingInput(datastore_name=name, path=path))
+                    for name, path in zip(
+                        batch.column("datastore_name").to_pylist(), batch.column("path").to_pylist()
+                    )
+                ]
+                table = {
+                    "datastore_name": pyarrow.array([m.datastore_name for m in mapped], pyarrow.string()),
+                    "dataset_id": batch.column("dataset_id").cast(pyarrow.binary()),
+                    "path": pyarrow.array([m.path for m in mapped], pyarrow.string()),
+                    "component": _fill_component(batch.column("component")),
+                }
+                chunks.append(pyarrow.table(table))
+        finally:
+            reader.close(force=True)
+        return pyarrow.concat_tables(chunks)
+
+    def _query_datastore_records(self, datastore_name: str, dataset_type: str) -> pyarrow.Table:
+        """Return the records in one of the target's datastores for the
+        datasets of one dataset type.
+        """
+        opaque_table = find_file_datastore(self._butler._datastore, datastore_name)._table
+        table = opaque_table._table
+        dataset = sqlalchemy.table(
+            "dataset", sqlalchemy.column("id"), sqlalchemy.column("dataset_type_id"), schema=self._namespace
+        )
+        dataset_type_table = sqlalchemy.table(
+            "dataset_type", sqlalchemy.column("id"), sqlalchemy.column("name"), schema=self._namespace
+        )
+        query = (
+            sqlalchemy.select(table.c.dataset_id, table.c.path, table.c.component)
+            .join(dataset, table.c.dataset_id == dataset.c.id)
+            .join(dataset_type_table, dataset.c.dataset_type_id == dataset_type_table.c.id)
+            .where(dataset_type_table.c.name == dataset_type)
+        )
+        records = self._query_table(query, {}, ["dataset_id", "path", "component"])
+        return records.set_column(2, "component", _fill_component(records.column("component")))
+
+    def _verify_dimension_records(self, element_name: str) -> Iterator[Mismatch]:
+        element = self._butler.dimensions[element_name]
+        if not element.has_own_table:
+            return
+        columns = list(element.schema.required.names)
+        exported = read_distinct_keys(
+            self._paths.open_input(self._paths.dimension_parquet_path(element_name)), columns
+        )
+        record_filter = self._closure.make_filter(element) if self._closure is not None else None
+        table = sqlalchemy.table(
+            element_name, *[sqlalchemy.column(c) for c in columns], schema=self._namespace
+        )
+        if record_filter is None:
+            target = self._query_table(sqlalchemy.select(*table.c), {}, columns)
+            problems = list(_compare(f"dimensions/{element_name}", exported, target, columns))
+        else:
+            # Only the records selected by the closure are looked up, a batch
+            # at a time.  Each key column is matched separately, so the target
+            # rows returned are a superset of the batch's records; that is
+            # enough to find the missing ones.
+            exported = exported.filter(pyarrow.array(record_filter(exported)))
+            problems = []
+            for offset in range(0, exported.num_rows, _KEY_BATCH_SIZE):
+                batch = exported.slice(offset, _KEY_BATCH_SIZE)
+                conditions = [
+                    table.c[c].in_(pyarrow.compute.unique(batch.column(c)).to_pylist()) for c in columns
+                ]
+                target = self._query_table(sqlalchemy.select(*table.c).where(*conditions), {}, columns)
+                problems.extend(_compare(f"dimensions/{element_name}", batch, target, columns))
+        yield from _merge_mismatches([problem for problem in problems if problem.category == "missing"])
+
+    def _query_table(self, query: Any, parameters: dict[str, Any], columns: list[str]) -> pyarrow.Table:
+        """Run a query, streaming its results into an Arrow table with the
+        given column names.  A ``dataset_id`` column is converted to 16-byte
+        binary values.
+        """
+        chunks = []
+        with self._engine.connect() as connection:
+            result = connection.execution_options(stream_results=True).execute(query, parameters)
+            for rows in result.partitions(_BATCH_SIZE):
+                values = list(zip(*rows))
+                data = {}
+                for name, column_values in zip(columns, values):
+                    if name == "dataset_id":
+                        data[name] = pyarrow.array(
+                            [get_dataset_id_bytes(v) for v in column_values], pyarrow.binary()
+                        )
+                    else:
+                        data[name] = pyarrow.array(column_values)
+                chunks.append(pyarrow.table(data))
+        if not chunks:
+            return _empty_table(columns)
+        return pyarrow.concat_tables(chunks, promote_options="permissive")
+
+    def _qualify(self, name: str) -> str:
+        quote = self._engine.dialect.identifier_preparer.quote
+        if self._namespace is None:
+            return quote(name)
+        return f"{quote(self._namespace)}.{quote(name)}"
+
+
+def _read_columns(input_file: pyarrow.NativeFile, columns: list[str]) -> pyarrow.Table:
+    reader = ParquetFile(input_file)
+    try:
+        return _normalize_keys(reader.read(columns=columns))
+    finally:
+        reader.close(force=True)
+
+
+def _empty_table(columns: list[str]) -> pyarrow.Table:
+    return pyarrow.table(
+        {c: pyarrow.array([], pyarrow.binary() if c == "dataset_id" else pyarrow.string()) for c in columns}
+    )
+
+
+def _compare(
+    name: str, expected: pyarrow.Table, actual: pyarrow.Table, keys: list[str]
+) -> Iterator[Mismatch]:
+    """Report rows of ``expected`` missing from ``actual``, and the
+    reverse.
+    """
+    expected = _normalize_keys(expected.select(keys))
+    actual = _normalize_keys(actual.select(keys))
+    # Match column types before the anti-joins.  An empty table read from
+    # the export has no type information.
+    if expected.num_rows == 0:
+        expected = expected.cast(actual.schema)
+    else:
+        actual = actual.cast(expected.schema)
+    for category, left, right in [("missing", expected, actual), ("unexpected", actual, expected)]:
+        rows = left.join(right, keys, join_type="left anti")
+        rows = rows.group_by(keys).aggregate([])
+        if rows.num_rows > 0:
+            yield Mismatch(
+                table=name,
+                category=category,
+                count=rows.num_rows,
+                samples=[_format_row(row) for row in rows.slice(0, _MAX_SAMPLES).to_pylist()],
+            )
+
+
+def _merge_mismatches(problems: list[Mismatch]) -> Iterator[Mismatch]:
+    """Combine mismatches of the same table and category found in separate
+    batches of distinct rows.
+    """
+    merged: dict[tuple[str, str], Mismatch] = {}
+    for problem in problems:
+        key = (problem.table, problem.category)
+        previous = merged.get(key)
+        if previous is not None:
+            problem = Mismatch(
+                table=problem.table,
+                category=problem.category,
+                count=previous.count + problem.count,
+                samples=(previous.samples + problem.samples)[:_MAX_SAMPLES],
+            )
+        merged[key] = problem
+    yield from merged.values()
+
+
+def _compare_runs(name: str, expected: pyarrow.Table, actual: pyarrow.Table) -> Iterator[Mismatch]:
+    """Report datasets present in both tables, but in different runs."""
+    target = actual.rename_columns(["dataset_id", "target_run"])
+    joined = expected.join(target, "dataset_id", join_type="inner")
+    rows = joined.filter(pyarrow.compute.not_equal(joined.column("run"), joined.column("target_run")))
+    if rows.num_rows > 0:
+        yield Mismatch(
+            table=name,
+            category="wrong run",
+            count=rows.num_rows,
+            samples=[_format_row(row) for row in rows.slice(0, _MAX_SAMPLES).to_pylist()],
+        )
+
+
+def _normalize_keys(table: pyarrow.Table) -> pyarrow.Table:
+    """Decode dictionary columns, and convert fixed-width binary columns to
+    variable-width, which Arrow joins support.
+    """
+    for i, field in enumerate(table.schema):
+        if pyarrow.types.is_dictionary(field.type):
+            table = table.set_column(i, field.name, table.column(i).dictionary_decode())
+        elif pyarrow.types.is_fixed_size_binary(field.type):
+            table = table.set_column(i, field.name, table.column(i).cast(pyarrow.binary()))
+    return table
+
+
+def _fill_component(column: pyarrow.ChunkedArray | pyarrow.Array) -> pyarrow.ChunkedArray | pyarrow.Array:
+    # Nulls never match in a join, so use an empty string for records that
+    # aren't components.
+    return pyarrow.compute.fill_null(column.cast(pyarrow.string()), "")
+
+
+def _sorted_ids(columns: list[pyarrow.ChunkedArray]) -> numpy.ndarray:
+    ids = [dataset_ids_to_numpy(chunk) for column in columns for chunk in column.chunks]
+    return numpy.sort(numpy.concatenate(ids)) if ids else numpy.empty(0, DATASET_ID_DTYPE)
+
+
+def _format_row(row: dict[str, object]) -> str:
+    return ", ".join(f"{k}={format_dataset_id(v) if isinstance(v, bytes) else v}" for k, v in row.items())
@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+
+from lsst.daf.butler import Butler
+from lsst.dp1_data_wrangling.archive import ArchiveExportPaths, DumpArchive, open_export, write_archive
+from lsst.dp1_data_wrangling.benchmark import BenchmarkScale, create_synthetic_repo
+from lsst.dp1_data_wrangling.export_dp1 import export
+from lsst.dp1_data_wrangling.importer import Importer
+from lsst.dp1_data_wrangling.path_mapping import get_datastore_mapping
+
+_SCALE = BenchmarkScale(
+    visits=2, detectors=2, dataset_types=1, runs=1, calibration_collections=1, log_zip_files=0
+)
+
+
+class DumpArchiveTestCase(unittest.TestCase):
+    """Pack directories into archives and read them back in place."""
+
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+
+    def test_members(self) -> None:
+        input_dir = os.path.join(self.root, "input")
+        os.makedirs(os.path.join(input_dir, "datasets"))
+        contents = {"index.json": b"{}", "datasets/a": b"x" * 5000, "datasets/b": b""}
+        for name, data in contents.items():
+            with open(os.path.join(input_dir, name), "wb") as f:
+                f.write(data)
+        archive_path = os.path.join(self.root, "input.dp1a")
+        write_archive(input_dir, archive_path, alignment=512)
+
+        archive = DumpArchive(archive_path, memory_map=False)
+        try:
+            self.assertEqual(set(archive.index.members), set(contents))
+            for name, data in contents.items():
+                self.assertEqual(archive.member_size(name), len(data))
+                self.assertEqual(archive.open_member(name).read(), data)
+                self.assertEqual(archive.index.members[name].offset % 512, 0)
+            self.assertNotIn("datasets/c", archive)
+            with self.assertRaises(FileNotFoundError):
+                archive.open_member("datasets/c")
+        finally:
+            archive.close()
+
+        paths = open_export(archive_path)
+        self.assertIsInstance(paths, ArchiveExportPaths)
+        self.assertTrue(paths.exists(paths.index_path()))
+        self.assertEqual(paths.read_text(paths.index_path()), "{}")
+
+    def test_not_an_archive(self) -> None:
+        path = os.path.join(self.root, "not-an-archive")
+        with open(path, "wb") as f:
+            f.write(b"\0" * 100)
+        with self.assertRaises(ValueError):
+            DumpArchive(path)
+
+    def test_import_from_archive(self) -> None:
+        source_repo = os.path.join(self.root, "source-repo")
+        dataset_types = create_synthetic_repo(source_repo, _SCALE)
+        dump_dir = os.path.join(self.root, "dump")
+        export(Butler(source_repo), "benchmark/all", dataset_types, dump_dir)
+        archive_path = os.path.join(self.root, "dump.dp1a")
+        write_archive(dump_dir, archive_path)
+
+        target_repo = os.path.join(self.root, "target-repo")
+        Butler.makeRepo(target_repo)
+        importer = Importer(archive_path, Butler(target_repo, writeable=True), None)
+        importer.import_all(get_datastore_mapping(no_datastore_remap=True, file_paths="rsp"))
+        source = Butler(source_repo)
+        target = Butler(target_repo)
+        for dataset_type in dataset_types:
+            expected = source.query_datasets(dataset_type, "benchmark/all", find_first=False)
+            actual = target.query_datasets(dataset_type, "benchmark/all", find_first=False)
+            self.assertEqual({ref.id for ref in actual}, {ref.id for ref in expected})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+import os
+import tempfile
+import unittest
+
+from lsst.daf.butler import Butler, CollectionType
+from lsst.dp1_data_wrangling.benchmark import BenchmarkScale, run_benchmark
+
+_SCALE = BenchmarkScale(
+    visits=2, detectors=2, dataset_types=1, runs=2, calibration_collections=1, log_zip_files=1
+)
+
+
+class BenchmarkTestCase(unittest.TestCase):
+    """Run the synthetic benchmark at a tiny scale, and check that the
+    import reproduces the source repository.
+    """
+
+    def test_round_trip(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            result = run_benchmark(_SCALE, directory)
+            self.assertEqual(set(result.stages), {"export", "symlinks", "import"})
+            for stage in result.stages.values():
+                self.assertGreater(stage.rows, 0)
+
+            source = Butler(os.path.join(directory, "source-repo"))
+            target = Butler(os.path.join(directory, "target-repo"))
+            for dataset_type in ["benchmark_0", "benchmark_log"]:
+                expected = {ref.id for ref in source.query_datasets(dataset_type, "benchmark/all")}
+                actual = {ref.id for ref in target.query_datasets(dataset_type, "benchmark/all")}
+                self.assertEqual(actual, expected)
+            self.assertEqual(
+                target.collections.get_info("benchmark/calib0").type, CollectionType.CALIBRATION
+            )
+            biases = target.query_datasets("benchmark_bias", "benchmark/calib0", find_first=False)
+            self.assertEqual(len(biases), _SCALE.detectors)
+
+
+if __name__ == "__main__":
+    unittest.main()
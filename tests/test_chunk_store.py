@@ -0,0 +1,48 @@
+import os
+import tempfile
+import unittest
+
+import pyarrow
+from lsst.dp1_data_wrangling.chunk_store import ChunkStoreExportPaths, write_chunk_store
+from pyarrow.parquet import ParquetFile, write_table
+
+
+class ChunkStoreTestCase(unittest.TestCase):
+    """Read files split across several chunks of a chunk store."""
+
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        export_dir = os.path.join(directory.name, "export")
+        os.makedirs(os.path.join(export_dir, "datasets"))
+        self.data = bytes(range(256)) * 40
+        with open(os.path.join(export_dir, "data.bin"), "wb") as f:
+            f.write(self.data)
+        self.table = pyarrow.table({"id": list(range(1000)), "name": [f"row{i}" for i in range(1000)]})
+        write_table(self.table, os.path.join(export_dir, "datasets", "table.parquet"), row_group_size=100)
+        store_dir = os.path.join(directory.name, "store")
+        write_chunk_store(export_dir, store_dir, chunk_size=1000)
+        self.paths = ChunkStoreExportPaths(store_dir)
+
+    def test_seek_and_read(self) -> None:
+        self.assertEqual(self.paths.file_size("data.bin"), len(self.data))
+        with self.paths.open_input("data.bin") as f:
+            self.assertEqual(f.size(), len(self.data))
+            # Reads that start in one chunk and end in another.
+            for offset, length in [(0, 10), (995, 10), (1999, 2003), (len(self.data) - 5, 100)]:
+                f.seek(offset)
+                self.assertEqual(f.read(length), self.data[offset : offset + length])
+            f.seek(0)
+            self.assertEqual(f.read(), self.data)
+
+    def test_read_parquet(self) -> None:
+        reader = ParquetFile(self.paths.open_input("datasets/table.parquet"))
+        try:
+            self.assertEqual(reader.read_row_group(7), self.table.slice(700, 100))
+            self.assertEqual(reader.read(), self.table)
+        finally:
+            reader.close(force=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import graphlib
+import os
+import tempfile
+import unittest
+
+from lsst.daf.butler import Butler, CollectionType
+from lsst.dp1_data_wrangling.collections_parquet import (
+    ExportedCollection,
+    read_collections_file,
+    register_collections,
+    sort_collections,
+    write_collections_file,
+)
+
+# Listed with every chain before its children.
+_COLLECTIONS = [
+    ExportedCollection("all", CollectionType.CHAINED, "Everything.", ["chain/a", "run/3"]),
+    ExportedCollection("chain/a", CollectionType.CHAINED, None, ["run/1", "tagged", "chain/b"]),
+    ExportedCollection("chain/b", CollectionType.CHAINED, None, ["calib", "run/2"]),
+    ExportedCollection("calib", CollectionType.CALIBRATION, "Calibrations.", []),
+    ExportedCollection("tagged", CollectionType.TAGGED, None, []),
+    ExportedCollection("run/1", CollectionType.RUN, None, []),
+    ExportedCollection("run/2", CollectionType.RUN, None, []),
+    ExportedCollection("run/3", CollectionType.RUN, None, []),
+]
+
+
+class CollectionsTestCase(unittest.TestCase):
+    """Check the order collections are registered in, and that chains are
+    defined with their children in order.
+    """
+
+    def assert_children_first(self, collections: list[ExportedCollection]) -> None:
+        positions = {c.name: i for i, c in enumerate(collections)}
+        for collection in collections:
+            for child in collection.children:
+                if child in positions:
+                    self.assertLess(positions[child], positions[collection.name], collection.name)
+
+    def test_sort(self) -> None:
+        for collections in [_COLLECTIONS, _COLLECTIONS[::-1], sorted(_COLLECTIONS, key=lambda c: c.name)]:
+            result = sort_collections(collections)
+            self.assertCountEqual(result, _COLLECTIONS)
+            self.assert_children_first(result)
+
+        # Children that aren't in the export (e.g. already in the target
+        # repository) are ignored.
+        partial = [c for c in _COLLECTIONS if c.name not in ("chain/b", "run/3")]
+        result = sort_collections(partial)
+        self.assertCountEqual(result, partial)
+        self.assert_children_first(result)
+
+        cycle = [
+            ExportedCollection("a", CollectionType.CHAINED, None, ["b"]),
+            ExportedCollection("b", CollectionType.CHAINED, None, ["a"]),
+        ]
+        with self.assertRaises(graphlib.CycleError):
+            sort_collections(cycle)
+
+    def test_file_round_trip(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "collections")
+            write_collections_file(path, _COLLECTIONS)
+            self.assertEqual(read_collections_file(path), sorted(_COLLECTIONS, key=lambda c: c.name))
+
+    def test_register(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            repo = os.path.join(directory, "repo")
+            Butler.makeRepo(repo)
+            butler = Butler(repo, writeable=True)
+            # Every chain is listed before its children.
+            register_collections(butler, _COLLECTIONS)
+            for expected in _COLLECTIONS:
+                info = butler.collections.get_info(expected.name)
+                self.assertEqual(info.type, expected.type, expected.name)
+                self.assertEqual(list(info.children), expected.children, expected.name)
+                self.assertEqual(info.doc or None, expected.doc, expected.name)
+            self.assertEqual(
+                list(butler.collections.query("all", flatten_chains=True)),
+                ["run/1", "tagged", "calib", "run/2", "run/3"],
+            )
+
+            # Registering again redefines the chains and keeps the other
+            # collections.
+            changed = [
+                c._replace(children=["run/3", "chain/a"]) if c.name == "all" else c for c in _COLLECTIONS
+            ]
+            register_collections(butler, changed)
+            self.assertEqual(list(butler.collections.get_info("all").children), ["run/3", "chain/a"])
+            self.assertEqual(butler.collections.get_info("calib").type, CollectionType.CALIBRATION)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import hashlib
+import os
+import tempfile
+import unittest
+import uuid
+
+import pyarrow
+from lsst.dp1_data_wrangling.dataset_id_index import (
+    DatasetIdIndex,
+    DatasetLocation,
+    build_dataset_id_index,
+    check_dataset_id_index,
+)
+from lsst.dp1_data_wrangling.dataset_ids import dataset_ids_to_numpy
+from lsst.dp1_data_wrangling.index import ExportIndex
+from lsst.dp1_data_wrangling.paths import ExportPaths
+from pyarrow.parquet import write_table
+
+_FILES = ["datasets/a", "datasets/b", "datastore"]
+
+
+def _make_id(i: int) -> bytes:
+    # The last byte is never zero, because numpy strips trailing zeros from
+    # fixed-width byte strings.
+    return hashlib.sha256(str(i).encode()).digest()[:15] + b"\x01"
+
+
+class DatasetIdIndexTestCase(unittest.TestCase):
+    """Look up dataset IDs in an index over two datasets files and a
+    datastore file with several row groups.
+    """
+
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.paths = ExportPaths(directory.name)
+        self.paths.create_directories()
+        id_type = pyarrow.binary(16)
+        write_table(
+            pyarrow.table({"dataset_id": pyarrow.array([_make_id(i) for i in range(10)], id_type)}),
+            self.paths.dataset_parquet_path("a"),
+        )
+        write_table(
+            pyarrow.table({"dataset_id": pyarrow.array([_make_id(i) for i in range(10, 20)], id_type)}),
+            self.paths.dataset_parquet_path("b"),
+        )
+        # Datasets 3 and 12 have two records each (e.g. disassembled
+        # composites), and dataset 15 has none.
+        self.datastore_ids = [9, 12, 0, 3, 19, 12, 1, 2, 4, 5, 3, 6, 7, 8, 10, 11, 13, 14, 16, 17, 18]
+        write_table(
+            pyarrow.table(
+                {"dataset_id": pyarrow.array([_make_id(i) for i in self.datastore_ids], pyarrow.binary())}
+            ),
+            self.paths.datastore_parquet_path(),
+            row_group_size=4,
+        )
+        self.info = build_dataset_id_index(
+            self.paths, [self.paths.path_from_relative(f) for f in _FILES], self.paths.dataset_id_index_path()
+        )
+        index = ExportIndex(
+            dimensions=[], dataset_types=["a", "b"], root_collection="test", dataset_id_index_files=_FILES
+        )
+        self.index = DatasetIdIndex(self.paths, index)
+        self.addCleanup(self.index.close)
+
+    def test_find(self) -> None:
+        self.assertEqual(len(self.index), 20 + len(self.datastore_ids))
+        self.assertEqual(
+            self.index.find(uuid.UUID(bytes=_make_id(3))),
+            [
+                DatasetLocation("datasets/a", 3),
+                DatasetLocation("datastore", 3),
+                DatasetLocation("datastore", 10),
+            ],
+        )
+        self.assertEqual(self.index.find(uuid.UUID(bytes=_make_id(15))), [DatasetLocation("datasets/b", 5)])
+        self.assertEqual(self.index.find(uuid.UUID(bytes=_make_id(100))), [])
+
+    def test_contains(self) -> None:
+        ids = dataset_ids_to_numpy(
+            pyarrow.array([_make_id(i) for i in [0, 12, 100, 15, 9]], pyarrow.binary())
+        )
+        self.assertEqual(self.index.contains(ids, ["datasets/b"]).tolist(), [False, True, False, True, False])
+        self.assertEqual(
+            self.index.contains(ids, ["datasets/a", "datasets/b"]).tolist(), [True, True, False, True, True]
+        )
+        self.assertEqual(self.index.contains(ids, []).tolist(), [False] * 5)
+
+    def test_find_row_groups(self) -> None:
+        def expected(dataset_ids: range) -> list[int]:
+            return sorted({row // 4 for row, i in enumerate(self.datastore_ids) if i in dataset_ids})
+
+        self.assertEqual(self.index.find_row_groups("datastore", ["datasets/a"]), expected(range(10)))
+        self.assertEqual(self.index.find_row_groups("datastore", ["datasets/b"]), expected(range(10, 20)))
+        self.assertEqual(self.index.find_row_groups("datastore", []), [])
+
+    def test_check(self) -> None:
+        self.assertEqual(check_dataset_id_index(self.paths, self.info), [])
+        self.index.close()
+        with open(self.paths.dataset_id_index_path(), "r+b") as f:
+            f.write(b"\xff")
+        problems = check_dataset_id_index(self.paths, self.info)
+        self.assertEqual(len(problems), 1)
+        self.assertIn("hash", problems[0])
+        self.assertEqual(self.info.num_bytes, os.path.getsize(self.paths.dataset_id_index_path()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import os
+import tempfile
+import unittest
+
+from lsst.daf.butler import Butler
+from lsst.dp1_data_wrangling.benchmark import BenchmarkScale, create_synthetic_repo
+from lsst.dp1_data_wrangling.export_dp1 import export
+from lsst.dp1_data_wrangling.paths import ExportPaths
+from pyarrow.parquet import read_table
+
+_SCALE = BenchmarkScale(
+    visits=5, detectors=3, dataset_types=2, runs=2, calibration_collections=1, log_zip_files=0
+)
+
+
+class BulkDatastoreExportTestCase(unittest.TestCase):
+    """Check that scanning the datastore records tables writes the same
+    records as `Datastore.export_records`.
+    """
+
+    def test_matches_export_records(self) -> None:
+        with tempfile.TemporaryDirectory() as root:
+            source_repo = os.path.join(root, "source-repo")
+            dataset_types = create_synthetic_repo(source_repo, _SCALE)
+            butler = Butler(source_repo)
+            tables = {}
+            for bulk in [False, True]:
+                dump_dir = os.path.join(root, f"dump-{bulk}")
+                # Deterministic mode sorts the datastore records, so the two
+                # exports can be compared row by row.
+                export(
+                    butler,
+                    "benchmark/all",
+                    dataset_types,
+                    dump_dir,
+                    deterministic=True,
+                    bulk_datastore_export=bulk,
+                )
+                tables[bulk] = read_table(ExportPaths(dump_dir).datastore_parquet_path())
+
+            expected = tables[False]
+            self.assertGreater(expected.num_rows, 0)
+            # The columns are in the records table's order rather than
+            # StoredFileInfo.to_record's, which readers don't depend on.
+            self.assertEqual(sorted(tables[True].column_names), sorted(expected.column_names))
+            self.assertTrue(tables[True].select(expected.column_names).equals(expected))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+import os
+import tempfile
+import unittest
+
+import pyarrow
+from lsst.dp1_data_wrangling.datastore_paths import (
+    PATH_COLUMNS,
+    factorize_path_column,
+    get_path_read_columns,
+    join_path_columns,
+    read_datastore_path_parts_from_file,
+)
+from lsst.dp1_data_wrangling.path_mapping import (
+    CachedDatastoreMapping,
+    DatastoreMappingInput,
+    get_datastore_mapping,
+)
+from pyarrow.parquet import write_table
+
+_PATHS = [
+    "run/a/file1.fits",
+    "run/a/file2.fits",
+    "run/b/archive.zip#member1.fits",
+    "run/b/archive.zip#member2.fits",
+    "top-level.fits",
+    "file:///sdf/data/rubin/shared/refcat/file.fits",
+]
+
+
+class DatastorePathsTestCase(unittest.TestCase):
+    """Split datastore paths into directory, file name and fragment
+    columns, and join them back together.
+    """
+
+    def test_round_trip(self) -> None:
+        table = pyarrow.table({"dataset_id": pyarrow.array(range(len(_PATHS))), "path": _PATHS})
+        factorized = factorize_path_column(table)
+        self.assertEqual(factorized.column_names, ["dataset_id", *PATH_COLUMNS])
+        self.assertEqual(
+            factorized.column("path_directory").to_pylist(),
+            ["run/a/", "run/a/", "run/b/", "run/b/", "", "file:///sdf/data/rubin/shared/refcat/"],
+        )
+        self.assertEqual(
+            factorized.column("path_fragment").to_pylist(),
+            [None, None, "member1.fits", "member2.fits", None, None],
+        )
+        # Directories are stored once per distinct value.
+        self.assertEqual(len(factorized.column("path_directory").combine_chunks().dictionary), 4)
+        self.assertEqual(join_path_columns(factorized).column("path").to_pylist(), _PATHS)
+        self.assertIs(join_path_columns(table), table)
+
+    def test_read_columns(self) -> None:
+        factorized = factorize_path_column(pyarrow.table({"path": _PATHS, "component": [None] * len(_PATHS)}))
+        self.assertEqual(
+            get_path_read_columns(factorized.schema, ["path", "component"]), [*PATH_COLUMNS, "component"]
+        )
+        old_schema = pyarrow.schema([("path", pyarrow.string()), ("component", pyarrow.string())])
+        self.assertEqual(get_path_read_columns(old_schema, ["path", "component"]), ["path", "component"])
+
+    def test_read_path_parts(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            for name, table in [
+                ("old", pyarrow.table({"path": _PATHS})),
+                ("new", factorize_path_column(pyarrow.table({"path": _PATHS}))),
+            ]:
+                with self.subTest(name=name):
+                    path = os.path.join(directory, name)
+                    write_table(table, path)
+                    paths = []
+                    for parts in read_datastore_path_parts_from_file(path, batch_size=4):
+                        for i, basename, fragment in zip(
+                            parts.directory_indices, parts.basenames, parts.fragments
+                        ):
+                            full = parts.directories[i] + basename
+                            paths.append(full + "#" + fragment if fragment is not None else full)
+                    self.assertEqual(paths, _PATHS)
+
+
+class CachedDatastoreMappingTestCase(unittest.TestCase):
+    """Map paths once per distinct datastore name and directory."""
+
+    def test_cache(self) -> None:
+        calls = []
+
+        def mapping(input: DatastoreMappingInput) -> DatastoreMappingInput:
+            calls.append(input)
+            return input._replace(datastore_name=input.datastore_name.upper(), path="mapped/" + input.path)
+
+        cached = CachedDatastoreMapping(mapping)
+        results = [cached(DatastoreMappingInput("store", path)) for path in _PATHS * 2]
+        results.append(cached(DatastoreMappingInput("other", _PATHS[0])))
+        self.assertEqual(
+            calls,
+            [
+                DatastoreMappingInput("store", "run/a/"),
+                DatastoreMappingInput("store", "run/b/"),
+                DatastoreMappingInput("store", ""),
+                DatastoreMappingInput("store", "file:///sdf/data/rubin/shared/refcat/"),
+                DatastoreMappingInput("other", "run/a/"),
+            ],
+        )
+        self.assertEqual([r.path for r in results[: len(_PATHS)]], ["mapped/" + p for p in _PATHS])
+        self.assertEqual(results[: len(_PATHS)], results[len(_PATHS) : 2 * len(_PATHS)])
+        self.assertEqual(results[-1], DatastoreMappingInput("OTHER", "mapped/run/a/file1.fits"))
+
+    def test_matches_uncached(self) -> None:
+        for file_paths in ["rsp", "rucio"]:
+            with self.subTest(file_paths=file_paths):
+                mapping = get_datastore_mapping(no_datastore_remap=False, file_paths=file_paths)
+                cached = CachedDatastoreMapping(mapping)
+                for path in _PATHS:
+                    input = DatastoreMappingInput("FileDatastore@<butlerRoot>", path)
+                    self.assertEqual(cached(input), mapping(input))
+
+
+if __name__ == "__main__":
+    unittest.main()
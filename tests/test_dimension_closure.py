@@ -0,0 +1,115 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import pyarrow.compute
+from lsst.daf.butler import Butler
+from lsst.dp1_data_wrangling.benchmark import BenchmarkScale, create_synthetic_repo
+from lsst.dp1_data_wrangling.dataset_types import import_dataset_types, load_export_universe
+from lsst.dp1_data_wrangling.dimension_closure import DimensionClosure
+from lsst.dp1_data_wrangling.export_dp1 import export
+from lsst.dp1_data_wrangling.importer import Importer
+from lsst.dp1_data_wrangling.index import ExportIndex
+from lsst.dp1_data_wrangling.path_mapping import get_datastore_mapping
+from lsst.dp1_data_wrangling.paths import ExportPaths
+from lsst.dp1_data_wrangling.utils import read_model_from_file
+from pyarrow.parquet import read_table, write_table
+
+_SCALE = BenchmarkScale(
+    visits=3, detectors=2, dataset_types=1, runs=1, calibration_collections=1, log_zip_files=0
+)
+
+
+class DimensionClosureTestCase(unittest.TestCase):
+    """Select the dimension records needed to import some of the dataset
+    types in an export.
+    """
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.directory = tempfile.TemporaryDirectory()
+        source_repo = os.path.join(cls.directory.name, "source-repo")
+        dataset_types = create_synthetic_repo(source_repo, _SCALE)
+        cls.dump_dir = os.path.join(cls.directory.name, "dump")
+        export(Butler(source_repo), "benchmark/all", dataset_types, cls.dump_dir)
+        # Leave visit 0 without any benchmark_0 datasets, so its records are
+        # in the export but not needed to import benchmark_0.
+        path = os.path.join(cls.dump_dir, "datasets", "benchmark_0")
+        table = read_table(path)
+        write_table(table.filter(pyarrow.compute.not_equal(table.column("visit"), 0)), path)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.directory.cleanup()
+
+    def make_closure(self, dataset_type_names: list[str]) -> DimensionClosure:
+        paths = ExportPaths(self.dump_dir)
+        index = read_model_from_file(ExportIndex, paths.index_path())
+        universe = load_export_universe(paths, index)
+        dataset_types = [
+            dt
+            for dt in import_dataset_types(paths.open_input(paths.dataset_type_path()), universe)
+            if dt.name in dataset_type_names
+        ]
+        self.universe = universe
+        self.paths = paths
+        return DimensionClosure(paths, universe, dataset_types, index.dimensions)
+
+    def test_calibration_closure(self) -> None:
+        closure = self.make_closure(["benchmark_bias"])
+        self.assertIn("instrument", closure.elements)
+        self.assertIn("detector", closure.elements)
+        self.assertNotIn("visit", closure.elements)
+        self.assertNotIn("visit_detector_region", closure.elements)
+
+    def test_visit_filter(self) -> None:
+        closure = self.make_closure(["benchmark_0"])
+        self.assertIn("visit", closure.elements)
+        # Elements visit records refer to are needed too.
+        self.assertIn("physical_filter", closure.elements)
+        self.assertIn("day_obs", closure.elements)
+
+        visits = read_table(self.paths.dimension_parquet_path("visit"))
+        record_filter = closure.make_filter(self.universe["visit"])
+        assert record_filter is not None
+        selected = visits.filter(pyarrow.array(record_filter(visits)))
+        self.assertEqual(sorted(selected.column("id").to_pylist()), list(range(1, _SCALE.visits)))
+        # Record batches are accepted too.
+        for batch in visits.to_batches(max_chunksize=1):
+            self.assertEqual(record_filter(batch).tolist(), [batch.column("id")[0].as_py() != 0])
+
+        # Instruments are only selected by value, and every exported
+        # instrument is used.
+        instruments = read_table(self.paths.dimension_parquet_path("instrument"))
+        instrument_filter = closure.make_filter(self.universe["instrument"])
+        assert instrument_filter is not None
+        self.assertTrue(all(instrument_filter(instruments)))
+
+    def test_partial_import(self) -> None:
+        with tempfile.TemporaryDirectory() as root:
+            dump_dir = os.path.join(root, "dump")
+            shutil.copytree(self.dump_dir, dump_dir)
+            # The rewritten datasets file no longer matches the export index.
+            paths = ExportPaths(dump_dir)
+            index = read_model_from_file(ExportIndex, paths.index_path())
+            index.files.pop("datasets/benchmark_0")
+            with open(paths.index_path(), "w") as f:
+                f.write(index.model_dump_json())
+
+            target_repo = os.path.join(root, "target-repo")
+            Butler.makeRepo(target_repo)
+            butler = Butler(target_repo, writeable=True)
+            Importer(dump_dir, butler, ["benchmark_0"]).import_all(
+                get_datastore_mapping(no_datastore_remap=True, file_paths="rsp")
+            )
+            visits = {record.id for record in butler.query_dimension_records("visit")}
+            self.assertEqual(visits, set(range(1, _SCALE.visits)))
+            self.assertEqual(
+                len(butler.query_datasets("benchmark_0", "benchmark/all", find_first=False)),
+                (_SCALE.visits - 1) * _SCALE.detectors,
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
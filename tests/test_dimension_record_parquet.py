@@ -0,0 +1,70 @@
+import os
+import tempfile
+import unittest
+
+from lsst.daf.butler import DimensionUniverse
+from lsst.dp1_data_wrangling.dimension_record_parquet import (
+    DimensionRecordParquetWriter,
+    read_dimension_records_from_file,
+)
+from lsst.dp1_data_wrangling.memory_budget import MemoryBudget
+from lsst.sphgeom import Angle, Circle, LonLat, UnitVector3d
+from pyarrow.parquet import read_table
+
+
+class DimensionRecordParquetWriterTestCase(unittest.TestCase):
+    """Check that records written in many small batches come out sorted and
+    de-duplicated.
+    """
+
+    def test_merge_runs(self) -> None:
+        element = DimensionUniverse()["instrument"]
+        names = [f"Cam{i:02d}" for i in [7, 3, 9, 3, 1, 7, 0, 5, 9, 2, 8, 4, 6, 1]]
+        with tempfile.TemporaryDirectory() as directory:
+            output_file = os.path.join(directory, "instrument.parquet")
+            # Batches of 3 rows, so the records are split across 5 runs.
+            writer = DimensionRecordParquetWriter(
+                element, output_file, sizer=MemoryBudget().open("instrument", max_rows=3)
+            )
+            for name in names:
+                writer.add_record(element.RecordClass(name=name))
+            writer.finish()
+
+            self.assertEqual(os.listdir(directory), ["instrument.parquet"])
+            records = [
+                record
+                for table in read_dimension_records_from_file(element, output_file)
+                for record in table
+            ]
+            self.assertEqual([r.name for r in records], sorted(set(names)))
+
+    def test_spatial_sort(self) -> None:
+        element = DimensionUniverse()["tract"]
+        # Tract IDs run in the opposite direction to their declinations.
+        centers = {tract: (45.0, 60.0 - 10.0 * tract) for tract in range(8)}
+        with tempfile.TemporaryDirectory() as directory:
+            output_file = os.path.join(directory, "tract.parquet")
+            writer = DimensionRecordParquetWriter(
+                element,
+                output_file,
+                sizer=MemoryBudget().open("tract", max_rows=3),
+                spatial_index_order=7,
+            )
+            for tract, (ra, dec) in centers.items():
+                center = UnitVector3d(LonLat.fromDegrees(ra, dec))
+                region = Circle(center, Angle.fromDegrees(0.1))
+                writer.add_record(element.RecordClass(skymap="sky", id=tract, region=region))
+            writer.add_record(element.RecordClass(skymap="sky", id=8, region=None))
+            writer.finish()
+
+            self.assertEqual(writer.sort_columns, ["healpix_pixels", "dec_min", "skymap", "id"])
+            table = read_table(output_file)
+            first_pixels = [p[0] if p else None for p in table.column("healpix_pixels").to_pylist()]
+            self.assertEqual(first_pixels[:-1], sorted(first_pixels[:-1]))
+            # Records without regions sort last.
+            self.assertEqual(table.column("id").to_pylist()[-1], 8)
+            self.assertEqual(table.num_rows, 9)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+import os
+import tempfile
+import unittest
+
+from click.testing import CliRunner
+from lsst.daf.butler import Butler, Config
+from lsst.dp1_data_wrangling.benchmark import BenchmarkScale, create_synthetic_repo
+from lsst.dp1_data_wrangling.export_dp1 import export
+from lsst.dp1_data_wrangling.fresh_load import (
+    FreshLoad,
+    compare_schemas,
+    describe_repo_schema,
+    get_registry_dialect,
+    make_reference_repo,
+)
+from lsst.dp1_data_wrangling.import_dp1 import main
+from lsst.dp1_data_wrangling.import_targets import ImportTarget
+from lsst.dp1_data_wrangling.importer import Importer
+from lsst.dp1_data_wrangling.path_mapping import get_datastore_mapping
+
+try:
+    import testing.postgresql
+except ImportError:
+    testing = None
+
+_SCALE = BenchmarkScale(
+    visits=2, detectors=2, dataset_types=1, runs=1, calibration_collections=1, log_zip_files=0
+)
+
+
+class FreshLoadTestCase(unittest.TestCase):
+    """Check that an import with ``fresh_load`` leaves the registry schema
+    the same as a newly created repository and a normal import, and that
+    indexes dropped by an interrupted load can be rebuilt.
+    """
+
+    dialect = "sqlite"
+
+    def setUp(self) -> None:
+        self._directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self._directory.cleanup)
+        self.root = self._directory.name
+        self.dump_dir = os.path.join(self.root, "dump")
+        source_repo = os.path.join(self.root, "source-repo")
+        dataset_types = create_synthetic_repo(source_repo, _SCALE)
+        export(Butler(source_repo), "benchmark/all", dataset_types, self.dump_dir)
+
+    def make_config(self, name: str) -> Config:
+        """Return the configuration for a new repository."""
+        return Config()
+
+    def make_repo(self, name: str) -> Butler:
+        root = os.path.join(self.root, name)
+        Butler.makeRepo(root, config=self.make_config(name))
+        return Butler(root, writeable=True)
+
+    def import_dump(self, target: Butler | ImportTarget, fresh_load: bool) -> None:
+        targets = [target] if isinstance(target, ImportTarget) else target
+        importer = Importer(self.dump_dir, targets, None, fresh_load=fresh_load)
+        importer.import_all(get_datastore_mapping(no_datastore_remap=True, file_paths="rsp"))
+
+    def test_schema_matches_normal_import(self) -> None:
+        normal = self.make_repo("normal-repo")
+        self.import_dump(normal, fresh_load=False)
+        loaded = self.make_repo("fresh-load-repo")
+        with make_reference_repo(self.make_config("fresh-load-repo")) as reference:
+            # The import itself checks the schema against the reference.
+            self.import_dump(ImportTarget("fresh-load-repo", loaded, reference), fresh_load=True)
+
+        self.assertEqual(compare_schemas(describe_repo_schema(normal), describe_repo_schema(loaded)), [])
+        self.assertEqual(FreshLoad.from_butler(loaded).get_pending_indexes(), [])
+
+    def test_restore_after_interrupted_load(self) -> None:
+        butler = self.make_repo("repo")
+        engine = butler._registry._db._engine
+        namespace = butler._registry._db.namespace
+
+        FreshLoad(engine, namespace).drop_indexes()
+        self.assertGreater(len(FreshLoad(engine, namespace).get_pending_indexes()), 0)
+        with self.assertRaises(RuntimeError):
+            FreshLoad(engine, namespace).drop_indexes()
+
+        # A new instance stands in for the recovery command, which does not
+        # have the schema recorded by the interrupted load.
+        with make_reference_repo(self.make_config("repo")) as reference:
+            expected = describe_repo_schema(reference)
+        FreshLoad(engine, namespace).restore(expected)
+        self.assertEqual(FreshLoad(engine, namespace).get_pending_indexes(), [])
+        self.assertEqual(compare_schemas(expected, describe_repo_schema(butler)), [])
+
+    def test_restore_detects_missing_index(self) -> None:
+        butler = self.make_repo("repo")
+        with make_reference_repo(self.make_config("repo")) as reference:
+            expected = describe_repo_schema(reference)
+        # An index the reference has but the loaded repository does not, as
+        # if it had been dropped and never recorded.
+        table = next(name for name, description in expected.items() if description["indexes"])
+        expected[table]["indexes"] = [*expected[table]["indexes"], ("extra_index", ("id",), False)]
+        with self.assertRaisesRegex(RuntimeError, f"{table}: indexes differ"):
+            FreshLoad.from_butler(butler).restore(expected)
+
+    def test_unsupported_dialect(self) -> None:
+        self.assertEqual(get_registry_dialect(Config()), "sqlite")
+        self.assertEqual(get_registry_dialect(self.make_config("repo")), self.dialect)
+        result = CliRunner().invoke(
+            main,
+            [
+                "--input-dir",
+                self.dump_dir,
+                "--fresh-load",
+                "--db-connection-string",
+                "mysql://localhost/registry",
+                "--db-schema",
+                "dp1",
+            ],
+        )
+        self.assertEqual(result.exit_code, 2, result.output)
+        self.assertIn("--fresh-load is not supported for 'mysql' registry databases", result.output)
+
+
+@unittest.skipIf(testing is None, "testing.postgresql is not installed")
+class PostgresFreshLoadTestCase(FreshLoadTestCase):
+    """Run the fresh load tests against a temporary PostgreSQL server."""
+
+    dialect = "postgresql"
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.postgresql = testing.postgresql.Postgresql()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.postgresql.stop()
+
+    def make_config(self, name: str) -> Config:
+        namespace = name.replace("-", "_")
+        return Config({"registry": {"db": self.postgresql.url(), "namespace": namespace}})
+
+
+if __name__ == "__main__":
+    unittest.main()
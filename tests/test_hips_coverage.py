@@ -0,0 +1,176 @@
+import json
+import os
+import tempfile
+import unittest
+
+import numpy
+import pyarrow
+from click.testing import CliRunner
+from lsst.dp1_data_wrangling.hips_coverage import (
+    Coverage,
+    _union_ranges,
+    compute_band_coverage,
+    compute_coverage,
+    get_hips_bands,
+    main,
+    read_patch_regions,
+    update_properties_file,
+)
+from lsst.dp1_data_wrangling.paths import ExportPaths
+from lsst.sphgeom import Angle, Circle, HealpixPixelization, LonLat, Region, UnitVector3d
+from pyarrow.parquet import write_table
+
+_ORDER = 8
+
+
+def _make_region(ra: float, dec: float) -> bytes:
+    return Circle(UnitVector3d(LonLat.fromDegrees(ra, dec)), Angle.fromDegrees(0.1)).encode()
+
+
+# Patch IDs and their centers.
+_PATCHES = {0: (53.0, -28.0), 1: (53.3, -28.0), 2: (150.0, 2.0)}
+
+
+class CoverageTestCase(unittest.TestCase):
+    """Check the HEALPix range arithmetic used for HiPS coverage."""
+
+    def test_union_ranges(self) -> None:
+        ranges = numpy.array([[10, 12], [0, 5], [5, 7], [3, 4], [20, 25], [11, 15]], dtype=numpy.uint64)
+        self.assertEqual(_union_ranges(ranges).tolist(), [[0, 7], [10, 15], [20, 25]])
+        self.assertEqual(len(_union_ranges(numpy.empty((0, 2), dtype=numpy.uint64))), 0)
+
+    def test_coverage(self) -> None:
+        a = Coverage(0, numpy.array([[0, 2]], dtype=numpy.uint64))
+        b = Coverage(0, numpy.array([[1, 3], [11, 12]], dtype=numpy.uint64))
+        self.assertEqual(a.sky_fraction, 2 / 12)
+        union = a.union(b)
+        self.assertEqual(union.ranges.tolist(), [[0, 3], [11, 12]])
+        self.assertEqual(union.sky_fraction, 4 / 12)
+        self.assertEqual(json.loads(union.to_moc_json()), {"0": [0, 1, 2, 11]})
+        with self.assertRaises(AssertionError):
+            a.union(Coverage(1, a.ranges))
+
+    def test_compute_coverage(self) -> None:
+        regions = [_make_region(*center) for center in _PATCHES.values()]
+        coverage = compute_coverage(regions, _ORDER)
+        pixelization = HealpixPixelization(_ORDER)
+        expected = set()
+        for encoded in regions:
+            for begin, end in pixelization.envelope(Region.decode(encoded)).ranges():
+                expected.update(range(begin, end))
+        self.assertEqual(json.loads(coverage.to_moc_json()), {str(_ORDER): sorted(expected)})
+        self.assertEqual(compute_coverage([], _ORDER).sky_fraction, 0.0)
+
+    def test_get_hips_bands(self) -> None:
+        self.assertEqual(get_hips_bands("band_g"), ["g"])
+        self.assertEqual(get_hips_bands("color_gri"), ["g", "r", "i"])
+        self.assertIsNone(get_hips_bands("band_"))
+        self.assertIsNone(get_hips_bands("Moc"))
+
+
+class HipsExportTestCase(unittest.TestCase):
+    """Compute the coverage of each band from the patches in an export, and
+    update HiPS properties files with it.
+    """
+
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        self.paths = ExportPaths(os.path.join(self.root, "dump"))
+        self.paths.create_directories()
+        os.makedirs(os.path.dirname(self.paths.dataset_parquet_path("deep_coadd")))
+        os.makedirs(os.path.dirname(self.paths.dimension_parquet_path("patch")))
+        # The g band has patches 0 and 1, and the r band patches 1 and 2;
+        # the repeated g band row is a second dataset of the same patch.
+        write_table(
+            pyarrow.table(
+                {
+                    "band": pyarrow.array(["g", "g", "g", "r", "r"]).dictionary_encode(),
+                    "skymap": pyarrow.array(["sky"] * 5).dictionary_encode(),
+                    "tract": pyarrow.array([1, 1, 1, 1, 1], pyarrow.int64()),
+                    "patch": pyarrow.array([0, 1, 1, 1, 2], pyarrow.int64()),
+                }
+            ),
+            self.paths.dataset_parquet_path("deep_coadd"),
+        )
+        # Patch 3 has no datasets.
+        patches = {**_PATCHES, 3: (10.0, 10.0)}
+        write_table(
+            pyarrow.table(
+                {
+                    "skymap": ["sky"] * len(patches),
+                    "tract": pyarrow.array([1] * len(patches), pyarrow.int32()),
+                    "id": pyarrow.array(list(patches), pyarrow.int32()),
+                    "region": pyarrow.array([_make_region(*c) for c in patches.values()], pyarrow.binary()),
+                }
+            ),
+            self.paths.dimension_parquet_path("patch"),
+        )
+
+    def test_read_patch_regions(self) -> None:
+        regions = read_patch_regions(self.paths, "deep_coadd")
+        self.assertEqual(
+            {band: sorted(r) for band, r in regions.items()},
+            {
+                "g": sorted(_make_region(*_PATCHES[i]) for i in (0, 1)),
+                "r": sorted(_make_region(*_PATCHES[i]) for i in (1, 2)),
+            },
+        )
+
+    def test_band_coverage(self) -> None:
+        coverage = compute_band_coverage(self.paths, "deep_coadd", _ORDER, jobs=2)
+        self.assertEqual(sorted(coverage), ["g", "r"])
+        for band, patches in [("g", (0, 1)), ("r", (1, 2))]:
+            expected = compute_coverage([_make_region(*_PATCHES[i]) for i in patches], _ORDER)
+            self.assertEqual(coverage[band].ranges.tolist(), expected.ranges.tolist(), band)
+
+    def test_update_properties(self) -> None:
+        properties_dir = os.path.join(self.root, "hips")
+        contents = "# HiPS properties\nhips_order = 11\nmoc_sky_fraction   = 0.5\n"
+        for name in ["band_g", "band_i", "color_gr", "unrelated"]:
+            os.makedirs(os.path.join(properties_dir, name))
+            with open(os.path.join(properties_dir, name, "properties"), "w") as file:
+                file.write(contents)
+        moc_dir = os.path.join(self.root, "mocs")
+
+        result = CliRunner().invoke(
+            main,
+            [
+                "--input-dir",
+                os.path.join(self.root, "dump"),
+                "--properties-dir",
+                properties_dir,
+                "--order",
+                str(_ORDER),
+                "--moc-dir",
+                moc_dir,
+                "--jobs",
+                "1",
+            ],
+        )
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("band_i: skipped, no deep_coadd datasets for i", result.output)
+
+        g = compute_coverage([_make_region(*_PATCHES[i]) for i in (0, 1)], _ORDER)
+        gr = compute_coverage([_make_region(*c) for c in _PATCHES.values()], _ORDER)
+        for name, coverage in [("band_g", g), ("color_gr", gr)]:
+            with open(os.path.join(properties_dir, name, "properties")) as file:
+                self.assertEqual(
+                    file.read(),
+                    f"# HiPS properties\nhips_order = 11\nmoc_sky_fraction   = {coverage.sky_fraction}\n",
+                )
+            with open(os.path.join(moc_dir, f"{name}.json")) as file:
+                self.assertEqual(file.read(), coverage.to_moc_json())
+        for name in ["band_i", "unrelated"]:
+            with open(os.path.join(properties_dir, name, "properties")) as file:
+                self.assertEqual(file.read(), contents)
+        self.assertEqual(sorted(os.listdir(moc_dir)), ["band_g.json", "color_gr.json"])
+
+        # Running again leaves the files as they are.
+        path = os.path.join(properties_dir, "band_g", "properties")
+        self.assertFalse(update_properties_file(path, {"moc_sky_fraction": str(g.sky_fraction)}))
+
+
+if __name__ == "__main__":
+    unittest.main()
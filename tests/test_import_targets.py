@@ -0,0 +1,89 @@
+import os
+import tempfile
+import unittest
+
+from lsst.daf.butler import Butler, CollectionType, MissingCollectionError
+from lsst.dp1_data_wrangling.benchmark import BenchmarkScale, create_synthetic_repo
+from lsst.dp1_data_wrangling.export_dp1 import export
+from lsst.dp1_data_wrangling.import_targets import ImportTarget
+from lsst.dp1_data_wrangling.importer import Importer
+from lsst.dp1_data_wrangling.path_mapping import get_datastore_mapping
+
+_SCALE = BenchmarkScale(
+    visits=3, detectors=2, dataset_types=1, runs=1, calibration_collections=1, log_zip_files=0
+)
+
+
+class FanOutImportTestCase(unittest.TestCase):
+    """Import one export into several target repositories at once."""
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.source_repo = os.path.join(cls.directory.name, "source-repo")
+        cls.dataset_types = create_synthetic_repo(cls.source_repo, _SCALE)
+        cls.dump_dir = os.path.join(cls.directory.name, "dump")
+        export(Butler(cls.source_repo), "benchmark/all", cls.dataset_types, cls.dump_dir)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.directory.cleanup()
+
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+
+    def _make_target(self, name: str) -> ImportTarget:
+        repo = os.path.join(self.root, name)
+        Butler.makeRepo(repo)
+        return ImportTarget(name=name, butler=Butler(repo, writeable=True))
+
+    def _import(self, targets: list[ImportTarget], queue_depth: int) -> None:
+        importer = Importer(self.dump_dir, targets, None, batch_size=2, queue_depth=queue_depth)
+        importer.import_all(get_datastore_mapping(no_datastore_remap=True, file_paths="rsp"))
+
+    def _assert_matches_source(self, repo: str) -> None:
+        source = Butler(self.source_repo)
+        target = Butler(repo)
+        for dataset_type in self.dataset_types:
+            expected = source.query_datasets(dataset_type, "benchmark/all", find_first=False)
+            actual = target.query_datasets(dataset_type, "benchmark/all", find_first=False)
+            self.assertEqual({ref.id for ref in actual}, {ref.id for ref in expected}, dataset_type)
+
+    def test_all_targets(self) -> None:
+        for queue_depth in [0, 2]:
+            with self.subTest(queue_depth=queue_depth):
+                targets = [self._make_target(f"q{queue_depth}-{i}") for i in range(3)]
+                self._import(targets, queue_depth)
+                for target in targets:
+                    self._assert_matches_source(os.path.join(self.root, target.name))
+
+    def test_one_target_fails(self) -> None:
+        targets = [self._make_target(name) for name in ["a", "b", "c"]]
+        # Registering the calibration collection with a different type
+        # fails part way through the import into "b".
+        targets[1].butler.collections.register("benchmark/calib0", CollectionType.TAGGED)
+
+        with self.assertRaisesRegex(RuntimeError, "Import failed for 1 of 3 targets: b"):
+            self._import(targets, queue_depth=2)
+
+        self._assert_matches_source(os.path.join(self.root, "a"))
+        self._assert_matches_source(os.path.join(self.root, "c"))
+        # Everything written to "b" before the failure was rolled back.
+        failed = Butler(os.path.join(self.root, "b"))
+        with self.assertRaises(MissingCollectionError):
+            failed.collections.get_info("benchmark/all")
+        self.assertEqual(failed.collections.get_info("benchmark/calib0").type, CollectionType.TAGGED)
+        self.assertEqual(failed.query_datasets("benchmark_0", "*", explain=False), [])
+
+    def test_all_targets_fail(self) -> None:
+        targets = [self._make_target(name) for name in ["a", "b"]]
+        for target in targets:
+            target.butler.collections.register("benchmark/calib0", CollectionType.TAGGED)
+        with self.assertRaisesRegex(RuntimeError, "Import failed for (all|2 of 2) targets"):
+            self._import(targets, queue_depth=1)
+
+
+if __name__ == "__main__":
+    unittest.main()
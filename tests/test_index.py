@@ -0,0 +1,78 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import pyarrow
+from lsst.daf.butler import Butler
+from lsst.dp1_data_wrangling.benchmark import BenchmarkScale, create_synthetic_repo
+from lsst.dp1_data_wrangling.export_dp1 import export
+from lsst.dp1_data_wrangling.index import ExportIndex, check_parquet_file
+from lsst.dp1_data_wrangling.paths import ExportPaths
+from lsst.dp1_data_wrangling.utils import read_model_from_file
+from pyarrow.parquet import read_table, write_table
+
+_SCALE = BenchmarkScale(
+    visits=3, detectors=2, dataset_types=1, runs=1, calibration_collections=1, log_zip_files=0
+)
+
+
+class ExportIndexTestCase(unittest.TestCase):
+    """Check the file information recorded in the export index, and that
+    changed files are detected.
+    """
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.directory = tempfile.TemporaryDirectory()
+        source_repo = os.path.join(cls.directory.name, "source-repo")
+        dataset_types = create_synthetic_repo(source_repo, _SCALE)
+        cls.dump_dir = os.path.join(cls.directory.name, "dump")
+        export(Butler(source_repo), "benchmark/all", dataset_types, cls.dump_dir)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.directory.cleanup()
+
+    def test_file_info(self) -> None:
+        paths = ExportPaths(self.dump_dir)
+        index = read_model_from_file(ExportIndex, paths.index_path())
+        info = index.files["datasets/benchmark_0"]
+        self.assertEqual(info.num_rows, _SCALE.visits * _SCALE.detectors)
+        self.assertEqual(info.num_bytes, os.path.getsize(paths.dataset_parquet_path("benchmark_0")))
+        self.assertEqual((info.key_ranges["visit"].min, info.key_ranges["visit"].max), (0, _SCALE.visits - 1))
+        self.assertIn("datastore", index.files)
+        for path, expected in index.files.items():
+            self.assertEqual(check_parquet_file(paths, paths.path_from_relative(path), expected), [], path)
+
+    def test_changed_files(self) -> None:
+        copy = os.path.join(self.directory.name, "changed")
+        shutil.copytree(self.dump_dir, copy)
+        paths = ExportPaths(copy)
+        index = read_model_from_file(ExportIndex, paths.index_path())
+
+        datasets_path = paths.dataset_parquet_path("benchmark_0")
+        with open(datasets_path, "r+b") as f:
+            f.truncate(os.path.getsize(datasets_path) // 2)
+        problems = check_parquet_file(paths, datasets_path, index.files["datasets/benchmark_0"])
+        self.assertEqual(len(problems), 1)
+        self.assertIn("bytes", problems[0])
+
+        visit_path = paths.dimension_parquet_path("visit")
+        table = read_table(visit_path)
+        write_table(table.append_column("extra", pyarrow.nulls(table.num_rows, pyarrow.int64())), visit_path)
+        expected = index.files["dimensions/visit"].model_copy(
+            update={"num_bytes": os.path.getsize(visit_path)}
+        )
+        problems = check_parquet_file(paths, visit_path, expected)
+        self.assertTrue(any("schema" in problem for problem in problems), problems)
+
+        os.remove(paths.datastore_parquet_path())
+        self.assertEqual(
+            check_parquet_file(paths, paths.datastore_parquet_path(), index.files["datastore"]),
+            [f"{paths.datastore_parquet_path()}: file is missing"],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import tempfile
+import unittest
+
+import pyarrow
+import pyarrow.compute
+from lsst.daf.butler import Butler
+from lsst.dp1_data_wrangling.archive import write_archive
+from lsst.dp1_data_wrangling.benchmark import BenchmarkScale, create_synthetic_repo
+from lsst.dp1_data_wrangling.export_dp1 import export
+from lsst.dp1_data_wrangling.inspect_dump import DumpInspector
+
+_SCALE = BenchmarkScale(
+    visits=3, detectors=2, dataset_types=1, runs=1, calibration_collections=1, log_zip_files=0
+)
+
+
+class DumpInspectorTestCase(unittest.TestCase):
+    """Query an export of a synthetic repository, both as a directory and as
+    an archive.
+    """
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.directory = tempfile.TemporaryDirectory()
+        source_repo = os.path.join(cls.directory.name, "source-repo")
+        dataset_types = create_synthetic_repo(source_repo, _SCALE)
+        cls.dump_dir = os.path.join(cls.directory.name, "dump")
+        export(Butler(source_repo), "benchmark/all", dataset_types, cls.dump_dir)
+        cls.archive = os.path.join(cls.directory.name, "dump.dp1a")
+        write_archive(cls.dump_dir, cls.archive)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.directory.cleanup()
+
+    def test_count(self) -> None:
+        for input_path in [self.dump_dir, self.archive]:
+            with self.subTest(input_path=input_path):
+                inspector = DumpInspector(input_path)
+                self.assertIn("datasets/benchmark_0", inspector.table_names())
+                self.assertEqual(inspector.count("datasets/benchmark_0"), _SCALE.visits * _SCALE.detectors)
+                filter = inspector.parse_filter("datasets/benchmark_0", ["visit=0,1"])
+                self.assertEqual(inspector.count("datasets/benchmark_0", filter), 2 * _SCALE.detectors)
+
+    def test_group_count(self) -> None:
+        counts = DumpInspector(self.archive).group_count("datasets/benchmark_0", ["visit"])
+        self.assertEqual(counts.column("visit").to_pylist(), list(range(_SCALE.visits)))
+        self.assertEqual(counts.column("count").to_pylist(), [_SCALE.detectors] * _SCALE.visits)
+
+    def test_join(self) -> None:
+        inspector = DumpInspector(self.archive)
+        filter = inspector.parse_filter("datasets/benchmark_0", ["visit=1"])
+        tables = list(
+            inspector.join(
+                "datasets/benchmark_0",
+                "datastore",
+                [("dataset_id", "dataset_id")],
+                ["dataset_id", "visit", "path"],
+                filter=filter,
+            )
+        )
+        joined = pyarrow.concat_tables(tables)
+        self.assertEqual(joined.num_rows, _SCALE.detectors)
+        self.assertEqual(set(joined.column("visit").to_pylist()), {1})
+        expected_ids = pyarrow.concat_arrays(
+            [b.column("dataset_id") for b in inspector.scan("datasets/benchmark_0", ["dataset_id"], filter)]
+        ).cast(pyarrow.binary())
+        self.assertEqual(
+            set(joined.column("dataset_id").cast(pyarrow.binary()).to_pylist()), set(expected_ids.to_pylist())
+        )
+        self.assertTrue(all(pyarrow.compute.utf8_length(joined.column("path")).to_pylist()))
+
+
+if __name__ == "__main__":
+    unittest.main()
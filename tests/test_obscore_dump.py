@@ -0,0 +1,96 @@
+import os
+import tempfile
+import unittest
+
+import pyarrow
+import yaml
+from lsst.daf.butler import Butler
+from lsst.dp1_data_wrangling.benchmark import BenchmarkScale, create_synthetic_repo
+from lsst.dp1_data_wrangling.export_dp1 import export
+from lsst.dp1_data_wrangling.obscore_dump import (
+    DumpObsCoreExporter,
+    _DimensionRecordReader,
+    export_obscore,
+    load_exporter_config,
+)
+from lsst.dp1_data_wrangling.paths import ExportPaths
+from pyarrow.parquet import read_table
+
+_SCALE = BenchmarkScale(
+    visits=2, detectors=2, dataset_types=1, runs=1, calibration_collections=1, log_zip_files=0
+)
+
+_CONFIG = {
+    "facility_name": "test_facility",
+    "obs_collection": "test_collection",
+    "collection_type": "RUN",
+    "use_butler_uri": True,
+    "dataset_types": {
+        "benchmark_0": {
+            "dataproduct_type": "image",
+            "dataproduct_subtype": "lsst.benchmark_0",
+            "calib_level": 2,
+            "o_ucd": "phot.count",
+            "access_format": "application/json",
+        },
+    },
+}
+
+
+class ObsCoreDumpTestCase(unittest.TestCase):
+    """Generate the ObsCore table for an export of visit-based datasets,
+    whose data IDs imply dimensions (e.g. ``physical_filter`` and
+    ``day_obs``) that the datasets files have no columns for.
+    """
+
+    def test_visit_datasets(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            source_repo = os.path.join(directory, "source-repo")
+            dataset_types = create_synthetic_repo(source_repo, _SCALE)
+            dump_dir = os.path.join(directory, "dump")
+            export(Butler(source_repo), "benchmark/all", dataset_types, dump_dir)
+            config_file = os.path.join(directory, "obscore.yaml")
+            with open(config_file, "w") as f:
+                yaml.safe_dump(_CONFIG, f)
+
+            output_file = os.path.join(directory, "obscore.parquet")
+            rows = export_obscore(
+                dump_dir, config_file, output_file, "parquet", datastore_root="s3://bucket/", jobs=1
+            )
+            self.assertEqual(rows, _SCALE.visits * _SCALE.detectors)
+
+            table = read_table(output_file).to_pydict()
+            self.assertEqual(set(table["dataproduct_type"]), {"image"})
+            self.assertEqual(len(table["access_url"]), rows)
+            for url in table["access_url"]:
+                self.assertTrue(url.startswith("s3://bucket/"), url)
+
+    def test_batch_records(self) -> None:
+        """Only the dimension records for each batch of datasets are read."""
+        with tempfile.TemporaryDirectory() as directory:
+            source_repo = os.path.join(directory, "source-repo")
+            dataset_types = create_synthetic_repo(source_repo, _SCALE)
+            dump_dir = os.path.join(directory, "dump")
+            export(Butler(source_repo), "benchmark/all", dataset_types, dump_dir)
+            config_file = os.path.join(directory, "obscore.yaml")
+            with open(config_file, "w") as f:
+                yaml.safe_dump(_CONFIG, f)
+
+            exporter = DumpObsCoreExporter(dump_dir, load_exporter_config(config_file), batch_size=1)
+            batches = list(exporter.iter_batches("benchmark_0"))
+            self.assertEqual(len(batches), _SCALE.visits * _SCALE.detectors)
+            self.assertTrue(all(batch.num_rows == 1 for batch in batches))
+
+            universe = exporter._universe
+            reader = _DimensionRecordReader(ExportPaths(dump_dir), exporter._index, universe)
+            records, keys = reader.read(
+                universe["visit"], {"instrument": pyarrow.array(["DummyCam"]), "visit": pyarrow.array([1])}
+            )
+            self.assertEqual([record.id for record in records], [1])
+            self.assertEqual(keys.column_names, ["instrument", "visit", "__row"])
+            records, _ = reader.read(universe["visit"], {"visit": pyarrow.array([0, 1, 0, None])})
+            self.assertEqual(sorted(record.id for record in records), [0, 1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import tempfile
+import unittest
+
+from lsst.daf.butler import Butler
+from lsst.dp1_data_wrangling.benchmark import BenchmarkScale, create_synthetic_repo
+from lsst.dp1_data_wrangling.export_dp1 import export
+from pyarrow.parquet import read_table
+
+_SCALE = BenchmarkScale(
+    visits=7, detectors=3, dataset_types=2, runs=2, calibration_collections=1, log_zip_files=0
+)
+
+
+def _list_parquet_files(root: str) -> list[str]:
+    files = []
+    for directory, _, names in os.walk(root):
+        for name in names:
+            path = os.path.join(directory, name)
+            with open(path, "rb") as f:
+                if f.read(4) == b"PAR1":
+                    files.append(os.path.relpath(path, root))
+    return sorted(files)
+
+
+class PartitionedExportTestCase(unittest.TestCase):
+    """Check that exporting dataset types in parallel partitions writes the
+    same rows as exporting them in one pass.
+    """
+
+    def test_partitions_match(self) -> None:
+        with tempfile.TemporaryDirectory() as root:
+            source_repo = os.path.join(root, "source-repo")
+            dataset_types = create_synthetic_repo(source_repo, _SCALE)
+            butler = Butler(source_repo)
+            exports = {}
+            for partitions in [1, 3]:
+                exports[partitions] = os.path.join(root, f"dump{partitions}")
+                # Deterministic mode sorts every file, so the two exports can
+                # be compared row by row.
+                export(
+                    butler,
+                    "benchmark/all",
+                    dataset_types,
+                    exports[partitions],
+                    partitions=partitions,
+                    deterministic=True,
+                )
+
+            files = _list_parquet_files(exports[1])
+            self.assertIn(os.path.join("datasets", "benchmark_0"), files)
+            self.assertEqual(_list_parquet_files(exports[3]), files)
+            for path in files:
+                expected = read_table(os.path.join(exports[1], path))
+                actual = read_table(os.path.join(exports[3], path))
+                self.assertTrue(actual.equals(expected), path)
+            # The partial files written by the partitions are removed.
+            for directory, _, names in os.walk(exports[3]):
+                self.assertEqual([name for name in names if ".part" in name], [], directory)
+
+
+if __name__ == "__main__":
+    unittest.main()
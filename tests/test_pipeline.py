@@ -0,0 +1,112 @@
+import os
+import tempfile
+import threading
+import unittest
+from collections.abc import Iterator
+
+from lsst.daf.butler import Butler
+from lsst.dp1_data_wrangling.benchmark import BenchmarkScale, create_synthetic_repo
+from lsst.dp1_data_wrangling.export_dp1 import export
+from lsst.dp1_data_wrangling.importer import Importer
+from lsst.dp1_data_wrangling.path_mapping import get_datastore_mapping
+from lsst.dp1_data_wrangling.pipeline import PipelineStats, prefetch
+
+_SCALE = BenchmarkScale(
+    visits=3, detectors=2, dataset_types=1, runs=1, calibration_collections=1, log_zip_files=0
+)
+
+
+class _Items:
+    """Iterate over ``range(count)`` in the producer thread, optionally
+    raising an exception after ``fail_after`` items.
+    """
+
+    def __init__(self, count: int, fail_after: int | None = None) -> None:
+        self.count = count
+        self.fail_after = fail_after
+        self.closed = threading.Event()
+        self.threads: set[int] = set()
+
+    def __iter__(self) -> Iterator[int]:
+        try:
+            for i in range(self.count):
+                self.threads.add(threading.get_ident())
+                if i == self.fail_after:
+                    raise RuntimeError(f"failed producing item {i}")
+                yield i
+        finally:
+            self.closed.set()
+
+
+class PrefetchTestCase(unittest.TestCase):
+    """Produce items in a background thread and consume them in the
+    calling thread.
+    """
+
+    def test_order(self) -> None:
+        items = _Items(100)
+        stats = PipelineStats()
+        self.assertEqual(list(prefetch(items, 3, stats)), list(range(100)))
+        self.assertEqual(stats.batches, 100)
+        self.assertNotIn(threading.get_ident(), items.threads)
+        self.assertTrue(items.closed.is_set())
+
+    def test_error(self) -> None:
+        items = _Items(100, fail_after=5)
+        stats = PipelineStats()
+        consumed = []
+        with self.assertRaisesRegex(RuntimeError, "failed producing item 5"):
+            for item in prefetch(items, 2, stats):
+                consumed.append(item)
+        # Every item produced before the error is delivered first.
+        self.assertEqual(consumed, list(range(5)))
+        self.assertEqual(stats.batches, 5)
+        self.assertTrue(items.closed.is_set())
+
+    def test_consumer_stops_early(self) -> None:
+        items = _Items(1000)
+        stats = PipelineStats()
+        iterator = prefetch(items, 2, stats)
+        self.assertEqual([next(iterator) for _ in range(3)], [0, 1, 2])
+        iterator.close()
+        # The producer is stopped and the items closed before close returns.
+        self.assertTrue(items.closed.is_set())
+        self.assertEqual(stats.batches, 3)
+
+    def test_consumer_error(self) -> None:
+        items = _Items(1000)
+        with self.assertRaises(ValueError):
+            for item in prefetch(items, 2, PipelineStats()):
+                if item == 10:
+                    raise ValueError(item)
+        self.assertTrue(items.closed.is_set())
+
+
+class PipelinedImportTestCase(unittest.TestCase):
+    """Import with batches decoded in a background thread."""
+
+    def test_import(self) -> None:
+        with tempfile.TemporaryDirectory() as root:
+            source_repo = os.path.join(root, "source-repo")
+            dataset_types = create_synthetic_repo(source_repo, _SCALE)
+            dump_dir = os.path.join(root, "dump")
+            export(Butler(source_repo), "benchmark/all", dataset_types, dump_dir)
+
+            target_repo = os.path.join(root, "target-repo")
+            Butler.makeRepo(target_repo)
+            importer = Importer(
+                dump_dir, Butler(target_repo, writeable=True), None, batch_size=1, queue_depth=2
+            )
+            importer.import_all(get_datastore_mapping(no_datastore_remap=True, file_paths="rsp"))
+            self.assertGreaterEqual(importer.pipeline_stats.batches, _SCALE.visits * _SCALE.detectors)
+
+            source = Butler(source_repo)
+            target = Butler(target_repo)
+            for dataset_type in dataset_types:
+                expected = source.query_datasets(dataset_type, "benchmark/all", find_first=False)
+                actual = target.query_datasets(dataset_type, "benchmark/all", find_first=False)
+                self.assertEqual({ref.id for ref in actual}, {ref.id for ref in expected})
+
+
+if __name__ == "__main__":
+    unittest.main()
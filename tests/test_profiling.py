@@ -0,0 +1,100 @@
+import os
+import pstats
+import tempfile
+import time
+import unittest
+
+from lsst.daf.butler import Butler
+from lsst.dp1_data_wrangling.benchmark import BenchmarkScale, create_synthetic_repo
+from lsst.dp1_data_wrangling.export_dp1 import export
+from lsst.dp1_data_wrangling.profiling import StageProfiler, make_profiler
+
+_SCALE = BenchmarkScale(
+    visits=2, detectors=2, dataset_types=1, runs=1, calibration_collections=1, log_zip_files=0
+)
+
+
+def _busy(seconds: float) -> list[bytes]:
+    end = time.perf_counter() + seconds
+    allocations = []
+    while time.perf_counter() < end:
+        allocations.append(bytes(1000))
+    return allocations
+
+
+class StageProfilerTestCase(unittest.TestCase):
+    """Write per-stage profiles, stack samples and memory reports."""
+
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.output_dir = os.path.join(directory.name, "profile")
+
+    def test_disabled(self) -> None:
+        profiler = make_profiler(False, False, self.output_dir)
+        self.assertFalse(profiler.enabled)
+        with profiler.stage("datasets/a"):
+            _busy(0.01)
+        profiler.finish()
+        self.assertFalse(os.path.exists(self.output_dir))
+
+    def test_profile(self) -> None:
+        profiler = make_profiler(True, False, self.output_dir)
+        for _ in range(2):
+            with profiler.stage("datasets/a"):
+                _busy(0.05)
+        with profiler.stage("index"):
+            pass
+        profiler.finish()
+        self.assertEqual(
+            sorted(os.listdir(self.output_dir)),
+            ["datasets.a.collapsed", "datasets.a.pstats", "index.collapsed", "index.pstats", "summary.txt"],
+        )
+        stats = pstats.Stats(os.path.join(self.output_dir, "datasets.a.pstats"))
+        self.assertIn("_busy", {function for _, _, function in stats.stats})
+        with open(os.path.join(self.output_dir, "datasets.a.collapsed")) as f:
+            stacks = [line.rsplit(" ", 1) for line in f]
+        self.assertTrue(any("_busy" in stack for stack, _ in stacks))
+        with open(os.path.join(self.output_dir, "summary.txt")) as f:
+            summary = f.read().splitlines()
+        self.assertEqual(len(summary), 2)
+        self.assertTrue(summary[0].startswith("datasets/a: "))
+        self.assertIn("in 2 calls", summary[0])
+        self.assertNotIn("peak traced memory", summary[0])
+
+    def test_trace_memory(self) -> None:
+        profiler = StageProfiler(self.output_dir, trace_memory=True)
+        with profiler.stage("datasets/a"):
+            allocations = _busy(0.01)
+        profiler.finish()
+        self.assertTrue(allocations)
+        with open(os.path.join(self.output_dir, "datasets.a.memory.txt")) as f:
+            report = f.read()
+        self.assertTrue(report.startswith("# Entry 1 of stage 'datasets/a'"))
+        self.assertIn("test_profiling.py", report)
+        with open(os.path.join(self.output_dir, "summary.txt")) as f:
+            self.assertIn("peak traced memory", f.read())
+        self.assertFalse(os.path.exists(os.path.join(self.output_dir, "datasets.a.pstats")))
+
+    def test_nested_stages(self) -> None:
+        profiler = StageProfiler(self.output_dir, profile=True)
+        with profiler.stage("outer"):
+            with self.assertRaises(AssertionError):
+                with profiler.stage("inner"):
+                    pass
+
+    def test_export(self) -> None:
+        source_repo = os.path.join(os.path.dirname(self.output_dir), "source-repo")
+        dataset_types = create_synthetic_repo(source_repo, _SCALE)
+        profiler = StageProfiler(self.output_dir, profile=True, trace_memory=True)
+        dump_dir = os.path.join(os.path.dirname(self.output_dir), "dump")
+        export(Butler(source_repo), "benchmark/all", dataset_types, dump_dir, profiler)
+        profiler.finish()
+        files = set(os.listdir(self.output_dir))
+        for stage in ["datasets.benchmark_0", "associations.benchmark_0", "collections", "index"]:
+            for suffix in [".pstats", ".collapsed", ".memory.txt"]:
+                self.assertIn(stage + suffix, files)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import os
+import socket
+import tempfile
+import unittest
+from unittest import mock
+
+import pyarrow.fs
+from lsst.daf.butler import Butler
+from lsst.dp1_data_wrangling.benchmark import BenchmarkScale, create_synthetic_repo
+from lsst.dp1_data_wrangling.export_dp1 import export
+from lsst.dp1_data_wrangling.importer import Importer
+from lsst.dp1_data_wrangling.path_mapping import get_datastore_mapping
+
+try:
+    from moto.server import ThreadedMotoServer
+except ImportError:
+    ThreadedMotoServer = None
+
+_SCALE = BenchmarkScale(
+    visits=2, detectors=2, dataset_types=1, runs=1, calibration_collections=1, log_zip_files=0
+)
+
+_CREDENTIALS = {
+    "AWS_ACCESS_KEY_ID": "testing",
+    "AWS_SECRET_ACCESS_KEY": "testing",
+    "AWS_DEFAULT_REGION": "us-east-1",
+}
+
+
+def _get_free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@unittest.skipIf(ThreadedMotoServer is None, "moto is not installed")
+class S3ExportTestCase(unittest.TestCase):
+    """Export to and import from an ``s3://`` URI, using a moto server as
+    the S3 endpoint.
+    """
+
+    def setUp(self) -> None:
+        self.enterContext(mock.patch.dict(os.environ, _CREDENTIALS))
+        port = _get_free_port()
+        server = ThreadedMotoServer(ip_address="127.0.0.1", port=port)
+        server.start()
+        self.addCleanup(server.stop)
+        self.endpoint = f"127.0.0.1:{port}"
+        filesystem = pyarrow.fs.S3FileSystem(endpoint_override=self.endpoint, scheme="http")
+        filesystem.create_dir("dp1-test")
+
+    def test_round_trip(self) -> None:
+        uri = f"s3://dp1-test/dump?endpoint_override={self.endpoint}&scheme=http"
+        with tempfile.TemporaryDirectory() as directory:
+            source_repo = os.path.join(directory, "source-repo")
+            dataset_types = create_synthetic_repo(source_repo, _SCALE)
+            export(Butler(source_repo), "benchmark/all", dataset_types, uri)
+
+            target_repo = os.path.join(directory, "target-repo")
+            Butler.makeRepo(target_repo)
+            importer = Importer(uri, Butler(target_repo, writeable=True), None)
+            importer.import_all(get_datastore_mapping(no_datastore_remap=True, file_paths="rsp"))
+
+            source = Butler(source_repo)
+            target = Butler(target_repo)
+            for dataset_type in dataset_types:
+                expected = source.query_datasets(dataset_type, "benchmark/all", find_first=False)
+                actual = target.query_datasets(dataset_type, "benchmark/all", find_first=False)
+                self.assertEqual({ref.id for ref in actual}, {ref.id for ref in expected})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+
+from lsst.dp1_data_wrangling.startup_benchmark import (
+    EntryPointResult,
+    StartupBenchmarkResult,
+    compare_to_baseline,
+    run_startup_benchmark,
+)
+
+
+class StartupBenchmarkTestCase(unittest.TestCase):
+    """Check that the command-line entry points start without loading the
+    Butler stack.
+    """
+
+    def test_help_does_not_import_butler(self) -> None:
+        result = run_startup_benchmark(repeat=1)
+        for name, entry_point in result.entry_points.items():
+            self.assertNotIn("lsst.daf.butler", entry_point.heavy_modules, name)
+            self.assertGreater(entry_point.modules, 0, name)
+
+    def test_compare_to_baseline(self) -> None:
+        baseline = StartupBenchmarkResult(
+            entry_points={
+                "a": EntryPointResult(seconds=1.0, modules=100, heavy_modules=[]),
+                "b": EntryPointResult(seconds=1.0, modules=100, heavy_modules=["sqlalchemy"]),
+            }
+        )
+        result = StartupBenchmarkResult(
+            entry_points={
+                "a": EntryPointResult(seconds=1.5, modules=110, heavy_modules=["lsst.daf.butler"]),
+                "b": EntryPointResult(seconds=1.1, modules=300, heavy_modules=["sqlalchemy"]),
+                "c": EntryPointResult(seconds=9.0, modules=900, heavy_modules=["pandas"]),
+            }
+        )
+        self.assertEqual(
+            compare_to_baseline(result, baseline, tolerance=0.2),
+            [
+                "a: 1.50 s vs baseline 1.00 s",
+                "a: now imports lsst.daf.butler",
+                "b: 300 modules vs baseline 100 modules",
+            ],
+        )
+        self.assertEqual(compare_to_baseline(baseline, baseline, tolerance=0.0), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import os
+import tempfile
+import unittest
+
+from lsst.daf.butler import Butler
+from lsst.dp1_data_wrangling.index import ExportSubset
+from lsst.dp1_data_wrangling.subset import SubsetFilter
+
+
+class SubsetFilterTestCase(unittest.TestCase):
+    """Check the query constraints added for each kind of dataset type."""
+
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        repo = os.path.join(directory.name, "repo")
+        Butler.makeRepo(repo)
+        self.butler = Butler(repo)
+
+    def get_clauses(self, subset: ExportSubset, dimensions: list[str]) -> list[str]:
+        subset_filter = SubsetFilter(self.butler, subset)
+        clauses, _ = subset_filter._get_constraints(self.butler.dimensions.conform(dimensions))
+        return clauses
+
+    def test_region_single_family(self) -> None:
+        subset = ExportSubset(region=(53.1, -28.1, 0.5))
+        self.assertEqual(
+            self.get_clauses(subset, ["visit", "detector"]),
+            ["visit_detector_region.region OVERLAPS subset_region"],
+        )
+        self.assertEqual(self.get_clauses(subset, ["visit"]), ["visit.region OVERLAPS subset_region"])
+        self.assertEqual(self.get_clauses(subset, ["patch"]), ["patch.region OVERLAPS subset_region"])
+        self.assertEqual(self.get_clauses(subset, ["instrument", "detector"]), [])
+
+    def test_region_two_families(self) -> None:
+        """A dataset type with observation and sky map dimensions must
+        overlap the region in both families.
+        """
+        subset = ExportSubset(region=(53.1, -28.1, 0.5))
+        dimensions = ["visit", "detector", "patch"]
+        self.assertEqual(len(self.butler.dimensions.conform(dimensions).spatial), 2)
+        self.assertEqual(
+            sorted(self.get_clauses(subset, dimensions)),
+            ["patch.region OVERLAPS subset_region", "visit_detector_region.region OVERLAPS subset_region"],
+        )
+        # The constraints are accepted by the query system.
+        subset_filter = SubsetFilter(self.butler, subset)
+        with self.butler.query() as query:
+            group = self.butler.dimensions.conform(dimensions)
+            self.assertEqual(list(subset_filter.apply(query.data_ids(group), group)), [])
+
+    def test_other_restrictions(self) -> None:
+        subset = ExportSubset(skymap="lsst_cells_v1", tracts=[5063], day_obs_min=20241120)
+        self.assertEqual(
+            self.get_clauses(subset, ["visit", "detector", "patch"]),
+            ["skymap = subset_skymap", "tract IN (subset_tracts)", "day_obs >= subset_day_obs_min"],
+        )
+        self.assertEqual(self.get_clauses(subset, ["instrument", "detector"]), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
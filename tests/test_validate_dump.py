@@ -0,0 +1,67 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import pyarrow.compute
+from lsst.daf.butler import Butler
+from lsst.dp1_data_wrangling.archive import write_archive
+from lsst.dp1_data_wrangling.benchmark import BenchmarkScale, create_synthetic_repo
+from lsst.dp1_data_wrangling.export_dp1 import export
+from lsst.dp1_data_wrangling.validate_dump import DumpValidator
+from pyarrow.parquet import read_table, write_table
+
+_SCALE = BenchmarkScale(
+    visits=3, detectors=2, dataset_types=1, runs=1, calibration_collections=1, log_zip_files=0
+)
+
+
+class DumpValidatorTestCase(unittest.TestCase):
+    """Validate an export of a synthetic repository, and a copy of it with
+    rows removed.
+    """
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.directory = tempfile.TemporaryDirectory()
+        source_repo = os.path.join(cls.directory.name, "source-repo")
+        dataset_types = create_synthetic_repo(source_repo, _SCALE)
+        cls.dump_dir = os.path.join(cls.directory.name, "dump")
+        export(Butler(source_repo), "benchmark/all", dataset_types, cls.dump_dir)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.directory.cleanup()
+
+    def test_good_export(self) -> None:
+        archive = os.path.join(self.directory.name, "dump.dp1a")
+        write_archive(self.dump_dir, archive)
+        for input_path in [self.dump_dir, archive]:
+            with self.subTest(input_path=input_path):
+                validator = DumpValidator(input_path, partitions=2)
+                self.assertEqual(validator.validate(), [])
+                self.assertEqual(validator.compare_collections(), [])
+
+    def test_corrupted_export(self) -> None:
+        corrupted = os.path.join(self.directory.name, "corrupted")
+        shutil.copytree(self.dump_dir, corrupted)
+        # The datastore records for visit 0 now refer to missing datasets.
+        _remove_rows(os.path.join(corrupted, "datasets", "benchmark_0"), "visit", 0)
+        # The datasets for visit 1 now refer to a missing visit record.
+        _remove_rows(os.path.join(corrupted, "dimensions", "visit"), "id", 1)
+
+        problems = {(p.source, p.target): p for p in DumpValidator(corrupted).validate()}
+        self.assertEqual(problems[("datastore", "datasets/*")].count, _SCALE.detectors)
+        visit_problem = problems[("datasets/benchmark_0", "dimensions/visit")]
+        self.assertEqual(visit_problem.columns, ["instrument", "visit"])
+        self.assertEqual(visit_problem.count, 1)
+        self.assertIn("visit=1", visit_problem.samples[0])
+
+
+def _remove_rows(path: str, column: str, value: int) -> None:
+    table = read_table(path)
+    write_table(table.filter(pyarrow.compute.not_equal(table.column(column), value)), path)
+
+
+if __name__ == "__main__":
+    unittest.main()
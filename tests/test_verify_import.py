@@ -0,0 +1,73 @@
+import os
+import tempfile
+import unittest
+
+import sqlalchemy
+from lsst.daf.butler import Butler
+from lsst.dp1_data_wrangling.benchmark import BenchmarkScale, create_synthetic_repo
+from lsst.dp1_data_wrangling.datastore_mapping import find_file_datastore
+from lsst.dp1_data_wrangling.export_dp1 import export
+from lsst.dp1_data_wrangling.importer import Importer
+from lsst.dp1_data_wrangling.path_mapping import get_datastore_mapping
+from lsst.dp1_data_wrangling.verify_import import ImportVerifier
+
+_SCALE = BenchmarkScale(
+    visits=3, detectors=2, dataset_types=1, runs=1, calibration_collections=1, log_zip_files=0
+)
+
+
+class ImportVerifierTestCase(unittest.TestCase):
+    """Verify full and partial imports of an export, and detect records
+    removed from the target afterward.
+    """
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.directory = tempfile.TemporaryDirectory()
+        source_repo = os.path.join(cls.directory.name, "source-repo")
+        cls.dataset_types = create_synthetic_repo(source_repo, _SCALE)
+        cls.dump_dir = os.path.join(cls.directory.name, "dump")
+        export(Butler(source_repo), "benchmark/all", cls.dataset_types, cls.dump_dir)
+        cls.mapping = get_datastore_mapping(no_datastore_remap=True, file_paths="rsp")
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.directory.cleanup()
+
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+
+    def _import(self, dataset_types: list[str] | None) -> Butler:
+        repo = os.path.join(self.root, "target-repo")
+        Butler.makeRepo(repo)
+        butler = Butler(repo, writeable=True)
+        Importer(self.dump_dir, butler, dataset_types).import_all(self.mapping)
+        return butler
+
+    def test_full_import(self) -> None:
+        butler = self._import(None)
+        self.assertEqual(ImportVerifier(self.dump_dir, butler, None, self.mapping).verify(), [])
+
+    def test_partial_import(self) -> None:
+        butler = self._import(["benchmark_0"])
+        self.assertEqual(ImportVerifier(self.dump_dir, butler, ["benchmark_0"], self.mapping).verify(), [])
+        # The other dataset types were not imported.
+        problems = ImportVerifier(self.dump_dir, butler, None, self.mapping).verify()
+        self.assertIn(("datasets/benchmark_bias", "missing"), {(p.table, p.category) for p in problems})
+
+    def test_missing_datastore_record(self) -> None:
+        butler = self._import(None)
+        ref = butler.query_datasets("benchmark_0", "benchmark/all", where="visit = 1 AND detector = 0")[0]
+        table = find_file_datastore(butler._datastore, butler._datastore.name)._table._table
+        with butler._registry._db._engine.begin() as connection:
+            connection.execute(sqlalchemy.delete(table).where(table.c.dataset_id == ref.id))
+
+        problems = ImportVerifier(self.dump_dir, butler, None, self.mapping).verify()
+        self.assertEqual([(p.table, p.category, p.count) for p in problems], [("datastore", "missing", 1)])
+        self.assertIn(f"dataset_id={ref.id.hex}", problems[0].samples[0])
+
+
+if __name__ == "__main__":
+    unittest.main()